@@ -0,0 +1,29 @@
+"""
+Access control for operator-only endpoints.
+
+There are no user accounts; endpoints that expose every link (listing, stats,
+metrics) take a shared ADMIN_TOKEN as a bearer token and are switched off
+entirely while no token is configured.
+"""
+import hmac
+from functools import wraps
+
+from flask import request
+
+from app import config
+from app.error_handlers import create_error_response
+
+def admin_required(view):
+    """Decorator: reject the request unless it carries the admin bearer token"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = config.ADMIN_TOKEN
+        if not token:
+            return create_error_response({'error': 'Admin API is disabled'}, 403)
+
+        supplied = request.headers.get('Authorization', '')
+        # Constant-time comparison so the token can't be guessed byte by byte
+        if not hmac.compare_digest(supplied.encode('utf-8'), f"Bearer {token}".encode('utf-8')):
+            return create_error_response({'error': 'Unauthorized'}, 401)
+        return view(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,190 @@
+"""
+In-process redirect cache for short code -> original URL lookups.
+
+Concurrent misses for the same code are coalesced (single flight): one thread
+runs the database lookup while the others wait for its result, so a viral link
+after a deploy or cache flush costs one query per worker instead of hundreds.
+
+Entries live for `ttl` seconds. With a `stale_ttl` window, an expired entry is
+still served for up to that long while a single background refresh reloads it
+(stale-while-revalidate), so hot codes never block on the database.
+
+The cache keeps a running estimate of the bytes its entries hold, so memory
+accounting (app/memory.py) can read it for free and trim() the oldest
+entries when the cache is over its byte cap.
+"""
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Per entry besides the two strings: OrderedDict slot and link, (url, expiry) tuple, expiry float
+ENTRY_OVERHEAD = 150
+
+def entry_size(code, original_url):
+    """Approximate bytes one cached entry holds"""
+    return ENTRY_OVERHEAD + sys.getsizeof(code) + sys.getsizeof(original_url)
+
+class _Call:
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """Run at most one call per key at a time; concurrent callers share its result"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def in_flight(self, key):
+        with self._lock:
+            return key in self._calls
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+class RedirectCache:
+    """LRU cache of short code -> original URL with TTL and stale-while-revalidate"""
+
+    def __init__(self, max_entries=10000, ttl=300.0, stale_ttl=0.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries = OrderedDict()  # code -> (original_url, expires_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+        self._refreshing = set()  # codes with a background refresh started
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, code, now=None):
+        """Return (original_url, is_fresh), or (None, False) on a miss"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            entry = self._entries.get(code)
+            if entry is None:
+                return None, False
+
+            original_url, expires_at = entry
+            if now < expires_at:
+                self._entries.move_to_end(code)
+                return original_url, True
+            if now < expires_at + self.stale_ttl:
+                return original_url, False
+
+            del self._entries[code]
+            self._bytes -= entry_size(code, original_url)
+            return None, False
+
+    def set(self, code, original_url, now=None):
+        if self.max_entries <= 0:
+            return
+        now = time.monotonic() if now is None else now
+        size = entry_size(code, original_url)
+        with self._lock:
+            previous = self._entries.get(code)
+            if previous is not None:
+                self._bytes -= entry_size(code, previous[0])
+            self._entries[code] = (original_url, now + self.ttl)
+            self._bytes += size
+            self._entries.move_to_end(code)
+            while len(self._entries) > self.max_entries:
+                self._evict_oldest()
+
+    def _evict_oldest(self):
+        evicted, (original_url, _) = self._entries.popitem(last=False)
+        self._bytes -= entry_size(evicted, original_url)
+
+    def set_many(self, items):
+        """Insert many (code, original_url) pairs at once, e.g. when warming up"""
+        for code, original_url in items:
+            self.set(code, original_url)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def nbytes(self):
+        """Approximate bytes held by the cached entries"""
+        return self._bytes
+
+    def trim(self, max_bytes):
+        """Evict least recently used entries until at most max_bytes are held"""
+        with self._lock:
+            while self._entries and self._bytes > max_bytes:
+                self._evict_oldest()
+
+    def resolve(self, code, loader):
+        """
+        Return the original URL for code, calling loader(code) on a miss.
+        Only one loader call per code is in flight at a time; a miss is not
+        cached (a code that doesn't exist yet may be created a moment later)
+        """
+        original_url, is_fresh = self.get(code)
+        if original_url is not None:
+            if not is_fresh:
+                self._refresh_in_background(code, loader)
+            return original_url
+
+        return self._flight.do(code, lambda: self._load(code, loader))
+
+    def _load(self, code, loader):
+        original_url = loader(code)
+        if original_url is not None:
+            self.set(code, original_url)
+        return original_url
+
+    def _refresh_in_background(self, code, loader):
+        # Checked and marked under one lock, so a burst of stale hits starts one refresh
+        with self._lock:
+            if code in self._refreshing or self._flight.in_flight(code):
+                return
+            self._refreshing.add(code)
+
+        def refresh():
+            try:
+                self._flight.do(code, lambda: self._load(code, loader))
+            except Exception:
+                # Keep serving the stale entry; the next request retries
+                logger.exception("Background refresh failed for %s", code)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(code)
+
+        try:
+            threading.Thread(target=refresh, name="cache-refresh", daemon=True).start()
+        except BaseException:
+            with self._lock:
+                self._refreshing.discard(code)
+            raise
@@ -0,0 +1,415 @@
+"""
+Raw click events for offline analytics, stored as a columnar dataset.
+
+With CLICK_LOG_ENABLED on, every redirect appends (code, time, referrer, user
+agent, client IP) to an in-memory list - a lock and a list append, nothing
+else on the request path. A background thread per worker turns the buffer
+into an Arrow record batch every CLICK_LOG_FLUSH_INTERVAL seconds (sooner once
+CLICK_LOG_BATCH_SIZE events are waiting) and writes it out. The IP is only
+used to look up a country at flush time and is never stored.
+
+Two storage formats:
+
+- arrow (default): Arrow IPC files under CLICK_LOG_PATH, partitioned by day
+  (day=2026-10-19/part-<pid>-<seq>.arrow). Each flush writes a new file under
+  a hidden name and renames it into place, so workers never share a file and
+  readers never see a partial one.
+- lance: a Lance dataset at CLICK_LOG_PATH (needs the optional pylance package).
+
+Lots of flushes mean lots of small files, so every CLICK_LOG_COMPACT_INTERVAL
+seconds one worker (whichever takes the lock first) merges each day's files
+into one, sorted by time. `python -m app.clicklog compact` does the same on
+demand.
+
+scan_clicks() reads the dataset with column projection (only the requested
+columns are read) and predicate pushdown: a time range prunes whole day
+partitions before any file is opened, and the rest of the filter is applied
+while scanning instead of after loading everything.
+
+If the writer falls behind, at most CLICK_LOG_MAX_BUFFER events are held per
+worker and the rest are dropped (and counted) rather than slowing redirects.
+The buffer's approximate size in bytes is kept as events come and go, and
+memory accounting (app/memory.py) flushes it early when it is over its cap.
+
+pyarrow is only imported once something is written or read, so a worker
+with the click log off never loads it.
+
+Usage:
+    python -m app.clicklog compact
+    python -m app.clicklog top [--since 2026-10-01] [--limit 20]
+"""
+import argparse
+import atexit
+import datetime
+import logging
+import os
+import threading
+import time
+import uuid
+
+from app import config, db
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - without fcntl two workers may compact at once
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ('arrow', 'lance')
+
+_SECONDS_PER_DAY = 86400
+# A buffered event: the 5-tuple, its timestamp float and its list slot, plus a header per string
+_EVENT_OVERHEAD = 112
+_STRING_OVERHEAD = 49
+
+def _event_size(event):
+    code, _, referrer, user_agent, ip = event
+    return _EVENT_OVERHEAD + sum(
+        _STRING_OVERHEAD + len(value) for value in (code, referrer, user_agent, ip) if value is not None
+    )
+
+_SCHEMA = None
+
+def schema():
+    """Arrow schema of a stored click event"""
+    global _SCHEMA
+    if _SCHEMA is None:
+        import pyarrow as pa
+
+        _SCHEMA = pa.schema([
+            ('code', pa.string()),
+            ('ts', pa.timestamp('ms', tz='UTC')),
+            ('referrer', pa.string()),
+            ('user_agent', pa.string()),
+            ('country', pa.string()),
+        ])
+    return _SCHEMA
+
+def _dataset_schema():
+    """schema() plus the day partition column"""
+    import pyarrow as pa
+
+    return schema().append(pa.field('day', pa.string()))
+
+def lookup_country(ip):
+    """
+    ISO country code for a client IP. A stub until a GeoIP database is wired
+    in; it runs on the flush thread, so a real lookup won't slow redirects
+    """
+    return None
+
+def _day(ts):
+    return time.strftime('%Y-%m-%d', time.gmtime(ts))
+
+def _write_ipc(path, table):
+    """Write table to path as an Arrow IPC file, appearing there only when complete"""
+    directory, name = os.path.split(path)
+    os.makedirs(directory, exist_ok=True)
+    temp_path = os.path.join(directory, f".{name}.tmp")  # dot files are ignored by readers
+    import pyarrow as pa
+
+    options = pa.ipc.IpcWriteOptions(compression='zstd' if pa.Codec.is_available('zstd') else None)
+    with pa.OSFile(temp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema, options=options) as writer:
+            writer.write_table(table)
+    os.replace(temp_path, path)
+
+class ArrowStore:
+    """Day-partitioned Arrow IPC files in a directory"""
+
+    def __init__(self, path):
+        self.path = path
+        self._sequence = 0
+
+    def append(self, day, table):
+        self._sequence += 1
+        name = f"part-{os.getpid()}-{self._sequence:06d}-{uuid.uuid4().hex[:8]}.arrow"
+        _write_ipc(os.path.join(self.path, f"day={day}", name), table)
+
+    def dataset(self):
+        """A pyarrow dataset over every file, or None while nothing has been written"""
+        if not os.path.isdir(self.path):
+            return None
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+
+        partitioning = ds.partitioning(pa.schema([('day', pa.string())]), flavor='hive')
+        return ds.dataset(self.path, schema=_dataset_schema(), format='ipc', partitioning=partitioning)
+
+    def compact(self):
+        """Merge each day's files into one; returns how many files were merged away"""
+        if not os.path.isdir(self.path):
+            return 0
+        import pyarrow.dataset as ds
+
+        merged = 0
+        for entry in sorted(os.listdir(self.path)):
+            directory = os.path.join(self.path, entry)
+            if not entry.startswith('day=') or not os.path.isdir(directory):
+                continue
+            files = sorted(
+                os.path.join(directory, name) for name in os.listdir(directory)
+                if name.endswith('.arrow') and not name.startswith('.')
+            )
+            if len(files) < 2:
+                continue
+
+            table = ds.dataset(files, schema=schema(), format='ipc').to_table().sort_by('ts')
+            _write_ipc(os.path.join(directory, f"compacted-{uuid.uuid4().hex}.arrow"), table)
+            # Readers may count these rows twice until they're gone; flushes only add new files
+            for path in files:
+                os.unlink(path)
+            merged += len(files) - 1
+        return merged
+
+class LanceStore:
+    """A Lance dataset, with day as an ordinary column"""
+
+    def __init__(self, path):
+        import lance  # optional: pip install pylance
+        self._lance = lance
+        self.path = path
+
+    def append(self, day, table):
+        import pyarrow as pa
+
+        table = table.append_column('day', pa.array([day] * table.num_rows, pa.string()))
+        mode = 'append' if os.path.exists(self.path) else 'create'
+        self._lance.write_dataset(table, self.path, mode=mode)
+
+    def dataset(self):
+        if not os.path.exists(self.path):
+            return None
+        return self._lance.dataset(self.path)
+
+    def compact(self):
+        dataset = self._lance.dataset(self.path) if os.path.exists(self.path) else None
+        if dataset is None:
+            return 0
+        metrics = dataset.optimize.compact_files()
+        dataset.cleanup_old_versions()
+        return metrics.fragments_removed - metrics.fragments_added
+
+def click_log_path():
+    return config.CLICK_LOG_PATH or f"{db.DB_PATH}.clicks"
+
+def open_store(path=None, fmt=None):
+    """The configured click store (CLICK_LOG_PATH / CLICK_LOG_FORMAT unless given)"""
+    path = path or click_log_path()
+    fmt = fmt or config.CLICK_LOG_FORMAT
+    if fmt not in FORMATS:
+        raise ValueError(f"CLICK_LOG_FORMAT must be one of {', '.join(FORMATS)}")
+    return LanceStore(path) if fmt == 'lance' else ArrowStore(path)
+
+def compact(store):
+    """Compact store unless another process is already doing it; returns files merged away"""
+    lock_path = f"{store.path}.compact.lock"
+    with open(lock_path, 'a') as lock:
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return 0
+        return store.compact()
+
+class ClickLog:
+    """Buffers click events and writes them to a store in batches from a background thread"""
+
+    def __init__(self, store, batch_size=5000, interval=5.0, max_buffer=100000, compact_interval=0):
+        self.store = store
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_buffer = max_buffer
+        self.compact_interval = compact_interval
+        self.written = 0
+        self.dropped = 0
+        self._events = []
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._last_compact = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="click-log", daemon=True)
+        self._thread.start()
+
+    def record(self, code, referrer, user_agent, ip):
+        event = (code, time.time(), referrer, user_agent, ip)
+        size = _event_size(event)
+        with self._lock:
+            if len(self._events) >= self.max_buffer:
+                self.dropped += 1
+                return
+            self._events.append(event)
+            self._bytes += size
+            waiting = len(self._events)
+        if waiting == self.batch_size:
+            self._wake.set()
+
+    def pending(self):
+        with self._lock:
+            return len(self._events)
+
+    def nbytes(self):
+        """Approximate bytes held by buffered events"""
+        return self._bytes
+
+    def trim(self, max_bytes):
+        """Write the buffer out now if it holds more than max_bytes"""
+        if self._bytes > max_bytes:
+            self.flush()
+
+    def flush(self):
+        """Write buffered events, one batch per day they fall on; returns how many were written"""
+        with self._flush_lock:
+            with self._lock:
+                events, self._events = self._events, []
+                self._bytes = 0
+            if not events:
+                return 0
+            import pyarrow as pa
+
+            days = {}
+            for event in events:
+                days.setdefault(int(event[1] // _SECONDS_PER_DAY), []).append(event)
+            batches = sorted(days.items())
+            written = 0
+            for position, (day_number, day_events) in enumerate(batches):
+                codes, times, referrers, user_agents, ips = zip(*day_events)
+                table = pa.table([
+                    pa.array(codes, pa.string()),
+                    pa.array([int(ts * 1000) for ts in times], schema().field('ts').type),
+                    pa.array(referrers, pa.string()),
+                    pa.array(user_agents, pa.string()),
+                    pa.array([lookup_country(ip) for ip in ips], pa.string()),
+                ], schema=schema())
+                try:
+                    self.store.append(_day(day_number * _SECONDS_PER_DAY), table)
+                except Exception:
+                    # Put back what wasn't written and try again next time
+                    self.written += written
+                    self._requeue([event for _, batch in batches[position:] for event in batch])
+                    raise
+                written += len(day_events)
+            self.written += written
+            return written
+
+    def _requeue(self, events):
+        with self._lock:
+            room = max(0, self.max_buffer - len(self._events))
+            self._events[:0] = events[:room]
+            self._bytes += sum(_event_size(event) for event in events[:room])
+            self.dropped += len(events) - len(events[:room])
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stopped:
+                return
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Failed to write click events")
+
+            if self.compact_interval and time.monotonic() - self._last_compact >= self.compact_interval:
+                self._last_compact = time.monotonic()
+                try:
+                    compact(self.store)
+                except Exception:
+                    logger.exception("Failed to compact the click log")
+
+    def close(self):
+        self._stopped = True
+        self._wake.set()
+        self._thread.join()
+        self.flush()
+
+def start_click_log(app, store=None):
+    """Log this app's redirects; the ClickLog is stored in app.extensions['click_log']"""
+    click_log = ClickLog(
+        store or open_store(),
+        config.CLICK_LOG_BATCH_SIZE,
+        config.CLICK_LOG_FLUSH_INTERVAL,
+        config.CLICK_LOG_MAX_BUFFER,
+        config.CLICK_LOG_COMPACT_INTERVAL,
+    )
+    app.extensions['click_log'] = click_log
+    atexit.register(click_log.close)
+    return click_log
+
+def _utc(moment):
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    return moment.astimezone(datetime.timezone.utc)
+
+def click_filter(code=None, since=None, until=None):
+    """
+    Filter expression for clicks on `code` in [since, until). The time bounds
+    are also put on the day partition so non-matching days are never opened
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    ts_type = schema().field('ts').type
+    conditions = []
+    if code is not None:
+        conditions.append(ds.field('code') == code)
+    if since is not None:
+        since = _utc(since)
+        conditions.append(ds.field('day') >= since.strftime('%Y-%m-%d'))
+        conditions.append(ds.field('ts') >= pa.scalar(since, ts_type))
+    if until is not None:
+        until = _utc(until)
+        conditions.append(ds.field('day') <= until.strftime('%Y-%m-%d'))
+        conditions.append(ds.field('ts') < pa.scalar(until, ts_type))
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+def scan_clicks(columns=None, code=None, since=None, until=None, store=None):
+    """
+    Read click events as a pyarrow Table, only the given columns (all by
+    default) and only rows matching click_filter(code, since, until)
+    """
+    dataset = (store or open_store()).dataset()
+    if dataset is None:
+        empty = _dataset_schema().empty_table()
+        return empty.select(columns) if columns else empty
+    return dataset.to_table(columns=columns, filter=click_filter(code, since, until))
+
+def top_codes(limit=20, since=None, until=None, store=None):
+    """[(code, clicks)] for the most clicked codes in the time range"""
+    import pyarrow.compute as pc
+
+    table = scan_clicks(['code'], since=since, until=until, store=store)
+    counts = table.group_by('code').aggregate([('code', 'count')])
+    order = pc.sort_indices(counts, sort_keys=[('code_count', 'descending'), ('code', 'ascending')])
+    counts = counts.take(order[:limit])
+    return list(zip(counts['code'].to_pylist(), counts['code_count'].to_pylist()))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m app.clicklog",
+        description="Maintain and query the click event log"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("compact", help="merge each day's small files into one")
+    top = commands.add_parser("top", help="most clicked short codes")
+    top.add_argument("--since", type=datetime.date.fromisoformat, help="first day to count (YYYY-MM-DD)")
+    top.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    store = open_store()
+    if args.command == "compact":
+        print(f"merged {compact(store)} files in {store.path}")
+
+    elif args.command == "top":
+        since = datetime.datetime.combine(args.since, datetime.time()) if args.since else None
+        for code, clicks in top_codes(args.limit, since=since, store=store):
+            print(f"{clicks:>10}  {code}")
+
+if __name__ == "__main__":
+    main()
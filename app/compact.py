@@ -0,0 +1,255 @@
+"""
+Compact in-memory storage for cached URLs.
+
+A plain dict-of-str cache pays for a key string, an OrderedDict node, an
+(url, expiry) tuple, a float and the full URL string for every link - around
+350-400 bytes for a typical 100 character URL. Most of our URLs share a few
+prefixes (https://www.ourshop.com/products/...), so here:
+
+- URLs are front-coded against a shared PrefixTable: each entry stores a
+  2-byte prefix id followed by the UTF-8 remainder, in a bytearray arena.
+- Entries are keyed by the integer value of their base62 code and kept in
+  open-addressing tables built from typed arrays (array module), so a slot
+  costs 22 bytes instead of several Python objects.
+- Eviction is generational instead of exact LRU: new entries go into the
+  current generation; when it is full the oldest generation is dropped in
+  one go, and hits in the older generation are copied forward.
+
+CompactRedirectCache is a drop-in replacement for RedirectCache.
+"""
+import time
+from array import array
+
+from app.cache import RedirectCache
+from app.shortener import decode_base62, MAX_VECTOR_WIDTH
+
+MAX_PREFIXES = 4096  # ids are 2 bytes; this bounds the table at ~1.5MB
+MAX_PREFIX_LENGTH = 255
+_EMPTY = -1
+_HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+
+class PrefixTable:
+    """Interns shared URL prefixes (scheme://host/first-segment/) as 2-byte ids"""
+
+    def __init__(self, max_prefixes=MAX_PREFIXES):
+        self.max_prefixes = max_prefixes
+        self._ids = {'': 0}
+        self._prefixes = ['']
+
+    def __len__(self):
+        return len(self._prefixes)
+
+    @staticmethod
+    def prefix_of(url):
+        """The part of url up to and including the slash after its first path segment"""
+        end = url.find('?')
+        end = len(url) if end == -1 else end
+        cut = 0
+        slashes = 0
+        position = url.find('/', 0, end)
+        while position != -1 and slashes < 4:
+            slashes += 1
+            cut = position + 1
+            position = url.find('/', cut, end)
+        return url[:min(cut, MAX_PREFIX_LENGTH)]
+
+    def encode(self, url):
+        prefix = self.prefix_of(url)
+        prefix_id = self._ids.get(prefix)
+        if prefix_id is None:
+            if len(self._prefixes) < self.max_prefixes:
+                prefix_id = self._ids[prefix] = len(self._prefixes)
+                self._prefixes.append(prefix)
+            else:
+                prefix, prefix_id = '', 0
+        return prefix_id.to_bytes(2, 'little') + url[len(prefix):].encode('utf-8')
+
+    def decode(self, data):
+        return self._prefixes[int.from_bytes(data[:2], 'little')] + data[2:].decode('utf-8')
+
+    def nbytes(self):
+        """Approximate memory held by the interned prefixes"""
+        return sum(49 + len(prefix) + 100 for prefix in self._prefixes)
+
+class _Generation:
+    """One open-addressing table of entries plus the arena their bytes live in"""
+
+    __slots__ = ('capacity', 'mask', 'shift', 'keys', 'offsets', 'lengths', 'expires', 'arena', 'count', 'wasted')
+
+    def __init__(self, capacity):
+        slots = 1
+        while slots < capacity * 2:  # keep the load factor at or below 0.5
+            slots *= 2
+        self.capacity = capacity
+        self.mask = slots - 1
+        self.shift = 64 - max(slots.bit_length() - 1, 1)
+        self.keys = array('q', [_EMPTY]) * slots
+        self.offsets = array('I', [0]) * slots
+        self.lengths = array('H', [0]) * slots
+        self.expires = array('d', [0.0]) * slots
+        self.arena = bytearray()
+        self.count = 0
+        self.wasted = 0  # arena bytes left behind by overwritten entries
+
+    def _slot(self, key):
+        slot = ((key * _HASH_MULTIPLIER) & 0xFFFFFFFFFFFFFFFF) >> self.shift
+        keys = self.keys
+        while True:
+            slot &= self.mask
+            stored = keys[slot]
+            if stored == key or stored == _EMPTY:
+                return slot
+            slot += 1
+
+    def find(self, key):
+        """Return (data, expires_at) for key, or None"""
+        slot = self._slot(key)
+        if self.keys[slot] == _EMPTY:
+            return None
+        offset = self.offsets[slot]
+        return bytes(self.arena[offset:offset + self.lengths[slot]]), self.expires[slot]
+
+    def put(self, key, data, expires_at):
+        """Store an entry; returns False if the generation is full"""
+        slot = self._slot(key)
+        if self.keys[slot] == _EMPTY:
+            if self.count >= self.capacity:
+                return False
+            self.keys[slot] = key
+            self.count += 1
+        elif self.lengths[slot] == len(data):
+            # Same size (e.g. a refresh of the same URL): overwrite in place
+            offset = self.offsets[slot]
+            self.arena[offset:offset + len(data)] = data
+            self.expires[slot] = expires_at
+            return True
+        elif self.wasted > max(4096, len(self.arena) // 2):
+            # Too much dead space from overwrites - treat as full so it gets rotated out
+            return False
+        else:
+            self.wasted += self.lengths[slot]
+        self.offsets[slot] = len(self.arena)
+        self.lengths[slot] = len(data)
+        self.expires[slot] = expires_at
+        self.arena += data
+        return True
+
+    def nbytes(self):
+        slots = self.mask + 1
+        return slots * (8 + 4 + 2 + 8) + len(self.arena)
+
+class CompactUrlStore:
+    """Integer key -> URL store made of two generations over typed arrays"""
+
+    def __init__(self, max_entries, generations=2):
+        self.max_entries = max_entries
+        self.generation_size = max(1, max_entries // generations)
+        self.generation_count = generations
+        self.prefixes = PrefixTable()
+        self.clear()
+
+    def clear(self):
+        self._generations = [_Generation(self.generation_size)]
+
+    def __len__(self):
+        return sum(generation.count for generation in self._generations)
+
+    def get(self, key):
+        """Return (url, expires_at) or None; hits in an older generation move forward"""
+        current = self._generations[-1]
+        found = current.find(key)
+        if found is None:
+            for generation in self._generations[-2::-1]:
+                found = generation.find(key)
+                if found is not None:
+                    self._put_data(key, *found)
+                    break
+            else:
+                return None
+        data, expires_at = found
+        return self.prefixes.decode(data), expires_at
+
+    def put(self, key, url, expires_at):
+        self._put_data(key, self.prefixes.encode(url), expires_at)
+
+    def _put_data(self, key, data, expires_at):
+        if not self._generations[-1].put(key, data, expires_at):
+            # Current generation is full: start a new one, dropping the oldest
+            self._generations.append(_Generation(self.generation_size))
+            del self._generations[:-self.generation_count]
+            self._generations[-1].put(key, data, expires_at)
+
+    def drop_oldest(self):
+        """Drop the oldest generation, or empty the only one; returns False if there was nothing to drop"""
+        if len(self._generations) > 1:
+            del self._generations[0]
+            return True
+        if self._generations[0].count:
+            self.clear()
+            return True
+        return False
+
+    def nbytes(self):
+        """Approximate bytes held by the store, including the prefix table"""
+        return sum(generation.nbytes() for generation in self._generations) + self.prefixes.nbytes()
+
+def code_key(code):
+    """
+    Integer key for a short code (its plain base62 value), or None if the code
+    can't be keyed unambiguously - '0abc' and 'abc' would share a value
+    """
+    if not code or len(code) > MAX_VECTOR_WIDTH or (code[0] == '0' and len(code) > 1):
+        return None
+    try:
+        return decode_base62(code)
+    except ValueError:
+        return None
+
+class CompactRedirectCache(RedirectCache):
+    """RedirectCache storing entries in a CompactUrlStore instead of an OrderedDict"""
+
+    def __init__(self, max_entries=10000, ttl=300.0, stale_ttl=0.0):
+        super().__init__(max_entries, ttl, stale_ttl)
+        self._store = CompactUrlStore(max(max_entries, 1))
+
+    def __len__(self):
+        return len(self._store)
+
+    def get(self, code, now=None):
+        key = code_key(code)
+        if key is None:
+            return None, False
+
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            found = self._store.get(key)
+        if found is None:
+            return None, False
+
+        original_url, expires_at = found
+        if now < expires_at:
+            return original_url, True
+        if now < expires_at + self.stale_ttl:
+            return original_url, False
+        return None, False
+
+    def set(self, code, original_url, now=None):
+        key = code_key(code)
+        if key is None or self.max_entries <= 0:
+            return
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._store.put(key, original_url, now + self.ttl)
+
+    def clear(self):
+        with self._lock:
+            self._store.clear()
+
+    def nbytes(self):
+        return self._store.nbytes()
+
+    def trim(self, max_bytes):
+        """Drop whole generations, oldest first, until at most max_bytes are held"""
+        with self._lock:
+            while self._store.nbytes() > max_bytes and self._store.drop_oldest():
+                pass
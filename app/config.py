@@ -0,0 +1,146 @@
+import os
+
+# Application settings, read from the environment (see .env.example)
+
+def _env_int(name, default):
+    return int(os.getenv(name, default))
+
+def _env_float(name, default):
+    return float(os.getenv(name, default))
+
+def _env_bool(name, default=False):
+    return os.getenv(name, str(default)).strip().lower() in ("1", "true", "yes", "on")
+
+# Short code scheme:
+#   "sequential" - plain base62 of the row id (default)
+#   "feistel"    - base62 of a keyed permutation of the id, so codes can't be enumerated.
+#                  Needs SHORT_CODE_KEY; don't change the key once codes have been issued.
+SHORT_CODE_SCHEME = os.getenv("SHORT_CODE_SCHEME", "sequential")
+SHORT_CODE_KEY = os.getenv("SHORT_CODE_KEY", "")
+
+# Per-client rate limiting (token buckets shared by all workers on the host).
+# Limits are "<requests>/<second|minute|hour|day>"; the count is also the burst size.
+RATE_LIMIT_ENABLED = _env_bool("RATE_LIMIT_ENABLED", False)
+RATE_LIMIT_SHORTEN = os.getenv("RATE_LIMIT_SHORTEN", "30/minute")
+RATE_LIMIT_REDIRECT = os.getenv("RATE_LIMIT_REDIRECT", "600/minute")
+RATE_LIMIT_RESOLVE_BATCH = os.getenv("RATE_LIMIT_RESOLVE_BATCH", "60/minute")
+RATE_LIMIT_PATH = os.getenv("RATE_LIMIT_PATH", "")  # defaults to <DATABASE_PATH>.ratelimit
+RATE_LIMIT_SLOTS = _env_int("RATE_LIMIT_SLOTS", 65536)
+RATE_LIMIT_TRUST_PROXY = _env_bool("RATE_LIMIT_TRUST_PROXY", False)  # key on X-Forwarded-For
+# Comma-separated API keys that get a bucket of their own; other callers are keyed by IP
+RATE_LIMIT_API_KEYS = os.getenv("RATE_LIMIT_API_KEYS", "")
+
+# Redirect cache (per worker). Concurrent misses for one code always share a
+# single lookup; REDIRECT_CACHE_STALE_TTL > 0 serves expired entries for that
+# many extra seconds while one background refresh reloads them.
+REDIRECT_CACHE_SIZE = _env_int("REDIRECT_CACHE_SIZE", 10000)
+REDIRECT_CACHE_TTL = _env_float("REDIRECT_CACHE_TTL", 300)
+REDIRECT_CACHE_STALE_TTL = _env_float("REDIRECT_CACHE_STALE_TTL", 0)
+# Store cached URLs prefix-compressed in typed arrays (several times smaller per entry,
+# slightly slower lookups, generational instead of exact LRU eviction)
+REDIRECT_CACHE_COMPACT = _env_bool("REDIRECT_CACHE_COMPACT", False)
+
+# Redirect cache warm-up at worker start (runs in the background; 0 disables)
+CACHE_WARMUP_SIZE = _env_int("CACHE_WARMUP_SIZE", 1000)
+CACHE_WARMUP_BUDGET = _env_float("CACHE_WARMUP_BUDGET", 5.0)  # seconds
+# With the click log on, the links clicked most over this many days come first
+CACHE_WARMUP_CLICK_DAYS = _env_float("CACHE_WARMUP_CLICK_DAYS", 1)
+
+# Group commit: batch /shorten inserts from concurrent requests into one
+# transaction, committing at most once every GROUP_COMMIT_MAX_DELAY_MS per worker
+GROUP_COMMIT_ENABLED = _env_bool("GROUP_COMMIT_ENABLED", False)
+GROUP_COMMIT_MAX_BATCH = _env_int("GROUP_COMMIT_MAX_BATCH", 100)
+GROUP_COMMIT_MAX_DELAY_MS = _env_float("GROUP_COMMIT_MAX_DELAY_MS", 5)
+
+# SQLite locking between workers. DB_JOURNAL_MODE=wal lets redirects read while a shorten
+# commits (set on boot by init_db; empty leaves the database as it is). DB_BUSY_TIMEOUT is
+# how long a connection waits for another worker's lock before "database is locked"
+DB_JOURNAL_MODE = os.getenv("DB_JOURNAL_MODE", "")
+DB_BUSY_TIMEOUT = _env_float("DB_BUSY_TIMEOUT", 5)
+
+# Memory accounting per worker (see app/memory.py; GET /debug/memory reports it). Caps are in
+# MB, 0 for none: a cache over its cap evicts its oldest entries, a buffer over its cap is
+# written out early. Over MEMORY_CAP_MB in total, the largest of them are trimmed first
+MEMORY_CHECK_INTERVAL = _env_float("MEMORY_CHECK_INTERVAL", 1)  # seconds; 0 only reports
+MEMORY_CAP_MB = _env_float("MEMORY_CAP_MB", 0)
+MEMORY_CAP_REDIRECT_CACHE_MB = _env_float("MEMORY_CAP_REDIRECT_CACHE_MB", 0)
+MEMORY_CAP_CLICK_LOG_MB = _env_float("MEMORY_CAP_CLICK_LOG_MB", 0)
+MEMORY_CAP_CLICK_COUNTER_MB = _env_float("MEMORY_CAP_CLICK_COUNTER_MB", 0)
+
+# Store new original URLs deflate-compressed against a shared dictionary (see app/urlcodec.py)
+URL_COMPRESSION = _env_bool("URL_COMPRESSION", False)
+
+# Operator endpoints (GET /links, ...) require "Authorization: Bearer <ADMIN_TOKEN>"
+# and are disabled while it is empty
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+LINKS_PAGE_SIZE = _env_int("LINKS_PAGE_SIZE", 100)
+LINKS_MAX_PAGE_SIZE = _env_int("LINKS_MAX_PAGE_SIZE", 1000)
+LINKS_SCAN_BUDGET = _env_int("LINKS_SCAN_BUDGET", 10000)  # rows checked per page for prefix filters
+
+# Logging: records are queued and written by a background thread (see app/logs.py).
+# LOG_FORMAT is json (one object per line) or text
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_QUEUE_SIZE = _env_int("LOG_QUEUE_SIZE", 10000)  # records held before dropping
+LOG_SAMPLE_BURST = _env_int("LOG_SAMPLE_BURST", 10)  # repeats of one warning/error let through per window (0 disables)
+LOG_SAMPLE_WINDOW = _env_float("LOG_SAMPLE_WINDOW", 60)  # seconds
+
+# Short URLs are built on SHORT_DOMAIN ("sho.rt", or "https://sho.rt" to fix the scheme)
+# instead of the request's Host. SHORT_DOMAINS lists extra short domains, each with its
+# own code namespace (see app/shortdomains.py)
+SHORT_DOMAIN = os.getenv("SHORT_DOMAIN", "")
+SHORT_DOMAINS = os.getenv("SHORT_DOMAINS", "")
+
+# Most codes accepted by one POST /resolve/batch request
+RESOLVE_BATCH_MAX_CODES = _env_int("RESOLVE_BATCH_MAX_CODES", 1000)
+
+# Per-domain click counts are buffered per worker and written every this many seconds; off (0)
+# by default, since every worker then writes to the database on that interval while redirects come in
+DOMAIN_STATS_FLUSH_INTERVAL = _env_float("DOMAIN_STATS_FLUSH_INTERVAL", 0)
+
+# Raw click events (code, time, referrer, user agent, country) for analytics, written
+# per worker in batches off the redirect path; see app/clicklog.py
+CLICK_LOG_ENABLED = _env_bool("CLICK_LOG_ENABLED", False)
+CLICK_LOG_PATH = os.getenv("CLICK_LOG_PATH", "")  # defaults to <DATABASE_PATH>.clicks
+CLICK_LOG_FORMAT = os.getenv("CLICK_LOG_FORMAT", "arrow")  # arrow (IPC files) or lance (needs pylance)
+CLICK_LOG_BATCH_SIZE = _env_int("CLICK_LOG_BATCH_SIZE", 5000)
+CLICK_LOG_FLUSH_INTERVAL = _env_float("CLICK_LOG_FLUSH_INTERVAL", 5)
+CLICK_LOG_MAX_BUFFER = _env_int("CLICK_LOG_MAX_BUFFER", 100000)  # events held per worker before dropping
+CLICK_LOG_COMPACT_INTERVAL = _env_float("CLICK_LOG_COMPACT_INTERVAL", 3600)  # 0 disables
+
+# Replication: on the primary, REPLICATION_CHANGELOG logs every write to urls for followers,
+# keeping entries for REPLICATION_RETENTION seconds (0 keeps them forever)
+REPLICATION_CHANGELOG = _env_bool("REPLICATION_CHANGELOG", False)
+REPLICATION_RETENTION = _env_float("REPLICATION_RETENTION", 7 * 86400)
+# Set REPLICATION_PRIMARY on read-only redirect nodes to the primary's URL
+# (http://primary:8000, using REPLICATION_TOKEN = the primary's ADMIN_TOKEN) or the path
+# of its database file; leave it empty on the primary. See app/replication.py
+REPLICATION_PRIMARY = os.getenv("REPLICATION_PRIMARY", "")
+REPLICATION_TOKEN = os.getenv("REPLICATION_TOKEN", "")
+REPLICATION_POLL_INTERVAL = _env_float("REPLICATION_POLL_INTERVAL", 1.0)
+REPLICATION_BATCH_SIZE = _env_int("REPLICATION_BATCH_SIZE", 1000)
+REPLICATION_MAX_LAG = _env_float("REPLICATION_MAX_LAG", 30)  # seconds behind before /readyz fails
+REPLICATION_FALLBACK = _env_bool("REPLICATION_FALLBACK", True)  # ask the primary about codes not yet replicated
+# Only for ids at most this far past the newest id the primary announced, and a code it
+# didn't know isn't asked about again for REPLICATION_MISS_TTL seconds
+REPLICATION_FALLBACK_WINDOW = _env_int("REPLICATION_FALLBACK_WINDOW", 1000)
+REPLICATION_MISS_TTL = _env_float("REPLICATION_MISS_TTL", 5.0)
+
+# Partitioning across app nodes (see app/hashring.py). On each node: its own name and
+# every node's name, in the same order as the router's ROUTER_NODES
+PARTITION_NODE = os.getenv("PARTITION_NODE", "")
+PARTITION_NODES = os.getenv("PARTITION_NODES", "")
+PARTITION_VNODES = _env_int("PARTITION_VNODES", 160)  # ring points per node; same on router and nodes
+PARTITION_BLOCK_SIZE = _env_int("PARTITION_BLOCK_SIZE", 1024)  # consecutive ids owned together
+PARTITION_ID_FLOOR = _env_int("PARTITION_ID_FLOOR", 0)  # raise above the highest id when the ring changes
+
+# Router mode: set ROUTER_NODES ("name=http://host:port,...") to run this process as a
+# router that forwards redirects and shortens to the node owning each code.
+# ROUTER_PREVIOUS_NODES is the ring before the last change, asked when a code isn't
+# found on its new owner while links are being moved
+ROUTER_NODES = os.getenv("ROUTER_NODES", "")
+ROUTER_PREVIOUS_NODES = os.getenv("ROUTER_PREVIOUS_NODES", "")
+ROUTER_TIMEOUT = _env_float("ROUTER_TIMEOUT", 5)
+
+# Frontend build directory (index.html plus static/); present in the Docker image
+STATIC_ROOT = os.getenv("STATIC_ROOT", "/app/static")
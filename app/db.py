@@ -1,34 +1,78 @@
 import sqlite3
 import os
+from contextlib import contextmanager
 from pathlib import Path
+from app import config
+from app.migrations import apply_migrations, get_schema_version, latest_version
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows has no fcntl, migrate without the lock
+    fcntl = None
 
 DB_PATH = Path(os.getenv("DATABASE_PATH", "url_shortener.db"))
 
+# Schema changes live in app.migrations; this is the version init_db brings a database up to
+SCHEMA_VERSION = latest_version()
+
+# Journal modes DB_JOURNAL_MODE can switch a database to; both are stored in the file
+JOURNAL_MODES = ('delete', 'wal')
+
 def get_db_connection():
-    return sqlite3.connect(DB_PATH)
+    # Waits up to DB_BUSY_TIMEOUT seconds for another worker's lock before "database is locked"
+    return sqlite3.connect(DB_PATH, timeout=config.DB_BUSY_TIMEOUT)
+
+def page_cache_limit(conn):
+    """Most bytes of pages the connection's cache will hold (PRAGMA cache_size)"""
+    (cache_size,) = conn.execute("PRAGMA cache_size").fetchone()
+    if cache_size < 0:
+        return -cache_size * 1024  # negative sizes are in KiB
+    (page_size,) = conn.execute("PRAGMA page_size").fetchone()
+    return cache_size * page_size
+
+def _journal_mode_wanted(conn):
+    """The journal mode DB_JOURNAL_MODE asks for, or None if the database already uses it"""
+    wanted = config.DB_JOURNAL_MODE.strip().lower()
+    if not wanted:
+        return None
+    if wanted not in JOURNAL_MODES:
+        raise ValueError(f"DB_JOURNAL_MODE must be one of {', '.join(JOURNAL_MODES)}, got {wanted!r}")
+    (current,) = conn.execute("PRAGMA journal_mode").fetchone()
+    return None if current == wanted else wanted
+
+@contextmanager
+def migration_lock():
+    """
+    Hold an exclusive file lock next to the database while migrating,
+    so only one gunicorn worker runs the migration
+    """
+    if fcntl is None:
+        yield
+        return
+
+    with open(f"{DB_PATH}.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
 
 def init_db():
+    """
+    Make sure the database schema is current, and in DB_JOURNAL_MODE if set.
+    Every worker calls this on boot, so the common case is a single-row read
+    of schema_version - no table scans and no writes.
+    """
     with get_db_connection() as conn:
-        cursor = conn.cursor()
-        
-        # Create the table
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS urls (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            original_url TEXT NOT NULL,
-            short_url TEXT UNIQUE NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-        """)
-        
-        # Set the auto-increment to start at 10000
-        # Only do this if the table is empty (first time setup)
-        cursor.execute("SELECT COUNT(*) FROM urls")
-        count = cursor.fetchone()[0]
-        
-        if count == 0:  # Table is empty, set starting ID
-            cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('urls', 9999)")
-        
-        conn.commit()
-
-# added TIMESTAMP to initial set up for optional future use (expiry time for the links)
\ No newline at end of file
+        if get_schema_version(conn) >= SCHEMA_VERSION and _journal_mode_wanted(conn) is None:
+            return
+
+    with migration_lock():
+        with get_db_connection() as conn:
+            # Another worker may have finished the migration while we waited
+            apply_migrations(conn)
+            journal_mode = _journal_mode_wanted(conn)
+            if journal_mode is not None:
+                conn.execute(f"PRAGMA journal_mode={journal_mode}")
+
+# added TIMESTAMP to initial set up for optional future use (expiry time for the links)
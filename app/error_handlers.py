@@ -7,8 +7,8 @@ def handle_server_error(error, context=""):
     """
     Handle server errors consistently
     """
-    error_msg = str(error)
-    logger.error(f"Server error in {context}: {error_msg}")
+    # Formatted on the log writer's thread, not here
+    logger.error("Server error in %s: %s", context, error, exc_info=error)
     
     return jsonify({
         'error': f'Internal server error occurred{" " + context if context else ""}'
@@ -0,0 +1,163 @@
+"""
+Consistent hashing of the id space across app nodes.
+
+Ids are grouped into blocks of PARTITION_BLOCK_SIZE consecutive ids, and each
+block belongs to the node its number hashes to on a ring where every node
+sits at PARTITION_VNODES points. A short code decodes to its id, so the
+router finds a code's node without asking anyone. Adding a node to an N-node
+ring only moves the blocks that now land on its points, about 1/(N+1) of
+them. Every other block keeps its owner.
+
+Before changing the ring, `python -m app.hashring plan` shows how many ids
+would move and between which nodes.
+
+Each node has its own database. For the router to find a new link, the node
+that creates it must pick an id in one of its own blocks. With
+PARTITION_NODE set, claim_owned_id() moves the urls id sequence forward to
+the node's next block whenever the current one isn't its own. That happens
+inside the insert's transaction, so ids stay unique per node, and on
+average only every block_size / N inserts.
+
+When the ring changes, set PARTITION_ID_FLOOR on every node above the
+highest id issued so far. New ids then never land in a block that was partly
+filled under the old ring.
+"""
+import argparse
+import bisect
+import hashlib
+from collections import Counter
+from functools import lru_cache
+
+from app import config
+
+DEFAULT_VNODES = 160
+
+def _hash(value):
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+def parse_node_names(value):
+    """'a, b,c' -> ['a', 'b', 'c']"""
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+class HashRing:
+    """Maps keys to node names; nodes are placed by name, so a node can change address freely"""
+
+    def __init__(self, nodes=(), vnodes=DEFAULT_VNODES):
+        self.vnodes = vnodes
+        self._points = []  # sorted hashes
+        self._owners = []  # node at each point
+        self._nodes = set()
+        for node in nodes:
+            self.add(node)
+
+    @property
+    def nodes(self):
+        return sorted(self._nodes)
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def add(self, node):
+        if node in self._nodes:
+            return
+        self._nodes.add(node)
+        for replica in range(self.vnodes):
+            point = _hash(f"{node}#{replica}")
+            position = bisect.bisect(self._points, point)
+            self._points.insert(position, point)
+            self._owners.insert(position, node)
+
+    def remove(self, node):
+        if node not in self._nodes:
+            return
+        self._nodes.discard(node)
+        keep = [i for i, owner in enumerate(self._owners) if owner != node]
+        self._points = [self._points[i] for i in keep]
+        self._owners = [self._owners[i] for i in keep]
+
+    def node_for(self, key):
+        """The node owning key: the first point clockwise from the key's hash"""
+        if not self._points:
+            raise LookupError("The hash ring has no nodes")
+        position = bisect.bisect(self._points, _hash(str(key)))
+        return self._owners[position % len(self._owners)]
+
+def block_of(url_id, block_size):
+    return url_id // block_size
+
+def id_owner(ring, url_id, block_size):
+    """The node an id (and so its short code) lives on"""
+    return ring.node_for(block_of(url_id, block_size))
+
+def next_owned_id(ring, node, after_id, block_size):
+    """The smallest id greater than after_id in a block that node owns"""
+    if node not in ring.nodes:
+        raise LookupError(f"{node!r} is not on the hash ring")
+    candidate = after_id + 1
+    block = block_of(candidate, block_size)
+    while ring.node_for(block) != node:
+        block += 1
+        candidate = block * block_size
+    return candidate
+
+@lru_cache(maxsize=4)
+def _partition_ring(nodes, vnodes):
+    return HashRing(parse_node_names(nodes), vnodes)
+
+def partition_ring():
+    """This node's view of the ring, or None when it isn't partitioned"""
+    if not config.PARTITION_NODE:
+        return None
+    return _partition_ring(config.PARTITION_NODES, config.PARTITION_VNODES)
+
+def claim_owned_id(conn):
+    """
+    On a partitioned node, move the urls id sequence so the next insert gets an
+    id in one of this node's blocks. Call it in the insert's transaction, opened
+    with BEGIN IMMEDIATE: otherwise another worker can read the same sequence
+    value, and its insert lands after ours, possibly in another node's block
+    """
+    ring = partition_ring()
+    if ring is None:
+        return
+    (seq,) = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'urls'").fetchone()
+    after_id = max(seq, config.PARTITION_ID_FLOOR - 1)
+    next_id = next_owned_id(ring, config.PARTITION_NODE, after_id, config.PARTITION_BLOCK_SIZE)
+    if next_id != seq + 1:
+        conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'urls'", (next_id - 1,))
+
+def plan_moves(nodes, new_nodes, max_id, block_size, vnodes=DEFAULT_VNODES):
+    """Ids up to max_id that change owner between two rings, as Counter({(old, new): ids})"""
+    old_ring, new_ring = HashRing(nodes, vnodes), HashRing(new_nodes, vnodes)
+    moves = Counter()
+    for block in range(block_of(max_id, block_size) + 1):
+        old, new = old_ring.node_for(block), new_ring.node_for(block)
+        if old != new:
+            first, last = block * block_size, min(max_id, (block + 1) * block_size - 1)
+            moves[old, new] += last - first + 1
+    return moves
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m app.hashring",
+        description="Plan changes to the partitioning ring"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    plan = commands.add_parser("plan", help="ids that move when nodes are added or removed")
+    plan.add_argument("--nodes", default=config.PARTITION_NODES, help="current nodes, comma-separated")
+    plan.add_argument("--add", default="", help="nodes to add")
+    plan.add_argument("--remove", default="", help="nodes to remove")
+    plan.add_argument("--max-id", type=int, required=True, help="highest id issued so far")
+    args = parser.parse_args(argv)
+
+    nodes = parse_node_names(args.nodes)
+    removed = set(parse_node_names(args.remove))
+    new_nodes = [node for node in nodes if node not in removed] + parse_node_names(args.add)
+    moves = plan_moves(nodes, new_nodes, args.max_id, config.PARTITION_BLOCK_SIZE, config.PARTITION_VNODES)
+    for (old, new), ids in sorted(moves.items()):
+        print(f"{old} -> {new}: {ids} ids")
+    moved = sum(moves.values())
+    print(f"{moved} of {args.max_id + 1} ids move ({moved / (args.max_id + 1):.1%})")
+
+if __name__ == "__main__":
+    main()
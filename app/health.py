@@ -0,0 +1,96 @@
+"""
+Liveness and readiness probes.
+
+/healthz answers from memory only: if the worker can run a request, it's alive.
+/readyz also checks that the database answers a trivial query on a connection
+kept open per thread, that the schema is at the version this code expects and
+that the redirect cache warm-up has finished, and on a read replica that
+replication isn't lagging. Both are cheap enough to poll every second, and
+neither is rate limited (app.ratelimit only limits the endpoints it lists).
+"""
+import sqlite3
+import threading
+
+from flask import Response
+
+from app import config, db
+from app.error_handlers import create_success_response
+
+_local = threading.local()
+# Page cache ceiling of each thread's open probe connection, for memory accounting
+_probe_caches = {}
+
+def _probe_connection():
+    """This thread's probe connection, reopened if the database path changed"""
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.path != db.DB_PATH:
+        if conn is not None:
+            conn.close()
+        conn = _local.conn = sqlite3.connect(db.DB_PATH, timeout=1.0)
+        _local.path = db.DB_PATH
+        _probe_caches[threading.get_ident()] = db.page_cache_limit(conn)
+    return conn
+
+def _drop_probe_connection():
+    conn = getattr(_local, 'conn', None)
+    _local.conn = None
+    _probe_caches.pop(threading.get_ident(), None)
+    if conn is not None:
+        conn.close()
+
+def probe_connections_nbytes():
+    """Most bytes the open probe connections' page caches can hold"""
+    return sum(list(_probe_caches.values()))
+
+def check_database():
+    """Return (ok, detail) for the database and its schema version"""
+    try:
+        row = _probe_connection().execute("SELECT version FROM schema_version WHERE id = 1").fetchone()
+    except sqlite3.Error as e:
+        # Start from a fresh connection next time
+        _drop_probe_connection()
+        return False, f"error: {e}"
+
+    version = row[0] if row else 0
+    if version < db.SCHEMA_VERSION:
+        return False, f"schema version {version}, expected {db.SCHEMA_VERSION}"
+    return True, "ok"
+
+def check_cache_warmup(app):
+    warmup = app.extensions.get('cache_warmup')
+    if warmup is not None and not warmup.is_set():
+        return False, "in progress"
+    return True, "ok"
+
+def check_replication(app):
+    """Followers are ready once caught up, and while no more than REPLICATION_MAX_LAG behind"""
+    if app.extensions.get('follower') is None:
+        return True, "primary"
+    from app.replication import follower_status
+    try:
+        lag = follower_status()['lag_seconds']
+    except Exception as e:
+        return False, f"error: {e}"
+    if lag is None:
+        return False, "not caught up yet"
+    if lag > config.REPLICATION_MAX_LAG:
+        return False, f"{lag:.0f}s behind"
+    return True, "ok"
+
+def register_health_routes(app):
+    """Register /healthz and /readyz"""
+
+    @app.route('/healthz', methods=['GET'])
+    def healthz():
+        return Response('ok', mimetype='text/plain')
+
+    @app.route('/readyz', methods=['GET'])
+    def readyz():
+        database_ok, database = check_database()
+        warmup_ok, warmup = check_cache_warmup(app)
+        replication_ok, replication = check_replication(app)
+        ready = database_ok and warmup_ok and replication_ok
+        return create_success_response({
+            'status': 'ready' if ready else 'not ready',
+            'checks': {'database': database, 'cache_warmup': warmup, 'replication': replication},
+        }, 200 if ready else 503)
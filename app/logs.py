@@ -0,0 +1,232 @@
+"""
+Structured logging that keeps log I/O off request threads.
+
+setup_logging() puts one LogQueueHandler on the root logger. On the thread
+that logs, the handler tags the record with the current request id, drops
+repeats of a noisy warning or error (see SamplingFilter), fills in the
+message and renders any traceback to text, and puts a copy of the record on
+a bounded queue. The queued copy holds no args or exception, so it doesn't
+keep the caller's objects or stack frames alive while it waits. A
+QueueListener thread formats the records as one JSON object per line
+(LOG_FORMAT=json) or as plain text, and writes them to stderr. When the
+queue is full, records are dropped and counted, so a slow stderr never
+blocks a worker.
+
+Every request gets an id: the caller's X-Request-ID if it looks sane,
+otherwise a new one. It is echoed back in the response and appears on every
+log line written while handling the request.
+"""
+import atexit
+import contextvars
+import copy
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import re
+import sys
+import threading
+import time
+import uuid
+
+from flask import request
+
+from app import config
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+_REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._:-]{1,128}$')
+MAX_SAMPLED_KEYS = 10000
+# A queued record with its message and request id, for memory accounting
+QUEUED_RECORD_BYTES = 500
+
+request_id_var = contextvars.ContextVar('request_id', default=None)
+
+# Attributes every LogRecord has; anything else was passed with extra= and is written out
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+_TRACEBACK_FORMATTER = logging.Formatter()
+
+def current_request_id():
+    return request_id_var.get()
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: ts, level, logger, message, request_id, plus any extra fields"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc)
+                  .isoformat(timespec='milliseconds').replace('+00:00', 'Z'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s')
+
+    def format(self, record):
+        if getattr(record, 'request_id', None) is None:
+            record.request_id = '-'
+        line = super().format(record)
+        suppressed = getattr(record, 'suppressed', None)
+        return f"{line} ({suppressed} similar suppressed)" if suppressed else line
+
+class RequestIdFilter(logging.Filter):
+    """Tags records with the id of the request being handled on this thread"""
+
+    def filter(self, record):
+        if getattr(record, 'request_id', None) is None:
+            record.request_id = request_id_var.get()
+        return True
+
+class SamplingFilter(logging.Filter):
+    """
+    Lets through the first `burst` records per `window` seconds for each kind of
+    warning or error (logger, level, message template, exception type). The
+    next one let through after the window reports how many were suppressed.
+    Lower levels always pass
+    """
+
+    def __init__(self, burst=10, window=60.0, level=logging.WARNING, clock=time.monotonic):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self.level = level
+        self._clock = clock
+        self._seen = {}  # key -> [window start, passed, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno < self.level or self.burst <= 0:
+            return True
+        exc_type = record.exc_info[0].__name__ if record.exc_info and record.exc_info[0] else None
+        key = (record.name, record.levelno, str(record.msg), exc_type)
+        now = self._clock()
+        with self._lock:
+            entry = self._seen.get(key)
+            if entry is None or now - entry[0] >= self.window:
+                if entry is None and len(self._seen) >= MAX_SAMPLED_KEYS:
+                    self._seen.clear()
+                if entry is not None and entry[2]:
+                    record.suppressed = entry[2]
+                self._seen[key] = [now, 1, 0]
+                return True
+            if entry[1] < self.burst:
+                entry[1] += 1
+                return True
+            entry[2] += 1
+            return False
+
+class LogQueueHandler(logging.handlers.QueueHandler):
+    """Enqueues records with their message and traceback as text; the listener thread formats the line"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Like QueueHandler.prepare, but the traceback stays apart from the message for JsonFormatter
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _TRACEBACK_FORMATTER.formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class LogWriter:
+    """The queue handler on the root logger and the thread writing its records out"""
+
+    def __init__(self, stream=None, fmt='json', level='INFO', queue_size=10000, burst=10, window=60.0):
+        output = logging.StreamHandler(stream or sys.stderr)
+        output.setFormatter(JsonFormatter() if fmt == 'json' else TextFormatter())
+        self.handler = LogQueueHandler(queue.Queue(maxsize=queue_size))
+        self.handler.addFilter(RequestIdFilter())
+        self.handler.addFilter(SamplingFilter(burst, window))
+        self.level = level
+        self.listener = logging.handlers.QueueListener(self.handler.queue, output)
+        self._closed = False
+
+    @property
+    def dropped(self):
+        return self.handler.dropped
+
+    def nbytes(self):
+        """Approximate bytes held by records waiting to be written"""
+        return self.handler.queue.qsize() * QUEUED_RECORD_BYTES
+
+    def install(self, logger=None):
+        logger = logger or logging.getLogger()
+        logger.addHandler(self.handler)
+        logger.setLevel(self.level)
+        self.listener.start()
+        return self
+
+    def close(self, logger=None):
+        """Stop taking records and write out the ones still queued"""
+        if self._closed:
+            return
+        self._closed = True
+        (logger or logging.getLogger()).removeHandler(self.handler)
+        self.listener.stop()
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def _new_request_id():
+    supplied = request.headers.get(REQUEST_ID_HEADER, '')
+    return supplied if _REQUEST_ID_PATTERN.match(supplied) else uuid.uuid4().hex
+
+def setup_logging(app):
+    """
+    Route this process's logging through one LogWriter (created on first call)
+    and give each of the app's requests an id. Stored in app.extensions['logging']
+    """
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = LogWriter(
+                fmt=config.LOG_FORMAT,
+                level=config.LOG_LEVEL.upper(),
+                queue_size=config.LOG_QUEUE_SIZE,
+                burst=config.LOG_SAMPLE_BURST,
+                window=config.LOG_SAMPLE_WINDOW,
+            ).install()
+            atexit.register(_writer.close)
+    app.extensions['logging'] = _writer
+
+    @app.before_request
+    def assign_request_id():
+        request_id = _new_request_id()
+        request.environ['app.request_id_token'] = request_id_var.set(request_id)
+
+    @app.after_request
+    def echo_request_id(response):
+        request_id = request_id_var.get()
+        if request_id is not None:
+            response.headers[REQUEST_ID_HEADER] = request_id
+        return response
+
+    @app.teardown_request
+    def clear_request_id(exc):
+        token = request.environ.pop('app.request_id_token', None)
+        if token is not None:
+            request_id_var.reset(token)
+
+    return _writer
@@ -0,0 +1,176 @@
+"""
+Memory accounting for the caches and buffers each worker holds.
+
+Every structure that grows with traffic registers how to measure itself and,
+if it can, how to shrink. The redirect cache and the click buffers keep a
+running byte estimate as entries come and go, so reading one costs nothing.
+The log queue and the health probes' SQLite page caches are estimated from
+their length and PRAGMA cache_size. The estimates count Python object
+overhead, not just the bytes of the strings, so they're close to what the
+worker really holds, but they are still estimates.
+
+Every MEMORY_CHECK_INTERVAL seconds a background thread checks the caps. A
+structure over its own cap is trimmed to it: the redirect cache evicts its
+least recently used entries, and a click buffer is written out early. If the
+total is over MEMORY_CAP_MB, the largest trimmable structures are trimmed
+first until it isn't. The log queue is already bounded by LOG_QUEUE_SIZE,
+and another thread's probe connection can't be touched, so those two are
+counted but never trimmed.
+
+GET /debug/memory (admin token) reports each structure's bytes, cap and
+trims, and the worker's peak RSS to compare against.
+"""
+import atexit
+import logging
+import sys
+import threading
+
+from app import config
+from app.auth import admin_required
+from app.error_handlers import create_success_response
+from app.health import probe_connections_nbytes
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - no peak RSS on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+class _Structure:
+    __slots__ = ('nbytes', 'trim', 'cap', 'trims', 'trimmed_bytes')
+
+    def __init__(self, nbytes, trim, cap):
+        self.nbytes = nbytes
+        self.trim = trim
+        self.cap = cap
+        self.trims = 0
+        self.trimmed_bytes = 0
+
+def peak_rss():
+    """The worker's peak resident set size in bytes, or None where it isn't available"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+class MemoryAccounting:
+    """Byte estimates for registered structures, kept under their caps by a background check"""
+
+    def __init__(self, total_cap=0, interval=1.0):
+        self.total_cap = total_cap
+        self.interval = interval
+        self._structures = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="memory-accounting", daemon=True)
+        if interval > 0:
+            self._thread.start()
+
+    def register(self, name, nbytes, trim=None, cap=0):
+        """
+        Account for a structure: nbytes() returns its size, trim(max_bytes)
+        shrinks it to at most that if it can. cap is its own limit in bytes (0 for none)
+        """
+        with self._lock:
+            self._structures[name] = _Structure(nbytes, trim, cap)
+
+    def usage(self):
+        """Bytes, cap and trims per structure, plus totals"""
+        with self._lock:
+            structures = dict(self._structures)
+        report = {
+            name: {
+                'bytes': structure.nbytes(),
+                'cap': structure.cap or None,
+                'trimmable': structure.trim is not None,
+                'trims': structure.trims,
+                'trimmed_bytes': structure.trimmed_bytes,
+            }
+            for name, structure in structures.items()
+        }
+        return {
+            'total_bytes': sum(entry['bytes'] for entry in report.values()),
+            'total_cap': self.total_cap or None,
+            'peak_rss_bytes': peak_rss(),
+            'structures': report,
+        }
+
+    def _trim(self, name, structure, size, max_bytes):
+        structure.trim(max_bytes)
+        trimmed = structure.nbytes()
+        structure.trims += 1
+        structure.trimmed_bytes += max(0, size - trimmed)
+        logger.info("Trimmed %s from %d to %d bytes (limit %d)", name, size, trimmed, max_bytes)
+        return trimmed
+
+    def enforce(self):
+        """Trim whatever is over its cap, then the largest structures while over the total cap"""
+        with self._lock:
+            structures = dict(self._structures)
+        sizes = {name: structure.nbytes() for name, structure in structures.items()}
+
+        for name, structure in structures.items():
+            if structure.trim is not None and structure.cap and sizes[name] > structure.cap:
+                sizes[name] = self._trim(name, structure, sizes[name], structure.cap)
+
+        if not self.total_cap:
+            return sizes
+        excess = sum(sizes.values()) - self.total_cap
+        for name in sorted(structures, key=sizes.get, reverse=True):
+            if excess <= 0:
+                break
+            structure = structures[name]
+            if structure.trim is None or not sizes[name]:
+                continue
+            size = sizes[name]
+            sizes[name] = self._trim(name, structure, size, max(0, size - excess))
+            excess -= size - sizes[name]
+        if excess > 0:
+            logger.warning("Still %d bytes over MEMORY_CAP_MB after trimming", excess)
+        return sizes
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.enforce()
+            except Exception:
+                logger.exception("Memory accounting check failed")
+
+    def close(self):
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+def start_memory_accounting(app):
+    """
+    Account for this app's caches and buffers and serve GET /debug/memory.
+    Call it after they've been set up; stored in app.extensions['memory']
+    """
+    accounting = MemoryAccounting(int(config.MEMORY_CAP_MB * MB), config.MEMORY_CHECK_INTERVAL)
+    caps = {
+        'redirect_cache': config.MEMORY_CAP_REDIRECT_CACHE_MB,
+        'click_log': config.MEMORY_CAP_CLICK_LOG_MB,
+        'click_counter': config.MEMORY_CAP_CLICK_COUNTER_MB,
+    }
+    for name, cap in caps.items():
+        structure = app.extensions.get(name)
+        if structure is not None:
+            accounting.register(name, structure.nbytes, structure.trim, int(cap * MB))
+    log_writer = app.extensions.get('logging')
+    if log_writer is not None:
+        accounting.register('log_queue', log_writer.nbytes)
+    accounting.register('probe_page_cache', probe_connections_nbytes)
+    app.extensions['memory'] = accounting
+    atexit.register(accounting.close)
+
+    #GET /debug/memory - what this worker's caches and buffers hold, against their caps
+    @app.route('/debug/memory', methods=['GET'])
+    @admin_required
+    def debug_memory():
+        return create_success_response(accounting.usage())
+
+    return accounting
@@ -0,0 +1,461 @@
+"""
+Versioned schema migrations and batched backfills.
+
+Migrations are small, ordered schema changes (version, description, function).
+Each one runs in its own transaction together with the schema_version bump, so a
+crash never leaves a half-applied version behind.
+
+Anything that has to touch every row of `urls` (filling a new column, rewriting
+values) is a backfill instead: it runs in resumable batches of N ids, each batch
+in its own short write transaction, with a sleep between batches so redirects
+and shortens keep getting the database. Progress is kept in backfill_progress,
+so a backfill can be stopped and resumed at any time.
+
+An index over all of `urls` can't be built in batches, and building it inside
+a migration would hold the write lock on every worker's boot until it's done.
+Such indexes are deferred: a migration only creates them on an empty table,
+where that's free. Otherwise `index NAME` builds them at a time of the
+operator's choosing, and the code using them works (more slowly) until then.
+
+Usage:
+    python -m app.migrations status
+    python -m app.migrations upgrade [--to VERSION]
+    python -m app.migrations backfill NAME [--batch-size 1000] [--sleep 0.05]
+    python -m app.migrations index NAME
+"""
+import argparse
+import sqlite3
+import time
+from collections import namedtuple
+
+Migration = namedtuple('Migration', ['version', 'description', 'apply', 'backfills'])
+Backfill = namedtuple('Backfill', ['name', 'description', 'apply'])
+Index = namedtuple('Index', ['name', 'description', 'sql'])
+
+MIGRATIONS = []
+BACKFILLS = {}
+INDEXES = {}
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_SLEEP = 0.05
+
+def migration(version, description, backfills=()):
+    """Register a schema migration; backfills lists backfills it schedules"""
+    def register(func):
+        MIGRATIONS.append(Migration(version, description, func, tuple(backfills)))
+        MIGRATIONS.sort(key=lambda m: m.version)
+        return func
+    return register
+
+def backfill(name, description):
+    """
+    Register a backfill. The function is called as func(conn, after_id, last_id)
+    and must process the urls rows with after_id < id <= last_id
+    """
+    def register(func):
+        BACKFILLS[name] = Backfill(name, description, func)
+        return func
+    return register
+
+def deferred_index(name, description, sql):
+    """Register an index that is built out of band with `index NAME` (sql: CREATE INDEX IF NOT EXISTS ...)"""
+    INDEXES[name] = Index(name, description, sql)
+
+def index_exists(conn, name):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (name,)
+    ).fetchone() is not None
+
+def build_index(conn, name):
+    """Build a deferred index unless it already exists; returns True if it was built"""
+    if index_exists(conn, name):
+        return False
+    conn.execute(INDEXES[name].sql)
+    return True
+
+def _build_index_if_empty(conn, name):
+    """In a migration: build a deferred index now if urls is empty, else leave it to `index NAME`"""
+    if conn.execute("SELECT 1 FROM urls LIMIT 1").fetchone() is None:
+        build_index(conn, name)
+
+def latest_version():
+    return MIGRATIONS[-1].version if MIGRATIONS else 0
+
+def get_schema_version(conn):
+    """Return the schema version recorded in the database (0 if never initialised)"""
+    try:
+        row = conn.execute("SELECT version FROM schema_version WHERE id = 1").fetchone()
+    except sqlite3.OperationalError:
+        # schema_version table doesn't exist yet
+        return 0
+    return row[0] if row else 0
+
+def pending_migrations(conn, target=None):
+    current = get_schema_version(conn)
+    target = latest_version() if target is None else target
+    return [m for m in MIGRATIONS if current < m.version <= target]
+
+def apply_migrations(conn, target=None):
+    """Apply every pending migration up to target (default: latest), returning them"""
+    applied = []
+    for m in pending_migrations(conn, target):
+        conn.execute("BEGIN")
+        try:
+            m.apply(conn)
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER NOT NULL
+            )
+            """)
+            conn.execute(
+                "INSERT OR REPLACE INTO schema_version (id, version) VALUES (1, ?)",
+                (m.version,)
+            )
+            for name in m.backfills:
+                conn.execute(
+                    "INSERT OR IGNORE INTO backfill_progress (name) VALUES (?)", (name,)
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(m)
+    return applied
+
+def get_backfill_progress(conn, name):
+    """Return (last_id, completed) for a backfill, or None if it was never scheduled"""
+    try:
+        row = conn.execute(
+            "SELECT last_id, completed FROM backfill_progress WHERE name = ?", (name,)
+        ).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return (row[0], bool(row[1])) if row else None
+
+def run_backfill(conn, name, batch_size=DEFAULT_BATCH_SIZE, sleep=DEFAULT_SLEEP,
+                 max_batches=None, on_batch=None):
+    """
+    Run (or resume) a backfill in batches of batch_size ids.
+    Returns the number of batches processed in this call; stops early after
+    max_batches so callers can spread a backfill over several runs.
+    """
+    step = BACKFILLS[name].apply
+    conn.execute("INSERT OR IGNORE INTO backfill_progress (name) VALUES (?)", (name,))
+    conn.commit()
+
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        # Take the write lock up front so the batch never has to upgrade a read lock
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            after_id, completed = conn.execute(
+                "SELECT last_id, completed FROM backfill_progress WHERE name = ?", (name,)
+            ).fetchone()
+            if completed:
+                conn.rollback()
+                break
+
+            last_id = conn.execute(
+                "SELECT MAX(id) FROM (SELECT id FROM urls WHERE id > ? ORDER BY id LIMIT ?)",
+                (after_id, batch_size)
+            ).fetchone()[0]
+
+            if last_id is None:
+                conn.execute(
+                    "UPDATE backfill_progress SET completed = 1, updated_at = CURRENT_TIMESTAMP WHERE name = ?",
+                    (name,)
+                )
+                conn.commit()
+                break
+
+            step(conn, after_id, last_id)
+            conn.execute(
+                "UPDATE backfill_progress SET last_id = ?, updated_at = CURRENT_TIMESTAMP WHERE name = ?",
+                (last_id, name)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        batches += 1
+        if on_batch:
+            on_batch(name, last_id)
+        if sleep:
+            time.sleep(sleep)
+
+    return batches
+
+
+@migration(1, "create urls table")
+def _create_urls(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS urls (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        original_url TEXT NOT NULL,
+        short_url TEXT UNIQUE NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
+    # Set the auto-increment to start at 10000
+    # Only do this on first time setup - sqlite_sequence gets a 'urls' row as soon as
+    # the sequence is seeded or the first row is inserted, so this avoids a COUNT(*) scan
+    row = conn.execute("SELECT 1 FROM sqlite_sequence WHERE name = 'urls'").fetchone()
+    if row is None:
+        conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('urls', 9999)")
+
+@migration(2, "create backfill_progress table")
+def _create_backfill_progress(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS backfill_progress (
+        name TEXT PRIMARY KEY,
+        last_id INTEGER NOT NULL DEFAULT 0,
+        completed INTEGER NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
+@migration(3, "create url_dictionaries table for compressed original_url storage")
+def _create_url_dictionaries(conn):
+    from app.urlcodec import DEFAULT_DICTIONARY
+
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS url_dictionaries (
+        id INTEGER PRIMARY KEY,
+        data BLOB NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    conn.execute("INSERT OR IGNORE INTO url_dictionaries (id, data) VALUES (1, ?)", (DEFAULT_DICTIONARY,))
+
+# Not scheduled by a migration: compression is opt-in, so this only runs when asked to
+@backfill("compress_original_url", "compress plain-text original_url values with the newest dictionary")
+def _compress_original_url(conn, after_id, last_id):
+    from app.urlcodec import active_codec
+
+    codec = active_codec(conn)
+    rows = conn.execute(
+        "SELECT id, original_url FROM urls WHERE id > ? AND id <= ? AND typeof(original_url) = 'text'",
+        (after_id, last_id)
+    ).fetchall()
+    updates = []
+    for url_id, original_url in rows:
+        value = codec.compress(original_url)
+        if value is not original_url:
+            updates.append((value, url_id))
+    conn.executemany("UPDATE urls SET original_url = ? WHERE id = ?", updates)
+
+deferred_index(
+    "idx_urls_created_at", "urls by creation time, for /links date filters",
+    "CREATE INDEX IF NOT EXISTS idx_urls_created_at ON urls (created_at)"
+)
+# Partial: rows waiting for the fill_url_host backfill don't take up index space
+deferred_index(
+    "idx_urls_host", "urls by host, for /links domain filters",
+    "CREATE INDEX IF NOT EXISTS idx_urls_host ON urls (host, id) WHERE host IS NOT NULL"
+)
+
+@migration(4, "add urls.host and indexes for listing links by domain and date", backfills=["fill_url_host"])
+def _add_host_and_listing_indexes(conn):
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(urls)")]
+    if 'host' not in columns:
+        conn.execute("ALTER TABLE urls ADD COLUMN host TEXT")
+    # Building either index reads every row of an existing table, even the partial
+    # one (to check its WHERE), so only a new database gets them during boot; see `index`
+    _build_index_if_empty(conn, "idx_urls_host")
+    _build_index_if_empty(conn, "idx_urls_created_at")
+
+@backfill("fill_url_host", "set urls.host from original_url for rows created before it existed")
+def _fill_url_host(conn, after_id, last_id):
+    from app.urlcodec import decode_url
+    from app.validators import url_host
+
+    rows = conn.execute(
+        "SELECT id, original_url FROM urls WHERE id > ? AND id <= ? AND host IS NULL",
+        (after_id, last_id)
+    ).fetchall()
+    conn.executemany(
+        "UPDATE urls SET host = ? WHERE id = ?",
+        [(url_host(decode_url(conn, original_url)), url_id) for url_id, original_url in rows]
+    )
+
+@migration(5, "create domain_stats with per-domain link counters kept by triggers")
+def _create_domain_stats(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS domain_stats (
+        host TEXT PRIMARY KEY,
+        link_count INTEGER NOT NULL DEFAULT 0,
+        click_count INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+    # Top-N by either counter is then an index walk of N entries
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_domain_stats_links ON domain_stats (link_count DESC)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_domain_stats_clicks ON domain_stats (click_count DESC)")
+
+    # Counted in the same transaction as the write to urls, whichever code path makes it
+    # (inserts, the fill_url_host backfill, manual fixes)
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS urls_host_insert AFTER INSERT ON urls
+    WHEN NEW.host IS NOT NULL
+    BEGIN
+        INSERT INTO domain_stats (host, link_count) VALUES (NEW.host, 1)
+        ON CONFLICT (host) DO UPDATE SET link_count = link_count + 1;
+    END
+    """)
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS urls_host_update AFTER UPDATE OF host ON urls
+    WHEN OLD.host IS NOT NEW.host
+    BEGIN
+        UPDATE domain_stats SET link_count = link_count - 1 WHERE host = OLD.host;
+        INSERT INTO domain_stats (host, link_count) SELECT NEW.host, 1 WHERE NEW.host IS NOT NULL
+        ON CONFLICT (host) DO UPDATE SET link_count = link_count + 1;
+    END
+    """)
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS urls_host_delete AFTER DELETE ON urls
+    WHEN OLD.host IS NOT NULL
+    BEGIN
+        UPDATE domain_stats SET link_count = link_count - 1 WHERE host = OLD.host;
+    END
+    """)
+
+    # Count rows that already have a host (one pass over idx_urls_host if it's built)
+    conn.execute("""
+    INSERT OR REPLACE INTO domain_stats (host, link_count, click_count)
+    SELECT host, COUNT(*), COALESCE((SELECT click_count FROM domain_stats d WHERE d.host = urls.host), 0)
+    FROM urls WHERE host IS NOT NULL GROUP BY host
+    """)
+
+
+@migration(6, "create the replication changelog and follower state")
+def _create_changelog(conn):
+    # One entry per write to urls while REPLICATION_CHANGELOG is on; app.replication
+    # installs the triggers that fill it. The row itself is read from urls when the
+    # change is shipped, so an entry costs a sequence number, an id and the time it
+    # was logged (for pruning)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS changelog (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        url_id INTEGER NOT NULL,
+        created_at INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
+    )
+    """)
+
+    # On a follower: how far it has applied the primary's changelog
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS replication_state (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        applied_seq INTEGER NOT NULL,
+        primary_seq INTEGER NOT NULL,
+        caught_up_at REAL,
+        synced_at REAL,
+        primary_max_id INTEGER
+    )
+    """)
+
+# Scheduled when the changelog is switched on (app.replication.enable_changelog), not by a migration
+@backfill("seed_changelog", "log rows written before the changelog was on, so followers copy them")
+def _seed_changelog(conn, after_id, last_id):
+    conn.execute(
+        "INSERT INTO changelog (url_id) SELECT id FROM urls WHERE id > ? AND id <= ? ORDER BY id",
+        (after_id, last_id)
+    )
+
+@migration(7, "add urls.short_domain, the short domain namespace a link was created in")
+def _add_short_domain(conn):
+    # 0 is the canonical short domain; adding a column with a constant default doesn't rewrite rows
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(urls)")]
+    if 'short_domain' not in columns:
+        conn.execute("ALTER TABLE urls ADD COLUMN short_domain INTEGER NOT NULL DEFAULT 0")
+
+@migration(8, "count deletes from urls, so incremental exports know when rows they copied are gone")
+def _count_url_deletes(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS url_deletes (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        count INTEGER NOT NULL
+    )
+    """)
+    conn.execute("INSERT OR IGNORE INTO url_deletes (id, count) VALUES (1, 0)")
+    # Deletes are rare (admin fixes, replicated deletes), so one shared counter row is fine
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS urls_count_delete AFTER DELETE ON urls
+    BEGIN
+        UPDATE url_deletes SET count = count + 1 WHERE id = 1;
+    END
+    """)
+
+
+def _print_status(conn):
+    current = get_schema_version(conn)
+    print(f"schema version: {current} (latest {latest_version()})")
+    for m in MIGRATIONS:
+        state = "applied" if m.version <= current else "pending"
+        print(f"  {m.version:>3}  {state:<8} {m.description}")
+
+    for name, bf in sorted(BACKFILLS.items()):
+        progress = get_backfill_progress(conn, name)
+        if progress is None:
+            state = "not scheduled"
+        elif progress[1]:
+            state = "complete"
+        else:
+            state = f"in progress (last id {progress[0]})"
+        print(f"  backfill {name}: {state} - {bf.description}")
+
+    for name, index in sorted(INDEXES.items()):
+        state = "built" if index_exists(conn, name) else f"not built (python -m app.migrations index {name})"
+        print(f"  index {name}: {state} - {index.description}")
+
+def main(argv=None):
+    from app.db import get_db_connection, migration_lock
+
+    parser = argparse.ArgumentParser(
+        prog="python -m app.migrations",
+        description="Apply schema migrations and run batched backfills"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status", help="show schema version and backfill progress")
+    upgrade = commands.add_parser("upgrade", help="apply pending migrations")
+    upgrade.add_argument("--to", type=int, default=None, help="target version (default: latest)")
+    run = commands.add_parser("backfill", help="run or resume a backfill")
+    run.add_argument("name", choices=sorted(BACKFILLS))
+    run.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    run.add_argument("--sleep", type=float, default=DEFAULT_SLEEP, help="seconds to pause between batches")
+    run.add_argument("--max-batches", type=int, default=None)
+    index = commands.add_parser("index", help="build a deferred index (holds the write lock while it runs)")
+    index.add_argument("name", choices=sorted(INDEXES))
+    args = parser.parse_args(argv)
+
+    if args.command == "status":
+        with get_db_connection() as conn:
+            _print_status(conn)
+
+    elif args.command == "upgrade":
+        with migration_lock():
+            with get_db_connection() as conn:
+                applied = apply_migrations(conn, args.to)
+        for m in applied:
+            print(f"applied {m.version}: {m.description}")
+        if not applied:
+            print("schema is up to date")
+
+    elif args.command == "backfill":
+        def on_batch(name, last_id):
+            print(f"{name}: processed up to id {last_id}", flush=True)
+
+        with get_db_connection() as conn:
+            batches = run_backfill(conn, args.name, args.batch_size, args.sleep,
+                                   args.max_batches, on_batch)
+            progress = get_backfill_progress(conn, args.name)
+        print(f"{args.name}: {batches} batches, {'complete' if progress[1] else 'incomplete'}")
+
+    elif args.command == "index":
+        with get_db_connection() as conn:
+            built = build_index(conn, args.name)
+        print(f"{args.name}: {'built' if built else 'already built'}")
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,37 @@
-from app.shortener import generate_short_url
+import logging
+
+from app import config
+from app.shortener import generate_short_url, decode_short_url
 from app.db import get_db_connection
+from app.hashring import claim_owned_id
+from app.migrations import index_exists
+from app.shortdomains import CANONICAL, cache_key
+from app.urlcodec import encode_url, decode_url
+from app.validators import url_host, split_url
+
+logger = logging.getLogger(__name__)
+
+# Set by app.writer.start_group_commit when group commit is enabled
+group_commit_writer = None
 
 class Url:
-    def __init__(self, id, original_url, short_url):
+    def __init__(self, id, original_url, short_url, short_domain=CANONICAL):
         self.id = id
         self.original_url = original_url
         self.short_url = short_url
+        self.short_domain = short_domain
 
 # When a user inputs a long URL, save the long URL to the database,
 # generate a short URL, and return the short URL to the user.
 # does not check for existing URLs in the database in order to allow the user to create multiple short URLs for the same long URL.
 # this would allow the user to track metrics for each short URL separately such as click counts or expiry times
-def get_short_url(original_url):
-    new_id = save_url_to_db(Url(None, original_url, None))
+# short_domain is the key of the short domain's code namespace (app/shortdomains.py)
+def get_short_url(original_url, short_domain=CANONICAL):
+    if group_commit_writer is not None:
+        # Group commit mode: the background writer batches this insert with others
+        return group_commit_writer.shorten(original_url, short_domain)
+
+    new_id = save_url_to_db(Url(None, original_url, None, short_domain))
     short_url = generate_short_url(new_id)
     update_short_url_in_db(new_id, short_url) 
     return short_url
@@ -20,9 +39,12 @@ def get_short_url(original_url):
 def save_url_to_db(url):
     with get_db_connection() as conn:
         cursor = conn.cursor()
+        # Take the write lock before claim_owned_id reads the id sequence
+        conn.execute("BEGIN IMMEDIATE")
+        claim_owned_id(conn)
         cursor.execute(
-            "INSERT INTO urls (original_url) VALUES (?)",
-            (url.original_url,)  
+            "INSERT INTO urls (original_url, host, short_domain) VALUES (?, ?, ?)",
+            (encode_url(conn, url.original_url), url_host(url.original_url), url.short_domain)
         )
         url_id = cursor.lastrowid
         conn.commit()
@@ -38,10 +60,280 @@ def update_short_url_in_db(url_id, short_url):
         )
         conn.commit()
 
-def find_original_url(short_url):
-    """Find the original URL by short_url - needed for redirects"""
+def insert_urls(conn, original_urls, short_domains=None):
+    """
+    Insert several URLs and assign their short URLs on the caller's connection,
+    without committing - used to write a whole batch in one transaction.
+    short_domains gives each URL's short domain key (all canonical by default)
+    """
+    cursor = conn.cursor()
+    short_urls = []
+    if short_domains is None:
+        short_domains = [CANONICAL] * len(original_urls)
+    if not conn.in_transaction:
+        # Take the write lock before claim_owned_id reads the id sequence
+        conn.execute("BEGIN IMMEDIATE")
+    for original_url, short_domain in zip(original_urls, short_domains):
+        claim_owned_id(conn)
+        cursor.execute(
+            "INSERT INTO urls (original_url, host, short_domain) VALUES (?, ?, ?)",
+            (encode_url(conn, original_url), url_host(original_url), short_domain)
+        )
+        url_id = cursor.lastrowid
+        short_url = generate_short_url(url_id)
+        cursor.execute("UPDATE urls SET short_url = ? WHERE id = ?", (short_url, url_id))
+        short_urls.append(short_url)
+    return short_urls
+
+def find_original_url(short_url, short_domain=None):
+    """
+    Find the original URL by short_url - needed for redirects. With short_domain,
+    only a link created for that short domain is found
+    """
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("SELECT original_url FROM urls WHERE short_url = ?", (short_url,))
+        if short_domain is None:
+            cursor.execute("SELECT original_url FROM urls WHERE short_url = ?", (short_url,))
+        else:
+            cursor.execute("SELECT original_url FROM urls WHERE short_url = ? AND short_domain = ?",
+                           (short_url, short_domain))
         row = cursor.fetchone()
-        return row[0] if row else None
\ No newline at end of file
+        return decode_url(conn, row[0]) if row else None
+
+# Largest id SQLite can store; longer codes decode past it and can't exist
+MAX_ROW_ID = 2**63 - 1
+
+def find_original_urls(short_urls, chunk_size=500):
+    """
+    Look up many short URLs at once; returns {short_url: original_url} for the
+    ones that exist on the canonical short domain. Codes are decoded to their
+    ids and read by primary key, one `id IN (...)` query per chunk_size codes
+    """
+    ids = set()
+    for short_url in short_urls:
+        try:
+            url_id = decode_short_url(short_url)
+        except ValueError:
+            continue  # not base62, or outside the code scheme's range
+        if 0 < url_id <= MAX_ROW_ID:
+            ids.add(url_id)
+    if not ids:
+        return {}
+
+    wanted = set(short_urls)
+    found = {}
+    ids = sorted(ids)
+    with get_db_connection() as conn:
+        for start in range(0, len(ids), chunk_size):
+            chunk = ids[start:start + chunk_size]
+            rows = conn.execute(
+                f"SELECT short_url, original_url FROM urls "
+                f"WHERE id IN ({','.join('?' * len(chunk))}) AND short_domain = ?",
+                chunk + [CANONICAL]
+            )
+            for short_url, original_url in rows:
+                # '0abc' decodes to the same id as 'abc' but only 'abc' was issued
+                if short_url in wanted:
+                    found[short_url] = decode_url(conn, original_url)
+    return found
+
+def _most_clicked_urls(limit, chunk_size):
+    """{short_url: original_url} for the most clicked canonical codes, in click order ({} without click data)"""
+    if not config.CLICK_LOG_ENABLED:
+        return {}
+    import datetime
+    from app.clicklog import top_codes
+
+    since = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=config.CACHE_WARMUP_CLICK_DAYS)
+    try:
+        codes = [code for code, _ in top_codes(limit, since=since)]
+    except Exception:
+        # Recency is still a fair guess
+        logger.exception("Couldn't rank warm-up links by clicks")
+        return {}
+    # The click log has the code only, so rank just the canonical short domain's links
+    found = find_original_urls(codes, chunk_size)
+    return {code: found[code] for code in codes if code in found}
+
+def iter_warmup_urls(limit, chunk_size=500):
+    """
+    Yield (cache key, original_url) pairs worth preloading into the redirect
+    cache, best first: with the click log on, the links clicked most over the
+    last CACHE_WARMUP_CLICK_DAYS days, then the most recently created links
+    from one bulk query. The key is the short_url, tagged with its short
+    domain if not the canonical one
+    """
+    clicked = _most_clicked_urls(limit, chunk_size)
+    yield from clicked.items()
+    remaining = limit - len(clicked)
+    if remaining <= 0:
+        return
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT short_url, original_url, short_domain FROM urls "
+            "WHERE short_url IS NOT NULL ORDER BY id DESC LIMIT ?",
+            (remaining + len(clicked),)  # some of them may have been yielded already
+        )
+        while remaining > 0:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for short_url, original_url, short_domain in rows:
+                key = cache_key(short_url, short_domain)
+                if key in clicked:
+                    continue
+                yield key, decode_url(conn, original_url)
+                remaining -= 1
+                if remaining <= 0:
+                    break
+
+def _first_id_created_from(conn, moment):
+    """Lowest id created at or after moment, relying on ids and created_at growing together"""
+    lowest, highest = conn.execute("SELECT MIN(id), MAX(id) FROM urls").fetchone()
+    if highest is None:
+        return None
+    found = None
+    while lowest <= highest:
+        middle = (lowest + highest) // 2
+        # Ids have gaps: look at the first row at or after the midpoint
+        url_id, created_at = conn.execute(
+            "SELECT id, created_at FROM urls WHERE id >= ? ORDER BY id LIMIT 1", (middle,)
+        ).fetchone()
+        if created_at is not None and created_at >= moment:
+            found, highest = url_id, middle - 1
+        else:
+            lowest = url_id + 1
+    return found
+
+class LinkQuery:
+    """
+    One page of links, newest first, using keyset pagination on id: a page
+    starts below the `before_id` cursor instead of at an OFFSET, so every page
+    costs the same however deep it is. Iterate it to get link dicts; afterwards
+    next_cursor is the before_id for the following page, or None at the end.
+
+    created_at bounds are turned into an id range through idx_urls_created_at
+    (ids and creation times grow together), or by binary search over ids on a
+    database where that index hasn't been built yet. A host goes through
+    idx_urls_host. A URL prefix has to be checked on each row, so those scans
+    stop after scan_budget rows and hand back a cursor to carry on from; so
+    does a host while idx_urls_host hasn't been built.
+    """
+
+    def __init__(self, limit, before_id=None, created_after=None, created_before=None,
+                 host=None, prefix=None, scan_budget=10000):
+        self.limit = limit
+        self.before_id = before_id
+        self.created_after = created_after
+        self.created_before = created_before
+        self.host = host
+        self.prefix = prefix
+        self.scan_budget = max(scan_budget, limit)
+        self.next_cursor = None
+
+        if prefix and host is None:
+            # A prefix that includes the whole host can use the host index too
+            parts = split_url(prefix)
+            if parts is not None and parts[1] and parts[3]:
+                self.host = parts[1].lower()
+
+    def _id_bounds(self, conn):
+        """(lowest id, id to stay below or None), or None if the date range is empty"""
+        if not index_exists(conn, 'idx_urls_created_at'):
+            return self._id_bounds_by_search(conn)
+        # One index seek each: the first/last entry of idx_urls_created_at on either side of
+        # the bound (MIN(id)/MAX(id) would read every entry in the range)
+        low, high = 0, self.before_id
+        if self.created_after:
+            row = conn.execute(
+                "SELECT id FROM urls WHERE created_at >= ? ORDER BY created_at LIMIT 1", (self.created_after,)
+            ).fetchone()
+            if row is None:
+                return None
+            low = row[0]
+        if self.created_before:
+            row = conn.execute(
+                "SELECT id FROM urls WHERE created_at < ? ORDER BY created_at DESC LIMIT 1", (self.created_before,)
+            ).fetchone()
+            if row is None:
+                return None
+            high = row[0] + 1 if high is None else min(high, row[0] + 1)
+        return low, high
+
+    def _id_bounds_by_search(self, conn):
+        """
+        _id_bounds until idx_urls_created_at has been built: binary search over
+        ids for where created_at crosses each bound, a rowid seek per step
+        """
+        low, high = 0, self.before_id
+        if self.created_after:
+            low = _first_id_created_from(conn, self.created_after)
+            if low is None:
+                return None
+        if self.created_before:
+            first = conn.execute("SELECT created_at FROM urls ORDER BY id LIMIT 1").fetchone()
+            if first is None or (first[0] is not None and first[0] >= self.created_before):
+                return None
+            end = _first_id_created_from(conn, self.created_before)
+            if end is not None:
+                high = end if high is None else min(high, end)
+        return low, high
+
+    def __iter__(self):
+        self.next_cursor = None
+        with get_db_connection() as conn:
+            bounds = self._id_bounds(conn)
+            if bounds is None:
+                return
+
+            conditions, params = ["id >= ?"], [bounds[0]]
+            if bounds[1] is not None:
+                conditions.append("id < ?")
+                params.append(bounds[1])
+            # Unary + keeps SQLite from using the created_at index here, which would
+            # mean sorting the whole range - the id bounds already do its job
+            if self.created_after:
+                conditions.append("+created_at >= ?")
+                params.append(self.created_after)
+            if self.created_before:
+                conditions.append("+created_at < ?")
+                params.append(self.created_before)
+            # Without its index, the host is checked on each row like a prefix
+            check_host = self.host if self.host and not index_exists(conn, 'idx_urls_host') else None
+            if self.host and not check_host:
+                conditions.append("host = ?")
+                params.append(self.host)
+
+            scan_limit = self.scan_budget if self.prefix or check_host else self.limit
+            cursor = conn.execute(
+                "SELECT id, short_url, original_url, created_at, host FROM urls "
+                f"WHERE {' AND '.join(conditions)} ORDER BY id DESC LIMIT ?",
+                (*params, scan_limit)
+            )
+
+            found = scanned = 0
+            url_id = None
+            while found < self.limit:
+                rows = cursor.fetchmany(500)
+                if not rows:
+                    break
+                for url_id, short_url, original_url, created_at, host in rows:
+                    scanned += 1
+                    if check_host and host != check_host:
+                        continue
+                    original_url = decode_url(conn, original_url)
+                    if self.prefix and not original_url.startswith(self.prefix):
+                        continue
+                    found += 1
+                    yield {
+                        'id': url_id,
+                        'short_url': short_url,
+                        'original_url': original_url,
+                        'created_at': created_at,
+                    }
+                    if found >= self.limit:
+                        break
+
+            if found >= self.limit or scanned >= scan_limit:
+                self.next_cursor = url_id
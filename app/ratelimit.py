@@ -0,0 +1,157 @@
+"""
+Per-client token-bucket rate limiting, shared by every gunicorn worker on a host.
+
+Buckets live in a small memory-mapped file: a fixed table of slots, each holding
+(key hash, tokens, last update). A client key hashes to one slot, and updates to
+that slot happen under a byte-range lock on it, so all workers see the same
+bucket and a check costs a hash, two fcntl calls and a few float operations.
+
+The table is lossy by design: if two keys land on the same slot the newcomer
+takes it over with a full bucket. With the default 65536 slots that only
+matters under a very large number of distinct clients.
+"""
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import namedtuple
+from functools import lru_cache
+
+from flask import request
+
+from app import config
+from app.error_handlers import create_error_response
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - without fcntl buckets are only shared between threads
+    fcntl = None
+
+RateLimit = namedtuple('RateLimit', ['rate', 'burst'])
+
+SLOT = struct.Struct('<Qdd')  # key hash, tokens, last update (unix time)
+DEFAULT_SLOTS = 65536
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+# Which endpoints are limited, and by which setting. Anything else - including the
+# /healthz and /readyz probes - is never limited
+LIMITED_ENDPOINTS = {
+    'shorten_url': 'RATE_LIMIT_SHORTEN',
+    'redirect_to_url': 'RATE_LIMIT_REDIRECT',
+    'resolve_batch': 'RATE_LIMIT_RESOLVE_BATCH',
+}
+
+def parse_limit(value):
+    """Parse a limit like '30/minute' into a RateLimit (refill per second, bucket size)"""
+    count, _, period = value.partition('/')
+    count = int(count)
+    if count <= 0 or period not in PERIODS:
+        raise ValueError(f"Invalid rate limit {value!r}, expected e.g. '30/minute'")
+    return RateLimit(count / PERIODS[period], count)
+
+class TokenBucketStore:
+    """Token buckets in a memory-mapped file shared between processes"""
+
+    def __init__(self, path, slots=DEFAULT_SLOTS):
+        self.path = str(path)
+        self.slots = slots
+        size = slots * SLOT.size
+
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size < size:
+            # Every worker truncates to the same size, so racing here is harmless
+            os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+        # fcntl locks are per process, so threads in this worker also need a lock
+        self._thread_lock = threading.Lock()
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+    def consume(self, key, rate, burst, cost=1.0, now=None):
+        """
+        Take `cost` tokens from the bucket for `key`.
+        Returns (allowed, retry_after) where retry_after is the number of
+        seconds until the request would be allowed (0 when allowed)
+        """
+        key_hash = int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little')
+        offset = (key_hash % self.slots) * SLOT.size
+        now = time.time() if now is None else now
+
+        with self._thread_lock:
+            if fcntl:
+                fcntl.lockf(self._fd, fcntl.LOCK_EX, SLOT.size, offset)
+            try:
+                stored_hash, tokens, updated = SLOT.unpack_from(self._map, offset)
+                if stored_hash != key_hash:
+                    tokens, updated = burst, now
+                else:
+                    # Clamp in case the wall clock went backwards
+                    tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+
+                allowed = tokens >= cost
+                if allowed:
+                    tokens -= cost
+                SLOT.pack_into(self._map, offset, key_hash, tokens, now)
+            finally:
+                if fcntl:
+                    fcntl.lockf(self._fd, fcntl.LOCK_UN, SLOT.size, offset)
+
+        return allowed, 0.0 if allowed else (cost - tokens) / rate
+
+def client_ip():
+    """The caller's IP address"""
+    if config.RATE_LIMIT_TRUST_PROXY and request.access_route:
+        # First hop in X-Forwarded-For, only trustworthy behind our own proxy
+        return request.access_route[0]
+    return request.remote_addr
+
+@lru_cache(maxsize=4)
+def _api_keys(value):
+    return frozenset(key.strip() for key in value.split(',') if key.strip())
+
+def client_key():
+    """
+    Identify the caller: its API key if it sent one listed in RATE_LIMIT_API_KEYS,
+    otherwise its IP. Any other X-API-Key is ignored, so made-up keys can't buy fresh buckets
+    """
+    api_key = request.headers.get('X-API-Key')
+    if api_key and api_key in _api_keys(config.RATE_LIMIT_API_KEYS):
+        return f"key:{api_key}"
+    return f"ip:{client_ip()}"
+
+def init_rate_limiting(app, store=None, limits=None):
+    """
+    Apply per-client limits to the shorten and redirect endpoints.
+    limits maps endpoint name to RateLimit and defaults to the RATE_LIMIT_* settings
+    """
+    if limits is None:
+        limits = {
+            endpoint: parse_limit(getattr(config, setting))
+            for endpoint, setting in LIMITED_ENDPOINTS.items()
+        }
+    if store is None:
+        from app import db
+        store = TokenBucketStore(config.RATE_LIMIT_PATH or f"{db.DB_PATH}.ratelimit", config.RATE_LIMIT_SLOTS)
+    app.extensions['rate_limiter'] = store
+
+    @app.before_request
+    def enforce_rate_limit():
+        limit = limits.get(request.endpoint)
+        if limit is None:
+            return None
+
+        allowed, retry_after = store.consume(f"{request.endpoint}:{client_key()}", limit.rate, limit.burst)
+        if allowed:
+            return None
+
+        response, status_code = create_error_response({'error': 'Too many requests'}, 429)
+        response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+        return response, status_code
+
+    return store
@@ -0,0 +1,233 @@
+"""
+Redirect maps for answering short links at the reverse proxy.
+
+Writes code -> URL mappings to a file HAProxy loads, as lines of
+`/<code> <url>` for `http-request redirect ... map(...)`, so those redirects
+never reach Python; codes missing from the map fall through to the app as
+usual. HAProxy matches map keys exactly and case-sensitively, as base62 codes
+need. nginx can't: string keys in a `map` block ignore case, so `/2Ly` and
+`/2lY` would collide, and regex keys are tried one by one on every request.
+
+Only links on the canonical short domain are exported; the map is consulted
+for every host the proxy serves, and links on other short domains must only
+redirect on theirs.
+
+Either every link is exported, or with --top N only the N most clicked ones
+(from the click log over the last --days days, or the newest N while the
+click log is empty). Clicks on links in the map are answered by the proxy
+and never reach the click log, so an exported link keeps the count it was
+exported with for --days days rather than dropping out on the next run and
+coming back on the one after.
+
+Exports are incremental. Exporting everything reads only rows added since
+the last run and appends them to the map (the proxy only reads it when
+reloaded). Rows it exported are counted again only after something was
+deleted from urls (url_deletes counts deletes), and if any of them are gone
+the map is rebuilt from scratch. A --top export looks every code up again,
+so deleted links leave the map on the next run. Rebuilt and --top maps are
+written next to the destination and renamed into place. A map is left alone
+when nothing changed, so the proxy only needs reloading when the export says
+so.
+
+URLs the proxy can't carry safely (with whitespace or control characters)
+are left out; those codes are still served by the app.
+
+Usage:
+    python -m app.redirect_map /etc/haproxy/short_links.map [--top 10000]
+        [--reload "systemctl reload haproxy"]
+"""
+import argparse
+import datetime
+import json
+import os
+import shlex
+import subprocess
+import time
+from collections import namedtuple
+
+from app import db
+from app.db import get_db_connection
+from app.models import find_original_urls
+from app.urlcodec import decode_url
+
+FORMATS = ('haproxy',)
+
+# A row without a short_url younger than this is still being created
+PENDING_SECONDS = 60
+
+ExportResult = namedtuple('ExportResult', ['path', 'entries', 'added', 'removed', 'rebuilt', 'changed'])
+
+def format_entry(fmt, code, url):
+    """One map line for code -> url, or None if the proxy can't serve this URL"""
+    if any(char.isspace() or ord(char) < 0x20 for char in url):
+        return None
+    return f"/{code} {url}\n"
+
+def _parse_line(fmt, line):
+    key, _, value = line.rstrip('\n').partition(' ')
+    return key[1:], value
+
+def read_map(path, fmt):
+    """{code: url} for the entries in an existing map file"""
+    entries = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                code, url = _parse_line(fmt, line)
+                entries[code] = url
+    return entries
+
+def _state_path(path):
+    return f"{path}.state"
+
+def _load_state(path, fmt, top):
+    """The previous export's state, or None if it can't be built on"""
+    try:
+        with open(_state_path(path)) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if state.get('format') != fmt or state.get('top') != top or not os.path.exists(path):
+        return None
+    return state
+
+def _write_atomically(path, write):
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        write(f)
+    os.replace(temp_path, path)
+
+def _save_state(path, state):
+    _write_atomically(_state_path(path), lambda f: json.dump(state, f))
+
+def _export_all(path, fmt, state):
+    # A map shorter than the last export wrote was truncated or replaced behind our back
+    rebuilt = state is None or os.path.getsize(path) < state.get('bytes', 0)
+    with get_db_connection() as conn:
+        (deletes,) = conn.execute("SELECT count FROM url_deletes WHERE id = 1").fetchone()
+        if not rebuilt and state.get('deletes') != deletes:
+            # Rows can be deleted, not changed: fewer of the exported ones means a rebuild
+            (rows,) = conn.execute(
+                "SELECT COUNT(*) FROM urls WHERE id <= ? AND short_url IS NOT NULL AND short_domain = 0",
+                (state['last_id'],)
+            ).fetchone()
+            rebuilt = rows != state['rows']
+        last_id = 0 if rebuilt else state['last_id']
+        rows = 0 if rebuilt else state['rows']
+
+        lines = []
+        cursor = conn.execute(
+            "SELECT id, short_url, original_url, created_at > datetime('now', ?) FROM urls "
+            "WHERE id > ? AND short_domain = 0 ORDER BY id",
+            (f"-{PENDING_SECONDS} seconds", last_id)
+        )
+        for url_id, code, original_url, recent in cursor:
+            if code is None:
+                if recent:
+                    break  # short_url is set right after the insert; pick this one up next time
+                continue  # an insert whose short_url was never set
+            line = format_entry(fmt, code, decode_url(conn, original_url))
+            if line is not None:
+                lines.append(line)
+            last_id = url_id
+            rows += 1
+
+    if rebuilt:
+        _write_atomically(path, lambda f: f.writelines(lines))
+        entries = len(lines)
+    else:
+        entries = state['entries'] + len(lines)
+        if lines:
+            with open(path, 'r+b') as f:
+                # Drop whatever a run that stopped before saving its state appended
+                f.truncate(state.get('bytes', os.path.getsize(path)))
+                f.seek(0, os.SEEK_END)
+                f.write(''.join(lines).encode('utf-8'))
+
+    _save_state(path, {'format': fmt, 'top': None, 'last_id': last_id, 'rows': rows, 'entries': entries,
+                       'deletes': deletes, 'bytes': os.path.getsize(path)})
+    return ExportResult(path, entries, len(lines), 0, rebuilt, rebuilt or bool(lines))
+
+def ranked_codes(limit, days=7):
+    """[(code, clicks)] for the `limit` most clicked codes of the last `days` days"""
+    from app.clicklog import top_codes
+    since = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=days)
+    return top_codes(limit, since=since)
+
+def newest_codes(limit):
+    with get_db_connection() as conn:
+        return [code for (code,) in conn.execute(
+            "SELECT short_url FROM urls WHERE short_url IS NOT NULL AND short_domain = 0 "
+            "ORDER BY id DESC LIMIT ?", (limit,)
+        )]
+
+def _export_top(path, fmt, top, days, state):
+    previous = read_map(path, fmt) if state is not None else {}
+    now = time.time()
+
+    # {code: (clicks, when counted)}; links in the map keep their count for `days` days,
+    # since the proxy answers them and the click log stops seeing their clicks
+    clicks = {code: (count, now) for code, count in ranked_codes(top, days)}
+    for code, (count, counted_at) in (state or {}).get('clicks', {}).items():
+        if code in previous and counted_at > now - days * 86400 and count > clicks.get(code, (0,))[0]:
+            clicks[code] = (count, counted_at)
+    if clicks:
+        codes = sorted(clicks, key=lambda code: (-clicks[code][0], code))[:top]
+    else:
+        codes = newest_codes(top)
+
+    # Codes already in the map are looked up again too, so deleted links drop out
+    urls = find_original_urls(codes)
+    lines, entries = [], {}
+    for code in codes:
+        url = urls.get(code)
+        line = format_entry(fmt, code, url) if url is not None else None
+        if line is not None:
+            lines.append(line)
+            entries[code] = url
+
+    added = len(entries.keys() - previous.keys())
+    removed = len(previous.keys() - entries.keys())
+    changed = state is None or added > 0 or removed > 0
+    if changed:
+        _write_atomically(path, lambda f: f.writelines(lines))
+    _save_state(path, {'format': fmt, 'top': top, 'entries': len(entries),
+                       'clicks': {code: clicks[code] for code in entries if code in clicks}})
+    return ExportResult(path, len(entries), added, removed, state is None, changed)
+
+def export_redirect_map(path, fmt='haproxy', top=None, days=7):
+    """
+    Bring the map at path up to date: every link, or the `top` most clicked
+    over the last `days` days. Returns an ExportResult; reload the proxy if
+    its `changed` is True
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    path = str(path)
+    state = _load_state(path, fmt, top)
+    if top is None:
+        return _export_all(path, fmt, state)
+    return _export_top(path, fmt, top, days, state)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m app.redirect_map",
+        description="Export short links to a map file the reverse proxy can serve"
+    )
+    parser.add_argument("path", help="map file to write")
+    parser.add_argument("--format", choices=FORMATS, default="haproxy")
+    parser.add_argument("--top", type=int, help="only the N most clicked links (default: all)")
+    parser.add_argument("--days", type=int, default=7, help="click window used to rank --top links")
+    parser.add_argument("--reload", help="command to run when the map changed, e.g. 'systemctl reload haproxy'")
+    args = parser.parse_args(argv)
+
+    result = export_redirect_map(args.path, args.format, args.top, args.days)
+    how = "rebuilt" if result.rebuilt else "updated" if result.changed else "unchanged"
+    print(f"{result.path} {how} from {db.DB_PATH}: {result.entries} entries "
+          f"(+{result.added} -{result.removed})")
+
+    if result.changed and args.reload:
+        subprocess.run(shlex.split(args.reload), check=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,538 @@
+"""
+One writer, many read-only redirect nodes.
+
+With REPLICATION_CHANGELOG on, the primary logs every write to urls -
+shortens, backfills, deletes, manual fixes - by appending (seq, url id) to
+the changelog table through triggers, in the same transaction. The row
+itself isn't copied: shipping a change reads the row's current state from
+urls, and a missing row means it was deleted. So a change is idempotent, and
+a follower that sees a row twice just writes the same values again.
+
+Switching the changelog on installs the triggers and schedules the
+seed_changelog backfill, which logs the rows already in urls in batches
+(python -m app.migrations backfill seed_changelog). Turning
+REPLICATION_CHANGELOG off doesn't touch either; dropping the triggers and the
+log is done on purpose, with python -m app.replication disable-changelog.
+Entries older than REPLICATION_RETENTION seconds are pruned. A follower asking for changes that have been pruned gets an
+error and has to be restored from a backup of the primary.
+
+A node with REPLICATION_PRIMARY set is a follower. It polls the primary for
+changes after the last one it applied, either over HTTP
+(GET /replication/changes with the primary's ADMIN_TOKEN) or straight from
+the primary's database file when both share a disk. It applies each batch to
+its own database in one transaction, together with its position in
+replication_state. One worker per node does the polling (whichever holds the
+lock file); the others only read. Followers refuse /shorten.
+
+Redirects on a follower are answered from its own database. When a code is
+missing locally but could have been created since the last batch (the
+follower is behind, or the code's id is newer than any row it has), it is
+looked up on the primary instead, through the admin-only /replication/lookup
+(which isn't rate limited). Every batch of changes announces the primary's
+newest id, and only ids up to REPLICATION_FALLBACK_WINDOW past it are looked
+up, so garbage and enumerated codes never reach the primary. A code the
+primary didn't know isn't asked about again for REPLICATION_MISS_TTL seconds.
+
+Lag is reported by GET /replication/status. A follower fails /readyz when it
+hasn't been caught up for REPLICATION_MAX_LAG seconds.
+
+Start a follower from a backup of the primary (python -m app.backup): a
+backup carries the primary's changelog position, so the follower picks up
+right after the last change it contains. An empty database works too while
+nothing has been pruned and seed_changelog has finished.
+"""
+import argparse
+import atexit
+import json
+import logging
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from app import config, db
+from app.db import get_db_connection
+from app.models import find_original_url
+from app.shortener import decode_short_url
+from app.urlcodec import encode_url, decode_url
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - without fcntl every worker polls
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_SIZE = 10000
+MAX_CACHED_MISSES = 10000
+PRUNE_INTERVAL = 60.0
+PRUNE_BATCH_SIZE = 10000
+
+_TRIGGERS = (('insert', 'NEW'), ('update', 'NEW'), ('delete', 'OLD'))
+
+_CHANGES_QUERY = """
+SELECT c.seq, c.url_id, u.short_url, u.original_url, u.host, u.created_at, u.short_domain
+FROM changelog c LEFT JOIN urls u ON u.id = c.url_id
+WHERE c.seq > ? ORDER BY c.seq LIMIT ?
+"""
+
+class ChangelogPruned(Exception):
+    """Changes a follower still needs are no longer in the primary's changelog"""
+
+def _changelog_triggers(conn):
+    return {name for (name,) in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'urls_changelog_%'"
+    )}
+
+def enable_changelog(conn):
+    """
+    Install the changelog triggers and schedule seed_changelog for the rows
+    already in urls (done at once if there are none). Returns False if the
+    triggers were already there
+    """
+    if len(_changelog_triggers(conn)) == len(_TRIGGERS):
+        return False
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Another worker may have done it while we waited for the lock
+        if len(_changelog_triggers(conn)) == len(_TRIGGERS):
+            conn.rollback()
+            return False
+        for event, row in _TRIGGERS:
+            conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS urls_changelog_{event} AFTER {event.upper()} ON urls
+            BEGIN
+                INSERT INTO changelog (url_id) VALUES ({row}.id);
+            END
+            """)
+        empty = conn.execute("SELECT 1 FROM urls LIMIT 1").fetchone() is None
+        conn.execute(
+            "INSERT INTO backfill_progress (name, completed) VALUES ('seed_changelog', ?) "
+            "ON CONFLICT (name) DO UPDATE SET last_id = 0, completed = excluded.completed, "
+            "updated_at = CURRENT_TIMESTAMP",
+            (int(empty),)
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return True
+
+def disable_changelog(conn):
+    """Drop the changelog triggers and empty the log; returns False if it was already off"""
+    if not _changelog_triggers(conn):
+        return False
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for event, _ in _TRIGGERS:
+            conn.execute(f"DROP TRIGGER IF EXISTS urls_changelog_{event}")
+        # Writes from now on go unlogged, so followers can't trust what's left
+        conn.execute("DELETE FROM changelog")
+        conn.execute("DELETE FROM backfill_progress WHERE name = 'seed_changelog'")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return True
+
+def prune_changelog(conn, retention, now=None, batch_size=PRUNE_BATCH_SIZE):
+    """Delete changelog entries logged more than `retention` seconds ago; returns how many"""
+    cutoff = (time.time() if now is None else now) - retention
+    deleted = 0
+    while True:
+        oldest = conn.execute("SELECT seq, created_at FROM changelog ORDER BY seq LIMIT 1").fetchone()
+        if oldest is None or oldest[1] >= cutoff:
+            return deleted
+        # Entries are logged in seq order, so everything up to the newest old one is old
+        (newest_old,) = conn.execute(
+            "SELECT MAX(seq) FROM changelog WHERE seq < ? AND created_at < ?",
+            (oldest[0] + batch_size, cutoff)
+        ).fetchone()
+        deleted += conn.execute("DELETE FROM changelog WHERE seq <= ?", (newest_old,)).rowcount
+        conn.commit()
+
+def newest_url_id(conn):
+    """Highest id ever stored in urls, even if that row has since been deleted"""
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'urls'").fetchone()
+    return row[0] if row else 0
+
+def _last_seq(conn):
+    # AUTOINCREMENT keeps the newest seq even once that entry has been pruned
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'changelog'").fetchone()
+    return row[0] if row else 0
+
+def read_changes(conn, after, limit, path=None):
+    """
+    Up to `limit` changes after seq `after`, as (changes, last_seq). Each
+    change is [seq, id, short_url, original_url, host, created_at, short_domain], with
+    original_url None if the row has been deleted. last_seq is the newest
+    seq in the log. path is the database's path if it isn't app.db.DB_PATH.
+    Raises ChangelogPruned if changes after `after` have been pruned
+    """
+    newest = _last_seq(conn)
+    if after < newest:
+        (oldest,) = conn.execute("SELECT MIN(seq) FROM changelog").fetchone()
+        if oldest is None or oldest > after + 1:
+            raise ChangelogPruned(f"changes after seq {after} have been pruned from the changelog")
+    changes = [
+        [seq, url_id, short_url, decode_url(conn, original_url, path), host, created_at, short_domain]
+        for seq, url_id, short_url, original_url, host, created_at, short_domain
+        in conn.execute(_CHANGES_QUERY, (after, limit))
+    ]
+    return changes, newest
+
+def last_seq():
+    with get_db_connection() as conn:
+        return _last_seq(conn)
+
+class SqliteSource:
+    """Reads the primary's database file directly, for followers on the same disk"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def _connect(self):
+        return sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=5.0)
+
+    def fetch(self, after, limit):
+        conn = self._connect()
+        try:
+            changes, last_seq = read_changes(conn, after, limit, self.path)
+            return changes, last_seq, newest_url_id(conn)
+        finally:
+            conn.close()
+
+    def lookup(self, code, short_domain=None):
+        conn = self._connect()
+        try:
+            if short_domain is None:
+                row = conn.execute("SELECT original_url FROM urls WHERE short_url = ?", (code,)).fetchone()
+            else:
+                row = conn.execute("SELECT original_url FROM urls WHERE short_url = ? AND short_domain = ?",
+                                   (code, short_domain)).fetchone()
+            return decode_url(conn, row[0], self.path) if row else None
+        finally:
+            conn.close()
+
+class HttpSource:
+    """Talks to the primary's /replication/changes and /replication/lookup endpoints"""
+
+    def __init__(self, base_url, token, timeout=5.0):
+        self.base_url = base_url.rstrip('/')
+        self.token = token
+        self.timeout = timeout
+
+    def _request(self, path, query):
+        request = urllib.request.Request(
+            f"{self.base_url}{path}?{urllib.parse.urlencode(query)}",
+            headers={'Authorization': f"Bearer {self.token}"}
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.load(response)
+
+    def fetch(self, after, limit):
+        """(changes, last_seq, the primary's newest id, or None from primaries that don't send it)"""
+        try:
+            page = self._request('/replication/changes', {'after': after, 'limit': limit})
+        except urllib.error.HTTPError as e:
+            if e.code == 410:
+                raise ChangelogPruned(f"{self.base_url} has pruned changes after seq {after}") from e
+            raise
+        return page['changes'], page['last_seq'], page.get('max_id')
+
+    def lookup(self, code, short_domain=None):
+        query = {'code': code}
+        if short_domain is not None:
+            query['short_domain'] = short_domain
+        return self._request('/replication/lookup', query)['original_url']
+
+def open_source(primary, token=None):
+    """HttpSource for an http(s):// primary, SqliteSource for a database path"""
+    if primary.startswith(('http://', 'https://')):
+        return HttpSource(primary, config.REPLICATION_TOKEN if token is None else token)
+    return SqliteSource(primary)
+
+def _read_state(conn):
+    return conn.execute(
+        "SELECT applied_seq, primary_seq, caught_up_at, synced_at, primary_max_id FROM replication_state WHERE id = 1"
+    ).fetchone()
+
+def follower_status(now=None):
+    """Replication position and lag of this node, read from its database"""
+    now = time.time() if now is None else now
+    with get_db_connection() as conn:
+        state = _read_state(conn)
+    if state is None:
+        return {'role': 'follower', 'applied_seq': 0, 'primary_seq': None, 'lag_changes': None,
+                'lag_seconds': None, 'synced_at': None}
+    applied_seq, primary_seq, caught_up_at, synced_at, _ = state
+    behind = applied_seq < primary_seq
+    if not behind:
+        lag_seconds = 0.0
+    else:
+        # Time since the follower last had everything the primary had
+        lag_seconds = round(now - caught_up_at, 3) if caught_up_at is not None else None
+    return {
+        'role': 'follower',
+        'applied_seq': applied_seq,
+        'primary_seq': primary_seq,
+        'lag_changes': primary_seq - applied_seq,
+        'lag_seconds': lag_seconds,
+        'synced_at': synced_at,
+    }
+
+class Follower:
+    """Applies the primary's changelog to the local database and resolves codes for redirects"""
+
+    def __init__(self, source, interval=1.0, batch_size=1000, fallback=True, start=True,
+                 fallback_window=1000, miss_ttl=5.0):
+        self.source = source
+        self.interval = interval
+        self.batch_size = min(batch_size, MAX_BATCH_SIZE)
+        self.fallback = fallback
+        self.fallback_window = fallback_window
+        self.miss_ttl = miss_ttl
+        self.fallbacks = 0
+        self._misses = {}  # (code, short_domain) -> when the primary may be asked again
+        self._misses_lock = threading.Lock()
+        self._lock_file = None
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="replication-follower", daemon=True)
+        if start:
+            self._thread.start()
+
+    def _applied_seq(self, conn):
+        state = _read_state(conn)
+        if state is not None:
+            return state[0]
+        # First sync: a backup of the primary already holds everything up to its newest change
+        return _last_seq(conn)
+
+    def sync_once(self):
+        """Fetch and apply one batch; returns (changes applied, caught up)"""
+        with get_db_connection() as conn:
+            after = self._applied_seq(conn)
+        changes, primary_seq, primary_max_id = self.source.fetch(after, self.batch_size)
+
+        # Every change carries the row's current state, so only the last one per id matters
+        rows = {}
+        for change in changes:
+            seq, url_id, short_url, original_url, host, created_at = change[:6]
+            # Primaries from before short domains send six fields
+            short_domain = change[6] if len(change) > 6 else 0
+            rows[url_id] = (short_url, original_url, host, created_at, short_domain)
+        applied_seq = changes[-1][0] if changes else after
+        now = time.time()
+
+        with get_db_connection() as conn:
+            for url_id, (short_url, original_url, host, created_at, short_domain) in rows.items():
+                if original_url is None:
+                    conn.execute("DELETE FROM urls WHERE id = ?", (url_id,))
+                    continue
+                conn.execute(
+                    "INSERT INTO urls (id, short_url, original_url, host, created_at, short_domain) "
+                    "VALUES (?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (id) DO UPDATE SET short_url = excluded.short_url, "
+                    "original_url = excluded.original_url, host = excluded.host, created_at = excluded.created_at, "
+                    "short_domain = excluded.short_domain",
+                    (url_id, short_url, encode_url(conn, original_url), host, created_at, short_domain)
+                )
+            caught_up = applied_seq >= primary_seq
+            conn.execute(
+                "INSERT INTO replication_state (id, applied_seq, primary_seq, caught_up_at, synced_at, primary_max_id) "
+                "VALUES (1, ?, ?, ?, ?, ?) ON CONFLICT (id) DO UPDATE SET applied_seq = excluded.applied_seq, "
+                "primary_seq = excluded.primary_seq, synced_at = excluded.synced_at, "
+                "caught_up_at = COALESCE(excluded.caught_up_at, caught_up_at), "
+                "primary_max_id = excluded.primary_max_id",
+                (applied_seq, primary_seq, now if caught_up else None, now, primary_max_id)
+            )
+            conn.commit()
+        return len(changes), caught_up
+
+    def sync(self):
+        """Apply batches until caught up with the primary; returns how many changes were applied"""
+        total = 0
+        while not self._stopped.is_set():
+            applied, caught_up = self.sync_once()
+            total += applied
+            if caught_up:
+                break
+        return total
+
+    def _holds_lock(self):
+        """Only one worker per node polls; the others retry in case it goes away"""
+        if fcntl is None or self._lock_file is not None:
+            return True
+        lock_file = open(f"{db.DB_PATH}.replication.lock", 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                if self._holds_lock():
+                    self.sync()
+            except ChangelogPruned as e:
+                logger.error("Replication from %s stopped: %s; restore this node from a backup of the primary",
+                             config.REPLICATION_PRIMARY, e)
+            except Exception:
+                logger.exception("Replication from %s failed", config.REPLICATION_PRIMARY)
+            self._stopped.wait(self.interval)
+
+    def _may_exist_on_primary(self, code):
+        try:
+            url_id = decode_short_url(code)
+        except ValueError:
+            return False
+        with get_db_connection() as conn:
+            state = _read_state(conn)
+            newest_id = newest_url_id(conn)
+        announced = state[4] if state is not None and state[4] is not None else newest_id
+        if url_id > announced + self.fallback_window:
+            # Further past the primary's newest id than it could have issued since it said so
+            return False
+        behind = state is None or state[0] < state[1]
+        return behind or url_id > newest_id
+
+    def _missed_recently(self, key):
+        with self._misses_lock:
+            retry_at = self._misses.get(key)
+            if retry_at is None:
+                return False
+            if retry_at > time.monotonic():
+                return True
+            del self._misses[key]
+            return False
+
+    def _remember_miss(self, key):
+        with self._misses_lock:
+            if len(self._misses) >= MAX_CACHED_MISSES:
+                self._misses.clear()
+            self._misses[key] = time.monotonic() + self.miss_ttl
+
+    def find_original_url(self, code, short_domain=None):
+        """Local lookup, falling back to the primary for codes that may not have arrived yet"""
+        original_url = find_original_url(code, short_domain)
+        if original_url is not None or not self.fallback:
+            return original_url
+        if not self._may_exist_on_primary(code) or self._missed_recently((code, short_domain)):
+            # The sync thread may have brought the row in since the lookup above
+            return find_original_url(code, short_domain)
+        self.fallbacks += 1
+        try:
+            original_url = self.source.lookup(code, short_domain)
+        except Exception:
+            logger.exception("Fallback lookup of %s on the primary failed", code)
+            original_url = None
+        if original_url is None:
+            # Not there either (or the primary is down): don't ask again for a while
+            self._remember_miss((code, short_domain))
+        return original_url
+
+    def close(self):
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+class ChangelogPruner:
+    """Deletes changelog entries older than `retention` seconds every `interval` seconds"""
+
+    def __init__(self, retention, interval=PRUNE_INTERVAL):
+        self.retention = retention
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="changelog-pruner", daemon=True)
+        if retention > 0:
+            self._thread.start()
+
+    def prune(self):
+        with get_db_connection() as conn:
+            return prune_changelog(conn, self.retention)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.prune()
+            except Exception:
+                logger.exception("Pruning the changelog failed")
+
+    def close(self):
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+def start_changelog(app):
+    """
+    Log writes to urls for followers, pruning entries older than
+    REPLICATION_RETENTION seconds; the pruner is stored in app.extensions['changelog']
+    """
+    with get_db_connection() as conn:
+        if enable_changelog(conn):
+            logger.info("Changelog enabled; existing rows are logged by "
+                        "`python -m app.migrations backfill seed_changelog`")
+    pruner = ChangelogPruner(config.REPLICATION_RETENTION)
+    app.extensions['changelog'] = pruner
+    atexit.register(pruner.close)
+    return pruner
+
+def check_changelog():
+    """Warn when writes are still logged although REPLICATION_CHANGELOG is off; nothing is changed"""
+    with get_db_connection() as conn:
+        if _changelog_triggers(conn):
+            logger.warning("REPLICATION_CHANGELOG is off but writes are still logged and never pruned; "
+                           "`python -m app.replication disable-changelog` drops the triggers and the log")
+
+def start_follower(app, source=None):
+    """Make this app a follower of REPLICATION_PRIMARY; stored in app.extensions['follower']"""
+    from flask import request
+    from app.error_handlers import create_error_response
+
+    follower = Follower(
+        source or open_source(config.REPLICATION_PRIMARY),
+        config.REPLICATION_POLL_INTERVAL,
+        config.REPLICATION_BATCH_SIZE,
+        config.REPLICATION_FALLBACK,
+        fallback_window=config.REPLICATION_FALLBACK_WINDOW,
+        miss_ttl=config.REPLICATION_MISS_TTL,
+    )
+    app.extensions['follower'] = follower
+
+    @app.before_request
+    def reject_writes():
+        if request.endpoint == 'shorten_url':
+            return create_error_response({'error': 'This node is a read replica; send writes to the primary'}, 503)
+        return None
+
+    return follower
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m app.replication",
+        description="Manage the changelog followers replicate from"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("enable-changelog", help="install the changelog triggers and schedule seed_changelog")
+    commands.add_parser("disable-changelog",
+                        help="drop the changelog triggers and the log (followers need a new backup)")
+    args = parser.parse_args(argv)
+
+    with get_db_connection() as conn:
+        if args.command == "enable-changelog":
+            changed = enable_changelog(conn)
+        else:
+            changed = disable_changelog(conn)
+    state = "enabled" if args.command == "enable-changelog" else "disabled"
+    print(f"changelog {state}" if changed else f"changelog already {state}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+"""
+Router mode: one front process for several app nodes, each with its own
+database and its own share of the id space (see app/hashring.py).
+
+A redirect is validated and decoded here, then forwarded to the node that
+owns the code's id. The node's response (status, Location and body) is passed
+back unchanged. Shortens go to the nodes in turn, and each node picks an id in
+its own blocks. Node addresses come from ROUTER_NODES
+("a=http://10.0.0.1:8000,b=http://10.0.0.2:8000"). Nodes are placed on the
+ring by name, so PARTITION_NODES on every node must list the same names.
+
+While links are being moved after a ring change, set ROUTER_PREVIOUS_NODES to
+the old ring. A code its new owner doesn't know is then asked of its old
+owner before answering 404.
+
+Run a local cluster with main.py: start each node with its own
+DATABASE_PATH, PORT and PARTITION_NODE, then start one more process with
+ROUTER_NODES set. See the README.
+"""
+import http.client
+import itertools
+import logging
+import select
+import threading
+import urllib.parse
+
+from flask import Flask, Response, request
+
+from app import config
+from app.error_handlers import create_error_response, handle_not_found
+from app.hashring import HashRing, id_owner
+from app.logs import REQUEST_ID_HEADER, current_request_id, setup_logging
+from app.shortener import decode_short_url
+from app.validators import validate_short_url
+
+logger = logging.getLogger(__name__)
+
+# Hop-by-hop headers (RFC 9110 7.6.1), plus the ones http.client and Flask set themselves
+_SKIP_HEADERS = {
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization', 'te', 'trailer',
+    'transfer-encoding', 'upgrade', 'content-length', 'host',
+}
+# Request headers worth passing on to a node
+_FORWARD_HEADERS = ('Accept', 'Accept-Encoding', 'Authorization', 'Content-Type', 'User-Agent',
+                    'Referer', 'X-API-Key')
+# Methods that can be sent again when a node hung up before answering
+_IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+
+def parse_nodes(value):
+    """'a=http://host:8001, b=http://host:8002' -> {'a': 'http://host:8001', 'b': 'http://host:8002'}"""
+    nodes = {}
+    for entry in value.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        name, sep, url = entry.partition('=')
+        if not sep or not name.strip() or not url.strip().startswith(('http://', 'https://')):
+            raise ValueError(f"Expected name=http://host:port, got {entry!r}")
+        nodes[name.strip()] = url.strip().rstrip('/')
+    return nodes
+
+class NodeUnavailable(Exception):
+    """
+    The node couldn't be reached or didn't answer. sent is False if the request
+    never got to it, so retrying another node is safe; True if the node may
+    have acted on it
+    """
+
+    def __init__(self, message, sent=False):
+        super().__init__(message)
+        self.sent = sent
+
+def _dropped(conn):
+    """Whether the node has closed an idle kept-alive connection (or sent something unasked on it)"""
+    if conn.sock is None:
+        return True
+    try:
+        readable, _, _ = select.select([conn.sock], [], [], 0)
+    except (OSError, ValueError):
+        return True
+    return bool(readable)
+
+class NodeClient:
+    """Forwards requests to one node, keeping an HTTP connection per thread"""
+
+    def __init__(self, name, base_url, timeout=5.0):
+        self.name = name
+        self.base_url = base_url
+        parsed = urllib.parse.urlsplit(base_url)
+        self._https = parsed.scheme == 'https'
+        self._netloc = parsed.netloc
+        self._prefix = parsed.path.rstrip('/')
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _unavailable(self, error, sent=False):
+        return NodeUnavailable(f"{self.name} ({self.base_url}): {error}", sent)
+
+    def _connection(self):
+        """(connection, whether it was kept alive from an earlier request)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and _dropped(conn):
+            self._reset()
+            conn = None
+        if conn is not None:
+            return conn, True
+        connection_class = http.client.HTTPSConnection if self._https else http.client.HTTPConnection
+        conn = connection_class(self._netloc, timeout=self.timeout)
+        try:
+            conn.connect()
+        except OSError as e:
+            raise self._unavailable(e) from e
+        self._local.conn = conn
+        return conn, False
+
+    def _reset(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def forward(self, method, path, body=None, headers=None):
+        """
+        Send one request; returns (status, [(header, value)], body). Raises
+        NodeUnavailable if the node can't be reached, times out or hangs up
+        """
+        for attempt in range(2):
+            conn, reused = self._connection()
+            try:
+                conn.request(method, self._prefix + path, body=body, headers=headers or {})
+            except (OSError, http.client.HTTPException) as e:
+                # The request didn't get out, so any method can go again on a fresh connection
+                self._reset()
+                if not reused or attempt:
+                    raise self._unavailable(e) from e
+                continue
+            try:
+                response = conn.getresponse()
+                return response.status, response.getheaders(), response.read()
+            except (OSError, http.client.HTTPException) as e:
+                self._reset()
+                # A kept-alive connection the node closed as the request went out is worth
+                # one retry, but only if doing the request twice is harmless
+                stale = isinstance(e, (http.client.RemoteDisconnected, ConnectionResetError))
+                if not (stale and reused and not attempt and method in _IDEMPOTENT_METHODS):
+                    raise self._unavailable(e, sent=True) from e
+
+    def close(self):
+        self._reset()
+
+class Router:
+    """Which node owns a code, and the clients to reach each node"""
+
+    def __init__(self, nodes, previous_nodes=None, vnodes=160, block_size=1024, timeout=5.0):
+        if not nodes:
+            raise ValueError("A router needs at least one node")
+        self.clients = {name: NodeClient(name, url, timeout) for name, url in nodes.items()}
+        self.ring = HashRing(nodes, vnodes)
+        self.previous_ring = None
+        if previous_nodes:
+            for name, url in previous_nodes.items():
+                self.clients.setdefault(name, NodeClient(name, url, timeout))
+            self.previous_ring = HashRing(previous_nodes, vnodes)
+        self.block_size = block_size
+        self._next_node = itertools.cycle(sorted(nodes))
+        self._next_lock = threading.Lock()
+
+    def owner(self, url_id, previous=False):
+        ring = self.previous_ring if previous else self.ring
+        return id_owner(ring, url_id, self.block_size)
+
+    def next_node(self):
+        """Round-robin over the current nodes, for shortens"""
+        with self._next_lock:
+            return next(self._next_node)
+
+    def close(self):
+        for client in self.clients.values():
+            client.close()
+
+def _forward_headers():
+    headers = {name: request.headers[name] for name in _FORWARD_HEADERS if name in request.headers}
+    headers['Host'] = request.host
+    forwarded_for = request.headers.get('X-Forwarded-For')
+    client = request.remote_addr or ''
+    headers['X-Forwarded-For'] = f"{forwarded_for}, {client}" if forwarded_for else client
+    headers['X-Forwarded-Proto'] = request.headers.get('X-Forwarded-Proto', request.scheme)
+    if current_request_id() is not None:
+        # The node logs under the same id
+        headers[REQUEST_ID_HEADER] = current_request_id()
+    return headers
+
+def _relay(status, headers, body):
+    return Response(body, status=status, headers=[
+        (name, value) for name, value in headers if name.lower() not in _SKIP_HEADERS
+    ])
+
+def create_router_app(nodes=None, previous_nodes=None):
+    """Application factory for router mode; the Router is stored in app.extensions['router']"""
+    if nodes is None:
+        nodes = parse_nodes(config.ROUTER_NODES)
+    if previous_nodes is None:
+        previous_nodes = parse_nodes(config.ROUTER_PREVIOUS_NODES)
+    router = Router(nodes, previous_nodes, config.PARTITION_VNODES, config.PARTITION_BLOCK_SIZE,
+                    config.ROUTER_TIMEOUT)
+
+    app = Flask(__name__, static_folder=None)
+    setup_logging(app)
+    app.extensions['router'] = router
+
+    def unavailable(error):
+        logger.warning("Node unavailable: %s", error)
+        return create_error_response({'error': 'Service temporarily unavailable'}, 502)
+
+    @app.route('/healthz', methods=['GET'])
+    def healthz():
+        return Response('ok', mimetype='text/plain')
+
+    @app.route('/readyz', methods=['GET'])
+    def readyz():
+        checks = {}
+        for name in router.ring.nodes:
+            try:
+                status, _, _ = router.clients[name].forward('GET', '/readyz')
+                checks[name] = 'ok' if status == 200 else f"not ready ({status})"
+            except Exception as e:
+                checks[name] = f"unreachable: {e}"
+        ready = all(check == 'ok' for check in checks.values())
+        return {'status': 'ready' if ready else 'not ready', 'checks': {'nodes': checks}}, 200 if ready else 503
+
+    @app.route('/shorten', methods=['POST'])
+    def shorten_url():
+        body, headers = request.get_data(), _forward_headers()
+        # Each node is tried at most once, and only when the request never got to it
+        for _ in range(len(router.ring)):
+            name = router.next_node()
+            try:
+                return _relay(*router.clients[name].forward('POST', '/shorten', body, headers))
+            except NodeUnavailable as e:
+                if e.sent:
+                    # The node may have created the link; another node would create it again
+                    return unavailable(e)
+                logger.warning("Shorten skipped %s: %s", name, e)
+        return create_error_response({'error': 'Service temporarily unavailable'}, 502)
+
+    @app.route('/<short_url>', methods=['GET'])
+    def redirect_to_url(short_url):
+        is_valid, error_response, status_code = validate_short_url(short_url)
+        if not is_valid:
+            return create_error_response(error_response, status_code)
+        try:
+            url_id = decode_short_url(short_url.strip())
+        except ValueError:
+            # Not a code any node could have issued
+            return handle_not_found("Short URL", short_url)
+
+        path = '/' + urllib.parse.quote(short_url)
+        headers = _forward_headers()
+        owner = router.owner(url_id)
+        try:
+            status, response_headers, body = router.clients[owner].forward('GET', path, headers=headers)
+        except NodeUnavailable as e:
+            return unavailable(e)
+        if status == 404 and router.previous_ring is not None:
+            previous_owner = router.owner(url_id, previous=True)
+            if previous_owner != owner:
+                try:
+                    status, response_headers, body = router.clients[previous_owner].forward('GET', path, headers=headers)
+                except NodeUnavailable as e:
+                    return unavailable(e)
+        return _relay(status, response_headers, body)
+
+    return app
@@ -1,7 +1,21 @@
-from flask import request, jsonify, redirect, url_for, send_from_directory
+from flask import request, jsonify, redirect, Response, stream_with_context
+import json
 import os
-from app.models import get_short_url, find_original_url
-from app.validators import validate_shorten_request, validate_short_url
+from app import config
+from app.cache import RedirectCache
+from app.compact import CompactRedirectCache
+from app.auth import admin_required
+from app.health import register_health_routes
+from app.static_files import StaticSite, register_static_routes
+from app.ratelimit import client_ip
+from app.replication import read_changes, last_seq, newest_url_id, follower_status, ChangelogPruned, MAX_BATCH_SIZE
+from app.shortdomains import CANONICAL, cache_key, load_short_domains
+from app.db import get_db_connection
+from app.models import get_short_url, find_original_url, find_original_urls, LinkQuery
+from app.stats import top_domains, domain_stats, SORT_COLUMNS
+from app.validators import (
+    validate_shorten_request, validate_short_url, validate_links_request, validate_resolve_batch_request
+)
 from app.error_handlers import (
     handle_server_error, 
     handle_not_found, 
@@ -11,14 +25,29 @@ from app.error_handlers import (
 
 def register_routes(app):
     """Register all routes with the Flask app"""
+    cache_class = CompactRedirectCache if config.REDIRECT_CACHE_COMPACT else RedirectCache
+    redirect_cache = cache_class(
+        config.REDIRECT_CACHE_SIZE,
+        config.REDIRECT_CACHE_TTL,
+        config.REDIRECT_CACHE_STALE_TTL
+    )
+    app.extensions['redirect_cache'] = redirect_cache
+    short_domains = load_short_domains()
+    app.extensions['short_domains'] = short_domains
+
+    register_health_routes(app)
+
+    # The React build is only there in the Docker image; look for it once, not per request
+    static_site = None
+    if os.path.isfile(os.path.join(config.STATIC_ROOT, 'index.html')):
+        static_site = StaticSite(config.STATIC_ROOT)
+        register_static_routes(app, static_site)
     
     @app.route('/', methods=['GET'])
     def serve_frontend():
         """Serve the React frontend index.html"""
-        # Use different static folder path for local vs Docker
-        if os.path.exists('/app/static'):
-            static_folder = '/app/static'  # Docker path
-            return send_from_directory(static_folder, 'index.html')
+        if static_site is not None:
+            return static_site.index_response()  # from memory, 304 when unchanged
         else:
             # For local development, return a simple response instead of trying to serve files
             return jsonify({"message": "URL Shortener API is running!", "frontend": "available at localhost:3000"})
@@ -50,20 +79,23 @@ def register_routes(app):
             if not is_valid:
                 return create_error_response(error_response, status_code)
             
+            # The short domain asked for, else the one this request came in on, else the canonical one
+            requested_domain = request_data.get('domain')
+            if requested_domain is not None:
+                domain = short_domains.for_host(requested_domain) if isinstance(requested_domain, str) else None
+                if domain is None:
+                    return create_error_response({'error': 'Unknown short domain'}, 400)
+            else:
+                domain = short_domains.for_host(request.host)
+            short_domain = domain.key if domain is not None else CANONICAL
+
             # Generate short URL
             original_url = request_data.get('url').strip()
-            short_url = get_short_url(original_url)
+            short_url = get_short_url(original_url, short_domain)
             
             # Use HTTPS if the request came from HTTPS
             scheme = 'https' if request.is_secure or request.headers.get('X-Forwarded-Proto') == 'https' else 'http'
-            
-            try:
-                full_short_url = url_for('redirect_to_url', short_url=short_url, _external=True, _scheme=scheme)
-            except Exception as e:
-                # Fallback for local development
-                print(f"url_for failed: {e}")
-                host = request.headers.get('Host', 'localhost:8000')
-                full_short_url = f"{scheme}://{host}/{short_url}"
+            full_short_url = short_domains.short_url(short_url, scheme, request.host, short_domain)
             
             return create_success_response({
                 'short_url': full_short_url,
@@ -73,6 +105,135 @@ def register_routes(app):
         except Exception as e:
             return handle_server_error(e, "while creating short URL")
 
+    #POST /resolve/batch - original URLs for many short URLs at once, without redirecting or counting clicks
+    @app.route('/resolve/batch', methods=['POST'])
+    def resolve_batch():
+        try:
+            codes, error_response, status_code = validate_resolve_batch_request(
+                request.get_json(silent=True), config.RESOLVE_BATCH_MAX_CODES
+            )
+            if error_response:
+                return create_error_response(error_response, status_code)
+
+            # The code to look up for each entry, or None if it isn't a valid short URL
+            lookups = [code.strip() if validate_short_url(code)[0] else None for code in codes]
+
+            found = {}
+            missing = []
+            for code in set(lookups) - {None}:
+                # Read the cache but don't fill it: a link checker's sweep would evict hot redirects
+                original_url, _ = redirect_cache.get(code)
+                if original_url is None:
+                    missing.append(code)
+                else:
+                    found[code] = original_url
+            found.update(find_original_urls(missing))
+
+            results = []
+            for code, lookup in zip(codes, lookups):
+                original_url = found.get(lookup)
+                if lookup is None:
+                    status = 'invalid'
+                elif original_url is None:
+                    status = 'not_found'
+                else:
+                    status = 'found'
+                results.append({'code': code, 'status': status, 'original_url': original_url})
+            return create_success_response({'results': results})
+
+        except Exception as e:
+            return handle_server_error(e, "while resolving short URLs")
+
+    #GET /links - operator listing of links, newest first, one keyset page at a time
+    @app.route('/links', methods=['GET'])
+    @admin_required
+    def list_links():
+        query, error_response, status_code = validate_links_request(
+            request.args, config.LINKS_PAGE_SIZE, config.LINKS_MAX_PAGE_SIZE
+        )
+        if error_response:
+            return create_error_response(error_response, status_code)
+
+        links = LinkQuery(scan_budget=config.LINKS_SCAN_BUDGET, **query)
+
+        def generate():
+            # Stream rows as they are read so large pages never sit in memory twice
+            yield '{"links": ['
+            for position, link in enumerate(links):
+                yield (',' if position else '') + json.dumps(link)
+            yield '], "next_cursor": ' + json.dumps(links.next_cursor) + '}'
+
+        return Response(stream_with_context(generate()), mimetype='application/json')
+
+    #GET /stats/domains - busiest domains by links or clicks, or one domain's counters
+    @app.route('/stats/domains', methods=['GET'])
+    @admin_required
+    def domain_statistics():
+        domain = request.args.get('domain', '').strip().lower()
+        if domain:
+            stats = domain_stats(domain)
+            if stats is None:
+                return handle_not_found("Domain", domain)
+            return create_success_response(stats)
+
+        sort = request.args.get('sort', 'links')
+        try:
+            limit = int(request.args.get('limit', 20))
+        except ValueError:
+            limit = 0
+        if sort not in SORT_COLUMNS or not 1 <= limit <= config.LINKS_MAX_PAGE_SIZE:
+            return create_error_response({
+                'error': f'sort must be one of {", ".join(SORT_COLUMNS)} and limit between 1 and {config.LINKS_MAX_PAGE_SIZE}'
+            }, 400)
+
+        return create_success_response({'domains': top_domains(limit, sort)})
+
+    #GET /replication/changes - changelog entries after a sequence number, for followers
+    @app.route('/replication/changes', methods=['GET'])
+    @admin_required
+    def replication_changes():
+        try:
+            after = int(request.args.get('after', 0))
+            limit = int(request.args.get('limit', config.REPLICATION_BATCH_SIZE))
+        except ValueError:
+            after, limit = -1, 0
+        if after < 0 or not 1 <= limit <= MAX_BATCH_SIZE:
+            return create_error_response({
+                'error': f'after must be a sequence number and limit between 1 and {MAX_BATCH_SIZE}'
+            }, 400)
+
+        if app.extensions.get('changelog') is None:
+            return create_error_response({'error': 'This node keeps no changelog (REPLICATION_CHANGELOG)'}, 404)
+        with get_db_connection() as conn:
+            try:
+                changes, newest = read_changes(conn, after, limit)
+            except ChangelogPruned as e:
+                return create_error_response({'error': str(e)}, 410)
+            max_id = newest_url_id(conn)
+        # max_id bounds which codes a follower asks /replication/lookup about
+        return create_success_response({'changes': changes, 'last_seq': newest, 'max_id': max_id})
+
+    #GET /replication/lookup - one code's original URL, for a follower's fallback lookups (not rate limited)
+    @app.route('/replication/lookup', methods=['GET'])
+    @admin_required
+    def replication_lookup():
+        code = request.args.get('code', '')
+        try:
+            short_domain = int(request.args['short_domain']) if 'short_domain' in request.args else None
+        except ValueError:
+            return create_error_response({'error': 'short_domain must be a number'}, 400)
+        is_valid, error_response, status_code = validate_short_url(code)
+        if not is_valid:
+            return create_error_response(error_response, status_code)
+        return create_success_response({'code': code, 'original_url': find_original_url(code, short_domain)})
+
+    #GET /replication/status - this node's role and, on a follower, its replication lag
+    @app.route('/replication/status', methods=['GET'])
+    def replication_status():
+        if app.extensions.get('follower') is not None:
+            return create_success_response(follower_status())
+        return create_success_response({'role': 'primary', 'last_seq': last_seq()})
+
     #GET /<short_url> - redirects to the original long URL
     @app.route('/<short_url>', methods=['GET'])
     def redirect_to_url(short_url):
@@ -83,9 +244,27 @@ def register_routes(app):
             if not is_valid:
                 return create_error_response(error_response, status_code)
                 
-            original_url = find_original_url(short_url.strip())
+            # Cached, and concurrent misses for the same code share one lookup
+            follower = app.extensions.get('follower')
+            loader = follower.find_original_url if follower is not None else find_original_url
+            code = short_url.strip()
+            namespace = short_domains.namespace(request.host)
+            if namespace is None:
+                original_url = redirect_cache.resolve(code, loader)
+            else:
+                # With several short domains a code only resolves on the domain it was created for
+                original_url = redirect_cache.resolve(
+                    cache_key(code, namespace), lambda key: loader(code, namespace)
+                )
             
             if original_url:
+                click_counter = app.extensions.get('click_counter')
+                if click_counter is not None:
+                    click_counter.record(original_url)
+                click_log = app.extensions.get('click_log')
+                if click_log is not None:
+                    click_log.record(short_url, request.headers.get('Referer'),
+                                     request.headers.get('User-Agent'), client_ip())
                 return redirect(original_url), 302  # Found - Temporary Redirect
             else:
                 return handle_not_found("Short URL", short_url)
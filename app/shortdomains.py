@@ -0,0 +1,95 @@
+"""
+Short domains: the host names short links are handed out on.
+
+SHORT_DOMAIN is the canonical one ("sho.rt", or "https://sho.rt" to always
+use https). Each short URL is its base string plus the code. The base is
+built once per domain and scheme, not per request with url_for. Without
+SHORT_DOMAIN the request's own Host is used, as before.
+
+SHORT_DOMAINS lists extra domains ("brand.co,go.example.com"), each with its
+own code namespace. A link records which domain it was created for, in
+urls.short_domain: 0 for the canonical domain, and for the others a stable
+key derived from the name, so it is the same on every node and survives
+reordering the list. A redirect on a listed domain only finds links created
+for it. Any other host counts as the canonical domain. The domain a request
+arrived on is found with one dict lookup on its Host header.
+"""
+import zlib
+
+from app import config
+
+CANONICAL = 0
+
+def domain_key(name):
+    """Stable, non-zero key for an extra short domain"""
+    return zlib.crc32(name.encode('utf-8')) & 0x7FFFFFFF or 1
+
+def cache_key(code, key):
+    """Redirect cache key of a code in a domain's namespace"""
+    return code if key == CANONICAL else f"{code}@{key}"
+
+def _split_domain(value):
+    """'https://sho.rt/' -> ('https', 'sho.rt'); 'sho.rt' -> (None, 'sho.rt')"""
+    value = value.strip().rstrip('/')
+    scheme, sep, host = value.partition('://')
+    if not sep:
+        return None, value.lower()
+    if scheme not in ('http', 'https') or not host:
+        raise ValueError(f"Short domains look like sho.rt or https://sho.rt, got {value!r}")
+    return scheme, host.lower()
+
+class ShortDomain:
+    def __init__(self, value, key):
+        self.scheme, self.host = _split_domain(value)
+        self.key = key
+        # Precomputed base per request scheme
+        self._bases = {
+            scheme: f"{self.scheme or scheme}://{self.host}/" for scheme in ('http', 'https')
+        }
+
+    def short_url(self, code, scheme):
+        return self._bases[scheme] + code
+
+class ShortDomains:
+    """The configured short domains, with Host -> domain and key -> domain lookup tables"""
+
+    def __init__(self, canonical='', extras=()):
+        self.canonical = ShortDomain(canonical, CANONICAL) if canonical else None
+        self._by_key = {CANONICAL: self.canonical}
+        self._by_host = {}
+        for value in extras:
+            domain = ShortDomain(value, None)
+            domain.key = domain_key(domain.host)
+            self._by_key[domain.key] = domain
+            self._by_host[domain.host] = domain
+        # Only with extra domains do links need checking against the host they're requested on
+        self.scoped = bool(self._by_host)
+        if self.canonical is not None:
+            self._by_host.setdefault(self.canonical.host, self.canonical)
+
+    def for_host(self, host):
+        """The short domain a Host header (or domain name) names, or None for any other host"""
+        host = host.lower()
+        domain = self._by_host.get(host)
+        if domain is None and ':' in host:
+            domain = self._by_host.get(host.rsplit(':', 1)[0])
+        return domain
+
+    def namespace(self, host):
+        """Key of the namespace a request on host resolves codes in; None when there are no extra domains"""
+        if not self.scoped:
+            return None
+        domain = self.for_host(host)
+        return domain.key if domain is not None else CANONICAL
+
+    def short_url(self, code, scheme, host, key=CANONICAL):
+        """The full short URL for a code in namespace key, asked for by a request on host"""
+        domain = self._by_key.get(key)
+        if domain is None:
+            return f"{scheme}://{host}/{code}"
+        return domain.short_url(code, scheme)
+
+def load_short_domains():
+    """ShortDomains from SHORT_DOMAIN and SHORT_DOMAINS"""
+    extras = [value for value in config.SHORT_DOMAINS.split(',') if value.strip()]
+    return ShortDomains(config.SHORT_DOMAIN, extras)
@@ -1,7 +1,28 @@
+import hashlib
+from functools import lru_cache
+from app import config
+
+CHARACTERS = "0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"
+BASE = len(CHARACTERS)
+CHARACTER_VALUES = {char: value for value, char in enumerate(CHARACTERS)}
+
+# Feistel permutation used by the "feistel" short code scheme: ids are permuted
+# within [0, 2**FEISTEL_BITS) so codes stay at most 7 characters long
+FEISTEL_BITS = 40
+FEISTEL_ROUNDS = 4
+_HALF_BITS = FEISTEL_BITS // 2
+_HALF_MASK = (1 << _HALF_BITS) - 1
+
+# 62**10 still fits in a signed 64-bit integer, 62**11 doesn't
+MAX_VECTOR_WIDTH = 10
+
 # Short URL generator using base62 encoding - takes in id from db
 def generate_short_url(url_id):
-    characters = "0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"
-    base = len(characters)
+    if config.SHORT_CODE_SCHEME == "feistel":
+        url_id = permute_id(url_id)
+
+    characters = CHARACTERS
+    base = BASE
     short_url = []
 
     while url_id > 0:
@@ -11,3 +32,176 @@ def generate_short_url(url_id):
     return ''.join(reversed(short_url)) if short_url else characters[0]
 
 # divmod - returns a tuple of the quotient and remainder when dividing two numbers (x//y, x%y)
+
+def decode_base62(short_url):
+    """Plain base62 value of a short URL, without undoing any short code scheme"""
+    if not short_url:
+        raise ValueError("Short URL cannot be empty")
+
+    value = 0
+    for char in short_url:
+        try:
+            value = value * BASE + CHARACTER_VALUES[char]
+        except KeyError:
+            raise ValueError(f"Invalid base62 character: {char!r}") from None
+    return value
+
+def decode_short_url(short_url):
+    """Turn a base62 short URL back into the id it was generated from"""
+    url_id = decode_base62(short_url)
+    if config.SHORT_CODE_SCHEME == "feistel":
+        return unpermute_id(url_id)
+    return url_id
+
+# Keyed Feistel network over FEISTEL_BITS bits: a bijection, so every id maps to a
+# unique code (no collisions, no lookup table) and decoding just runs it backwards
+
+@lru_cache(maxsize=4)
+def _round_keys(key):
+    if not key:
+        raise ValueError("SHORT_CODE_KEY must be set to use the feistel short code scheme")
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=4 * FEISTEL_ROUNDS).digest()
+    return tuple(int.from_bytes(digest[i:i + 4], 'big') for i in range(0, len(digest), 4))
+
+def _round(half, round_key):
+    mixed = ((half ^ round_key) * 0x9E3779B1) & 0xFFFFFFFF
+    return (mixed ^ (mixed >> 15)) & _HALF_MASK
+
+def permute_id(url_id):
+    """Map an id onto a scrambled id in [0, 2**FEISTEL_BITS)"""
+    if not 0 <= url_id < (1 << FEISTEL_BITS):
+        raise ValueError(f"id {url_id} is outside the {FEISTEL_BITS}-bit feistel range")
+
+    left, right = url_id >> _HALF_BITS, url_id & _HALF_MASK
+    for round_key in _round_keys(config.SHORT_CODE_KEY):
+        left, right = right, left ^ _round(right, round_key)
+    return (left << _HALF_BITS) | right
+
+def unpermute_id(value):
+    """Inverse of permute_id"""
+    if not 0 <= value < (1 << FEISTEL_BITS):
+        raise ValueError(f"{value} is outside the {FEISTEL_BITS}-bit feistel range")
+
+    left, right = value >> _HALF_BITS, value & _HALF_MASK
+    for round_key in reversed(_round_keys(config.SHORT_CODE_KEY)):
+        left, right = right ^ _round(left, round_key), left
+    return (left << _HALF_BITS) | right
+
+# Bulk versions of the above for import/export and batch jobs.
+# numpy is imported lazily so web workers that never call these don't pay for it on boot.
+
+def encode_many(ids, width=None):
+    """
+    Vectorised generate_short_url: encode an array of ids into a numpy array of
+    fixed-width bytes (dtype 'S<width>'). Each element is exactly the scalar
+    encoding; numpy pads shorter codes with NUL bytes, which it strips on access.
+    """
+    import numpy as np
+
+    ids = np.asarray(ids, dtype=np.int64).ravel()
+    if ids.size and ids.min() < 0:
+        raise ValueError("ids must be non-negative")
+    if config.SHORT_CODE_SCHEME == "feistel":
+        ids = _permute_many(ids)
+
+    needed = _base62_length(int(ids.max())) if ids.size else 1
+    width = needed if width is None else width
+    if width < needed or width > MAX_VECTOR_WIDTH:
+        raise ValueError(f"width must be between {needed} and {MAX_VECTOR_WIDTH}")
+
+    # digits[:, j] is the j-th base62 digit, most significant first
+    digits = np.empty((ids.size, width), dtype=np.int64)
+    remaining = ids.copy()
+    for column in range(width - 1, -1, -1):
+        remaining, digits[:, column] = np.divmod(remaining, BASE)
+
+    # Shift every code left so it starts at column 0, then NUL out the tail
+    lengths = np.maximum(width - _leading_zeros(digits), 1)
+    positions = np.arange(width)
+    source = np.minimum((width - lengths)[:, None] + positions, width - 1)
+    alphabet = np.frombuffer(CHARACTERS.encode('ascii'), dtype=np.uint8)
+    chars = alphabet[np.take_along_axis(digits, source, axis=1)]
+    chars[positions >= lengths[:, None]] = 0
+
+    return np.ascontiguousarray(chars).view(f'S{width}').ravel()
+
+def decode_many(short_urls):
+    """
+    Vectorised decode_short_url: decode an array (or list) of short URLs, as str
+    or bytes, into a numpy int64 array of ids. Raises ValueError if any code is
+    empty, too long, or contains a non-base62 character.
+    """
+    import numpy as np
+
+    codes = np.asarray(short_urls)
+    if codes.dtype.kind == 'U':
+        codes = np.char.encode(codes, 'ascii')
+    codes = codes.astype(f'S{max(codes.dtype.itemsize, 1)}').ravel()
+
+    width = codes.dtype.itemsize
+    if width > MAX_VECTOR_WIDTH:
+        raise ValueError(f"Short URLs longer than {MAX_VECTOR_WIDTH} characters can't be decoded in bulk")
+
+    chars = codes.view(np.uint8).reshape(codes.size, width)
+    values = _value_table()[chars]
+    padding = chars == 0
+
+    # Padding may only appear after the last character, and every code needs one
+    if np.any(values < 0) or np.any(padding[:, :-1] & ~padding[:, 1:]) or np.any(padding[:, 0]):
+        raise ValueError("Invalid base62 short URL in batch")
+
+    ids = np.zeros(codes.size, dtype=np.int64)
+    for column in range(width):
+        ids = np.where(padding[:, column], ids, ids * BASE + values[:, column])
+
+    if config.SHORT_CODE_SCHEME == "feistel":
+        return _permute_many(ids, inverse=True)
+    return ids
+
+def _permute_many(values, inverse=False):
+    """Vectorised permute_id / unpermute_id"""
+    import numpy as np
+
+    if values.size and (values.min() < 0 or values.max() >= (1 << FEISTEL_BITS)):
+        raise ValueError(f"values must be within the {FEISTEL_BITS}-bit feistel range")
+
+    # uint64 so the 32x32-bit multiply in _round can't overflow
+    values = values.astype(np.uint64)
+    left, right = values >> _HALF_BITS, values & _HALF_MASK
+    keys = _round_keys(config.SHORT_CODE_KEY)
+    if inverse:
+        for round_key in reversed(keys):
+            left, right = right ^ _round(left, round_key), left
+    else:
+        for round_key in keys:
+            left, right = right, left ^ _round(right, round_key)
+    return ((left << _HALF_BITS) | right).astype(np.int64)
+
+def _base62_length(value):
+    length = 1
+    while value >= BASE:
+        value //= BASE
+        length += 1
+    return length
+
+def _leading_zeros(digits):
+    import numpy as np
+
+    nonzero = digits != 0
+    first = np.argmax(nonzero, axis=1)
+    return np.where(nonzero.any(axis=1), first, digits.shape[1])
+
+_VALUE_TABLE = None
+
+def _value_table():
+    """Lookup table from byte to base62 value: -1 for invalid bytes, 0 for NUL padding"""
+    global _VALUE_TABLE
+    if _VALUE_TABLE is None:
+        import numpy as np
+
+        table = np.full(256, -1, dtype=np.int64)
+        table[0] = 0
+        for value, char in enumerate(CHARACTERS.encode('ascii')):
+            table[char] = value
+        _VALUE_TABLE = table
+    return _VALUE_TABLE
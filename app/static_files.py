@@ -0,0 +1,172 @@
+"""
+Serving the React build: index.html and the fingerprinted assets under /static.
+
+index.html is read once, together with its compressed variants, and served
+from memory with an ETag and `Cache-Control: no-cache`. Browsers revalidate it
+on every visit and get a 304 back unless a new build has been deployed.
+
+Assets come from the build's static/ directory. CRA fingerprints their file
+names (main.3f2a1b9c.js), so a fingerprinted file never changes under the same
+name and is sent with a one-year immutable Cache-Control. Browsers then don't
+ask for it again. When the client accepts it, the .br or .gz file written next
+to the original at image build time is sent as-is, so nothing is compressed
+per request. File metadata is looked up once per path.
+
+Usage (at image build time):
+    python -m app.static_files precompress /app/static
+"""
+import argparse
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from collections import namedtuple
+
+from flask import Response, request, send_file
+from werkzeug.security import safe_join
+
+from app.error_handlers import handle_not_found
+
+# CRA build names: main.3f2a1b9c.js, 787.2d1f8a3e.chunk.js, logo.5d5d9eef.svg
+FINGERPRINTED = re.compile(r'\.[0-9a-f]{8,}\.(?:chunk\.)?[A-Za-z0-9]+$')
+COMPRESSIBLE = {'.html', '.js', '.css', '.svg', '.json', '.map', '.txt', '.xml', '.ico'}
+MIN_COMPRESS_SIZE = 256
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+# Preferred first; extension of the precompressed file for each
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+_Asset = namedtuple('_Asset', ['paths', 'mimetype', 'etag', 'cache_control'])
+
+def _choose_encoding(available):
+    """Best encoding we have a variant for that the client accepts, or 'identity'"""
+    accepted = request.accept_encodings
+    for encoding, _ in ENCODINGS:
+        if encoding in available and accepted[encoding] > 0:
+            return encoding
+    return 'identity'
+
+def _finish(response, encoding, etag, cache_control):
+    response.set_etag(etag if encoding == 'identity' else f"{etag}-{encoding}")
+    response.headers['Cache-Control'] = cache_control
+    response.vary.add('Accept-Encoding')
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    return response.make_conditional(request)
+
+class StaticSite:
+    """index.html and static/ assets of a frontend build directory"""
+
+    def __init__(self, root):
+        self.root = root
+        self.assets_dir = os.path.join(root, 'static')
+        self._assets = {}
+        self._lock = threading.Lock()
+
+        # index.html and its variants, held in memory
+        self._index = {}
+        index_path = os.path.join(root, 'index.html')
+        with open(index_path, 'rb') as f:
+            self._index['identity'] = f.read()
+        for encoding, suffix in ENCODINGS:
+            if os.path.exists(index_path + suffix):
+                with open(index_path + suffix, 'rb') as f:
+                    self._index[encoding] = f.read()
+        self._index_etag = hashlib.blake2b(self._index['identity'], digest_size=8).hexdigest()
+
+    def index_response(self):
+        encoding = _choose_encoding(self._index)
+        response = Response(self._index[encoding], mimetype='text/html')
+        return _finish(response, encoding, self._index_etag, REVALIDATE)
+
+    def _asset(self, filename):
+        asset = self._assets.get(filename)
+        if asset is not None:
+            return asset
+
+        path = safe_join(self.assets_dir, filename)
+        if path is None or not os.path.isfile(path):
+            return None  # misses aren't remembered, so random paths can't grow the table
+
+        paths = {'identity': path}
+        for encoding, suffix in ENCODINGS:
+            if os.path.isfile(path + suffix):
+                paths[encoding] = path + suffix
+        stat = os.stat(path)
+        fingerprinted = FINGERPRINTED.search(os.path.basename(path)) is not None
+        asset = _Asset(
+            paths,
+            mimetypes.guess_type(path)[0] or 'application/octet-stream',
+            f"{stat.st_mtime_ns:x}-{stat.st_size:x}",
+            IMMUTABLE if fingerprinted else REVALIDATE,
+        )
+        with self._lock:
+            self._assets[filename] = asset
+        return asset
+
+    def asset_response(self, filename):
+        asset = self._asset(filename)
+        if asset is None:
+            return handle_not_found("File", filename)
+
+        encoding = _choose_encoding(asset.paths)
+        # send_file hands the file to the server's sendfile support where it can
+        response = send_file(asset.paths[encoding], mimetype=asset.mimetype, conditional=False, etag=False)
+        return _finish(response, encoding, asset.etag, asset.cache_control)
+
+def register_static_routes(app, site):
+    """Serve site's assets at /static/<path> (the app's own static folder must be disabled)"""
+
+    @app.route('/static/<path:filename>', methods=['GET'])
+    def static_asset(filename):
+        return site.asset_response(filename)
+
+def precompress(root, min_size=MIN_COMPRESS_SIZE):
+    """
+    Write .gz (and .br, if the optional brotli package is installed) next to
+    every compressible file under root, skipping variants that aren't smaller.
+    Returns the number of files written
+    """
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+
+    written = 0
+    for directory, _, files in os.walk(root):
+        for name in files:
+            path = os.path.join(directory, name)
+            if os.path.splitext(name)[1].lower() not in COMPRESSIBLE or os.path.getsize(path) < min_size:
+                continue
+            with open(path, 'rb') as f:
+                data = f.read()
+
+            variants = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                variants['.br'] = brotli.compress(data, quality=11)
+            for suffix, compressed in variants.items():
+                if len(compressed) < len(data):
+                    with open(path + suffix, 'wb') as f:
+                        f.write(compressed)
+                    written += 1
+    return written
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m app.static_files",
+        description="Prepare a frontend build for serving"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    compress = commands.add_parser("precompress", help="write .gz/.br variants of compressible files")
+    compress.add_argument("root", help="frontend build directory")
+    args = parser.parse_args(argv)
+
+    if args.command == "precompress":
+        print(f"wrote {precompress(args.root)} compressed files under {args.root}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Per-domain link and click counters.
+
+domain_stats holds one row per host. link_count is kept up to date by
+triggers on urls (see migration 5), so it is never recounted. With
+DOMAIN_STATS_FLUSH_INTERVAL set (it is 0, off, by default), clicks are
+counted in memory by each worker and added to click_count every that many
+seconds in one short transaction, so redirects never wait on a write. A worker that is killed loses at most that interval's
+clicks; a normal shutdown flushes them. Memory accounting (app/memory.py)
+flushes early when the buffered hosts take more than their cap.
+
+Top domains by either counter are read through an index on it, so the cost
+depends on how many are asked for, not on how many links or domains exist.
+"""
+import atexit
+import logging
+import threading
+from collections import Counter
+
+from app import config
+from app.db import get_db_connection
+from app.validators import url_host
+
+logger = logging.getLogger(__name__)
+
+SORT_COLUMNS = {'links': 'link_count', 'clicks': 'click_count'}
+# Per buffered host: its dict slot and count, plus the host string's header
+_HOST_OVERHEAD = 70
+
+class ClickCounter:
+    """Buffers redirect counts per host and periodically adds them to domain_stats"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.flushes = 0
+        self._counts = Counter()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="domain-click-counter", daemon=True)
+        self._thread.start()
+
+    def record(self, original_url):
+        host = url_host(original_url)
+        if host is None:
+            return
+        with self._lock:
+            self._counts[host] += 1
+
+    def pending(self):
+        with self._lock:
+            return sum(self._counts.values())
+
+    def nbytes(self):
+        """Approximate bytes held by the buffered counts"""
+        with self._lock:
+            return sum(_HOST_OVERHEAD + len(host) for host in self._counts)
+
+    def trim(self, max_bytes):
+        """Write the buffered counts now if they hold more than max_bytes"""
+        if self.nbytes() > max_bytes:
+            self.flush()
+
+    def flush(self):
+        """Write buffered counts to domain_stats; returns how many clicks were written"""
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+        if not counts:
+            return 0
+
+        try:
+            with get_db_connection() as conn:
+                conn.executemany(
+                    "UPDATE domain_stats SET click_count = click_count + ? WHERE host = ?",
+                    [(count, host) for host, count in counts.items()]
+                )
+        except Exception:
+            # Put them back and try again next time
+            with self._lock:
+                self._counts.update(counts)
+            raise
+        self.flushes += 1
+        return sum(counts.values())
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Failed to flush domain click counts")
+
+    def close(self):
+        self._stopped.set()
+        self._thread.join()
+        self.flush()
+
+def start_click_counter(app, interval=None):
+    """Count redirects per domain for this app; stored in app.extensions['click_counter']"""
+    counter = ClickCounter(config.DOMAIN_STATS_FLUSH_INTERVAL if interval is None else interval)
+    app.extensions['click_counter'] = counter
+    atexit.register(counter.close)
+    return counter
+
+def top_domains(limit, sort='links'):
+    """Return the `limit` busiest domains as dicts, by link or click count"""
+    column = SORT_COLUMNS[sort]
+    with get_db_connection() as conn:
+        rows = conn.execute(
+            f"SELECT host, link_count, click_count FROM domain_stats "
+            f"WHERE link_count > 0 ORDER BY {column} DESC LIMIT ?",
+            (limit,)
+        ).fetchall()
+    return [{'domain': host, 'links': links, 'clicks': clicks} for host, links, clicks in rows]
+
+def domain_stats(host):
+    """Counters for one domain, or None if no link has ever pointed at it"""
+    with get_db_connection() as conn:
+        row = conn.execute(
+            "SELECT host, link_count, click_count FROM domain_stats WHERE host = ?", (host,)
+        ).fetchone()
+    if row is None:
+        return None
+    return {'domain': row[0], 'links': row[1], 'clicks': row[2]}
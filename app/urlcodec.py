@@ -0,0 +1,205 @@
+"""
+Compressed storage for urls.original_url.
+
+With URL_COMPRESSION on, new URLs are stored as a BLOB: one header byte naming
+a dictionary, then the URL raw-deflated against that preset dictionary. A
+single URL is far too short for zlib to find repeats in on its own; primed
+with the prefixes and query parameters our links share, a typical 100
+character URL shrinks to around half. URLs that wouldn't get smaller are kept
+as TEXT, and TEXT values are always read back as-is, so compressed and plain
+rows mix freely and the setting can be switched on or off at any time.
+
+Dictionaries live in the url_dictionaries table and never change once written
+(id 1 is DEFAULT_DICTIONARY). `python -m app.urlcodec train` builds a new one
+from the links already stored; workers pick it up for new writes on restart.
+The compress_original_url backfill converts existing rows.
+
+Usage:
+    python -m app.urlcodec train [--sample 100000] [--size 4096]
+    python -m app.urlcodec stats
+"""
+import argparse
+import threading
+import zlib
+from collections import Counter
+
+from app import config, db
+from app.compact import PrefixTable
+
+DICTIONARY_SIZE = 4096
+MAX_DICTIONARY_ID = 255  # ids are stored in one header byte
+_WBITS = -15  # raw deflate: no zlib header or checksum, saving 6 bytes per URL
+
+# Built-in dictionary (id 1). zlib matches nearer the end of the dictionary
+# with shorter codes, so the most common fragments come last
+DEFAULT_DICTIONARY = (
+    "index.html.php.aspx/en/en-us/en-gb/amp/blog/news/article/posts/2024/2025/"
+    "&ref=&source=&lang=en&page=&sort=&q=&id=?id=?v=watch?v=&t=&list="
+    "https://docs.google.com/document/d/https://drive.google.com/file/d/"
+    "https://www.youtube.com/watch?v=https://youtu.be/https://github.com/"
+    "https://www.linkedin.com/in/https://twitter.com/https://x.com/"
+    "https://www.instagram.com/p/https://www.facebook.com/https://en.wikipedia.org/wiki/"
+    "https://www.amazon.com/dp/https://medium.com/@https://www.reddit.com/r/"
+    ".co.uk/.org/.net/.io/search?q=/products//collections//category/"
+    "&utm_content=&utm_term=&utm_campaign=&utm_medium=email&utm_medium=social"
+    "?utm_source=newsletter&utm_medium=?utm_source=http://www.https://www."
+).encode('utf-8')
+
+class UrlCodec:
+    """Compresses and decompresses URLs against one preset dictionary"""
+
+    def __init__(self, dictionary_id, dictionary):
+        if not 1 <= dictionary_id <= MAX_DICTIONARY_ID:
+            raise ValueError(f"dictionary id must be between 1 and {MAX_DICTIONARY_ID}")
+        self.dictionary_id = dictionary_id
+        self.dictionary = dictionary
+        self._header = bytes([dictionary_id])
+        # Priming a (de)compressor with a dictionary costs more than compressing
+        # one URL, so prime once and copy the primed state for every call
+        self._compressor = zlib.compressobj(9, zlib.DEFLATED, _WBITS, 9, zlib.Z_DEFAULT_STRATEGY, dictionary)
+        self._decompressor = zlib.decompressobj(_WBITS, dictionary)
+
+    def compress(self, url):
+        """Return the value to store: a BLOB, or url itself if compressing doesn't help"""
+        raw = url.encode('utf-8')
+        compressor = self._compressor.copy()
+        data = self._header + compressor.compress(raw) + compressor.flush()
+        return data if len(data) < len(raw) else url
+
+    def decompress(self, data):
+        decompressor = self._decompressor.copy()
+        return (decompressor.decompress(data[1:]) + decompressor.flush()).decode('utf-8')
+
+# Per database file: {dictionary id: UrlCodec} and the id new writes use
+_codecs = {}
+_active_ids = {}
+_lock = threading.Lock()
+
+def _load_codec(conn, dictionary_id, path=None):
+    key = (path or db.DB_PATH, dictionary_id)
+    codec = _codecs.get(key)
+    if codec is None:
+        row = conn.execute("SELECT data FROM url_dictionaries WHERE id = ?", (dictionary_id,)).fetchone()
+        if row is None:
+            raise LookupError(f"Unknown URL dictionary {dictionary_id}")
+        codec = UrlCodec(dictionary_id, bytes(row[0]))
+        with _lock:
+            _codecs[key] = codec
+    return codec
+
+def active_codec(conn):
+    """The codec new writes use: the newest dictionary, fixed for the life of the process"""
+    dictionary_id = _active_ids.get(db.DB_PATH)
+    if dictionary_id is None:
+        dictionary_id = conn.execute("SELECT MAX(id) FROM url_dictionaries").fetchone()[0]
+        with _lock:
+            _active_ids[db.DB_PATH] = dictionary_id
+    return _load_codec(conn, dictionary_id)
+
+def encode_url(conn, url):
+    """Value to store in urls.original_url for url (compressed if URL_COMPRESSION is on)"""
+    if not config.URL_COMPRESSION:
+        return url
+    return active_codec(conn).compress(url)
+
+def decode_url(conn, value, path=None):
+    """
+    Inverse of encode_url, for a value read from urls.original_url. Pass the
+    database's path if conn isn't a connection to app.db.DB_PATH
+    """
+    if isinstance(value, str) or value is None:
+        return value
+    return _load_codec(conn, value[0], path).decompress(value)
+
+def reset_codecs():
+    """Forget loaded dictionaries, e.g. after training a new one in this process"""
+    with _lock:
+        _codecs.clear()
+        _active_ids.clear()
+
+def _fragments(url):
+    """Split a URL into the pieces worth putting in a dictionary"""
+    prefix = PrefixTable.prefix_of(url)
+    yield prefix
+    path, _, query = url[len(prefix):].partition('?')
+    for segment in path.split('/')[:-1]:
+        if segment:
+            yield segment + '/'
+    for parameter in query.split('&'):
+        name, equals, value = parameter.partition('=')
+        if equals:
+            yield name + '='
+            if len(value) <= 16:
+                yield parameter  # common name=value pairs like utm_medium=email
+
+def train_dictionary(urls, size=DICTIONARY_SIZE):
+    """
+    Build a preset dictionary from sample URLs: the fragments (prefixes, path
+    segments, query parameters) that would save the most bytes, ordered so
+    the most valuable ones end up last
+    """
+    counts = Counter()
+    for url in urls:
+        counts.update(set(_fragments(url)))
+
+    # Bytes saved if each occurrence could be replaced by a back-reference
+    scored = sorted(
+        ((count * len(fragment), fragment) for fragment, count in counts.items() if count > 1),
+        reverse=True
+    )
+    chosen, used = [], 0
+    for _, fragment in scored:
+        encoded = fragment.encode('utf-8')
+        if used + len(encoded) > size:
+            continue
+        chosen.append(encoded)
+        used += len(encoded)
+    return b''.join(reversed(chosen))
+
+def add_dictionary(conn, dictionary):
+    """Store a new dictionary and return its id; new writes use it after a restart"""
+    cursor = conn.execute("INSERT INTO url_dictionaries (data) VALUES (?)", (dictionary,))
+    if cursor.lastrowid > MAX_DICTIONARY_ID:
+        conn.rollback()
+        raise ValueError(f"No more than {MAX_DICTIONARY_ID} URL dictionaries can be stored")
+    conn.commit()
+    return cursor.lastrowid
+
+def storage_stats(conn):
+    """Return (rows, compressed rows, stored bytes, original bytes) for urls.original_url"""
+    rows, compressed, stored = conn.execute(
+        "SELECT COUNT(*), COALESCE(SUM(typeof(original_url) = 'blob'), 0), "
+        "COALESCE(SUM(length(CAST(original_url AS BLOB))), 0) FROM urls"
+    ).fetchone()
+    original = stored
+    cursor = conn.execute("SELECT original_url FROM urls WHERE typeof(original_url) = 'blob'")
+    for (value,) in cursor:
+        original += len(decode_url(conn, value).encode('utf-8')) - len(value)
+    return rows, compressed, stored, original
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m app.urlcodec",
+        description="Train URL compression dictionaries and report storage savings"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    train = commands.add_parser("train", help="build a dictionary from stored URLs")
+    train.add_argument("--sample", type=int, default=100_000, help="number of recent URLs to learn from")
+    train.add_argument("--size", type=int, default=DICTIONARY_SIZE, help="dictionary size in bytes")
+    commands.add_parser("stats", help="show how much original_url storage compression saves")
+    args = parser.parse_args(argv)
+
+    with db.get_db_connection() as conn:
+        if args.command == "train":
+            cursor = conn.execute("SELECT original_url FROM urls ORDER BY id DESC LIMIT ?", (args.sample,))
+            dictionary = train_dictionary((decode_url(conn, value) for (value,) in cursor), args.size)
+            dictionary_id = add_dictionary(conn, dictionary)
+            print(f"stored dictionary {dictionary_id} ({len(dictionary)} bytes); restart workers to use it")
+
+        elif args.command == "stats":
+            rows, compressed, stored, original = storage_stats(conn)
+            ratio = stored / original if original else 1.0
+            print(f"{rows} urls, {compressed} compressed; {stored} bytes stored for {original} bytes of URLs ({ratio:.0%})")
+
+if __name__ == "__main__":
+    main()
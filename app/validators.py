@@ -1,6 +1,9 @@
 import re
+from datetime import datetime, timezone
 
 #Compile URL pattern once for performance and then use it for validation
+# This is the reference definition of a valid URL; is_valid_url implements the same
+# rules with a cheap structural split and only uses a regex for the host portion
 URL_PATTERN = re.compile(
     r'^https?://'  # http:// or https://
     r'(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+[A-Z]{2,6}\.?|'  # domain...
@@ -9,15 +12,122 @@ URL_PATTERN = re.compile(
     r'(?::\d+)?'  # optional port
     r'(?:/?|[/?]\S+)$', re.IGNORECASE)
 
+# Host portion only (domain or localhost) - IPs are checked without a regex
+HOST_PATTERN = re.compile(
+    r'(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+[A-Z]{2,6}\.?|localhost)',
+    re.IGNORECASE)
+WHITESPACE_PATTERN = re.compile(r'\s')
+
 # Configuration constants
 MAX_URL_LENGTH = 2048
 MAX_SHORT_URL_LENGTH = 10
+MAX_HOST_LENGTH = 253  # longest valid DNS name, keeps the host regex bounded
+
+def split_url(url):
+    """
+    Split an already stripped URL into (scheme, host, port, rest) without any regex.
+    port is None when absent; rest is everything from the first '/' or '?' on.
+    Returns None if the URL doesn't start with http:// or https://
+    """
+    prefix = url[:8].lower()
+    if prefix.startswith('https://'):
+        scheme, start = 'https', 8
+    elif prefix.startswith('http://'):
+        scheme, start = 'http', 7
+    else:
+        return None
+
+    # The authority ends at the first '/' or '?'
+    end = url.find('/', start)
+    if end == -1:
+        end = len(url)
+    query = url.find('?', start, end)
+    if query != -1:
+        end = query
+
+    host, colon, port = url[start:end].partition(':')
+    return scheme, host, port if colon else None, url[end:]
+
+def url_host(url):
+    """Lower-cased host of a URL without its port, or None if it has no http(s) host"""
+    parts = split_url(url.strip())
+    if parts is None or not parts[1]:
+        return None
+    return parts[1].lower()
+
+def is_valid_host(host):
+    """Validate a URL host: a domain name, localhost or an IPv4 address"""
+    if not host or len(host) > MAX_HOST_LENGTH:
+        return False
+
+    # IPv4 fast path: four dot-separated ASCII numbers between 0 and 255.
+    # Domain names end in a letter (or a dot), so only split hosts ending in a digit
+    if host[-1].isdigit():
+        octets = host.split('.')
+        if len(octets) == 4 and all(octet.isascii() and octet.isdigit() for octet in octets):
+            return all(len(octet) <= 3 and int(octet) <= 255 for octet in octets)
+
+    return HOST_PATTERN.fullmatch(host) is not None
+
+def _is_valid_stripped_url(url):
+    parts = split_url(url)
+    if parts is None:
+        return False
+    _, host, port, rest = parts
+
+    if port is not None and not port.isdecimal():
+        return False
+
+    # Path/query: nothing, a lone '/', or '/' or '?' followed by non-whitespace
+    if len(rest) > 1:
+        if WHITESPACE_PATTERN.search(rest):
+            return False
+    elif rest == '?':
+        return False
+
+    return is_valid_host(host)
 
 def is_valid_url(url):
-    """Validate URL format using regex"""
+    """Validate URL format"""
     if not url or not isinstance(url, str):
         return False
-    return URL_PATTERN.match(url.strip()) is not None
+    return _is_valid_stripped_url(url.strip())
+
+def check_url(url):
+    """
+    Validate a single URL for shortening, cheapest checks first: type and
+    emptiness, then length, then structure, and the host regex last.
+    Returns (url, error_response, status_code) - the stripped URL with
+    None, None when valid, otherwise None with the error to send back
+    """
+    if not url:
+        return None, {'error': 'URL cannot be empty'}, 400
+
+    if not isinstance(url, str):
+        return None, {
+            'error': 'Invalid URL format. URL must start with http:// or https://'
+        }, 422
+
+    url = url.strip()
+    if not url:
+        return None, {'error': 'URL cannot be empty'}, 400
+
+    # Check URL length (reasonable limit) before doing any parsing
+    if len(url) > MAX_URL_LENGTH:
+        return None, {
+            'error': f'URL too long. Maximum length is {MAX_URL_LENGTH} characters'
+        }, 422
+
+    if not _is_valid_stripped_url(url):
+        return None, {
+            'error': 'Invalid URL format. URL must start with http:// or https://'
+        }, 422
+
+    return url, None, None
+
+def check_urls(urls):
+    """Validate a batch of URLs; returns one check_url result per input, in order"""
+    return [check_url(url) for url in urls]
 
 def validate_shorten_request(request_data, is_json):
     """
@@ -27,33 +137,19 @@ def validate_shorten_request(request_data, is_json):
     # Check if request has JSON content
     if not is_json:
         return False, {'error': 'Content-Type must be application/json'}, 400
-    
+
     # Check if JSON body exists
     if request_data is None:
         return False, {'error': 'Request body must contain valid JSON'}, 400
-    
+
     # Check if 'url' field exists
     if 'url' not in request_data:
         return False, {'error': 'Missing required field: url'}, 400
-    
-    original_url = request_data.get('url')
-    
-    # Check if URL is empty or None
-    if not original_url or not original_url.strip():
-        return False, {'error': 'URL cannot be empty'}, 400
-    
-    # Validate URL format
-    if not is_valid_url(original_url.strip()):
-        return False, {
-            'error': 'Invalid URL format. URL must start with http:// or https://'
-        }, 422
-    
-    # Check URL length (reasonable limit)
-    if len(original_url.strip()) > MAX_URL_LENGTH:
-        return False, {
-            'error': f'URL too long. Maximum length is {MAX_URL_LENGTH} characters'
-        }, 422
-    
+
+    _, error_response, status_code = check_url(request_data.get('url'))
+    if error_response:
+        return False, error_response, status_code
+
     return True, None, None
 
 def validate_short_url(short_url):
@@ -64,9 +160,69 @@ def validate_short_url(short_url):
     # Basic validation of short_url format
     if not short_url or len(short_url.strip()) == 0:
         return False, {'error': 'Invalid short URL format'}, 400
-    
+
     # Check for reasonable length (base62 shouldn't be too long)
     if len(short_url.strip()) > MAX_SHORT_URL_LENGTH:
         return False, {'error': 'Invalid short URL format'}, 400
-    
+
     return True, None, None
+
+def validate_resolve_batch_request(request_data, max_codes):
+    """
+    Validate the POST /resolve/batch body: {"codes": [...]}
+    Returns: (codes, error_response, status_code)
+    """
+    if not isinstance(request_data, dict):
+        return None, {'error': 'Request body must be a JSON object'}, 400
+
+    codes = request_data.get('codes')
+    if not isinstance(codes, list) or not all(isinstance(code, str) for code in codes):
+        return None, {'error': 'codes must be a list of strings'}, 400
+    if not 1 <= len(codes) <= max_codes:
+        return None, {'error': f'codes must hold between 1 and {max_codes} short URLs'}, 400
+
+    return codes, None, None
+
+def _parse_timestamp(value):
+    """ISO 8601 date or datetime -> 'YYYY-MM-DD HH:MM:SS' in UTC, as created_at is stored"""
+    parsed = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed.strftime('%Y-%m-%d %H:%M:%S')
+
+def validate_links_request(args, default_limit, max_limit):
+    """
+    Validate the GET /links query string
+    Returns: (query, error_response, status_code) - query holds LinkQuery keyword arguments
+    """
+    query = {}
+
+    try:
+        query['limit'] = int(args.get('limit', default_limit))
+        cursor = args.get('cursor')
+        query['before_id'] = int(cursor) if cursor else None
+    except ValueError:
+        return None, {'error': 'limit and cursor must be integers'}, 400
+    if not 1 <= query['limit'] <= max_limit:
+        return None, {'error': f'limit must be between 1 and {max_limit}'}, 400
+
+    for name in ('created_after', 'created_before'):
+        value = args.get(name)
+        try:
+            query[name] = _parse_timestamp(value) if value else None
+        except ValueError:
+            return None, {'error': f'{name} must be an ISO 8601 date or datetime'}, 400
+
+    domain = args.get('domain', '').strip().lower()
+    if domain and not is_valid_host(domain):
+        return None, {'error': 'Invalid domain'}, 400
+    query['host'] = domain or None
+
+    prefix = args.get('prefix', '').strip()
+    if prefix and split_url(prefix) is None:
+        return None, {
+            'error': 'Invalid URL prefix. Prefix must start with http:// or https://'
+        }, 400
+    query['prefix'] = prefix or None
+
+    return query, None, None
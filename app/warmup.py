@@ -0,0 +1,63 @@
+"""
+Redirect cache warm-up at worker start.
+
+After a deploy every worker starts with an empty cache, so create_app preloads
+the links most likely to be requested from a single bulk query. It runs in a
+background thread so the worker starts serving straight away, and stops once
+it has loaded CACHE_WARMUP_SIZE links or spent CACHE_WARMUP_BUDGET seconds.
+"""
+import logging
+import threading
+import time
+
+from app import config
+from app.models import iter_warmup_urls
+
+logger = logging.getLogger(__name__)
+
+def warm_redirect_cache(cache, limit, budget):
+    """Load up to `limit` links into the cache within `budget` seconds; returns how many"""
+    limit = min(limit, cache.max_entries)
+    if limit <= 0:
+        return 0
+
+    deadline = time.monotonic() + budget
+    batch = []
+    loaded = 0
+    for code, original_url in iter_warmup_urls(limit):
+        batch.append((code, original_url))
+        if len(batch) >= 500:
+            cache.set_many(batch)
+            loaded += len(batch)
+            batch = []
+            if time.monotonic() >= deadline:
+                logger.warning("Cache warm-up stopped at the %ss budget after %d links", budget, loaded)
+                return loaded
+
+    cache.set_many(batch)
+    return loaded + len(batch)
+
+def start_cache_warmup(app, limit=None, budget=None):
+    """
+    Warm the app's redirect cache in a background thread.
+    app.extensions['cache_warmup'] is an Event that is set once warm-up has finished
+    """
+    limit = config.CACHE_WARMUP_SIZE if limit is None else limit
+    budget = config.CACHE_WARMUP_BUDGET if budget is None else budget
+    done = threading.Event()
+    app.extensions['cache_warmup'] = done
+
+    def run():
+        try:
+            start = time.monotonic()
+            loaded = warm_redirect_cache(app.extensions['redirect_cache'], limit, budget)
+            logger.info("Warmed redirect cache with %d links in %.3fs", loaded, time.monotonic() - start)
+        except Exception:
+            # A cold cache is slower, not broken - keep serving
+            logger.exception("Cache warm-up failed")
+        finally:
+            done.set()
+
+    thread = threading.Thread(target=run, name="cache-warmup", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,137 @@
+"""
+Group commit for shorten requests.
+
+Instead of every request committing its own insert (two fsyncs each in
+save_url_to_db/update_short_url_in_db), requests hand their URL to a background
+writer thread and wait. The writer collects everything that arrives within
+`max_delay` seconds (up to `max_batch` rows), writes it in one transaction and
+then hands each caller its short URL.
+
+Commits are also spaced at least `max_delay` apart, so a worker never does more
+than 1 / max_delay commits per second however many requests arrive. Batching
+only helps when a worker handles requests concurrently (gunicorn --threads).
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from app import config, models
+from app.db import get_db_connection
+from app.shortdomains import CANONICAL
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+class GroupCommitWriter:
+    """Background thread that batches URL inserts into one transaction per batch"""
+
+    def __init__(self, max_batch=100, max_delay=0.005, timeout=30.0):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.batches = 0
+        self.rows = 0
+        self._queue = queue.Queue()
+        self._last_commit = 0.0
+        self._thread = threading.Thread(target=self._run, name="group-commit-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, original_url, short_domain=CANONICAL):
+        """Queue a URL for insertion; the returned Future resolves to its short URL"""
+        future = Future()
+        self._queue.put((original_url, short_domain, future))
+        return future
+
+    def shorten(self, original_url, short_domain=CANONICAL):
+        """Insert a URL as part of the next batch and return its short URL"""
+        return self.submit(original_url, short_domain).result(self.timeout)
+
+    def close(self):
+        """Write whatever is queued, then stop the writer thread"""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+
+            # Collect until the batch is full and the commit interval has passed
+            commit_at = max(time.monotonic() + self.max_delay, self._last_commit + self.max_delay)
+            while len(batch) < self.max_batch:
+                remaining = commit_at - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            # A full batch still waits for the interval, to keep commits/second bounded
+            wait = self._last_commit + self.max_delay - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            self._commit(batch)
+
+        # Drain anything queued after the stop request
+        leftovers = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                leftovers.append(item)
+        if leftovers:
+            self._commit(leftovers)
+
+    def _commit(self, batch):
+        futures = [future for _, _, future in batch]
+        try:
+            with get_db_connection() as conn:
+                short_urls = models.insert_urls(
+                    conn, [url for url, _, _ in batch], [short_domain for _, short_domain, _ in batch]
+                )
+                conn.commit()
+        except Exception as error:
+            logger.exception("Group commit of %d rows failed", len(batch))
+            for future in futures:
+                future.set_exception(error)
+        else:
+            for future, short_url in zip(futures, short_urls):
+                future.set_result(short_url)
+            self.batches += 1
+            self.rows += len(batch)
+        finally:
+            self._last_commit = time.monotonic()
+
+def start_group_commit(max_batch=None, max_delay=None):
+    """Route get_short_url through a background writer for this process"""
+    if models.group_commit_writer is not None:
+        return models.group_commit_writer
+
+    writer = GroupCommitWriter(
+        config.GROUP_COMMIT_MAX_BATCH if max_batch is None else max_batch,
+        config.GROUP_COMMIT_MAX_DELAY_MS / 1000 if max_delay is None else max_delay
+    )
+    models.group_commit_writer = writer
+    atexit.register(stop_group_commit)
+    return writer
+
+def stop_group_commit():
+    """Flush and stop the writer; get_short_url goes back to committing per request"""
+    writer, models.group_commit_writer = models.group_commit_writer, None
+    if writer is not None:
+        writer.close()
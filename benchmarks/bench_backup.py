@@ -0,0 +1,95 @@
+"""
+Online backup cost: throughput of app.backup, and the longest a concurrent
+writer had to wait for a commit while it ran. Compares the incremental copy,
+a one-step copy and VACUUM INTO, with a writer committing one shorten every
+--interval seconds - first in the default rollback journal mode, then in WAL
+mode, where the incremental copy reads one snapshot and never restarts.
+
+    python -m benchmarks.bench_backup --rows 500000
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from benchmarks.common import temp_database, fill_urls
+from app.db import init_db
+from app.backup import backup_database, compact_database
+
+
+class Writer(threading.Thread):
+    """Commits one insert per interval, recording how long each commit took"""
+
+    def __init__(self, db_path, interval):
+        super().__init__(daemon=True)
+        self.db_path = db_path
+        self.interval = interval
+        self.latencies = []
+        self.stopped = threading.Event()
+
+    def run(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        while not self.stopped.wait(self.interval):
+            start = time.perf_counter()
+            conn.execute("INSERT INTO urls (original_url) VALUES ('https://www.example.com/bench-writer')")
+            conn.commit()
+            self.latencies.append(time.perf_counter() - start)
+        conn.close()
+
+
+def run(name, db_path, func, interval, dest):
+    # Freeing a large file the backup would replace can hold up fsyncs on its own
+    # (ext4 does it on rename), so each run starts without one
+    if os.path.exists(dest):
+        os.unlink(dest)
+
+    writer = Writer(db_path, interval)
+    writer.start()
+    time.sleep(0.2)
+    result = func()
+    time.sleep(0.2)
+    writer.stopped.set()
+    writer.join()
+
+    latencies = sorted(writer.latencies)
+    p99 = latencies[int(len(latencies) * 0.99)] if latencies else 0.0
+    line = f"{name:<28} max stall {latencies[-1] * 1e3:8.1f} ms  p99 {p99 * 1e3:6.1f} ms"
+    if result is not None:
+        line += (f"  {result.bytes / result.seconds / 2**20:7.1f} MiB/s  {result.seconds:6.2f}s"
+                 f"  {result.steps} steps, {result.restarts} restarts")
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=500_000)
+    parser.add_argument('--interval', type=float, default=0.05, help="seconds between writer commits")
+    parser.add_argument('--pages', type=int, default=256)
+    parser.add_argument('--sleep', type=float, default=0.01)
+    args = parser.parse_args()
+
+    dest = os.path.join(tempfile.mkdtemp(), 'backup.db')
+    with temp_database() as db_path:
+        init_db()
+        fill_urls(db_path, args.rows)
+        print(f"database: {os.path.getsize(db_path) / 2**20:.1f} MiB, writer every {args.interval * 1e3:.0f} ms")
+
+        for mode in ('delete', 'wal'):
+            conn = sqlite3.connect(db_path)
+            conn.execute(f"PRAGMA journal_mode = {mode}")
+            conn.close()
+            print(f"journal_mode={mode}")
+            run("no backup (baseline)", db_path, lambda: time.sleep(1), args.interval, dest)
+            run("incremental backup", db_path, lambda: backup_database(dest, args.pages, args.sleep), args.interval, dest)
+            run("one-step backup", db_path, lambda: backup_database(dest, pages=0), args.interval, dest)
+            run("VACUUM INTO", db_path, lambda: compact_database(dest), args.interval, dest)
+        conn = sqlite3.connect(db_path)
+        conn.execute("PRAGMA journal_mode = delete")  # removes the -wal and -shm files
+        conn.close()
+    os.unlink(dest)
+
+
+if __name__ == "__main__":
+    main()
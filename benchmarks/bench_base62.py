@@ -0,0 +1,49 @@
+"""
+Short code encode/decode throughput: generate_short_url/decode_short_url in a
+Python loop against encode_many/decode_many, for each short code scheme.
+
+    python -m benchmarks.bench_base62 --count 1000000
+"""
+import argparse
+from unittest.mock import patch
+
+import numpy as np
+
+from benchmarks.common import timeit, report
+from app.shortener import generate_short_url, decode_short_url, encode_many, decode_many
+
+
+def bench_scheme(scheme, count):
+    ids = np.arange(10000, 10000 + count, dtype=np.int64)
+    id_list = ids.tolist()
+    codes = encode_many(ids)
+    code_list = [generate_short_url(i) for i in id_list]
+
+    def rate(seconds):
+        return f"{count / seconds / 1e6:.2f}M ids/s"
+
+    scalar_encode = timeit(lambda: [generate_short_url(i) for i in id_list], repeat=3)
+    vector_encode = timeit(lambda: encode_many(ids), repeat=3)
+    scalar_decode = timeit(lambda: [decode_short_url(c) for c in code_list], repeat=3)
+    vector_decode = timeit(lambda: decode_many(codes), repeat=3)
+
+    report(f"[{scheme}] encode: generate_short_url loop", scalar_encode, rate(scalar_encode))
+    report(f"[{scheme}] encode: encode_many", vector_encode,
+           f"{rate(vector_encode)}, {scalar_encode / vector_encode:.1f}x")
+    report(f"[{scheme}] decode: decode_short_url loop", scalar_decode, rate(scalar_decode))
+    report(f"[{scheme}] decode: decode_many", vector_decode,
+           f"{rate(vector_decode)}, {scalar_decode / vector_decode:.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=1_000_000, help='number of ids to encode')
+    args = parser.parse_args()
+
+    for scheme in ("sequential", "feistel"):
+        with patch('app.config.SHORT_CODE_SCHEME', scheme), patch('app.config.SHORT_CODE_KEY', 'bench-key'):
+            bench_scheme(scheme, args.count)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Redirect latency through the Flask test client with and without the click
+log (flushing frequently, so writes happen during the run), the cost of
+ClickLog.record() itself, flush throughput, and scans of the written dataset:
+everything vs projected and filtered, before and after compaction.
+
+    python -m benchmarks.bench_click_log --requests 20000
+"""
+import argparse
+import datetime
+import tempfile
+import time
+from unittest.mock import patch
+
+from flask import Flask
+
+from benchmarks.common import temp_database, fill_urls, timeit, report
+from app.clicklog import ArrowStore, ClickLog, compact, scan_clicks, start_click_log
+from app.db import init_db
+from app.routes import register_routes
+from app.shortener import generate_short_url
+
+
+def redirect_latencies(client, codes, requests):
+    latencies = []
+    for i in range(requests):
+        path = f"/{codes[i % len(codes)]}"
+        start = time.perf_counter()
+        client.get(path, headers={'Referer': 'https://news.example/', 'User-Agent': 'bench-agent'})
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--events', type=int, default=1_000_000, help="events written for the scan benchmarks")
+    args = parser.parse_args()
+
+    with temp_database() as db_path, tempfile.TemporaryDirectory() as directory:
+        init_db()
+        fill_urls(db_path, 1000)
+        codes = [generate_short_url(i) for i in range(10000, 11000)]
+
+        app = Flask(__name__)
+        register_routes(app)
+        client = app.test_client()
+        redirect_latencies(client, codes, len(codes))  # fill the redirect cache
+
+        p50, p99 = redirect_latencies(client, codes, args.requests)
+        report("redirect, no click log: p50 / p99", p50, f"p99 {p99 * 1e6:.0f} us")
+
+        store = ArrowStore(f"{directory}/redirects")
+        # Flush every 50ms so writes overlap the redirects being timed
+        with patch('app.config.CLICK_LOG_FLUSH_INTERVAL', 0.05), patch('app.config.CLICK_LOG_BATCH_SIZE', 1000):
+            click_log = start_click_log(app, store)
+            p50, p99 = redirect_latencies(client, codes, args.requests)
+            click_log.close()
+        report("redirect, click log: p50 / p99", p50,
+               f"p99 {p99 * 1e6:.0f} us, {click_log.written} events written")
+
+        # Recording alone, with the writer parked
+        idle = ClickLog(ArrowStore(f"{directory}/idle"), interval=3600, max_buffer=10_000_000)
+        report("ClickLog.record()", timeit(lambda: idle.record('abc123', 'https://news.example/', 'bench-agent',
+                                                              '203.0.113.9'), number=100_000))
+
+        # Flush throughput: events spread over 30 days, written 10,000 at a time
+        store = ArrowStore(f"{directory}/scan")
+        writer = ClickLog(store, interval=3600, max_buffer=args.events)
+        start_day = datetime.datetime(2026, 9, 20, tzinfo=datetime.timezone.utc).timestamp()
+        step = 30 * 86400 / args.events
+        started = time.perf_counter()
+        for first in range(0, args.events, 10_000):
+            writer._events = [(codes[i % len(codes)], start_day + i * step, 'https://news.example/',
+                               'bench-agent', '203.0.113.9') for i in range(first, min(first + 10_000, args.events))]
+            writer.flush()
+        elapsed = time.perf_counter() - started
+        report("flush", elapsed / args.events, f"{args.events / elapsed:.0f} events/s")
+        writer.close()
+
+        last_day = datetime.datetime(2026, 10, 19, tzinfo=datetime.timezone.utc)
+        for label in ("small files", "compacted"):
+            report(f"scan all columns ({label})", timeit(lambda: scan_clicks(store=store), repeat=3))
+            report(f"scan code, last day ({label})", timeit(
+                lambda: scan_clicks(['code'], since=last_day, store=store), repeat=3))
+            report(f"scan one code, all days ({label})", timeit(
+                lambda: scan_clicks(['ts'], code=codes[0], store=store), repeat=3))
+            if label == "small files":
+                compact(store)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Redirect cache memory: bytes per entry (tracemalloc) and lookup cost for the
+dict-based RedirectCache vs the prefix-coded CompactRedirectCache, filled with
+shop-style URLs that share a handful of prefixes.
+
+    python -m benchmarks.bench_compact --entries 100000
+"""
+import argparse
+import random
+import tracemalloc
+
+from benchmarks.common import timeit, report
+from app.cache import RedirectCache
+from app.compact import CompactRedirectCache
+from app.shortener import generate_short_url
+
+PREFIXES = [
+    'https://www.ourshop.com/products/',
+    'https://www.ourshop.com/collections/',
+    'https://blog.ourshop.com/posts/',
+    'https://www.example.com/',
+]
+
+
+def make_items(count):
+    rng = random.Random(42)
+    items = []
+    for url_id in range(10000, 10000 + count):
+        slug = '-'.join(rng.choice(['blue', 'linen', 'shirt', 'classic', 'summer', 'sale']) for _ in range(4))
+        url = f"{rng.choice(PREFIXES)}{slug}-{url_id}?utm_source=newsletter&utm_medium=email"
+        items.append((generate_short_url(url_id), url))
+    return items
+
+
+def measure(cache_class, items):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    cache = cache_class(max_entries=len(items), ttl=3600)
+    # Fresh string copies, as if each URL had just been read from the database
+    cache.set_many((code[:-1] + code[-1], url[:-1] + url[-1]) for code, url in items)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return cache, used
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--entries', type=int, default=100_000)
+    args = parser.parse_args()
+
+    items = make_items(args.entries)
+    average_url = sum(len(url) for _, url in items) / len(items)
+    print(f"{len(items)} entries, average URL length {average_url:.0f} characters")
+
+    codes = [code for code, _ in random.Random(1).sample(items, min(10_000, len(items)))]
+    for cache_class in (RedirectCache, CompactRedirectCache):
+        cache, used = measure(cache_class, items)
+        print(f"{cache_class.__name__:<22} {used / 2**20:8.1f} MiB  {used / len(cache):6.0f} bytes/entry  ({len(cache)} held)")
+
+        def lookups():
+            for code in codes:
+                cache.get(code)
+        report(f"{cache_class.__name__}.get()", timeit(lookups, number=5) / len(codes), "per lookup")
+
+
+if __name__ == "__main__":
+    main()
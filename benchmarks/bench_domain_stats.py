@@ -0,0 +1,42 @@
+"""
+"How many links point at domain X": a LIKE scan over original_url, COUNT(*)
+over the host index, and the domain_stats counters - for one domain and for
+the top 20.
+
+    python -m benchmarks.bench_domain_stats --rows 1000000
+"""
+import argparse
+import sqlite3
+
+from benchmarks.common import temp_database, fill_urls, timeit, report
+from app.db import init_db
+from app.stats import top_domains, domain_stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--domains', type=int, default=5000)
+    args = parser.parse_args()
+
+    with temp_database() as db_path:
+        init_db()
+        fill_urls(db_path, args.rows)
+        with sqlite3.connect(db_path) as conn:
+            # Spread rows over many domains; the triggers keep domain_stats in step
+            conn.execute("UPDATE urls SET host = 'site' || (id % ?) || '.example.com'", (args.domains,))
+
+        with sqlite3.connect(db_path) as conn:
+            report("LIKE scan on original_url", timeit(lambda: conn.execute(
+                "SELECT COUNT(*) FROM urls WHERE original_url LIKE 'https://www.example.com/%'").fetchone(), repeat=3))
+            report("COUNT(*) via host index", timeit(lambda: conn.execute(
+                "SELECT COUNT(*) FROM urls WHERE host = 'site7.example.com'").fetchone()))
+            report("top 20 via GROUP BY host", timeit(lambda: conn.execute(
+                "SELECT host, COUNT(*) c FROM urls WHERE host IS NOT NULL GROUP BY host ORDER BY c DESC LIMIT 20").fetchall(), repeat=3))
+
+        report("domain_stats() one domain", timeit(lambda: domain_stats('site7.example.com'), number=100))
+        report("top_domains(20)", timeit(lambda: top_domains(20), number=100))
+
+
+if __name__ == "__main__":
+    main()
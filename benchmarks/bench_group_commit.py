@@ -0,0 +1,77 @@
+"""
+Shorten throughput, latency and commit rate with and without group commit,
+with several threads shortening concurrently against one database file.
+
+    python -m benchmarks.bench_group_commit --threads 16 --requests 4000
+"""
+import argparse
+import sqlite3
+import threading
+import time
+
+from benchmarks.common import temp_database, report
+from app import models
+from app.db import init_db
+from app.writer import start_group_commit, stop_group_commit
+
+
+def run(threads, requests):
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    per_thread = requests // threads
+
+    def worker(index):
+        mine = []
+        for i in range(per_thread):
+            start = time.perf_counter()
+            try:
+                models.get_short_url(f"https://www.example.com/products/{index}/{i}")
+            except sqlite3.OperationalError as error:
+                # e.g. 'database is locked' when too many writers queue up
+                with lock:
+                    errors.append(error)
+                continue
+            mine.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(mine)
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return elapsed, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)], len(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=4000)
+    parser.add_argument('--max-delay-ms', type=float, default=5)
+    args = parser.parse_args()
+    total = args.requests // args.threads * args.threads
+
+    with temp_database():
+        init_db()
+        elapsed, p50, p99, errors = run(args.threads, args.requests)
+        report("per-request commits: throughput", elapsed / total,
+               f"{(total - errors) / elapsed:.0f} shortens/s, {errors} failed")
+        report("per-request commits: p50 / p99", p50, f"p99 {p99 * 1e3:.2f} ms, {2 * (total - errors) / elapsed:.0f} commits/s")
+
+        writer = start_group_commit(max_delay=args.max_delay_ms / 1000)
+        try:
+            elapsed, p50, p99, errors = run(args.threads, args.requests)
+        finally:
+            stop_group_commit()
+        report("group commit: throughput", elapsed / total,
+               f"{(total - errors) / elapsed:.0f} shortens/s, {errors} failed")
+        report("group commit: p50 / p99", p50, f"p99 {p99 * 1e3:.2f} ms, {writer.batches / elapsed:.0f} commits/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+"""
+Probe cost through the Flask test client: the old health check (GET /, which
+touches the filesystem) against /healthz and /readyz.
+
+    python -m benchmarks.bench_health
+"""
+from flask import Flask
+
+from benchmarks.common import temp_database, timeit, report
+from app.db import init_db
+from app.routes import register_routes
+
+
+def main():
+    with temp_database():
+        init_db()
+        app = Flask(__name__)
+        register_routes(app)
+        client = app.test_client()
+
+        for path in ('/', '/healthz', '/readyz'):
+            report(f"GET {path}", timeit(lambda: client.get(path), number=2000))
+
+
+if __name__ == "__main__":
+    main()
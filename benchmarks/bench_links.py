@@ -0,0 +1,52 @@
+"""
+GET /links paging cost: keyset pages (LinkQuery) at increasing depth, against
+the same page fetched with LIMIT/OFFSET, plus date-range and domain filters.
+
+    python -m benchmarks.bench_links --rows 1000000
+"""
+import argparse
+import sqlite3
+
+from benchmarks.common import temp_database, fill_urls, timeit, report
+from app.db import init_db
+from app.models import LinkQuery
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--page', type=int, default=100)
+    args = parser.parse_args()
+
+    with temp_database() as db_path:
+        init_db()
+        fill_urls(db_path, args.rows)
+        with sqlite3.connect(db_path) as conn:
+            conn.execute("UPDATE urls SET host = CASE WHEN id % 10 THEN 'www.example.com' ELSE 'blog.example.com' END")
+            conn.execute("UPDATE urls SET created_at = datetime('2025-01-01', '+' || (id - 10000) || ' seconds')")
+        last_id = 10000 + args.rows
+
+        for depth in (0.0, 0.5, 0.99):
+            offset = int(args.rows * depth)
+
+            def keyset():
+                list(LinkQuery(args.page, before_id=last_id - offset))
+
+            def offset_page():
+                with sqlite3.connect(db_path) as conn:
+                    conn.execute(
+                        "SELECT id, short_url, original_url, created_at FROM urls ORDER BY id DESC LIMIT ? OFFSET ?",
+                        (args.page, offset)
+                    ).fetchall()
+
+            report(f"page at {depth:.0%} depth, keyset", timeit(keyset))
+            report(f"page at {depth:.0%} depth, OFFSET", timeit(offset_page))
+
+        report("page in a created_at range", timeit(lambda: list(LinkQuery(
+            args.page, created_after='2025-01-03 00:00:00', created_before='2025-01-04 00:00:00'))))
+        report("page for a domain (10% of rows)", timeit(lambda: list(LinkQuery(args.page, host='blog.example.com'))))
+        report("page for a URL prefix", timeit(lambda: list(LinkQuery(args.page, prefix='https://www.example.com/products/'))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Logging cost on the calling thread: a synchronous StreamHandler writing to a
+file vs the queued LogWriter, for an info line and for an error with a
+traceback, and how many lines a burst of identical errors writes with sampling.
+
+    python -m benchmarks.bench_logging
+"""
+import argparse
+import logging
+import os
+import tempfile
+
+from benchmarks.common import timeit, report
+from app.logs import LogWriter, JsonFormatter
+
+
+def make_logger(name):
+    logger = logging.getLogger(name)
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    return logger
+
+
+def log_error(logger):
+    try:
+        raise RuntimeError("database is locked")
+    except RuntimeError as e:
+        logger.error("Server error in %s: %s", "during redirect", e, exc_info=e)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--number', type=int, default=10000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        with open(os.path.join(directory, 'sync.log'), 'w') as stream:
+            logger = make_logger('bench.sync')
+            handler = logging.StreamHandler(stream)
+            handler.setFormatter(JsonFormatter())
+            logger.addHandler(handler)
+            report("sync, info", timeit(lambda: logger.info("shortened %s", "abc"), number=args.number))
+            report("sync, error with traceback", timeit(lambda: log_error(logger), number=args.number))
+            logger.removeHandler(handler)
+
+        with open(os.path.join(directory, 'queued.log'), 'w') as stream:
+            logger = make_logger('bench.queued')
+            # Sampling off, so every record is enqueued and written
+            writer = LogWriter(stream=stream, queue_size=10**7, burst=0).install(logger)
+            report("queued, info", timeit(lambda: logger.info("shortened %s", "abc"), number=args.number))
+            report("queued, error with traceback", timeit(lambda: log_error(logger), number=args.number))
+            writer.close(logger)
+
+        path = os.path.join(directory, 'sampled.log')
+        with open(path, 'w') as stream:
+            logger = make_logger('bench.sampled')
+            writer = LogWriter(stream=stream).install(logger)
+            report("queued + sampled, error burst", timeit(lambda: log_error(logger), number=args.number))
+            writer.close(logger)
+        with open(path) as f:
+            written = sum(1 for _ in f)
+        print(f"error burst: {written} lines written for {5 * args.number} errors, {writer.dropped} dropped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Memory accounting: what keeping a byte estimate costs on the hot paths
+(RedirectCache.set, ClickLog.record), what one background check costs with
+full structures, and how close the estimates are to what tracemalloc sees.
+
+    python -m benchmarks.bench_memory
+"""
+import argparse
+import tempfile
+import time
+import tracemalloc
+from collections import OrderedDict
+
+from benchmarks.common import timeit, report
+from app.cache import RedirectCache
+from app.clicklog import ArrowStore, ClickLog
+from app.memory import MemoryAccounting
+from app.shortener import generate_short_url
+
+URL = "https://www.ourshop.com/products/item-{}?utm_source=newsletter"
+USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/130.0 Safari/537.36"
+
+
+def measured(build):
+    """(bytes tracemalloc saw allocated by build(), what build() returned)"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    allocated = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return allocated, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--entries', type=int, default=10000)
+    parser.add_argument('--events', type=int, default=100000)
+    parser.add_argument('--number', type=int, default=100000)
+    args = parser.parse_args()
+
+    codes = [generate_short_url(url_id) for url_id in range(10000, 10000 + args.entries)]
+    urls = [URL.format(url_id) for url_id in range(args.entries)]
+
+    plain = OrderedDict()
+    cache = RedirectCache(max_entries=args.entries)
+    position = iter(range(10 ** 9))
+
+    def plain_set():
+        i = next(position) % args.entries
+        plain[codes[i]] = (urls[i], time.monotonic() + 300)
+        plain.move_to_end(codes[i])
+
+    def cache_set():
+        i = next(position) % args.entries
+        cache.set(codes[i], urls[i])
+
+    report("OrderedDict set (no accounting)", timeit(plain_set, number=args.number))
+    report("RedirectCache.set with byte estimate", timeit(cache_set, number=args.number))
+
+    with tempfile.TemporaryDirectory() as directory:
+        click_log = ClickLog(ArrowStore(directory), interval=3600, max_buffer=args.events * 10)
+        report("ClickLog.record with byte estimate", timeit(
+            lambda: click_log.record('aB3xY9', 'https://news.example.com/', USER_AGENT, '203.0.113.9'),
+            number=args.number))
+        click_log.flush()
+
+        # Fresh strings per entry, as requests produce them
+        def fill_cache():
+            filled = RedirectCache(max_entries=args.entries)
+            for code, url in zip(codes, urls):
+                filled.set(''.join(code), ''.join(url))
+            return filled
+
+        def fill_click_log():
+            for i in range(args.events):
+                click_log.record(f"c{i % 1000}", f"https://news.example.com/{i}", f"{USER_AGENT} {i}", f"10.0.{i % 256}.1")
+            return click_log
+
+        allocated, filled = measured(fill_cache)
+        print(f"redirect cache, {args.entries} entries: estimate {filled.nbytes() / 1e6:.2f} MB,"
+              f" tracemalloc {allocated / 1e6:.2f} MB")
+        allocated, _ = measured(fill_click_log)
+        print(f"click buffer, {args.events} events: estimate {click_log.nbytes() / 1e6:.2f} MB,"
+              f" tracemalloc {allocated / 1e6:.2f} MB")
+
+        accounting = MemoryAccounting(interval=0)
+        accounting.register('redirect_cache', filled.nbytes, filled.trim)
+        accounting.register('click_log', click_log.nbytes, click_log.trim)
+        report("one check, nothing over its cap", timeit(accounting.enforce, number=1000))
+        report("usage() for /debug/memory", timeit(accounting.usage, number=1000))
+
+        filled.trim(0)
+        report("trim a full cache to half", timeit(
+            lambda: (filled.set_many(zip(codes, urls)), filled.trim(filled.nbytes() // 2)), repeat=3))
+        click_log.close()
+
+
+if __name__ == "__main__":
+    main()
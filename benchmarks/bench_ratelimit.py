@@ -0,0 +1,55 @@
+"""
+Rate limiter overhead: TokenBucketStore.consume on its own, and a full redirect
+through the Flask test client with and without rate limiting enabled.
+
+    python -m benchmarks.bench_ratelimit
+"""
+import argparse
+import os
+import tempfile
+from unittest.mock import patch
+
+from flask import Flask
+
+from benchmarks.common import timeit, report
+from app.ratelimit import TokenBucketStore, RateLimit, init_rate_limiting
+from app.routes import register_routes
+
+
+def make_client(store=None):
+    app = Flask(__name__)
+    register_routes(app)
+    if store is not None:
+        init_rate_limiting(app, store, {'redirect_to_url': RateLimit(1e9, 1e9)})
+    return app.test_client()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--slots', type=int, default=65536)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'bench.ratelimit')
+    store = TokenBucketStore(path, args.slots)
+    try:
+        report("consume() same client", timeit(lambda: store.consume('ip:10.0.0.1', 1e9, 1e9), number=100_000))
+
+        keys = [f"ip:10.0.{i // 256}.{i % 256}" for i in range(10_000)]
+        def many_clients():
+            for key in keys:
+                store.consume(key, 1e9, 1e9)
+        report("consume() 10k distinct clients", timeit(many_clients, number=10) / len(keys), "per call")
+
+        with patch('app.routes.find_original_url', return_value='https://example.com'):
+            plain, limited = make_client(), make_client(store)
+            baseline = timeit(lambda: plain.get('/abc123'), number=2000)
+            with_limit = timeit(lambda: limited.get('/abc123'), number=2000)
+        report("redirect via test client, no limiter", baseline)
+        report("redirect via test client, rate limited", with_limit, f"+{(with_limit - baseline) * 1e6:.1f} us")
+    finally:
+        store.close()
+        os.unlink(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Redirect map export: a full export, a re-run with nothing new, a run after
+1000 new links, and a --top 10000 export, with the resulting map size.
+
+    python -m benchmarks.bench_redirect_map --rows 1000000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.common import temp_database, fill_urls, report
+from app.db import init_db
+from app.redirect_map import export_redirect_map
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--top', type=int, default=10000)
+    args = parser.parse_args()
+
+    with temp_database() as db_path, tempfile.TemporaryDirectory() as directory:
+        init_db()
+        fill_urls(db_path, args.rows)
+        path = os.path.join(directory, 'short_links.map')
+
+        seconds, result = timed(lambda: export_redirect_map(path))
+        report(f"full export, {result.entries} links", seconds, f"{os.path.getsize(path) / 2**20:.1f} MiB map")
+        seconds, result = timed(lambda: export_redirect_map(path))
+        report("re-export, nothing new", seconds, f"changed={result.changed}")
+        fill_urls(db_path, 1000)
+        seconds, result = timed(lambda: export_redirect_map(path))
+        report("re-export, 1000 new links", seconds, f"+{result.added}")
+
+        top_path = os.path.join(directory, 'top.map')
+        seconds, result = timed(lambda: export_redirect_map(top_path, top=args.top))
+        report(f"--top {args.top}, first run", seconds, f"{os.path.getsize(top_path) / 2**10:.0f} KiB map")
+        seconds, result = timed(lambda: export_redirect_map(top_path, top=args.top))
+        report(f"--top {args.top}, re-run", seconds, f"changed={result.changed}")
+
+
+if __name__ == "__main__":
+    main()
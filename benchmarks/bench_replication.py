@@ -0,0 +1,82 @@
+"""
+Replication costs: what the changelog triggers add to a shorten, seeding and
+pruning the log, how fast a new follower catches up (changes applied per
+second, from the primary's database file), and a follower's lookup locally vs
+falling back to the primary.
+
+    python -m benchmarks.bench_replication --rows 200000
+"""
+import argparse
+import os
+import tempfile
+import time
+from unittest.mock import patch
+
+from benchmarks.common import temp_database, fill_urls, timeit, report
+from app import models
+from app.db import get_db_connection, init_db
+from app.migrations import run_backfill
+from app.replication import Follower, SqliteSource, enable_changelog, disable_changelog, prune_changelog
+from app.shortener import generate_short_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    with temp_database():
+        init_db()
+        counter = iter(range(10**9))
+        shorten = lambda: models.get_short_url(f"https://www.example.com/products/{next(counter)}")
+        report("get_short_url without changelog", timeit(shorten, number=20))
+        with get_db_connection() as conn:
+            enable_changelog(conn)
+        report("get_short_url with changelog", timeit(shorten, number=20))
+
+    with temp_database() as primary:
+        init_db()
+        fill_urls(primary, args.rows)
+        with get_db_connection() as conn:
+            enable_changelog(conn)
+            start = time.perf_counter()
+            run_backfill(conn, 'seed_changelog', sleep=0)
+            report(f"seed_changelog, {args.rows} rows", time.perf_counter() - start)
+
+        follower_db = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+        follower_db.close()
+        try:
+            with patch('app.db.DB_PATH', follower_db.name):
+                init_db()
+                follower = Follower(SqliteSource(primary), batch_size=args.batch_size, start=False)
+                start = time.perf_counter()
+                applied = follower.sync()
+                elapsed = time.perf_counter() - start
+                report(f"follower catch-up, {applied} changes", elapsed / applied,
+                       f"{applied / elapsed:.0f} changes/s in {elapsed:.2f}s")
+
+                local = generate_short_url(10000 + args.rows // 2)
+                report("follower lookup, local hit", timeit(lambda: follower.find_original_url(local), number=1000))
+
+            # A code the follower hasn't seen yet
+            fill_urls(primary, 1)
+            newest = generate_short_url(10000 + args.rows)
+            with patch('app.db.DB_PATH', follower_db.name):
+                report("follower lookup, primary fallback", timeit(lambda: follower.find_original_url(newest), number=1000))
+                follower.close()
+        finally:
+            for path in (follower_db.name, follower_db.name + '.replication.lock'):
+                if os.path.exists(path):
+                    os.unlink(path)
+
+        with get_db_connection() as conn:
+            report("prune_changelog, nothing old enough", timeit(lambda: prune_changelog(conn, 3600), number=1000))
+            start = time.perf_counter()
+            pruned = prune_changelog(conn, 0, now=time.time() + 1)
+            report(f"prune_changelog, {pruned} entries", time.perf_counter() - start)
+            disable_changelog(conn)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Resolving 1000 codes: one GET /<code> each vs one POST /resolve/batch, and
+underneath it one query per code vs chunked `short_url IN (...)` vs chunked
+`id IN (...)` (what find_original_urls does).
+
+    python -m benchmarks.bench_resolve_batch --rows 1000000
+"""
+import argparse
+import random
+import sqlite3
+
+from flask import Flask
+
+from benchmarks.common import temp_database, fill_urls, timeit, report
+from app.db import init_db
+from app.models import find_original_url, find_original_urls
+from app.routes import register_routes
+from app.shortener import generate_short_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--codes', type=int, default=1000)
+    args = parser.parse_args()
+
+    with temp_database() as db_path:
+        init_db()
+        fill_urls(db_path, args.rows)
+        codes = [generate_short_url(i) for i in random.sample(range(10000, 10000 + args.rows), args.codes)]
+
+        report(f"find_original_url x {args.codes}", timeit(lambda: [find_original_url(c) for c in codes], repeat=3))
+
+        with sqlite3.connect(db_path) as conn:
+            def short_url_in():
+                for start in range(0, len(codes), 500):
+                    chunk = codes[start:start + 500]
+                    conn.execute(f"SELECT short_url, original_url FROM urls WHERE short_url IN "
+                                 f"({','.join('?' * len(chunk))})", chunk).fetchall()
+            report("chunked short_url IN (...)", timeit(short_url_in))
+        report("find_original_urls (chunked id IN)", timeit(lambda: find_original_urls(codes)))
+
+        app = Flask(__name__)
+        register_routes(app)
+        client = app.test_client()
+        app.extensions['redirect_cache'].clear()
+        report(f"GET /<code> x {args.codes} (uncached)",
+               timeit(lambda: ([client.get(f"/{c}") for c in codes], app.extensions['redirect_cache'].clear()),
+                      repeat=3))
+        report(f"POST /resolve/batch, {args.codes} codes",
+               timeit(lambda: client.post('/resolve/batch', json={'codes': codes})))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Partitioning costs: a ring lookup, the share of ids that move when a node is
+added, how evenly blocks spread for a few vnode counts, what claiming an owned
+id adds to an insert, and a redirect through the router vs straight to the
+node (one node process on a free port).
+
+    python -m benchmarks.bench_router
+"""
+import argparse
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from collections import Counter
+from unittest.mock import patch
+
+from benchmarks.common import timeit, report
+from app.db import init_db
+from app.hashring import HashRing, plan_moves, claim_owned_id
+from app.router import NodeClient, create_router_app
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_node(db_path, port):
+    env = dict(os.environ, DATABASE_PATH=db_path, PARTITION_NODE='a', PARTITION_NODES='a',
+               CACHE_WARMUP_SIZE='0', ROUTER_NODES='')
+    process = subprocess.Popen([sys.executable, '-c', f'import main; main.create_app().run(port={port})'],
+                               env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 20
+    while True:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/healthz', timeout=1).read()
+            return process
+        except OSError:
+            if time.monotonic() > deadline:
+                process.terminate()
+                raise
+            time.sleep(0.1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--max-id', type=int, default=10_000_000)
+    parser.add_argument('--block-size', type=int, default=1024)
+    args = parser.parse_args()
+
+    ring = HashRing([f'node{i}' for i in range(8)])
+    report("ring lookup, 8 nodes x 160 vnodes", timeit(lambda: ring.node_for(123456), number=100000))
+
+    for count in (2, 4, 8):
+        nodes = [f'node{i}' for i in range(count)]
+        moves = plan_moves(nodes, nodes + ['new'], args.max_id, args.block_size)
+        moved = sum(moves.values()) / args.max_id
+        print(f"add a node to {count}: {moved:.1%} of ids move (ideal {1 / (count + 1):.1%})")
+
+    blocks = args.max_id // args.block_size
+    for vnodes in (10, 40, 160, 640):
+        counts = Counter(HashRing([f'node{i}' for i in range(8)], vnodes).node_for(block) for block in range(blocks))
+        print(f"{vnodes:>4} vnodes, 8 nodes: busiest node {max(counts.values()) / (blocks / 8):.2f}x the mean")
+
+    # Claiming on an in-memory copy of the schema, so fsync doesn't hide it
+    with tempfile.NamedTemporaryFile(suffix='.db') as temp_db, patch('app.db.DB_PATH', temp_db.name):
+        init_db()
+        conn = sqlite3.connect(':memory:')
+        sqlite3.connect(temp_db.name).backup(conn)
+    insert = lambda: conn.execute("INSERT INTO urls (original_url) VALUES ('https://www.example.com/')")
+    report("insert, unpartitioned", timeit(insert, number=10000))
+    with patch('app.config.PARTITION_NODE', 'node0'), \
+            patch('app.config.PARTITION_NODES', ','.join(f'node{i}' for i in range(8))):
+        report("insert with claim_owned_id, 8 nodes", timeit(lambda: (claim_owned_id(conn), insert()), number=10000))
+
+    with tempfile.TemporaryDirectory() as directory:
+        port = free_port()
+        node = start_node(os.path.join(directory, 'a.db'), port)
+        try:
+            url = f'http://127.0.0.1:{port}'
+            direct = NodeClient('a', url)
+            status, headers, body = direct.forward('POST', '/shorten', b'{"url": "https://www.example.com/"}',
+                                                   {'Content-Type': 'application/json'})
+            code = body.decode().split('"short_url":')[1].split('"')[1].rsplit('/', 1)[1]
+            report("redirect straight to the node", timeit(lambda: direct.forward('GET', f'/{code}'), number=200))
+            client = create_router_app({'a': url}, {}).test_client()
+            report("redirect through the router", timeit(lambda: client.get(f'/{code}'), number=200))
+        finally:
+            node.terminate()
+            node.wait()
+
+
+if __name__ == "__main__":
+    main()
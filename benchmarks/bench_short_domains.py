@@ -0,0 +1,39 @@
+"""
+Building the short URL in a /shorten response: url_for(..., _external=True)
+vs a precomputed per-scheme base string, and the Host -> short domain lookup
+a redirect does when several short domains are configured.
+
+    python -m benchmarks.bench_short_domains
+"""
+import argparse
+
+from flask import Flask, url_for
+
+from benchmarks.common import timeit, report
+from app.shortdomains import ShortDomains
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--number', type=int, default=100000)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.add_url_rule('/<short_url>', 'redirect_to_url', lambda short_url: '')
+    domains = ShortDomains('sho.rt', [f'brand{i}.co' for i in range(20)])
+    request_only = ShortDomains()
+
+    with app.test_request_context('/shorten', base_url='https://sho.rt'):
+        report("url_for(_external=True)", timeit(
+            lambda: url_for('redirect_to_url', short_url='aB3xY9', _external=True, _scheme='https'), number=args.number))
+        report("request Host, no SHORT_DOMAIN", timeit(
+            lambda: request_only.short_url('aB3xY9', 'https', 'sho.rt'), number=args.number))
+        report("precomputed SHORT_DOMAIN base", timeit(
+            lambda: domains.short_url('aB3xY9', 'https', 'sho.rt'), number=args.number))
+
+    report("Host lookup, 21 domains, hit", timeit(lambda: domains.namespace('brand7.co'), number=args.number))
+    report("Host lookup, unknown host:port", timeit(lambda: domains.namespace('10.0.0.5:8000'), number=args.number))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Import and startup cost of a worker: importing the app and running create_app()
+against a fresh database and against an already-migrated database with many rows.
+
+    python -m benchmarks.bench_startup --rows 1000000
+"""
+import argparse
+import sqlite3
+import subprocess
+import sys
+from pathlib import Path
+
+from benchmarks.common import temp_database, fill_urls, timeit, report
+
+ROOT = Path(__file__).parent.parent
+
+
+def import_time():
+    """Time `import main` in a fresh interpreter, as a gunicorn worker would"""
+    code = (
+        "import time; start = time.perf_counter(); import main; "
+        "print(time.perf_counter() - start)"
+    )
+    best = float('inf')
+    for _ in range(5):
+        out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+        best = min(best, float(out.stdout.strip()))
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200_000, help='rows in the populated database')
+    args = parser.parse_args()
+
+    from main import create_app
+    from app.db import init_db
+
+    report("import main (fresh interpreter)", import_time())
+
+    with temp_database() as db_path:
+        report("create_app() on empty database", timeit(create_app, repeat=1))
+
+        fill_urls(db_path, args.rows)
+        report(f"create_app() with {args.rows} rows", timeit(create_app))
+        report(f"init_db() with {args.rows} rows", timeit(init_db))
+
+        # What every worker used to pay on boot before schema_version existed
+        def legacy_count():
+            with sqlite3.connect(db_path) as conn:
+                conn.execute("SELECT COUNT(*) FROM urls").fetchone()
+        report(f"legacy COUNT(*) with {args.rows} rows", timeit(legacy_count))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Frontend serving through the Flask test client: the old send_from_directory
+for index.html and Flask's static route for a bundle, against app.static_files
+(in-memory index, precompressed variants, 304s for revalidation).
+
+    python -m benchmarks.bench_static
+"""
+import os
+import random
+import shutil
+import string
+import tempfile
+from unittest.mock import patch
+
+from flask import Flask, send_from_directory
+
+from benchmarks.common import timeit, report
+from app.routes import register_routes
+from app.static_files import precompress
+
+
+def make_build(root):
+    os.makedirs(os.path.join(root, 'static', 'js'))
+    rng = random.Random(1)
+    words = [''.join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 12))) for _ in range(2000)]
+    bundle = ' '.join(f"function {rng.choice(words)}(){{return {rng.choice(words)}.{rng.choice(words)}()}}"
+                      for _ in range(20000))
+    with open(os.path.join(root, 'index.html'), 'w') as f:
+        f.write('<!doctype html><html><head><script src="/static/js/main.3f2a1b9c.js"></script></head>'
+                '<body><div id="root"></div></body></html>' * 10)
+    with open(os.path.join(root, 'static', 'js', 'main.3f2a1b9c.js'), 'w') as f:
+        f.write(bundle)
+    precompress(root)
+
+
+def main():
+    root = tempfile.mkdtemp()
+    try:
+        make_build(root)
+
+        old = Flask(__name__, static_folder=os.path.join(root, 'static'), static_url_path='/static')
+        old.add_url_rule('/', 'index', lambda: send_from_directory(root, 'index.html'))
+        old_client = old.test_client()
+
+        new = Flask(__name__, static_folder=None)
+        with patch('app.config.STATIC_ROOT', root):
+            register_routes(new)
+        new_client = new.test_client()
+
+        bundle = '/static/js/main.3f2a1b9c.js'
+        gzip_header = {'Accept-Encoding': 'gzip'}
+        etag = new_client.get(bundle, headers=gzip_header).headers['ETag']
+
+        report("index.html, send_from_directory", timeit(lambda: old_client.get('/').data, number=1000))
+        report("index.html, in memory", timeit(lambda: new_client.get('/').data, number=1000))
+        size = len(old_client.get(bundle).data)
+        report("bundle, Flask static", timeit(lambda: old_client.get(bundle).data, number=200), f"{size} bytes")
+        size = len(new_client.get(bundle, headers=gzip_header).data)
+        report("bundle, precompressed gzip", timeit(lambda: new_client.get(bundle, headers=gzip_header).data, number=200),
+               f"{size} bytes")
+        report("bundle, revalidated (304)", timeit(
+            lambda: new_client.get(bundle, headers={**gzip_header, 'If-None-Match': etag}).data, number=1000))
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Compressed original_url storage: database size, rows per page, how much of
+the file fits in SQLite's default 2 MiB page cache, and find_original_url
+latency - plain TEXT vs the built-in dictionary vs a dictionary trained on
+the data.
+
+    python -m benchmarks.bench_url_compression --rows 200000
+"""
+import argparse
+import os
+import random
+import sqlite3
+
+from benchmarks.common import temp_database, timeit, report
+from benchmarks.bench_compact import make_items
+from app.db import init_db
+from app.models import find_original_url
+from app.urlcodec import UrlCodec, DEFAULT_DICTIONARY, train_dictionary, reset_codecs
+
+PAGE_CACHE_BYTES = 2000 * 1024  # SQLite's default cache_size of -2000 (KiB)
+
+
+def build(db_path, items, codec):
+    with sqlite3.connect(db_path) as conn:
+        if codec is not None and codec.dictionary_id != 1:
+            conn.execute("INSERT INTO url_dictionaries (id, data) VALUES (?, ?)", (codec.dictionary_id, codec.dictionary))
+        conn.executemany(
+            "INSERT INTO urls (id, original_url, short_url) VALUES (?, ?, ?)",
+            ((i, url if codec is None else codec.compress(url), code) for i, (code, url) in enumerate(items, 10000))
+        )
+        conn.commit()
+        conn.execute("VACUUM")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200_000)
+    args = parser.parse_args()
+
+    items = make_items(args.rows)
+    codes = [code for code, _ in random.Random(1).sample(items, min(2000, len(items)))]
+    trained = train_dictionary(url for _, url in items[:20000])
+
+    variants = [
+        ("plain TEXT", None),
+        ("zlib, built-in dictionary", UrlCodec(1, DEFAULT_DICTIONARY)),
+        ("zlib, trained dictionary", UrlCodec(2, trained)),
+    ]
+    for name, codec in variants:
+        with temp_database() as db_path:
+            init_db()
+            build(db_path, items, codec)
+            size = os.path.getsize(db_path)
+            print(f"{name}: {size / 2**20:.1f} MiB, {size / len(items):.0f} bytes/row, "
+                  f"{min(1.0, PAGE_CACHE_BYTES / size):.1%} of the file fits the page cache")
+
+            def lookups():
+                for code in codes:
+                    find_original_url(code)
+            report(f"  find_original_url ({name})", timeit(lookups, repeat=3) / len(codes), "per lookup")
+            reset_codecs()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+URL validation cost: the reference URL_PATTERN regex against the tiered
+check_url/is_valid_url fast path, on typical URLs and on pathological inputs
+built to make a backtracking regex work hard. Also fuzzes both against each
+other and reports any disagreement.
+
+    python -m benchmarks.bench_validators --fuzz 200000
+"""
+import argparse
+import random
+import time
+
+from benchmarks.common import timeit, report
+from app.validators import URL_PATTERN, MAX_URL_LENGTH, is_valid_url, check_url, check_urls
+
+TYPICAL = [
+    'https://www.example.com/products/item-123?utm_source=newsletter&utm_medium=email',
+    'http://localhost:3000/',
+    'https://192.168.1.1:8080/admin',
+    'https://sub.domain.example.co.uk/a/b/c/d/e/f?x=1&y=2#frag',
+]
+
+PATHOLOGICAL = {
+    'long single label': 'https://' + 'a' * (MAX_URL_LENGTH - 8),
+    'many labels, bad tld': 'https://' + 'a.' * 1000 + '-',
+    'hyphen runs': 'https://' + 'a-' * 1000 + '.com',
+    'long path, trailing space': 'https://example.com/' + 'x' * (MAX_URL_LENGTH - 22) + ' y',
+    'dotted digits': 'https://' + '1.' * 1000,
+    'long port': 'https://example.com:' + '9' * 2000,
+    'overlong (rejected on length)': 'https://example.com/' + 'x' * 100_000,
+}
+
+FRAGMENTS = [
+    'http://', 'https://', 'HTTPS://', 'ftp://', 'example', '.com', '.co.uk', 'a', '-', '.', '..',
+    ':', '80', ':8080', '/', '?', '#', '@', 'localhost', '192.168.1.1', '255', '256', '.1', 'x y',
+    '\t', '_', 'é', 'com', 'abcdefg', '/path', '?q=1', '//',
+]
+
+
+def fuzz(count, seed):
+    rng = random.Random(seed)
+    mismatches = 0
+    worst = 0.0
+    for _ in range(count):
+        url = ''.join(rng.choice(FRAGMENTS) for _ in range(rng.randint(1, 12)))
+        start = time.perf_counter()
+        fast = is_valid_url(url)
+        worst = max(worst, time.perf_counter() - start)
+        if fast != (URL_PATTERN.match(url.strip()) is not None):
+            mismatches += 1
+            print(f"  mismatch: {url!r}")
+    return mismatches, worst
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--fuzz', type=int, default=100_000, help='number of random URLs to fuzz')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    for url in TYPICAL:
+        label = url[:40]
+        report(f"regex      {label}", timeit(lambda: URL_PATTERN.match(url), number=10000))
+        report(f"check_url  {label}", timeit(lambda: check_url(url), number=10000))
+
+    print()
+    for name, url in PATHOLOGICAL.items():
+        report(f"regex      {name}", timeit(lambda: URL_PATTERN.match(url.strip()), number=20))
+        report(f"check_url  {name}", timeit(lambda: check_url(url), number=20))
+
+    print()
+    batch = TYPICAL * 2500
+    report(f"check_urls batch of {len(batch)}", timeit(lambda: check_urls(batch), repeat=3), "per batch")
+
+    mismatches, worst = fuzz(args.fuzz, args.seed)
+    report(f"fuzz {args.fuzz} URLs, worst is_valid_url", worst, f"{mismatches} mismatches vs URL_PATTERN")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Shared helpers for the benchmark scripts
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from unittest.mock import patch
+
+# Make `import app` work when a benchmark is run as a plain script
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+
+@contextmanager
+def temp_database():
+    """Point app.db at a throwaway database file for the duration of a benchmark"""
+    temp_db = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+    temp_db.close()
+    try:
+        with patch('app.db.DB_PATH', temp_db.name):
+            yield temp_db.name
+    finally:
+        for path in (temp_db.name, temp_db.name + '.lock'):
+            if os.path.exists(path):
+                os.unlink(path)
+
+
+def fill_urls(db_path, rows, url="https://www.example.com/products/item?utm_source=bench"):
+    """Bulk insert `rows` urls (with short codes) straight into the database"""
+    from app.shortener import generate_short_url
+
+    with sqlite3.connect(db_path) as conn:
+        start = conn.execute("SELECT COALESCE(MAX(seq), 9999) FROM sqlite_sequence WHERE name = 'urls'").fetchone()[0] + 1
+        conn.executemany(
+            "INSERT INTO urls (id, original_url, short_url) VALUES (?, ?, ?)",
+            ((i, f"{url}&n={i}", generate_short_url(i)) for i in range(start, start + rows))
+        )
+        conn.commit()
+
+
+def timeit(func, repeat=5, number=1):
+    """Run func `number` times per round and return the best per-call time in seconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def report(name, seconds, per=None):
+    """Print one benchmark result line"""
+    if seconds < 1e-3:
+        value = f"{seconds * 1e6:10.2f} us"
+    elif seconds < 1:
+        value = f"{seconds * 1e3:10.2f} ms"
+    else:
+        value = f"{seconds:10.2f} s "
+    suffix = f"  ({per})" if per else ""
+    print(f"{name:<48}{value}{suffix}")
@@ -0,0 +1,224 @@
+"""
+Soak and concurrency stress test for several worker processes sharing one
+SQLite file, the way gunicorn runs the app.
+
+Each process runs a number of threads that shorten and redirect interleaved
+for --duration seconds, through app.models just like the routes. At the end
+the database is checked:
+- every code a worker was given exists and points at its URL (nothing lost)
+- no code was handed out twice
+- no urls row is left with a NULL short_url
+- every redirect of a known code found its URL
+
+It reports throughput, latency percentiles and the errors seen per
+operation. SQLite doesn't report how long a statement waited on a lock, so
+waits show up as the slow tail: "waited" counts operations slower than
+--lock-threshold-ms.
+
+    python -m benchmarks.stress                                  # CI-sized, ~5 s
+    python -m benchmarks.stress --duration 3600 --processes 8 --threads 8 --wal
+    python -m benchmarks.stress --db /tmp/soak.db --group-commit --json
+
+Exits non-zero when a check fails or an operation raised.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from unittest.mock import patch
+
+# Make `import app` work when run as a plain script
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+OPERATIONS = ('shorten', 'redirect')
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def _worker(db_path, worker, threads, duration, read_ratio, group_commit, seed, results):
+    """One process: threads shortening and redirecting until the deadline"""
+    with patch('app.db.DB_PATH', db_path):
+        from app import models
+        from app.writer import start_group_commit, stop_group_commit
+
+        if group_commit:
+            start_group_commit()
+        deadline = time.monotonic() + duration
+        created = []  # (code, url), shared by this process's threads
+        created_lock = threading.Lock()
+        stats = {op: {'latencies': [], 'errors': Counter()} for op in OPERATIONS}
+        stats['redirect']['wrong'] = 0
+
+        def run(thread):
+            rng = random.Random(seed * 1000 + thread)
+            sequence = 0
+            while time.monotonic() < deadline:
+                with created_lock:
+                    known = created[rng.randrange(len(created))] if created else None
+                op = 'redirect' if known is not None and rng.random() < read_ratio else 'shorten'
+                start = time.perf_counter()
+                try:
+                    if op == 'shorten':
+                        url = f"https://stress.example.com/{worker}/{thread}/{sequence}"
+                        sequence += 1
+                        code = models.get_short_url(url)
+                        with created_lock:
+                            created.append((code, url))
+                    else:
+                        if models.find_original_url(known[0]) != known[1]:
+                            stats['redirect']['wrong'] += 1
+                except Exception as e:
+                    stats[op]['errors'][f"{type(e).__name__}: {e}"] += 1
+                stats[op]['latencies'].append(time.perf_counter() - start)
+
+        workers = [threading.Thread(target=run, args=(thread,)) for thread in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        if group_commit:
+            stop_group_commit()
+    results.put({'worker': worker, 'created': created, 'stats': stats})
+
+
+def check_database(db_path, created):
+    """Problems found comparing what workers were given with what the database holds"""
+    problems = []
+    codes = Counter(code for code, _ in created)
+    duplicates = [code for code, count in codes.items() if count > 1]
+    if duplicates:
+        problems.append(f"{len(duplicates)} codes handed out more than once, e.g. {duplicates[:5]}")
+
+    from app.urlcodec import decode_url
+    conn = sqlite3.connect(db_path)
+    try:
+        stored = {}
+        for short_url, original_url in conn.execute("SELECT short_url, original_url FROM urls"):
+            stored[short_url] = original_url
+        lost = [code for code, url in created if code not in stored
+                or decode_url(conn, stored[code], db_path) != url]
+        (null_rows,) = conn.execute("SELECT COUNT(*) FROM urls WHERE short_url IS NULL").fetchone()
+    finally:
+        conn.close()
+    if lost:
+        problems.append(f"{len(lost)} codes missing or pointing elsewhere, e.g. {lost[:5]}")
+    if null_rows:
+        problems.append(f"{null_rows} rows with a NULL short_url")
+    return problems
+
+
+def run_stress(db_path=None, processes=4, threads=4, duration=5.0, read_ratio=0.8,
+               group_commit=False, wal=False, lock_threshold=0.1, seed=0):
+    """Run the workers against db_path (a fresh temp file by default) and return a report dict"""
+    from app import config
+    from app.db import init_db
+
+    temp_dir = None
+    if db_path is None:
+        temp_dir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(temp_dir.name, 'stress.db')
+    try:
+        # DB_JOURNAL_MODE as configured, or WAL when asked for
+        journal_mode = 'wal' if wal else config.DB_JOURNAL_MODE
+        with patch('app.db.DB_PATH', db_path), patch('app.config.DB_JOURNAL_MODE', journal_mode):
+            init_db()
+        conn = sqlite3.connect(db_path)
+        (journal_mode,) = conn.execute("PRAGMA journal_mode").fetchone()
+        conn.close()
+
+        context = multiprocessing.get_context('fork' if hasattr(os, 'fork') else 'spawn')
+        results = context.Queue()
+        workers = [
+            context.Process(target=_worker, args=(db_path, worker, threads, duration, read_ratio,
+                                                  group_commit, seed + worker, results))
+            for worker in range(processes)
+        ]
+        start = time.monotonic()
+        for process in workers:
+            process.start()
+        # A worker that died never reports; don't wait for it forever
+        reports = [results.get(timeout=duration + 300) for _ in workers]
+        for process in workers:
+            process.join()
+        elapsed = time.monotonic() - start
+
+        created = [pair for report in reports for pair in report['created']]
+        report = {
+            'processes': processes, 'threads': threads, 'seconds': round(elapsed, 2),
+            'group_commit': group_commit, 'journal_mode': journal_mode,
+            'busy_timeout': config.DB_BUSY_TIMEOUT, 'operations': {},
+            'problems': check_database(db_path, created),
+        }
+        for op in OPERATIONS:
+            latencies = [latency for r in reports for latency in r['stats'][op]['latencies']]
+            errors = sum((r['stats'][op]['errors'] for r in reports), Counter())
+            report['operations'][op] = {
+                'count': len(latencies),
+                'per_second': round(len(latencies) / elapsed, 1),
+                'p50_ms': round(percentile(latencies, 0.5) * 1e3, 2),
+                'p99_ms': round(percentile(latencies, 0.99) * 1e3, 2),
+                'max_ms': round(max(latencies, default=0) * 1e3, 2),
+                'waited': sum(1 for latency in latencies if latency > lock_threshold),
+                'errors': dict(errors),
+            }
+        wrong = sum(r['stats']['redirect']['wrong'] for r in reports)
+        if wrong:
+            report['problems'].append(f"{wrong} redirects of known codes didn't find their URL")
+        for op, summary in report['operations'].items():
+            if summary['errors']:
+                report['problems'].append(f"{sum(summary['errors'].values())} {op} errors")
+        return report
+    finally:
+        if temp_dir is not None:
+            temp_dir.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help="database file to use (default: a fresh temporary one)")
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4, help="threads per process")
+    parser.add_argument('--duration', type=float, default=5.0, help="seconds")
+    parser.add_argument('--read-ratio', type=float, default=0.8, help="share of operations that are redirects")
+    parser.add_argument('--group-commit', action='store_true', help="shorten through the group commit writer")
+    parser.add_argument('--wal', action='store_true', help="switch the database to WAL mode first (else DB_JOURNAL_MODE)")
+    parser.add_argument('--lock-threshold-ms', type=float, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    args = parser.parse_args()
+
+    report = run_stress(args.db, args.processes, args.threads, args.duration, args.read_ratio,
+                        args.group_commit, args.wal, args.lock_threshold_ms / 1e3, args.seed)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{report['processes']} processes x {report['threads']} threads for {report['seconds']}s"
+              f" (group commit {'on' if report['group_commit'] else 'off'}, journal_mode={report['journal_mode']},"
+              f" busy timeout {report['busy_timeout']}s)")
+        for op, s in report['operations'].items():
+            print(f"{op:<9} {s['count']:>8} ops {s['per_second']:>9.1f}/s  p50 {s['p50_ms']:.2f} ms"
+                  f"  p99 {s['p99_ms']:.2f} ms  max {s['max_ms']:.2f} ms  waited {s['waited']}")
+            for error, count in s['errors'].items():
+                print(f"          {count:>8} x {error}")
+        for problem in report['problems']:
+            print(f"FAIL: {problem}")
+        if not report['problems']:
+            print("ok: no lost or duplicate codes, no NULL short_url rows")
+    sys.exit(1 if report['problems'] else 0)
+
+
+if __name__ == "__main__":
+    main()
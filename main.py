@@ -1,18 +1,61 @@
 from flask import Flask
 from flask_cors import CORS
 import os
+from app import config
+from app.clicklog import start_click_log
 from app.db import init_db
+from app.logs import setup_logging
+from app.memory import start_memory_accounting
+from app.ratelimit import init_rate_limiting
+from app.replication import start_changelog, start_follower, check_changelog
+from app.router import create_router_app
 from app.routes import register_routes
+from app.stats import start_click_counter
+from app.warmup import start_cache_warmup
+from app.writer import start_group_commit
 
 def create_app():
     """Application factory"""
-    app = Flask(__name__, static_folder='/app/static/static', static_url_path='/static')
+    if config.ROUTER_NODES:
+        # A router has no database of its own; it forwards to the nodes
+        return create_router_app()
+
+    # /static is served by app.static_files (precompressed, cache headers) when the build exists
+    app = Flask(__name__, static_folder=None)
+    setup_logging(app)
     init_db()
     # Enable CORS for all routes (for frontend development)
     CORS(app)
     
     # Register routes
     register_routes(app)
+
+    if config.RATE_LIMIT_ENABLED:
+        init_rate_limiting(app)
+
+    if config.REPLICATION_CHANGELOG:
+        start_changelog(app)
+    else:
+        # Left as it is: dropping the log is python -m app.replication disable-changelog
+        check_changelog()
+
+    if config.REPLICATION_PRIMARY:
+        start_follower(app)
+
+    if config.GROUP_COMMIT_ENABLED:
+        start_group_commit()
+
+    if config.DOMAIN_STATS_FLUSH_INTERVAL > 0:
+        start_click_counter(app)
+
+    if config.CLICK_LOG_ENABLED:
+        start_click_log(app)
+
+    # Measure the caches and buffers set up above and keep them under their caps
+    start_memory_accounting(app)
+
+    # Preload popular links in the background so startup isn't delayed
+    start_cache_warmup(app)
     
     return app
 
@@ -0,0 +1,123 @@
+import pytest
+import tempfile
+import os
+import sqlite3
+from unittest.mock import patch
+from app.db import get_db_connection, init_db
+from app.backup import backup_database, compact_database, verify_backup, main
+
+
+@pytest.fixture
+def temp_db():
+    temp_dir = tempfile.mkdtemp()
+    db_path = os.path.join(temp_dir, 'live.db')
+    with patch('app.db.DB_PATH', db_path):
+        init_db()
+        with get_db_connection() as conn:
+            conn.executemany(
+                "INSERT INTO urls (original_url, short_url) VALUES (?, ?)",
+                [(f"https://example.com/{'x' * 200}/{i}", f"c{i}") for i in range(2000)]
+            )
+        yield temp_dir
+    for name in os.listdir(temp_dir):
+        os.unlink(os.path.join(temp_dir, name))
+    os.rmdir(temp_dir)
+
+
+def count_rows(path):
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM urls").fetchone()[0]
+
+
+class TestBackup:
+    # Test online backups of the live database
+
+    def test_incremental_backup(self, temp_db):
+        dest = os.path.join(temp_db, 'backup.db')
+        steps = []
+        result = backup_database(dest, pages=10, sleep=0, on_progress=lambda remaining, total: steps.append(remaining))
+
+        assert count_rows(dest) == 2000
+        assert result.steps == len(steps) > 1
+        assert steps[-1] == 0
+        assert not result.one_step
+        assert verify_backup(dest)
+        assert not os.path.exists(dest + '.tmp')
+
+    def test_concurrent_write_restarts_copy(self, temp_db):
+        dest = os.path.join(temp_db, 'backup.db')
+        writer = sqlite3.connect(os.path.join(temp_db, 'live.db'))
+        written = []
+
+        def write_once(remaining, total):
+            if not written:
+                writer.execute("INSERT INTO urls (original_url) VALUES ('https://example.com/new')")
+                writer.commit()
+                written.append(True)
+
+        result = backup_database(dest, pages=10, sleep=0, on_progress=write_once)
+        writer.close()
+
+        assert result.restarts == 1
+        assert count_rows(dest) == 2001  # the copy includes the write that restarted it
+
+    def test_falls_back_to_one_step(self, temp_db):
+        dest = os.path.join(temp_db, 'backup.db')
+        writer = sqlite3.connect(os.path.join(temp_db, 'live.db'))
+
+        def keep_writing(remaining, total):
+            writer.execute("INSERT INTO urls (original_url) VALUES ('https://example.com/new')")
+            writer.commit()
+
+        result = backup_database(dest, pages=10, sleep=0, max_restarts=2, on_progress=keep_writing)
+        writer.close()
+
+        assert result.one_step
+        assert result.restarts == 3
+        assert verify_backup(dest)
+
+    def test_existing_destination_replaced(self, temp_db):
+        dest = os.path.join(temp_db, 'backup.db')
+        with open(dest, 'w') as f:
+            f.write('old')
+
+        backup_database(dest, pages=0)
+        assert count_rows(dest) == 2000
+
+    def test_compact_backup(self, temp_db):
+        with get_db_connection() as conn:
+            conn.execute("DELETE FROM urls WHERE id % 2 = 0")
+
+        dest = os.path.join(temp_db, 'compact.db')
+        result = compact_database(dest)
+
+        assert count_rows(dest) == 1000
+        assert result.bytes < os.path.getsize(os.path.join(temp_db, 'live.db'))
+
+    def test_cli(self, temp_db, capsys):
+        dest = os.path.join(temp_db, 'cli.db')
+        main([dest, '--pages', '50', '--sleep', '0', '--verify'])
+
+        output = capsys.readouterr().out
+        assert "MiB/s" in output
+        assert "integrity check: ok" in output
+
+    def test_wal_backup_is_one_snapshot(self, temp_db):
+        live = os.path.join(temp_db, 'live.db')
+        writer = sqlite3.connect(live)
+        writer.execute("PRAGMA journal_mode = wal")
+
+        def keep_writing(remaining, total):
+            writer.execute("INSERT INTO urls (original_url) VALUES ('https://example.com/new')")
+            writer.commit()
+
+        dest = os.path.join(temp_db, 'backup.db')
+        result = backup_database(dest, pages=10, sleep=0, max_restarts=0, on_progress=keep_writing)
+        writer.execute("PRAGMA journal_mode = delete")
+        writer.close()
+
+        # Writers never waited and never restarted the copy, which has the rows from when it began
+        assert result.restarts == 0
+        assert not result.one_step
+        assert count_rows(dest) == 2000
+        assert count_rows(live) == 2000 + result.steps
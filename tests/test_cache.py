@@ -0,0 +1,222 @@
+import pytest
+import tempfile
+import os
+import threading
+import time
+from unittest.mock import patch
+from app.cache import RedirectCache, entry_size, SingleFlight
+from app.db import init_db
+from app.models import get_short_url, find_original_url
+
+
+def run_concurrently(func, count):
+    # Start `count` threads together and collect their results
+    barrier = threading.Barrier(count)
+    results = [None] * count
+
+    def worker(index):
+        barrier.wait()
+        results[index] = func()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class TestSingleFlight:
+    # Test coalescing of concurrent calls
+
+    def test_concurrent_calls_share_one_execution(self):
+        flight = SingleFlight()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            time.sleep(0.1)
+            return 'result'
+
+        results = run_concurrently(lambda: flight.do('key', slow), 20)
+
+        assert len(calls) == 1
+        assert results == ['result'] * 20
+
+    def test_error_is_shared_and_not_remembered(self):
+        flight = SingleFlight()
+
+        def failing():
+            raise RuntimeError("boom")
+
+        with pytest.raises(RuntimeError):
+            flight.do('key', failing)
+
+        # The failed call isn't cached, the next one runs again
+        assert flight.do('key', lambda: 'ok') == 'ok'
+        assert not flight.in_flight('key')
+
+
+class TestRedirectCache:
+    # Test the LRU/TTL behaviour
+
+    def test_get_and_set(self):
+        cache = RedirectCache(max_entries=10, ttl=60)
+        cache.set('abc', 'https://example.com', now=0)
+
+        assert cache.get('abc', now=30) == ('https://example.com', True)
+        assert cache.get('missing', now=30) == (None, False)
+
+    def test_entries_expire(self):
+        cache = RedirectCache(max_entries=10, ttl=60)
+        cache.set('abc', 'https://example.com', now=0)
+
+        assert cache.get('abc', now=61) == (None, False)
+        assert len(cache) == 0
+
+    def test_stale_window(self):
+        cache = RedirectCache(max_entries=10, ttl=60, stale_ttl=30)
+        cache.set('abc', 'https://example.com', now=0)
+
+        assert cache.get('abc', now=75) == ('https://example.com', False)
+        assert cache.get('abc', now=91) == (None, False)
+
+    def test_least_recently_used_evicted(self):
+        cache = RedirectCache(max_entries=2, ttl=60)
+        cache.set('a', 'https://a.com', now=0)
+        cache.set('b', 'https://b.com', now=0)
+        cache.get('a', now=1)
+        cache.set('c', 'https://c.com', now=1)
+
+        assert cache.get('a', now=1)[0] == 'https://a.com'
+        assert cache.get('b', now=1)[0] is None
+
+    def test_disabled_cache_still_resolves(self):
+        cache = RedirectCache(max_entries=0)
+
+        assert cache.resolve('abc', lambda code: 'https://example.com') == 'https://example.com'
+        assert len(cache) == 0
+
+    def test_misses_are_not_cached(self):
+        cache = RedirectCache()
+        calls = []
+
+        def loader(code):
+            calls.append(code)
+            return None
+
+        cache.resolve('abc', loader)
+        cache.resolve('abc', loader)
+        assert calls == ['abc', 'abc']
+
+    def test_stale_entry_served_while_refreshing(self):
+        cache = RedirectCache(max_entries=10, ttl=0.05, stale_ttl=60)
+        cache.set('abc', 'https://old.example.com')
+        time.sleep(0.06)
+        refreshed = threading.Event()
+
+        def loader(code):
+            refreshed.set()
+            return 'https://new.example.com'
+
+        # Served immediately from the stale entry, refresh happens in the background
+        assert cache.resolve('abc', loader) == 'https://old.example.com'
+        assert refreshed.wait(1)
+        time.sleep(0.01)
+        assert cache.get('abc')[0] == 'https://new.example.com'
+
+
+    def test_burst_of_stale_hits_starts_one_refresh(self):
+        cache = RedirectCache(max_entries=10, ttl=0.01, stale_ttl=60)
+        cache.set('abc', 'https://old.example.com')
+        time.sleep(0.02)
+        release = threading.Event()
+        calls = []
+
+        def loader(code):
+            calls.append(code)
+            release.wait(5)
+            return 'https://new.example.com'
+
+        do = cache._flight.do
+
+        def slow_to_start(key, func):
+            # Widen the gap between starting a refresh thread and its lookup being in flight
+            time.sleep(0.05)
+            return do(key, func)
+
+        with patch.object(cache._flight, 'do', side_effect=slow_to_start):
+            results = run_concurrently(lambda: cache.resolve('abc', loader), 50)
+            refreshes = [thread for thread in threading.enumerate() if thread.name == 'cache-refresh']
+            release.set()
+            for thread in refreshes:
+                thread.join()
+
+        assert results == ['https://old.example.com'] * 50
+        assert len(refreshes) == 1
+        assert calls == ['abc']
+
+class TestCacheSize:
+    # Test the cache's running byte estimate and trimming to a byte limit
+
+    def test_bytes_follow_entries(self):
+        cache = RedirectCache(max_entries=2, ttl=60)
+        cache.set('a', 'https://a.com', now=0)
+        one = cache.nbytes()
+        assert one == entry_size('a', 'https://a.com')
+
+        cache.set('a', 'https://a.example.com/longer', now=0)  # replaced, not added
+        assert cache.nbytes() == entry_size('a', 'https://a.example.com/longer')
+
+        cache.set('b', 'https://b.com', now=0)
+        cache.set('c', 'https://c.com', now=0)  # evicts a
+        assert cache.nbytes() == entry_size('b', 'https://b.com') + entry_size('c', 'https://c.com')
+
+        cache.get('b', now=61)  # expired and removed
+        assert cache.nbytes() == entry_size('c', 'https://c.com')
+        cache.clear()
+        assert cache.nbytes() == 0
+
+    def test_trim_evicts_least_recently_used(self):
+        cache = RedirectCache(max_entries=100, ttl=60)
+        for code in 'abcd':
+            cache.set(code, f'https://{code}.com', now=0)
+        cache.get('a', now=1)
+
+        cache.trim(2 * entry_size('a', 'https://a.com'))
+
+        assert len(cache) == 2
+        assert cache.get('a', now=1)[0] == 'https://a.com'
+        assert cache.get('b', now=1)[0] is None
+
+
+class TestCoalescedDatabaseLookups:
+    # A burst of concurrent misses for one code should hit SQLite once
+
+    @pytest.fixture
+    def temp_db(self):
+        temp_db_file = tempfile.NamedTemporaryFile(delete=False)
+        temp_db_file.close()
+        with patch('app.db.DB_PATH', temp_db_file.name):
+            init_db()
+            yield temp_db_file.name
+        os.unlink(temp_db_file.name)
+
+    def test_burst_of_misses_runs_one_query(self, temp_db):
+        short_url = get_short_url('https://example.com/viral')
+        cache = RedirectCache()
+        queries = []
+
+        def counting_lookup(code):
+            queries.append(code)
+            time.sleep(0.05)  # hold the lookup open so the whole burst piles up behind it
+            return find_original_url(code)
+
+        results = run_concurrently(lambda: cache.resolve(short_url, counting_lookup), 50)
+
+        assert queries == [short_url]
+        assert results == ['https://example.com/viral'] * 50
+
+        # And later requests are served from the cache
+        cache.resolve(short_url, counting_lookup)
+        assert len(queries) == 1
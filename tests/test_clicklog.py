@@ -0,0 +1,189 @@
+import pytest
+import datetime
+import os
+import subprocess
+import sys
+import time
+from unittest.mock import patch
+from app.clicklog import ArrowStore, ClickLog, compact, open_store, scan_clicks, top_codes, click_filter
+
+UTC = datetime.timezone.utc
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ArrowStore(str(tmp_path / 'clicks'))
+
+
+@pytest.fixture
+def click_log(store):
+    click_log = ClickLog(store, interval=3600)  # flushed by hand in these tests
+    yield click_log
+    click_log.close()
+
+
+def record_at(click_log, moment, code, referrer=None):
+    with patch('app.clicklog.time.time', return_value=moment.timestamp()):
+        click_log.record(code, referrer, 'test-agent', '203.0.113.9')
+
+
+def data_files(store):
+    return sorted(
+        os.path.relpath(os.path.join(directory, name), store.path)
+        for directory, _, names in os.walk(store.path) for name in names
+    )
+
+
+class TestClickLog:
+    # Test buffering and writing click events
+
+    def test_events_buffered_until_flush(self, click_log, store):
+        click_log.record('abc', 'https://ref.example/', 'test-agent', '203.0.113.9')
+        click_log.record('abc', None, None, '203.0.113.9')
+
+        assert click_log.pending() == 2
+        assert scan_clicks(store=store).num_rows == 0
+
+        assert click_log.flush() == 2
+        assert click_log.pending() == 0
+        table = scan_clicks(store=store)
+        assert table.column_names == ['code', 'ts', 'referrer', 'user_agent', 'country', 'day']
+        assert table['referrer'].to_pylist() == ['https://ref.example/', None]
+        assert table['country'].to_pylist() == [None, None]  # lookup_country is a stub
+
+    def test_flush_splits_batches_by_day(self, click_log, store):
+        record_at(click_log, datetime.datetime(2026, 10, 18, 23, 59, 59, tzinfo=UTC), 'late')
+        record_at(click_log, datetime.datetime(2026, 10, 19, 0, 0, 1, tzinfo=UTC), 'early')
+        click_log.flush()
+
+        assert [path.split(os.sep)[0] for path in data_files(store)] == ['day=2026-10-18', 'day=2026-10-19']
+
+    def test_full_batch_flushes_in_background(self, store):
+        click_log = ClickLog(store, batch_size=3, interval=3600)
+        for _ in range(3):
+            click_log.record('abc', None, None, None)
+        deadline = time.monotonic() + 5
+        while click_log.written < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        click_log.close()
+
+        assert click_log.written == 3
+
+    def test_full_buffer_drops_events(self, store):
+        click_log = ClickLog(store, interval=3600, max_buffer=2)
+        for _ in range(5):
+            click_log.record('abc', None, None, None)
+        click_log.close()
+
+        assert click_log.written == 2
+        assert click_log.dropped == 3
+
+    def test_failed_write_keeps_events(self, click_log, store):
+        click_log.record('abc', None, None, None)
+        with patch.object(store, 'append', side_effect=OSError("disk full")):
+            with pytest.raises(OSError):
+                click_log.flush()
+
+        assert click_log.pending() == 1
+        assert click_log.flush() == 1
+
+    def test_buffer_size_tracked_and_trimmed_by_flushing(self, click_log, store):
+        assert click_log.nbytes() == 0
+        click_log.record('abc', 'https://ref.example/', 'test-agent', '203.0.113.9')
+        click_log.record('abc', None, None, None)
+        size = click_log.nbytes()
+        assert size > 2 * len('https://ref.example/')
+
+        click_log.trim(size)  # within the limit: nothing happens
+        assert click_log.pending() == 2
+
+        click_log.trim(size - 1)
+        assert click_log.pending() == 0
+        assert click_log.nbytes() == 0
+        assert scan_clicks(store=store).num_rows == 2
+
+    def test_failed_write_keeps_buffer_size(self, click_log, store):
+        click_log.record('abc', None, None, None)
+        size = click_log.nbytes()
+        with patch.object(store, 'append', side_effect=OSError("disk full")):
+            with pytest.raises(OSError):
+                click_log.flush()
+
+        assert click_log.nbytes() == size
+
+    def test_close_flushes(self, store):
+        click_log = ClickLog(store, interval=3600)
+        click_log.record('abc', None, None, None)
+        click_log.close()
+
+        assert scan_clicks(store=store).num_rows == 1
+
+    def test_app_import_does_not_load_pyarrow(self):
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        result = subprocess.run(
+            [sys.executable, '-c', "import sys, main; print('pyarrow' in sys.modules)"],
+            cwd=root, capture_output=True, text=True, check=True)
+
+        assert result.stdout.strip() == 'False'
+
+
+class TestScanClicks:
+    # Test projection, filtering and compaction of the stored events
+
+    @pytest.fixture
+    def filled(self, click_log, store):
+        for day in (17, 18, 19):
+            for code in ('aaa', 'bbb', 'bbb'):
+                record_at(click_log, datetime.datetime(2026, 10, day, 12, tzinfo=UTC), code)
+            click_log.flush()
+        return store
+
+    def test_empty_log(self, store):
+        assert scan_clicks(['code'], store=store).num_rows == 0
+        assert top_codes(store=store) == []
+
+    def test_projection(self, filled):
+        table = scan_clicks(['code', 'ts'], store=filled)
+        assert table.column_names == ['code', 'ts']
+        assert table.num_rows == 9
+
+    def test_filters(self, filled):
+        since = datetime.datetime(2026, 10, 18, tzinfo=UTC)
+        until = datetime.datetime(2026, 10, 19, tzinfo=UTC)
+
+        assert scan_clicks(code='aaa', store=filled).num_rows == 3
+        assert scan_clicks(since=since, store=filled).num_rows == 6
+        assert scan_clicks(['code'], code='bbb', since=since, until=until, store=filled).num_rows == 2
+
+    def test_time_range_prunes_partitions(self, filled):
+        dataset = filled.dataset()
+        since = datetime.datetime(2026, 10, 19, tzinfo=UTC)
+        fragments = list(dataset.get_fragments(filter=click_filter(since=since)))
+
+        assert len(fragments) == 1
+        assert 'day=2026-10-19' in fragments[0].path
+
+    def test_top_codes(self, filled):
+        assert top_codes(store=filled) == [('bbb', 6), ('aaa', 3)]
+        assert top_codes(1, store=filled) == [('bbb', 6)]
+
+    def test_compact_merges_files(self, click_log, filled):
+        for _ in range(3):
+            record_at(click_log, datetime.datetime(2026, 10, 19, 13, tzinfo=UTC), 'ccc')
+            click_log.flush()
+        assert len([path for path in data_files(filled) if path.startswith('day=2026-10-19')]) == 4
+
+        assert compact(filled) == 3
+        files = data_files(filled)
+        assert len(files) == 3
+        assert all(os.path.basename(path).startswith(('part-', 'compacted-')) for path in files)
+
+        table = scan_clicks(['code', 'ts'], since=datetime.datetime(2026, 10, 19, tzinfo=UTC), store=filled)
+        assert table.num_rows == 6
+        assert table['ts'].to_pylist() == sorted(table['ts'].to_pylist())
+
+        assert compact(filled) == 0
+
+    def test_unknown_format(self, tmp_path):
+        with pytest.raises(ValueError):
+            open_store(str(tmp_path), 'csv')
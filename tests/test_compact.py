@@ -0,0 +1,142 @@
+from app.compact import PrefixTable, CompactUrlStore, CompactRedirectCache, code_key
+from app.shortener import generate_short_url
+
+
+class TestPrefixTable:
+    # Test front-coding URLs against shared prefixes
+
+    def test_prefix_of(self):
+        assert PrefixTable.prefix_of('https://www.ourshop.com/products/item-1?a=/b') == 'https://www.ourshop.com/products/'
+        assert PrefixTable.prefix_of('https://example.com/path') == 'https://example.com/'
+        assert PrefixTable.prefix_of('https://example.com') == 'https://'
+
+    def test_round_trip(self):
+        table = PrefixTable()
+        urls = [
+            'https://www.ourshop.com/products/item-1?utm_source=mail',
+            'https://www.ourshop.com/products/item-2',
+            'http://localhost:3000/',
+            'https://example.com/café/menu',
+        ]
+        for url in urls:
+            assert table.decode(table.encode(url)) == url
+
+    def test_shared_prefix_stored_once(self):
+        table = PrefixTable()
+        first = table.encode('https://www.ourshop.com/products/item-1')
+        table.encode('https://www.ourshop.com/products/item-2')
+
+        assert len(table) == 2  # '' plus the shared prefix
+        assert first[2:] == b'item-1'
+
+    def test_full_table_falls_back_to_no_prefix(self):
+        table = PrefixTable(max_prefixes=2)
+        table.encode('https://a.com/x/1')
+        data = table.encode('https://b.com/y/2')
+
+        assert data[:2] == b'\x00\x00'
+        assert table.decode(data) == 'https://b.com/y/2'
+
+
+class TestCompactUrlStore:
+    # Test the generational typed-array store
+
+    def test_put_and_get(self):
+        store = CompactUrlStore(100)
+        store.put(10000, 'https://example.com/a', 50.0)
+
+        assert store.get(10000) == ('https://example.com/a', 50.0)
+        assert store.get(10001) is None
+
+    def test_overwrite(self):
+        store = CompactUrlStore(100)
+        store.put(10000, 'https://example.com/a', 50.0)
+        store.put(10000, 'https://example.com/b', 60.0)
+        store.put(10000, 'https://example.com/longer', 70.0)
+
+        assert store.get(10000) == ('https://example.com/longer', 70.0)
+        assert len(store) == 1
+
+    def test_oldest_generation_evicted(self):
+        store = CompactUrlStore(100)
+        for key in range(300):
+            store.put(key, f'https://example.com/{key}', 1.0)
+
+        assert len(store) <= 100
+        assert store.get(0) is None
+        assert store.get(299) == ('https://example.com/299', 1.0)
+
+    def test_hits_in_old_generation_survive(self):
+        store = CompactUrlStore(100)
+        store.put(0, 'https://example.com/hot', 1.0)
+        for key in range(1, 80):
+            store.put(key, f'https://example.com/{key}', 1.0)
+            store.get(0)  # keep touching the hot entry
+
+        for key in range(80, 200):
+            store.put(key, f'https://example.com/{key}', 1.0)
+            store.get(0)
+
+        assert store.get(0) == ('https://example.com/hot', 1.0)
+
+
+class TestCompactRedirectCache:
+    # Test the drop-in RedirectCache replacement
+
+    def test_code_key(self):
+        assert code_key('2Bi') == 10000
+        assert code_key('0') == 0
+        assert code_key('02Bi') is None  # would collide with '2Bi'
+        assert code_key('ab-c') is None
+        assert code_key('x' * 11) is None
+
+    def test_get_and_set(self):
+        cache = CompactRedirectCache(max_entries=10, ttl=60)
+        cache.set('2Bi', 'https://example.com', now=0)
+
+        assert cache.get('2Bi', now=30) == ('https://example.com', True)
+        assert cache.get('2Bj', now=30) == (None, False)
+
+    def test_expiry_and_stale_window(self):
+        cache = CompactRedirectCache(max_entries=10, ttl=60, stale_ttl=30)
+        cache.set('2Bi', 'https://example.com', now=0)
+
+        assert cache.get('2Bi', now=75) == ('https://example.com', False)
+        assert cache.get('2Bi', now=91) == (None, False)
+
+    def test_resolve_with_unkeyable_code(self):
+        cache = CompactRedirectCache(max_entries=10)
+
+        assert cache.resolve('02Bi', lambda code: 'https://example.com') == 'https://example.com'
+        assert len(cache) == 0
+
+    def test_holds_max_entries(self):
+        cache = CompactRedirectCache(max_entries=1000)
+        for url_id in range(10000, 15000):
+            cache.set(generate_short_url(url_id), f'https://www.ourshop.com/products/{url_id}')
+
+        assert len(cache) <= 1000
+        assert cache.get(generate_short_url(14999))[0] == 'https://www.ourshop.com/products/14999'
+
+    def test_smaller_than_naive_cache(self):
+        cache = CompactRedirectCache(max_entries=1000)
+        for url_id in range(10000, 11000):
+            cache.set(generate_short_url(url_id), f'https://www.ourshop.com/products/item-{url_id}?utm_source=newsletter')
+
+        # A str of this URL alone is ~130 bytes; the whole compact entry should be well under that
+        assert cache.nbytes() / len(cache) < 100
+
+    def test_trim_drops_oldest_generation(self):
+        cache = CompactRedirectCache(max_entries=1000)
+        for url_id in range(10000, 10900):
+            cache.set(generate_short_url(url_id), f'https://www.ourshop.com/products/{url_id}')
+        before = cache.nbytes()
+
+        cache.trim(before - 1)
+
+        assert cache.nbytes() < before
+        assert cache.get(generate_short_url(10000))[0] is None
+        assert cache.get(generate_short_url(10899))[0] == 'https://www.ourshop.com/products/10899'
+
+        cache.trim(0)  # can't go below an empty table; stops rather than looping
+        assert len(cache) == 0
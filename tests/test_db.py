@@ -2,7 +2,7 @@ import pytest
 import tempfile
 import os
 from unittest.mock import patch
-from app.db import get_db_connection, init_db, DB_PATH
+from app.db import get_db_connection, init_db, get_schema_version, DB_PATH, SCHEMA_VERSION
 
 
 class TestDatabaseConnection:
@@ -83,8 +83,8 @@ class TestDatabaseInitialization:
                 cursor.execute("PRAGMA table_info(urls)")
                 columns = cursor.fetchall()
                 
-                # Should have 4 columns: id, original_url, short_url, created_at
-                assert len(columns) == 4
+                # Should have 6 columns: id, original_url, short_url, created_at, host, short_domain
+                assert len(columns) == 6
                 
                 # Check column details
                 column_names = [col[1] for col in columns]
@@ -92,6 +92,8 @@ class TestDatabaseInitialization:
                 assert 'original_url' in column_names
                 assert 'short_url' in column_names
                 assert 'created_at' in column_names
+                assert 'host' in column_names
+                assert 'short_domain' in column_names
                 
                 # Check that id is primary key and autoincrement
                 id_column = next(col for col in columns if col[1] == 'id')
@@ -156,6 +158,102 @@ class TestDatabaseInitialization:
                 assert result[0] >= 10000
 
 
+class TestSchemaVersion:
+    # Test the schema_version table and the fast startup path
+
+    @pytest.fixture
+    def temp_db(self):
+        temp_db_file = tempfile.NamedTemporaryFile(delete=False)
+        temp_db_file.close()
+        yield temp_db_file.name
+        os.unlink(temp_db_file.name)
+        if os.path.exists(temp_db_file.name + '.lock'):
+            os.unlink(temp_db_file.name + '.lock')
+
+    def test_fresh_database_has_no_version(self, temp_db):
+        with patch('app.db.DB_PATH', temp_db):
+            with get_db_connection() as conn:
+                assert get_schema_version(conn) == 0
+
+    def test_init_db_records_schema_version(self, temp_db):
+        with patch('app.db.DB_PATH', temp_db):
+            init_db()
+
+            with get_db_connection() as conn:
+                assert get_schema_version(conn) == SCHEMA_VERSION
+                cursor = conn.cursor()
+                cursor.execute("SELECT COUNT(*) FROM schema_version")
+                assert cursor.fetchone()[0] == 1
+
+    def test_init_db_skips_migration_when_current(self, temp_db):
+        # Once the version row is current, workers shouldn't touch the schema again
+        with patch('app.db.DB_PATH', temp_db):
+            init_db()
+
+            with patch('app.db.apply_migrations') as mock_create, \
+                 patch('app.db.migration_lock') as mock_lock:
+                init_db()
+
+                mock_create.assert_not_called()
+                mock_lock.assert_not_called()
+
+    def test_init_db_migrates_legacy_database(self, temp_db):
+        # A database created before schema_version existed keeps its data and sequence
+        with patch('app.db.DB_PATH', temp_db):
+            with get_db_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                CREATE TABLE urls (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    original_url TEXT NOT NULL,
+                    short_url TEXT UNIQUE NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+                """)
+                cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('urls', 9999)")
+                cursor.execute("INSERT INTO urls (original_url, short_url) VALUES ('https://example.com', '2Bi')")
+                conn.commit()
+
+            init_db()
+
+            with get_db_connection() as conn:
+                cursor = conn.cursor()
+                assert get_schema_version(conn) == SCHEMA_VERSION
+                cursor.execute("SELECT seq FROM sqlite_sequence WHERE name='urls'")
+                assert cursor.fetchone()[0] == 10000
+                cursor.execute("SELECT COUNT(*) FROM urls")
+                assert cursor.fetchone()[0] == 1
+
+    def test_init_db_takes_migration_lock(self, temp_db):
+        # The migration itself runs under the file lock next to the database
+        with patch('app.db.DB_PATH', temp_db):
+            init_db()
+
+            assert os.path.exists(temp_db + '.lock')
+
+
+    def test_init_db_switches_journal_mode(self, temp_db):
+        with patch('app.db.DB_PATH', temp_db):
+            init_db()
+            with patch('app.config.DB_JOURNAL_MODE', 'wal'):
+                init_db()
+                with get_db_connection() as conn:
+                    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+
+                # Already in WAL: back to the fast path
+                with patch('app.db.migration_lock') as mock_lock:
+                    init_db()
+                mock_lock.assert_not_called()
+        for suffix in ('-wal', '-shm'):
+            if os.path.exists(temp_db + suffix):
+                os.unlink(temp_db + suffix)
+
+    def test_init_db_rejects_unknown_journal_mode(self, temp_db):
+        with patch('app.db.DB_PATH', temp_db), patch('app.config.DB_JOURNAL_MODE', 'off'):
+            with pytest.raises(ValueError):
+                init_db()
+
+
 class TestDatabasePath:
     # Test database path configuration
 
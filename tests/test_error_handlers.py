@@ -49,8 +49,9 @@ class TestErrorHandlers:
             handle_server_error(error, "test context")
             
             mock_logger.error.assert_called_once()
-            logged_message = mock_logger.error.call_args[0][0]
-            assert "Server error in test context: Test error" in logged_message
+            args, kwargs = mock_logger.error.call_args
+            assert args[0] % args[1:] == "Server error in test context: Test error"
+            assert kwargs['exc_info'] is error
     
     def test_handle_not_found_default(self):
         # Test not found handler with default parameters
@@ -0,0 +1,129 @@
+import pytest
+import tempfile
+import os
+import threading
+import time
+from collections import Counter
+from unittest.mock import patch
+from app.db import get_db_connection, init_db
+from app.hashring import HashRing, id_owner, next_owned_id, claim_owned_id, parse_node_names, plan_moves
+from app.models import get_short_url, insert_urls
+from app.shortener import decode_short_url
+
+
+@pytest.fixture
+def temp_db():
+    temp_db_file = tempfile.NamedTemporaryFile(delete=False)
+    temp_db_file.close()
+    with patch('app.db.DB_PATH', temp_db_file.name):
+        init_db()
+        yield temp_db_file.name
+    os.unlink(temp_db_file.name)
+
+
+@pytest.fixture
+def partitioned():
+    # This process is node 'b' of three
+    with patch('app.config.PARTITION_NODE', 'b'), \
+            patch('app.config.PARTITION_NODES', 'a,b,c'), \
+            patch('app.config.PARTITION_BLOCK_SIZE', 16):
+        yield HashRing(['a', 'b', 'c'])
+
+
+class TestHashRing:
+    # Test placing keys on the ring
+
+    def test_same_key_same_node(self):
+        ring = HashRing(['a', 'b', 'c'])
+        assert all(ring.node_for(key) == HashRing(['c', 'b', 'a']).node_for(key) for key in range(1000))
+
+    def test_keys_spread_evenly(self):
+        ring = HashRing(['a', 'b', 'c', 'd'])
+        counts = Counter(ring.node_for(key) for key in range(40000))
+        assert set(counts) == {'a', 'b', 'c', 'd'}
+        assert all(7000 < count < 13000 for count in counts.values())
+
+    def test_adding_a_node_moves_few_keys(self):
+        ring = HashRing(['a', 'b', 'c', 'd'])
+        before = {key: ring.node_for(key) for key in range(20000)}
+        ring.add('e')
+        moved = [key for key in before if ring.node_for(key) != before[key]]
+
+        # Only keys now owned by the new node move, about a fifth of them
+        assert all(ring.node_for(key) == 'e' for key in moved)
+        assert 0.1 < len(moved) / len(before) < 0.3
+
+    def test_removing_a_node_only_moves_its_keys(self):
+        ring = HashRing(['a', 'b', 'c'])
+        before = {key: ring.node_for(key) for key in range(5000)}
+        ring.remove('b')
+        assert all(ring.node_for(key) == owner for key, owner in before.items() if owner != 'b')
+        assert ring.nodes == ['a', 'c']
+
+    def test_empty_ring(self):
+        with pytest.raises(LookupError):
+            HashRing().node_for(1)
+
+    def test_plan_moves(self):
+        moves = plan_moves(['a', 'b'], ['a', 'b', 'c'], 1023999, 1024)
+        assert {new for _, new in moves} == {'c'}
+        assert 0.2 < sum(moves.values()) / 1024000 < 0.5
+
+    def test_parse_node_names(self):
+        assert parse_node_names(' a, b,,c ') == ['a', 'b', 'c']
+
+
+class TestOwnedIds:
+    # Test nodes issuing ids only in their own blocks
+
+    def test_next_owned_id(self):
+        ring = HashRing(['a', 'b', 'c'])
+        after = 0
+        for _ in range(200):
+            after = next_owned_id(ring, 'b', after, 16)
+            assert id_owner(ring, after, 16) == 'b'
+
+    def test_unknown_node(self):
+        with pytest.raises(LookupError):
+            next_owned_id(HashRing(['a']), 'b', 0, 16)
+
+    def test_shortened_codes_route_to_this_node(self, temp_db, partitioned):
+        codes = [get_short_url(f'https://example.com/{i}') for i in range(40)]
+        with get_db_connection() as conn:
+            codes += insert_urls(conn, [f'https://example.com/batch/{i}' for i in range(40)])
+
+        assert all(id_owner(partitioned, decode_short_url(code), 16) == 'b' for code in codes)
+        assert len(set(codes)) == 80
+
+    def test_concurrent_inserts_at_block_boundary(self, temp_db, partitioned):
+        # The next id is the last of one of b's blocks, and the block after it isn't b's
+        block = next(block for block in range(1, 1000)
+                     if partitioned.node_for(block) == 'b' and partitioned.node_for(block + 1) != 'b')
+        with get_db_connection() as conn:
+            conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'urls'", ((block + 1) * 16 - 2,))
+            conn.commit()
+        codes = []
+
+        with get_db_connection() as first:
+            codes += insert_urls(first, ['https://example.com/first'])
+            # A second worker shortens while the first still holds its transaction open
+            second = threading.Thread(target=lambda: codes.append(get_short_url('https://example.com/second')))
+            second.start()
+            time.sleep(0.2)
+            first.commit()
+        second.join()
+
+        assert decode_short_url(codes[0]) == (block + 1) * 16 - 1
+        assert all(id_owner(partitioned, decode_short_url(code), 16) == 'b' for code in codes)
+
+    def test_unpartitioned_ids_untouched(self, temp_db):
+        seq = "SELECT seq FROM sqlite_sequence WHERE name = 'urls'"
+        with get_db_connection() as conn:
+            before = conn.execute(seq).fetchone()[0]
+            claim_owned_id(conn)
+            assert conn.execute(seq).fetchone()[0] == before
+
+    def test_id_floor(self, temp_db, partitioned):
+        with patch('app.config.PARTITION_ID_FLOOR', 10000):
+            code = get_short_url('https://example.com/')
+        assert decode_short_url(code) >= 10000
@@ -0,0 +1,67 @@
+import pytest
+import tempfile
+import os
+import threading
+from unittest.mock import patch
+from flask import Flask
+from app.db import init_db, get_db_connection
+from app.routes import register_routes
+
+
+class TestHealthEndpoints:
+    # Test the /healthz and /readyz probes
+
+    @pytest.fixture
+    def app(self):
+        app = Flask(__name__)
+        app.config['TESTING'] = True
+        register_routes(app)
+        return app
+
+    @pytest.fixture
+    def client(self, app):
+        return app.test_client()
+
+    @pytest.fixture
+    def temp_db(self):
+        temp_db_file = tempfile.NamedTemporaryFile(delete=False)
+        temp_db_file.close()
+        with patch('app.db.DB_PATH', temp_db_file.name):
+            init_db()
+            yield temp_db_file.name
+        os.unlink(temp_db_file.name)
+
+    def test_healthz_needs_no_database(self, client):
+        with patch('app.db.DB_PATH', '/nonexistent/dir/url_shortener.db'):
+            response = client.get('/healthz')
+
+        assert response.status_code == 200
+        assert response.get_data(as_text=True) == 'ok'
+
+    def test_ready(self, client, temp_db):
+        response = client.get('/readyz')
+
+        assert response.status_code == 200
+        assert response.get_json() == {'status': 'ready', 'checks': {'database': 'ok', 'cache_warmup': 'ok', 'replication': 'primary'}}
+
+    def test_not_ready_while_warming_up(self, app, client, temp_db):
+        app.extensions['cache_warmup'] = threading.Event()
+        assert client.get('/readyz').status_code == 503
+
+        app.extensions['cache_warmup'].set()
+        assert client.get('/readyz').status_code == 200
+
+    def test_not_ready_with_old_schema(self, client, temp_db):
+        with get_db_connection() as conn:
+            conn.execute("UPDATE schema_version SET version = 1")
+
+        response = client.get('/readyz')
+        assert response.status_code == 503
+        assert response.get_json()['checks']['database'].startswith('schema version 1')
+
+    def test_not_ready_without_database(self, client):
+        with patch('app.db.DB_PATH', '/nonexistent/dir/url_shortener.db'):
+            response = client.get('/readyz')
+
+        assert response.status_code == 503
+        assert response.get_json()['checks']['database'].startswith('error')
@@ -0,0 +1,180 @@
+import pytest
+import io
+import json
+import logging
+import queue
+import weakref
+from unittest.mock import patch
+from flask import Flask
+from app.logs import LogWriter, LogQueueHandler, SamplingFilter, setup_logging, current_request_id
+
+
+@pytest.fixture
+def output():
+    return io.StringIO()
+
+
+@pytest.fixture
+def logger(output):
+    # A private logger, so the root logger and pytest's capture are left alone
+    test_logger = logging.getLogger('tests.logs')
+    test_logger.propagate = False
+    writer = LogWriter(stream=output, burst=3, window=60).install(test_logger)
+    test_logger.writer = writer
+    yield test_logger
+    writer.close(test_logger)
+    test_logger.propagate = True
+
+
+def lines(output):
+    return [json.loads(line) for line in output.getvalue().splitlines()]
+
+
+class TestLogWriter:
+    # Test queued JSON output
+
+    def test_json_lines(self, logger, output):
+        logger.info("shortened %s", "abc", extra={'host': 'example.com'})
+        logger.writer.close(logger)
+
+        (entry,) = lines(output)
+        assert entry['level'] == 'INFO'
+        assert entry['logger'] == 'tests.logs'
+        assert entry['message'] == 'shortened abc'
+        assert entry['host'] == 'example.com'
+        assert entry['ts'].endswith('Z')
+
+    def test_exception_formatted_by_writer(self, logger, output):
+        try:
+            raise ValueError("boom")
+        except ValueError as e:
+            logger.error("failed: %s", e, exc_info=e)
+        logger.writer.close(logger)
+
+        (entry,) = lines(output)
+        assert entry['message'] == 'failed: boom'
+        assert 'ValueError: boom' in entry['exception']
+
+    def test_queued_record_keeps_only_text(self):
+        class Payload:
+            def __str__(self):
+                return "world"
+
+        payload = Payload()
+        alive = weakref.ref(payload)
+        test_logger = logging.getLogger('tests.logs.queued')
+        test_logger.propagate = False
+        handler = LogQueueHandler(queue.Queue())
+        test_logger.addHandler(handler)
+        with patch('app.logs.JsonFormatter.format') as mock_format:
+            test_logger.warning("hello %s", payload)
+            try:
+                raise ValueError("boom")
+            except ValueError:
+                test_logger.error("failed", exc_info=True)
+        test_logger.removeHandler(handler)
+        info, error = handler.queue.get_nowait(), handler.queue.get_nowait()
+        del payload
+
+        assert (info.msg, info.args) == ("hello world", None)
+        assert alive() is None
+        assert error.exc_info is None
+        assert 'ValueError: boom' in error.exc_text
+        mock_format.assert_not_called()
+
+    def test_text_format_with_exception(self, output):
+        test_logger = logging.getLogger('tests.logs.text')
+        test_logger.propagate = False
+        writer = LogWriter(stream=output, fmt='text').install(test_logger)
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            test_logger.exception("failed")
+        writer.close(test_logger)
+        assert 'ERROR [-] tests.logs.text: failed\nTraceback' in output.getvalue()
+        assert 'ValueError: boom' in output.getvalue()
+
+    def test_full_queue_drops(self):
+        handler = LogQueueHandler(queue.Queue(maxsize=1))
+        for _ in range(3):
+            handler.handle(logging.LogRecord('x', logging.ERROR, '', 0, 'msg', (), None))
+        assert handler.dropped == 2
+
+    def test_text_format(self, output):
+        test_logger = logging.getLogger('tests.logs.text')
+        test_logger.propagate = False
+        writer = LogWriter(stream=output, fmt='text').install(test_logger)
+        test_logger.warning("careful")
+        writer.close(test_logger)
+        assert 'WARNING [-] tests.logs.text: careful' in output.getvalue()
+
+
+class TestSampling:
+    # Test suppressing repeated errors
+
+    def test_burst_then_suppressed(self, logger, output):
+        for _ in range(10):
+            logger.error("Server error in %s: %s", "redirect", "db locked")
+        logger.info("still here")
+        logger.writer.close(logger)
+
+        messages = [entry['message'] for entry in lines(output)]
+        assert messages.count('Server error in redirect: db locked') == 3
+        assert 'still here' in messages
+
+    def test_window_reports_suppressed(self):
+        now = [0.0]
+        sampler = SamplingFilter(burst=1, window=10, clock=lambda: now[0])
+        record = lambda: logging.LogRecord('x', logging.ERROR, '', 0, 'same', (), None)
+
+        assert sampler.filter(record())
+        assert not sampler.filter(record())
+        assert not sampler.filter(record())
+        now[0] = 11
+        next_record = record()
+        assert sampler.filter(next_record)
+        assert next_record.suppressed == 2
+
+    def test_different_messages_sampled_separately(self):
+        sampler = SamplingFilter(burst=1, window=10)
+        assert sampler.filter(logging.LogRecord('x', logging.ERROR, '', 0, 'one', (), None))
+        assert sampler.filter(logging.LogRecord('x', logging.ERROR, '', 0, 'two', (), None))
+
+
+class TestRequestIds:
+    # Test correlation ids on requests and their log lines
+
+    @pytest.fixture
+    def app(self, logger):
+        app = Flask(__name__)
+        with patch('app.logs._writer', logger.writer):
+            setup_logging(app)
+
+        @app.route('/work')
+        def work():
+            logger.warning("working")
+            return {'request_id': current_request_id()}
+
+        return app
+
+    def test_new_id_per_request(self, app):
+        client = app.test_client()
+        first, second = client.get('/work'), client.get('/work')
+        assert first.headers['X-Request-ID'] == first.get_json()['request_id']
+        assert first.headers['X-Request-ID'] != second.headers['X-Request-ID']
+
+    def test_caller_id_kept(self, app):
+        response = app.test_client().get('/work', headers={'X-Request-ID': 'edge-1234'})
+        assert response.headers['X-Request-ID'] == 'edge-1234'
+
+    def test_unsafe_caller_id_replaced(self, app):
+        response = app.test_client().get('/work', headers={'X-Request-ID': 'bad id<script>'})
+        assert response.headers['X-Request-ID'] != 'bad id<script>'
+
+    def test_log_lines_carry_id(self, app, logger, output):
+        response = app.test_client().get('/work')
+        logger.writer.close(logger)
+
+        (entry,) = lines(output)
+        assert entry['request_id'] == response.headers['X-Request-ID']
+        assert current_request_id() is None
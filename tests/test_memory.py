@@ -0,0 +1,145 @@
+import pytest
+import tempfile
+import os
+import time
+from unittest.mock import patch
+from flask import Flask
+from app.db import init_db
+from app.memory import MemoryAccounting, start_memory_accounting
+from app.routes import register_routes
+from app.stats import start_click_counter
+
+
+class Sized:
+    """A structure that is as big as it's told and shrinks when trimmed"""
+
+    def __init__(self, size):
+        self.size = size
+        self.trimmed_to = []
+
+    def nbytes(self):
+        return self.size
+
+    def trim(self, max_bytes):
+        self.trimmed_to.append(max_bytes)
+        self.size = min(self.size, max_bytes)
+
+
+class TestMemoryAccounting:
+    # Test per-structure and total caps
+
+    @pytest.fixture
+    def accounting(self):
+        accounting = MemoryAccounting(interval=0)  # enforced by hand in these tests
+        yield accounting
+        accounting.close()
+
+    def test_usage_reports_each_structure(self, accounting):
+        accounting.register('cache', Sized(300).nbytes, cap=1000)
+        accounting.register('queue', Sized(200).nbytes)
+
+        usage = accounting.usage()
+
+        assert usage['total_bytes'] == 500
+        assert usage['total_cap'] is None
+        assert usage['structures']['cache'] == {
+            'bytes': 300, 'cap': 1000, 'trimmable': False, 'trims': 0, 'trimmed_bytes': 0
+        }
+        assert usage['structures']['queue']['cap'] is None
+
+    def test_structure_over_its_cap_is_trimmed(self, accounting):
+        under, over = Sized(100), Sized(500)
+        accounting.register('under', under.nbytes, under.trim, cap=200)
+        accounting.register('over', over.nbytes, over.trim, cap=200)
+
+        accounting.enforce()
+
+        assert under.trimmed_to == []
+        assert over.trimmed_to == [200]
+        assert accounting.usage()['structures']['over']['trimmed_bytes'] == 300
+
+    def test_total_cap_trims_largest_first(self):
+        accounting = MemoryAccounting(total_cap=1000, interval=0)
+        small, large, fixed = Sized(300), Sized(600), Sized(400)
+        accounting.register('small', small.nbytes, small.trim)
+        accounting.register('large', large.nbytes, large.trim)
+        accounting.register('fixed', fixed.nbytes)  # counted, never trimmed
+
+        sizes = accounting.enforce()
+
+        assert large.trimmed_to == [300]
+        assert small.trimmed_to == []
+        assert sum(sizes.values()) == 1000
+
+    def test_total_cap_moves_on_to_the_next_structure(self):
+        accounting = MemoryAccounting(total_cap=100, interval=0)
+        first, second = Sized(300), Sized(200)
+        accounting.register('first', first.nbytes, first.trim)
+        accounting.register('second', second.nbytes, second.trim)
+
+        accounting.enforce()
+
+        assert first.trimmed_to == [0]
+        assert second.trimmed_to == [100]
+
+    def test_background_check_enforces_caps(self):
+        structure = Sized(500)
+        accounting = MemoryAccounting(interval=0.01)
+        accounting.register('cache', structure.nbytes, structure.trim, cap=100)
+        try:
+            for _ in range(500):
+                if structure.size <= 100:
+                    break
+                time.sleep(0.01)
+        finally:
+            accounting.close()
+
+        assert structure.size == 100
+
+
+class TestDebugMemoryEndpoint:
+    # Test GET /debug/memory and which structures get registered
+
+    AUTH = {'Authorization': 'Bearer secret'}
+
+    @pytest.fixture
+    def temp_db(self):
+        temp_db_file = tempfile.NamedTemporaryFile(delete=False)
+        temp_db_file.close()
+        with patch('app.db.DB_PATH', temp_db_file.name):
+            init_db()
+            yield temp_db_file.name
+        os.unlink(temp_db_file.name)
+
+    @pytest.fixture
+    def app(self, temp_db):
+        app = Flask(__name__)
+        app.config['TESTING'] = True
+        register_routes(app)
+        counter = start_click_counter(app, interval=3600)
+        with patch('app.config.MEMORY_CHECK_INTERVAL', 0), \
+                patch('app.config.MEMORY_CAP_REDIRECT_CACHE_MB', 1):
+            accounting = start_memory_accounting(app)
+        yield app
+        accounting.close()
+        counter.close()
+
+    def test_requires_admin_token(self, app):
+        with patch('app.config.ADMIN_TOKEN', ''):
+            assert app.test_client().get('/debug/memory').status_code == 403
+
+    def test_reports_registered_structures(self, app):
+        app.extensions['redirect_cache'].set('abc', 'https://example.com/')
+        client = app.test_client()
+        client.get('/readyz')  # opens this thread's probe connection
+
+        with patch('app.config.ADMIN_TOKEN', 'secret'):
+            response = client.get('/debug/memory', headers=self.AUTH)
+
+        assert response.status_code == 200
+        structures = response.get_json()['structures']
+        assert set(structures) >= {'redirect_cache', 'click_counter', 'probe_page_cache'}
+        assert structures['redirect_cache']['bytes'] > 0
+        assert structures['redirect_cache']['cap'] == 1024 * 1024
+        assert structures['probe_page_cache']['trimmable'] is False
+        assert structures['probe_page_cache']['bytes'] > 0
@@ -0,0 +1,255 @@
+import pytest
+import tempfile
+import os
+import sqlite3
+from unittest.mock import patch
+from app.migrations import (
+    MIGRATIONS,
+    BACKFILLS,
+    Backfill,
+    apply_migrations,
+    pending_migrations,
+    get_schema_version,
+    get_backfill_progress,
+    latest_version,
+    run_backfill,
+    build_index,
+    index_exists,
+    main,
+)
+
+
+class TestMigrations:
+    # Test applying versioned migrations
+
+    @pytest.fixture
+    def conn(self):
+        temp_db_file = tempfile.NamedTemporaryFile(delete=False)
+        temp_db_file.close()
+        conn = sqlite3.connect(temp_db_file.name)
+        yield conn
+        conn.close()
+        os.unlink(temp_db_file.name)
+
+    def test_migrations_are_ordered_and_unique(self):
+        versions = [m.version for m in MIGRATIONS]
+        assert versions == sorted(versions)
+        assert len(versions) == len(set(versions))
+        assert latest_version() == versions[-1]
+
+    def test_apply_all_migrations(self, conn):
+        applied = apply_migrations(conn)
+
+        assert [m.version for m in applied] == [m.version for m in MIGRATIONS]
+        assert get_schema_version(conn) == latest_version()
+        assert pending_migrations(conn) == []
+
+    def test_apply_migrations_up_to_target(self, conn):
+        apply_migrations(conn, target=1)
+        assert get_schema_version(conn) == 1
+
+        # Applying again only runs what's left
+        applied = apply_migrations(conn)
+        assert [m.version for m in applied] == [m.version for m in MIGRATIONS if m.version > 1]
+
+    def test_apply_migrations_is_idempotent(self, conn):
+        apply_migrations(conn)
+        assert apply_migrations(conn) == []
+
+    def test_failed_migration_rolls_back(self, conn):
+        apply_migrations(conn, target=1)
+
+        def broken(conn):
+            conn.execute("CREATE TABLE half_done (id INTEGER)")
+            raise RuntimeError("boom")
+
+        broken_migration = MIGRATIONS[1]._replace(apply=broken)
+        with patch('app.migrations.MIGRATIONS', [MIGRATIONS[0], broken_migration]):
+            with pytest.raises(RuntimeError):
+                apply_migrations(conn)
+
+        # Neither the DDL nor the version bump survived
+        assert get_schema_version(conn) == 1
+        tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+        assert 'half_done' not in tables
+
+
+    def test_changelog_not_kept_by_default(self, conn):
+        apply_migrations(conn, target=5)
+        conn.execute("INSERT INTO urls (original_url) VALUES ('https://example.com/a')")
+        conn.commit()
+
+        apply_migrations(conn)
+        conn.execute("INSERT INTO urls (original_url) VALUES ('https://example.com/b')")
+
+        # No triggers and no seeding at boot; see app.replication.enable_changelog
+        assert conn.execute("SELECT COUNT(*) FROM changelog").fetchone() == (0,)
+        assert get_backfill_progress(conn, 'seed_changelog') is None
+
+    def test_existing_links_in_canonical_short_domain(self, conn):
+        apply_migrations(conn, target=6)
+        conn.execute("INSERT INTO urls (original_url) VALUES ('https://example.com/')")
+        conn.commit()
+
+        apply_migrations(conn)
+
+        assert conn.execute("SELECT short_domain FROM urls").fetchall() == [(0,)]
+
+    def test_deletes_counted(self, conn):
+        apply_migrations(conn)
+        conn.executemany("INSERT INTO urls (original_url) VALUES (?)", [('https://example.com/a',), ('https://example.com/b',)])
+        conn.execute("DELETE FROM urls")
+
+        assert conn.execute("SELECT count FROM url_deletes").fetchone() == (2,)
+
+    def test_created_at_index_deferred_on_existing_table(self, conn):
+        apply_migrations(conn, target=3)
+        conn.execute("INSERT INTO urls (original_url) VALUES ('https://example.com/')")
+        conn.commit()
+
+        apply_migrations(conn)
+        assert not index_exists(conn, 'idx_urls_created_at')
+
+        assert build_index(conn, 'idx_urls_created_at')
+        assert index_exists(conn, 'idx_urls_created_at')
+        assert not build_index(conn, 'idx_urls_created_at')
+
+    def test_created_at_index_built_on_new_database(self, conn):
+        apply_migrations(conn)
+        assert index_exists(conn, 'idx_urls_created_at')
+
+    def test_host_index_deferred_on_existing_table(self, conn):
+        apply_migrations(conn, target=3)
+        conn.execute("INSERT INTO urls (original_url) VALUES ('https://example.com/')")
+        conn.commit()
+
+        apply_migrations(conn)
+        assert not index_exists(conn, 'idx_urls_host')
+
+        assert build_index(conn, 'idx_urls_host')
+        assert index_exists(conn, 'idx_urls_host')
+
+class TestBackfill:
+    # Test resumable, batched backfills
+
+    @pytest.fixture
+    def conn(self):
+        temp_db_file = tempfile.NamedTemporaryFile(delete=False)
+        temp_db_file.close()
+        conn = sqlite3.connect(temp_db_file.name)
+        apply_migrations(conn)
+        conn.executemany(
+            "INSERT INTO urls (original_url) VALUES (?)",
+            [(f"https://example.com/{i}",) for i in range(25)]
+        )
+        conn.commit()
+        yield conn
+        conn.close()
+        os.unlink(temp_db_file.name)
+
+    @pytest.fixture
+    def upper_backfill(self):
+        # A backfill that upper-cases original_url, recording each batch it sees
+        batches = []
+
+        def step(conn, after_id, last_id):
+            batches.append((after_id, last_id))
+            conn.execute(
+                "UPDATE urls SET original_url = UPPER(original_url) WHERE id > ? AND id <= ?",
+                (after_id, last_id)
+            )
+
+        with patch.dict(BACKFILLS, {'upper': Backfill('upper', 'test backfill', step)}):
+            yield batches
+
+    def test_backfill_runs_in_batches(self, conn, upper_backfill):
+        batches = run_backfill(conn, 'upper', batch_size=10, sleep=0)
+
+        assert batches == 3
+        assert upper_backfill == [(0, 10009), (10009, 10019), (10019, 10024)]
+        assert get_backfill_progress(conn, 'upper') == (10024, True)
+
+        lowercase = conn.execute("SELECT COUNT(*) FROM urls WHERE original_url != UPPER(original_url)").fetchone()[0]
+        assert lowercase == 0
+
+    def test_backfill_resumes_where_it_stopped(self, conn, upper_backfill):
+        assert run_backfill(conn, 'upper', batch_size=10, sleep=0, max_batches=1) == 1
+        assert get_backfill_progress(conn, 'upper') == (10009, False)
+
+        run_backfill(conn, 'upper', batch_size=10, sleep=0)
+        assert upper_backfill[1] == (10009, 10019)
+        assert get_backfill_progress(conn, 'upper')[1] is True
+
+    def test_completed_backfill_does_nothing(self, conn, upper_backfill):
+        run_backfill(conn, 'upper', batch_size=100, sleep=0)
+        upper_backfill.clear()
+
+        assert run_backfill(conn, 'upper', batch_size=100, sleep=0) == 0
+        assert upper_backfill == []
+
+    @patch('app.migrations.time.sleep')
+    def test_backfill_throttles_between_batches(self, mock_sleep, conn, upper_backfill):
+        run_backfill(conn, 'upper', batch_size=10, sleep=0.25)
+
+        assert mock_sleep.call_count == 3
+        mock_sleep.assert_called_with(0.25)
+
+    def test_failed_batch_keeps_previous_progress(self, conn):
+        def step(conn, after_id, last_id):
+            if after_id > 0:
+                raise RuntimeError("boom")
+
+        with patch.dict(BACKFILLS, {'flaky': Backfill('flaky', 'test backfill', step)}):
+            with pytest.raises(RuntimeError):
+                run_backfill(conn, 'flaky', batch_size=10, sleep=0)
+
+        assert get_backfill_progress(conn, 'flaky') == (10009, False)
+
+    def test_fill_url_host_backfill(self, conn):
+        # Scheduled by the migration that added the column
+        assert get_backfill_progress(conn, 'fill_url_host') == (0, False)
+
+        run_backfill(conn, 'fill_url_host', batch_size=10, sleep=0)
+
+        hosts = {row[0] for row in conn.execute("SELECT host FROM urls")}
+        assert hosts == {'example.com'}
+
+
+
+class TestMigrationsCli:
+    # Test the python -m app.migrations command line
+
+    @pytest.fixture
+    def temp_db(self):
+        temp_db_file = tempfile.NamedTemporaryFile(delete=False)
+        temp_db_file.close()
+        with patch('app.db.DB_PATH', temp_db_file.name):
+            yield temp_db_file.name
+        os.unlink(temp_db_file.name)
+        if os.path.exists(temp_db_file.name + '.lock'):
+            os.unlink(temp_db_file.name + '.lock')
+
+    def test_cli_upgrade_and_status(self, temp_db, capsys):
+        main(['upgrade'])
+        assert f"applied {latest_version()}" in capsys.readouterr().out
+
+        main(['upgrade'])
+        assert "schema is up to date" in capsys.readouterr().out
+
+        main(['status'])
+        assert f"schema version: {latest_version()}" in capsys.readouterr().out
+
+    def test_cli_builds_deferred_index(self, temp_db, capsys):
+        main(['upgrade', '--to', '3'])
+        with sqlite3.connect(temp_db) as conn:
+            conn.execute("INSERT INTO urls (original_url) VALUES ('https://example.com/')")
+        main(['upgrade'])
+        capsys.readouterr()
+
+        main(['status'])
+        assert "index idx_urls_created_at: not built" in capsys.readouterr().out
+
+        main(['index', 'idx_urls_created_at'])
+        assert "idx_urls_created_at: built" in capsys.readouterr().out
+        main(['status'])
+        assert "index idx_urls_created_at: built" in capsys.readouterr().out
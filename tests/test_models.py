@@ -2,7 +2,7 @@ import pytest
 import tempfile
 import os
 from unittest.mock import patch, MagicMock
-from app.models import Url, get_short_url, save_url_to_db, update_short_url_in_db, find_original_url
+from app.models import Url, get_short_url, save_url_to_db, update_short_url_in_db, find_original_url, find_original_urls, LinkQuery
 from app.db import get_db_connection, init_db
 
 
@@ -86,6 +86,27 @@ class TestDatabaseOperations:
             assert original_url is None
 
 
+    def test_find_original_urls(self, temp_db):
+        codes = [get_short_url(f"https://example.com/{i}") for i in range(5)]
+
+        found = find_original_urls(codes + ['zzzzz', 'not-base62!', '0' + codes[0], 'z' * 10])
+
+        assert found == {code: f"https://example.com/{i}" for i, code in enumerate(codes)}
+
+    def test_find_original_urls_in_chunks(self, temp_db):
+        codes = [get_short_url(f"https://example.com/{i}") for i in range(7)]
+
+        assert len(find_original_urls(codes, chunk_size=3)) == 7
+        assert find_original_urls([]) == {}
+
+    def test_find_original_urls_only_canonical_domain(self, temp_db):
+        from app.shortdomains import domain_key
+        code = get_short_url("https://example.com/canonical")
+        brand = get_short_url("https://example.com/brand", domain_key("brand.co"))
+
+        assert find_original_urls([code, brand]) == {code: "https://example.com/canonical"}
+
+
 class TestGetShortUrl:
     # Test the main get_short_url function
 
@@ -118,3 +139,102 @@ class TestGetShortUrl:
         # Test that the exception is propagated
         with pytest.raises(Exception, match="Database error"):
             get_short_url("https://example.com")
+
+
+class TestLinkQuery:
+    # Test keyset-paginated link listing
+
+    @pytest.fixture
+    def temp_db(self):
+        temp_db_file = tempfile.NamedTemporaryFile(delete=False)
+        temp_db_file.close()
+
+        with patch('app.db.DB_PATH', temp_db_file.name):
+            init_db()
+            with get_db_connection() as conn:
+                conn.executemany(
+                    "INSERT INTO urls (original_url, short_url, host, created_at) VALUES (?, ?, ?, ?)",
+                    [(f"https://{host}/p/{i}", f"c{i}", host, f"2025-01-{i % 28 + 1:02d} 12:00:00")
+                     for i in range(40) for host in ['shop.example.com' if i % 2 else 'blog.example.com']]
+                )
+                # Keep created_at in step with id, as it is for real inserts
+                conn.execute("UPDATE urls SET created_at = datetime('2025-01-01', '+' || (id - 10000) || ' hours')")
+            yield temp_db_file.name
+
+        os.unlink(temp_db_file.name)
+
+    def test_pages_cover_everything_once(self, temp_db):
+        seen, cursor = [], None
+        while True:
+            page = LinkQuery(limit=15, before_id=cursor)
+            seen.extend(link['id'] for link in page)
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+
+        assert seen == list(range(10039, 9999, -1))
+
+    def test_last_page_has_no_cursor(self, temp_db):
+        page = LinkQuery(limit=100)
+        assert len(list(page)) == 40
+        assert page.next_cursor is None
+
+    def test_created_at_range(self, temp_db):
+        page = LinkQuery(limit=100, created_after='2025-01-01 10:00:00', created_before='2025-01-01 20:00:00')
+        assert [link['id'] for link in page] == list(range(10019, 10009, -1))
+
+    def test_empty_created_at_range(self, temp_db):
+        assert list(LinkQuery(limit=10, created_after='2030-01-01 00:00:00')) == []
+
+    @pytest.mark.parametrize('created_after, created_before', [
+        ('2025-01-01 10:00:00', '2025-01-01 20:00:00'),
+        ('2025-01-01 10:30:00', None),
+        (None, '2025-01-01 05:00:00'),
+        ('2030-01-01 00:00:00', None),
+        (None, '2024-01-01 00:00:00'),
+        (None, '2030-01-01 00:00:00'),
+    ])
+    def test_created_at_range_before_index_is_built(self, temp_db, created_after, created_before):
+        with get_db_connection() as conn:
+            conn.execute("DELETE FROM urls WHERE id % 3 = 0")  # gaps in the ids
+        expected = list(LinkQuery(limit=100, created_after=created_after, created_before=created_before))
+        with get_db_connection() as conn:
+            conn.execute("DROP INDEX idx_urls_created_at")
+
+        query = LinkQuery(limit=100, created_after=created_after, created_before=created_before)
+        assert list(query) == expected
+
+    def test_host_filter(self, temp_db):
+        links = list(LinkQuery(limit=100, host='shop.example.com'))
+
+        assert len(links) == 20
+        assert all(link['original_url'].startswith('https://shop.example.com/') for link in links)
+
+    def test_host_filter_before_index_is_built(self, temp_db):
+        expected = list(LinkQuery(limit=100, host='shop.example.com'))
+        with get_db_connection() as conn:
+            conn.execute("DROP INDEX idx_urls_host")
+
+        assert list(LinkQuery(limit=100, host='shop.example.com')) == expected
+        # Checked on each row, so within the scan budget like a prefix
+        page = LinkQuery(limit=5, host='shop.example.com', scan_budget=6)
+        assert [link['id'] for link in page] == [10039, 10037, 10035]
+        assert page.next_cursor == 10034
+
+    def test_prefix_filter(self, temp_db):
+        links = list(LinkQuery(limit=100, prefix='https://blog.example.com/p/1'))
+        assert [link['original_url'] for link in links] == [f'https://blog.example.com/p/{i}' for i in (18, 16, 14, 12, 10)]
+
+    def test_prefix_scan_budget_returns_cursor(self, temp_db):
+        # Only 10 rows of shop.example.com are checked; the page comes back short with a cursor
+        page = LinkQuery(limit=5, prefix='https://shop.example.com/p/39', scan_budget=10)
+
+        assert [link['id'] for link in page] == [10039]
+        assert page.next_cursor == 10021
+
+        cursor, pages = page.next_cursor, 1
+        while cursor is not None:
+            rest = LinkQuery(limit=5, before_id=cursor, prefix='https://shop.example.com/p/39', scan_budget=10)
+            assert list(rest) == []
+            cursor, pages = rest.next_cursor, pages + 1
+        assert pages == 3  # 20 shop rows, 10 per page, then one empty page to find the end
@@ -0,0 +1,150 @@
+import pytest
+import json
+import multiprocessing
+import tempfile
+import os
+from flask import Flask
+from unittest.mock import patch
+from app.ratelimit import TokenBucketStore, RateLimit, parse_limit, init_rate_limiting
+from app.routes import register_routes
+
+
+@pytest.fixture
+def store_path():
+    temp_file = tempfile.NamedTemporaryFile(delete=False)
+    temp_file.close()
+    os.unlink(temp_file.name)
+    yield temp_file.name
+    if os.path.exists(temp_file.name):
+        os.unlink(temp_file.name)
+
+
+def _consume_many(path, count, results):
+    store = TokenBucketStore(path, slots=64)
+    allowed = sum(store.consume('shared', rate=0.001, burst=100)[0] for _ in range(count))
+    results.put(allowed)
+
+
+class TestParseLimit:
+    # Test parsing of RATE_LIMIT_* settings
+
+    def test_parse_limit(self):
+        assert parse_limit('30/minute') == RateLimit(0.5, 30)
+        assert parse_limit('5/second') == RateLimit(5.0, 5)
+
+    def test_parse_limit_invalid(self):
+        for value in ['30', '0/minute', '10/fortnight', 'abc/minute']:
+            with pytest.raises(ValueError):
+                parse_limit(value)
+
+
+class TestTokenBucketStore:
+    # Test the shared token bucket table
+
+    def test_allows_burst_then_limits(self, store_path):
+        store = TokenBucketStore(store_path, slots=64)
+
+        results = [store.consume('client', rate=1, burst=3, now=100.0) for _ in range(4)]
+
+        assert [allowed for allowed, _ in results] == [True, True, True, False]
+        assert results[3][1] == pytest.approx(1.0)
+
+    def test_refills_over_time(self, store_path):
+        store = TokenBucketStore(store_path, slots=64)
+        for _ in range(3):
+            store.consume('client', rate=2, burst=3, now=100.0)
+
+        assert store.consume('client', rate=2, burst=3, now=100.0)[0] is False
+        assert store.consume('client', rate=2, burst=3, now=100.5)[0] is True
+        assert store.consume('client', rate=2, burst=3, now=100.5)[0] is False
+
+    def test_clients_have_separate_buckets(self, store_path):
+        store = TokenBucketStore(store_path, slots=65536)
+        store.consume('client-a', rate=1, burst=1, now=100.0)
+
+        assert store.consume('client-a', rate=1, burst=1, now=100.0)[0] is False
+        assert store.consume('client-b', rate=1, burst=1, now=100.0)[0] is True
+
+    def test_buckets_shared_between_stores(self, store_path):
+        # Two stores on one file behave like two workers on one host
+        worker_one = TokenBucketStore(store_path, slots=64)
+        worker_two = TokenBucketStore(store_path, slots=64)
+
+        assert worker_one.consume('client', rate=1, burst=1, now=100.0)[0] is True
+        assert worker_two.consume('client', rate=1, burst=1, now=100.0)[0] is False
+
+    def test_buckets_shared_between_processes(self, store_path):
+        # Four processes racing for a bucket of 100 get exactly 100 tokens between them
+        TokenBucketStore(store_path, slots=64).close()
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        processes = [context.Process(target=_consume_many, args=(store_path, 50, results)) for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        assert sum(results.get() for _ in processes) == 100
+
+
+class TestRateLimitedRoutes:
+    # Test the 429 responses on the Flask app
+
+    @pytest.fixture
+    def client(self, store_path):
+        app = Flask(__name__)
+        app.config['TESTING'] = True
+        register_routes(app)
+        init_rate_limiting(app, TokenBucketStore(store_path, slots=1024), {
+            'shorten_url': RateLimit(0.01, 2),
+            'redirect_to_url': RateLimit(0.01, 1),
+        })
+        return app.test_client()
+
+    def shorten(self, client, headers=None):
+        return client.post('/shorten', data=json.dumps({'url': 'https://example.com'}),
+                           content_type='application/json', headers=headers)
+
+    @patch('app.routes.get_short_url', return_value='abc123')
+    def test_shorten_limited_with_retry_after(self, mock_get_short_url, client):
+        assert self.shorten(client).status_code == 201
+        assert self.shorten(client).status_code == 201
+
+        response = self.shorten(client)
+        assert response.status_code == 429
+        assert response.get_json() == {'error': 'Too many requests'}
+        assert int(response.headers['Retry-After']) >= 1
+
+    @patch('app.routes.get_short_url', return_value='abc123')
+    @patch('app.routes.find_original_url', return_value='https://example.com')
+    def test_endpoints_limited_separately(self, mock_find, mock_get_short_url, client):
+        assert client.get('/abc123').status_code == 302
+        assert client.get('/abc123').status_code == 429
+
+        # Using up redirects doesn't touch the shorten bucket
+        assert self.shorten(client).status_code == 201
+
+    @patch('app.config.RATE_LIMIT_API_KEYS', 'one, two')
+    @patch('app.routes.get_short_url', return_value='abc123')
+    def test_api_keys_limited_separately(self, mock_get_short_url, client):
+        for _ in range(2):
+            self.shorten(client, headers={'X-API-Key': 'one'})
+
+        assert self.shorten(client, headers={'X-API-Key': 'one'}).status_code == 429
+        assert self.shorten(client, headers={'X-API-Key': 'two'}).status_code == 201
+
+    @patch('app.config.RATE_LIMIT_API_KEYS', 'one')
+    @patch('app.routes.get_short_url', return_value='abc123')
+    def test_rotating_unknown_keys_still_limited(self, mock_get_short_url, client):
+        statuses = [
+            self.shorten(client, headers={'X-API-Key': f'bogus-{i}'}).status_code for i in range(4)
+        ]
+
+        assert statuses == [201, 201, 429, 429]
+        # A configured key still has its own bucket
+        assert self.shorten(client, headers={'X-API-Key': 'one'}).status_code == 201
+
+    def test_unlimited_endpoints(self, client):
+        for _ in range(5):
+            assert client.get('/').status_code == 200
+            assert client.get('/healthz').status_code == 200
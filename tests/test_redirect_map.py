@@ -0,0 +1,235 @@
+import pytest
+import tempfile
+import os
+import time
+from unittest.mock import patch
+from app.db import get_db_connection, init_db
+from app.models import get_short_url
+from app.redirect_map import export_redirect_map, format_entry, read_map
+from app.shortdomains import domain_key
+
+
+@pytest.fixture
+def temp_db():
+    temp_db_file = tempfile.NamedTemporaryFile(delete=False)
+    temp_db_file.close()
+    with patch('app.db.DB_PATH', temp_db_file.name):
+        init_db()
+        yield temp_db_file.name
+    os.unlink(temp_db_file.name)
+
+
+@pytest.fixture
+def map_path(tmp_path):
+    return str(tmp_path / 'short_links.map')
+
+
+class TestFormatEntry:
+    # Test map file lines
+
+    def test_haproxy(self):
+        assert format_entry('haproxy', 'abc', 'https://example.com/a') == '/abc https://example.com/a\n'
+
+    def test_unsafe_urls_left_to_the_app(self):
+        assert format_entry('haproxy', 'abc', 'https://example.com/a b') is None
+        assert format_entry('haproxy', 'abc', 'https://example.com/a\x01') is None
+
+    def test_round_trip(self, map_path):
+        url = 'https://example.com/a\\b?q="x"&$host'
+        with open(map_path, 'w') as f:
+            f.write(format_entry('haproxy', 'abc', url))
+        assert read_map(map_path, 'haproxy') == {'abc': url}
+
+    def test_codes_differing_only_in_case_stay_distinct(self, map_path):
+        with open(map_path, 'w') as f:
+            f.write(format_entry('haproxy', '2Ly', 'https://example.com/upper'))
+            f.write(format_entry('haproxy', '2lY', 'https://example.com/lower'))
+        assert read_map(map_path, 'haproxy') == {'2Ly': 'https://example.com/upper', '2lY': 'https://example.com/lower'}
+
+
+class TestExportAll:
+    # Test exporting every link, incrementally
+
+    def test_first_export_writes_everything(self, temp_db, map_path):
+        codes = [get_short_url(f'https://example.com/{i}') for i in range(3)]
+
+        result = export_redirect_map(map_path)
+
+        assert result.rebuilt and result.changed
+        assert read_map(map_path, 'haproxy') == {code: f'https://example.com/{i}' for i, code in enumerate(codes)}
+
+    def test_only_new_rows_appended(self, temp_db, map_path):
+        get_short_url('https://example.com/old')
+        export_redirect_map(map_path)
+
+        new = get_short_url('https://example.com/new')
+        with patch('app.redirect_map.format_entry', wraps=format_entry) as mock_format:
+            result = export_redirect_map(map_path)
+
+        assert mock_format.call_count == 1
+        assert (result.added, result.entries, result.rebuilt) == (1, 2, False)
+        assert read_map(map_path, 'haproxy')[new] == 'https://example.com/new'
+
+    def test_exported_rows_counted_only_after_deletes(self, temp_db, map_path):
+        get_short_url('https://example.com/old')
+        export_redirect_map(map_path)
+        get_short_url('https://example.com/new')
+        queries = []
+
+        def traced_connection():
+            conn = get_db_connection()
+            conn.set_trace_callback(queries.append)
+            return conn
+
+        with patch('app.redirect_map.get_db_connection', traced_connection):
+            export_redirect_map(map_path)
+            assert not any('COUNT(*)' in query for query in queries)
+
+            with get_db_connection() as conn:
+                conn.execute("DELETE FROM urls WHERE original_url = 'https://example.com/new'")
+            export_redirect_map(map_path)
+            assert any('COUNT(*)' in query for query in queries)
+
+    def test_unfinished_append_dropped(self, temp_db, map_path):
+        get_short_url('https://example.com/old')
+        export_redirect_map(map_path)
+        with open(map_path, 'a') as f:
+            f.write('/half https://exa')  # a run that stopped before saving its state
+        new = get_short_url('https://example.com/new')
+
+        export_redirect_map(map_path)
+
+        assert set(read_map(map_path, 'haproxy').values()) == {'https://example.com/old', 'https://example.com/new'}
+        assert new in read_map(map_path, 'haproxy')
+
+    def test_unchanged_leaves_file_alone(self, temp_db, map_path):
+        get_short_url('https://example.com/')
+        export_redirect_map(map_path)
+        modified = os.stat(map_path).st_mtime_ns
+
+        result = export_redirect_map(map_path)
+
+        assert not result.changed
+        assert os.stat(map_path).st_mtime_ns == modified
+
+    def test_deleted_rows_trigger_rebuild(self, temp_db, map_path):
+        gone = get_short_url('https://example.com/gone')
+        get_short_url('https://example.com/kept')
+        export_redirect_map(map_path)
+
+        with get_db_connection() as conn:
+            conn.execute("DELETE FROM urls WHERE short_url = ?", (gone,))
+        result = export_redirect_map(map_path)
+
+        assert result.rebuilt
+        assert gone not in read_map(map_path, 'haproxy')
+
+    def test_waits_for_pending_short_url(self, temp_db, map_path):
+        with get_db_connection() as conn:
+            conn.execute("INSERT INTO urls (original_url) VALUES ('https://example.com/pending')")
+        export_redirect_map(map_path)
+
+        with get_db_connection() as conn:
+            conn.execute("UPDATE urls SET short_url = 'pend' WHERE short_url IS NULL")
+        export_redirect_map(map_path)
+
+        assert read_map(map_path, 'haproxy') == {'pend': 'https://example.com/pending'}
+
+    def test_format_change_rebuilds(self, temp_db, map_path):
+        code = get_short_url('https://example.com/')
+        export_redirect_map(map_path)
+        with open(f'{map_path}.state') as f:
+            state = f.read()
+        with open(f'{map_path}.state', 'w') as f:
+            f.write(state.replace('"haproxy"', '"nginx"'))  # left by an older version
+
+        assert export_redirect_map(map_path).rebuilt
+        assert read_map(map_path, 'haproxy') == {code: 'https://example.com/'}
+
+    def test_other_short_domains_left_out(self, temp_db, map_path):
+        canonical = get_short_url('https://example.com/canonical')
+        get_short_url('https://example.com/brand', domain_key('brand.co'))
+
+        export_redirect_map(map_path)
+        assert read_map(map_path, 'haproxy') == {canonical: 'https://example.com/canonical'}
+
+        get_short_url('https://example.com/brand2', domain_key('brand.co'))
+        result = export_redirect_map(map_path)
+        assert not result.rebuilt and not result.changed
+
+
+class TestExportTop:
+    # Test exporting only the most clicked links
+
+    def test_top_by_clicks(self, temp_db, map_path):
+        codes = [get_short_url(f'https://example.com/{i}') for i in range(3)]
+
+        with patch('app.clicklog.top_codes', return_value=[(codes[2], 9), (codes[0], 4)]):
+            result = export_redirect_map(map_path, top=2)
+
+        assert result.entries == 2
+        assert set(read_map(map_path, 'haproxy')) == {codes[2], codes[0]}
+
+    def test_newest_without_click_data(self, temp_db, map_path):
+        codes = [get_short_url(f'https://example.com/{i}') for i in range(3)]
+        get_short_url('https://example.com/brand', domain_key('brand.co'))
+
+        with patch('app.clicklog.top_codes', return_value=[]):
+            export_redirect_map(map_path, top=2)
+
+        assert set(read_map(map_path, 'haproxy')) == set(codes[1:])
+
+    def test_clicked_code_on_other_short_domain_left_out(self, temp_db, map_path):
+        code = get_short_url('https://example.com/canonical')
+        brand = get_short_url('https://example.com/brand', domain_key('brand.co'))
+
+        with patch('app.clicklog.top_codes', return_value=[(brand, 9), (code, 4)]):
+            export_redirect_map(map_path, top=2)
+
+        assert read_map(map_path, 'haproxy') == {code: 'https://example.com/canonical'}
+
+    def test_more_clicked_code_replaces_one(self, temp_db, map_path):
+        codes = [get_short_url(f'https://example.com/{i}') for i in range(3)]
+        with patch('app.clicklog.top_codes', return_value=[(codes[0], 5), (codes[1], 3)]):
+            export_redirect_map(map_path, top=2)
+
+        with patch('app.clicklog.top_codes', return_value=[(codes[2], 7)]):
+            result = export_redirect_map(map_path, top=2)
+
+        assert (result.added, result.removed, result.changed) == (1, 1, True)
+        assert set(read_map(map_path, 'haproxy')) == {codes[0], codes[2]}
+
+        with patch('app.clicklog.top_codes', return_value=[(codes[2], 9), (codes[0], 8)]):
+            assert not export_redirect_map(map_path, top=2).changed
+
+    def test_exported_codes_keep_their_rank(self, temp_db, map_path):
+        codes = [get_short_url(f'https://example.com/{i}') for i in range(3)]
+        with patch('app.clicklog.top_codes', return_value=[(codes[0], 9), (codes[1], 5)]):
+            export_redirect_map(map_path, top=2)
+
+        # The proxy answers codes[0] and codes[1] now, so only codes[2] shows up in the log
+        with patch('app.clicklog.top_codes', return_value=[(codes[2], 2)]):
+            assert not export_redirect_map(map_path, top=2).changed
+            assert set(read_map(map_path, 'haproxy')) == {codes[0], codes[1]}
+
+            # Until their counts are older than the click window
+            with patch('app.redirect_map.time.time', return_value=time.time() + 8 * 86400):
+                export_redirect_map(map_path, top=2)
+        assert set(read_map(map_path, 'haproxy')) == {codes[2]}
+
+    def test_deleted_codes_removed(self, temp_db, map_path):
+        codes = [get_short_url(f'https://example.com/{i}') for i in range(2)]
+        with patch('app.clicklog.top_codes', return_value=[(codes[0], 9), (codes[1], 5)]):
+            export_redirect_map(map_path, top=2)
+
+        with get_db_connection() as conn:
+            conn.execute("DELETE FROM urls WHERE short_url = ?", (codes[0],))
+        with patch('app.clicklog.top_codes', return_value=[]):
+            result = export_redirect_map(map_path, top=2)
+
+        assert (result.removed, result.changed) == (1, True)
+        assert read_map(map_path, 'haproxy') == {codes[1]: 'https://example.com/1'}
+
+    def test_unknown_format(self, temp_db, map_path):
+        with pytest.raises(ValueError):
+            export_redirect_map(map_path, 'nginx')
@@ -0,0 +1,433 @@
+import pytest
+import tempfile
+import os
+import io
+import json
+import urllib.error
+from contextlib import contextmanager
+from unittest.mock import patch, MagicMock
+from flask import Flask
+from app.db import get_db_connection, init_db
+from app.migrations import get_backfill_progress, run_backfill
+from app.models import get_short_url, find_original_url
+from app.replication import (
+    Follower, SqliteSource, HttpSource, ChangelogPruned, ChangelogPruner, read_changes, follower_status,
+    start_follower, enable_changelog, disable_changelog, prune_changelog, check_changelog, main,
+)
+from app.routes import register_routes
+
+
+def temp_database():
+    temp_db_file = tempfile.NamedTemporaryFile(delete=False)
+    temp_db_file.close()
+    return temp_db_file.name
+
+
+@pytest.fixture
+def primary():
+    path = temp_database()
+    with patch('app.db.DB_PATH', path):
+        init_db()
+        with get_db_connection() as conn:
+            enable_changelog(conn)
+    yield path
+    os.unlink(path)
+
+
+@pytest.fixture
+def follower_db():
+    # The follower's own database is the current one, as it is on a follower node
+    path = temp_database()
+    with patch('app.db.DB_PATH', path):
+        init_db()
+        yield path
+    os.unlink(path)
+    if os.path.exists(path + '.replication.lock'):
+        os.unlink(path + '.replication.lock')
+
+
+@pytest.fixture
+def follower(primary, follower_db):
+    follower = Follower(SqliteSource(primary), batch_size=2, start=False)
+    yield follower
+    follower.close()
+
+
+@contextmanager
+def on_primary(path):
+    with patch('app.db.DB_PATH', path):
+        yield
+
+
+class TestChangelog:
+    # Test the changelog kept by triggers on urls
+
+    def test_writes_are_logged_with_current_row(self, primary):
+        with on_primary(primary):
+            code = get_short_url('https://example.com/')
+            with get_db_connection() as conn:
+                changes, last_seq = read_changes(conn, 0, 100)
+
+        # The insert and the short_url update, both shipping the row as it is now
+        assert last_seq == 2
+        assert [change[:4] for change in changes] == [[1, 10000, code, 'https://example.com/'],
+                                                      [2, 10000, code, 'https://example.com/']]
+
+    def test_deleted_rows(self, primary):
+        with on_primary(primary):
+            get_short_url('https://example.com/')
+            with get_db_connection() as conn:
+                conn.execute("DELETE FROM urls")
+                changes, _ = read_changes(conn, 2, 100)
+
+        assert changes == [[3, 10000, None, None, None, None, None]]
+
+    def test_off_until_enabled(self, follower_db):
+        get_short_url('https://example.com/')
+        with get_db_connection() as conn:
+            assert conn.execute("SELECT COUNT(*) FROM changelog").fetchone() == (0,)
+
+    def test_enabling_seeds_existing_rows_in_batches(self, follower_db):
+        old = [get_short_url(f'https://example.com/{i}') for i in range(3)]
+        with get_db_connection() as conn:
+            assert enable_changelog(conn)
+            assert not enable_changelog(conn)
+            assert get_backfill_progress(conn, 'seed_changelog') == (0, False)
+            new = get_short_url('https://example.com/new')
+
+            assert run_backfill(conn, 'seed_changelog', batch_size=2, sleep=0) == 2
+            changes, _ = read_changes(conn, 0, 100)
+
+        # The new row's insert and update, then the old rows (and the new one again)
+        assert [change[2] for change in changes] == [new, new] + old + [new]
+
+    def test_disabling_drops_triggers_and_log(self, primary):
+        with on_primary(primary):
+            get_short_url('https://example.com/')
+            with get_db_connection() as conn:
+                assert disable_changelog(conn)
+                get_short_url('https://example.com/unlogged')
+
+                assert conn.execute("SELECT COUNT(*) FROM changelog").fetchone() == (0,)
+                assert not disable_changelog(conn)
+                with pytest.raises(ChangelogPruned):
+                    read_changes(conn, 0, 100)
+
+    def test_boot_without_changelog_leaves_it_alone(self, primary, caplog):
+        with on_primary(primary):
+            get_short_url('https://example.com/')
+            check_changelog()
+            with get_db_connection() as conn:
+                changes, _ = read_changes(conn, 0, 100)
+
+        assert len(changes) == 2
+        assert 'disable-changelog' in caplog.text
+
+    def test_disable_from_command_line(self, primary, capsys):
+        with on_primary(primary):
+            main(['disable-changelog'])
+            main(['disable-changelog'])
+            with get_db_connection() as conn:
+                assert conn.execute("SELECT COUNT(*) FROM changelog").fetchone() == (0,)
+
+        assert capsys.readouterr().out == "changelog disabled\nchangelog already disabled\n"
+
+    def test_prune_old_entries(self, primary):
+        with on_primary(primary):
+            for i in range(3):
+                get_short_url(f'https://example.com/{i}')
+            with get_db_connection() as conn:
+                conn.execute("UPDATE changelog SET created_at = 1000 WHERE seq <= 4")
+                conn.commit()
+
+                assert prune_changelog(conn, 60, now=1030) == 0
+                assert prune_changelog(conn, 60, now=1100, batch_size=3) == 4
+                changes, last_seq = read_changes(conn, 4, 100)
+                with pytest.raises(ChangelogPruned):
+                    read_changes(conn, 3, 100)
+
+        assert [change[0] for change in changes] == [5, 6]
+        assert last_seq == 6
+
+    def test_pruned_log_keeps_last_seq(self, primary):
+        with on_primary(primary):
+            get_short_url('https://example.com/')
+            with get_db_connection() as conn:
+                prune_changelog(conn, 0, now=10**10)
+
+                assert read_changes(conn, 2, 100) == ([], 2)
+
+    def test_compressed_urls_shipped_as_text(self, primary):
+        with on_primary(primary), patch('app.config.URL_COMPRESSION', True):
+            get_short_url('https://www.youtube.com/watch?v=abcdefghijk&utm_source=newsletter')
+        changes, _, _ = SqliteSource(primary).fetch(0, 100)
+
+        assert changes[0][3] == 'https://www.youtube.com/watch?v=abcdefghijk&utm_source=newsletter'
+
+
+class TestFollower:
+    # Test applying the primary's changelog on a follower
+
+    def test_sync_copies_rows(self, primary, follower):
+        with on_primary(primary):
+            codes = [get_short_url(f'https://example.com/{i}') for i in range(3)]
+
+        assert follower.sync() == 6  # two changes per shorten, two per batch
+        assert [find_original_url(code) for code in codes] == [f'https://example.com/{i}' for i in range(3)]
+        assert follower_status()['lag_changes'] == 0
+
+    def test_sync_copies_short_domain(self, primary, follower):
+        with on_primary(primary):
+            code = get_short_url('https://example.com/', 12345)
+        follower.sync()
+
+        assert find_original_url(code, 12345) == 'https://example.com/'
+        assert find_original_url(code, 0) is None
+
+    def test_sync_applies_updates_and_deletes(self, primary, follower):
+        with on_primary(primary):
+            kept = get_short_url('https://example.com/kept')
+            gone = get_short_url('https://example.com/gone')
+        follower.sync()
+
+        with on_primary(primary):
+            with get_db_connection() as conn:
+                conn.execute("DELETE FROM urls WHERE short_url = ?", (gone,))
+                conn.execute("UPDATE urls SET original_url = 'https://example.com/moved' WHERE short_url = ?", (kept,))
+        follower.sync()
+
+        assert find_original_url(gone) is None
+        assert find_original_url(kept) == 'https://example.com/moved'
+        with get_db_connection() as conn:
+            assert conn.execute("SELECT link_count FROM domain_stats WHERE host = 'example.com'").fetchone() == (1,)
+
+    def test_lag_reported_while_behind(self, primary, follower):
+        with on_primary(primary):
+            for i in range(3):
+                get_short_url(f'https://example.com/{i}')
+
+        assert follower_status()['lag_seconds'] is None  # never synced
+        follower.sync_once()
+        status = follower_status(now=follower_status()['synced_at'] + 5)
+
+        assert status['applied_seq'] == 2
+        assert status['lag_changes'] == 4
+        assert status['lag_seconds'] is None  # hasn't caught up yet
+
+        follower.sync()
+        assert follower_status()['lag_seconds'] == 0.0
+
+    def test_resumes_from_backup_of_primary(self, primary, follower_db):
+        with on_primary(primary):
+            get_short_url('https://example.com/old')
+        with open(primary, 'rb') as source, open(follower_db, 'wb') as target:
+            target.write(source.read())
+        with on_primary(primary):
+            new = get_short_url('https://example.com/new')
+
+        source = SqliteSource(primary)
+        follower = Follower(source, start=False)
+        with patch.object(source, 'fetch', wraps=source.fetch) as mock_fetch:
+            follower.sync()
+
+        assert mock_fetch.call_args_list[0].args[0] == 2
+        assert find_original_url(new) == 'https://example.com/new'
+
+    def test_fallback_to_primary_for_new_codes(self, primary, follower):
+        with on_primary(primary):
+            old = get_short_url('https://example.com/old')
+        follower.sync()
+        with on_primary(primary):
+            new = get_short_url('https://example.com/new')
+
+        assert follower.find_original_url(old) == 'https://example.com/old'
+        assert follower.find_original_url(new) == 'https://example.com/new'
+        assert follower.fallbacks == 1
+
+    def test_fallback_keeps_short_domain(self, primary, follower):
+        follower.sync()
+        with on_primary(primary):
+            code = get_short_url('https://example.com/brand', 12345)
+
+        assert follower.find_original_url(code, 0) is None
+        assert follower.find_original_url(code, 12345) == 'https://example.com/brand'
+
+    def test_row_arriving_during_lookup_is_found(self, primary, follower):
+        with on_primary(primary):
+            code = get_short_url('https://example.com/')
+        synced = []
+
+        def lookup_then_sync(code, short_domain=None):
+            # The sync thread lands the row just after the local lookup missed it
+            original_url = find_original_url(code, short_domain)
+            if not synced:
+                synced.append(follower.sync())
+            return original_url
+
+        with patch('app.replication.find_original_url', side_effect=lookup_then_sync), \
+                patch.object(follower.source, 'lookup') as mock_lookup:
+            assert follower.find_original_url(code) == 'https://example.com/'
+        mock_lookup.assert_not_called()
+
+    def test_no_fallback_for_codes_that_cannot_exist(self, primary, follower):
+        with on_primary(primary):
+            code = get_short_url('https://example.com/')
+        follower.sync()
+        with on_primary(primary):
+            with get_db_connection() as conn:
+                conn.execute("DELETE FROM urls")
+        follower.sync()
+
+        with patch.object(follower.source, 'lookup') as mock_lookup:
+            assert follower.find_original_url(code) is None
+            assert follower.find_original_url('not-base62!') is None
+        mock_lookup.assert_not_called()
+
+    def test_no_fallback_past_primary_max_id(self, primary, follower):
+        with on_primary(primary):
+            get_short_url('https://example.com/')
+        follower.sync()
+
+        with patch.object(follower.source, 'lookup') as mock_lookup:
+            for code in ('zzzzzz', 'abcdefg', 'Zq9xY', '4fa18'):
+                assert follower.find_original_url(code) is None
+        mock_lookup.assert_not_called()
+
+    def test_misses_are_not_asked_again_until_ttl(self, primary, follower):
+        follower.sync()
+        with on_primary(primary):
+            code = get_short_url('https://example.com/')
+            with get_db_connection() as conn:
+                conn.execute("DELETE FROM urls")
+
+        with patch.object(follower.source, 'lookup', return_value=None) as mock_lookup, \
+                patch('app.replication.time.monotonic', return_value=1000.0) as mock_clock:
+            assert follower.find_original_url(code) is None
+            assert follower.find_original_url(code) is None
+            assert mock_lookup.call_count == 1
+            mock_clock.return_value += follower.miss_ttl
+            assert follower.find_original_url(code) is None
+        assert mock_lookup.call_count == 2
+
+    def test_only_one_worker_polls(self, primary, follower_db):
+        first = Follower(SqliteSource(primary), start=False)
+        second = Follower(SqliteSource(primary), start=False)
+        try:
+            assert first._holds_lock()
+            assert not second._holds_lock()
+        finally:
+            first.close()
+            second.close()
+
+
+class TestHttpSource:
+    # Test the HTTP client side of replication
+
+    def test_fetch(self):
+        body = io.BytesIO(json.dumps({'changes': [[1, 10000, 'abc', 'https://example.com/', None, None]],
+                                      'last_seq': 5, 'max_id': 10000}).encode())
+        with patch('urllib.request.urlopen', return_value=body) as mock_open:
+            changes, last_seq, max_id = HttpSource('http://primary:8000/', 'secret').fetch(0, 100)
+
+        request = mock_open.call_args.args[0]
+        assert request.full_url == 'http://primary:8000/replication/changes?after=0&limit=100'
+        assert request.headers['Authorization'] == 'Bearer secret'
+        assert (len(changes), last_seq, max_id) == (1, 5, 10000)
+
+    def test_lookup(self):
+        body = io.BytesIO(json.dumps({'code': 'abc', 'original_url': 'https://example.com/'}).encode())
+        with patch('urllib.request.urlopen', return_value=body) as mock_open:
+            assert HttpSource('http://primary:8000', 'secret').lookup('abc', 7) == 'https://example.com/'
+        request = mock_open.call_args.args[0]
+        assert request.full_url == 'http://primary:8000/replication/lookup?code=abc&short_domain=7'
+        assert request.headers['Authorization'] == 'Bearer secret'
+
+    def test_pruned(self):
+        error = urllib.error.HTTPError('http://primary:8000/replication/changes', 410, 'Gone', {}, io.BytesIO(b'{}'))
+        with patch('urllib.request.urlopen', side_effect=error):
+            with pytest.raises(ChangelogPruned):
+                HttpSource('http://primary:8000', 'secret').fetch(0, 100)
+
+
+class TestReplicationEndpoints:
+    # Test /replication/* and follower mode in the app
+
+    AUTH = {'Authorization': 'Bearer secret'}
+
+    @pytest.fixture
+    def app(self):
+        app = Flask(__name__)
+        app.config['TESTING'] = True
+        register_routes(app)
+        app.extensions['changelog'] = ChangelogPruner(retention=0)  # never prunes
+        return app
+
+    def test_changes_endpoint(self, app, primary):
+        with on_primary(primary), patch('app.config.ADMIN_TOKEN', 'secret'):
+            code = get_short_url('https://example.com/')
+            client = app.test_client()
+
+            assert client.get('/replication/changes').status_code == 401
+            assert client.get('/replication/changes?limit=0', headers=self.AUTH).status_code == 400
+            response = client.get('/replication/changes?after=1&limit=10', headers=self.AUTH)
+
+        assert response.get_json()['last_seq'] == 2
+        assert response.get_json()['max_id'] == 10000
+        assert response.get_json()['changes'][0][:3] == [2, 10000, code]
+
+    def test_changes_pruned_or_not_kept(self, app, primary):
+        with on_primary(primary), patch('app.config.ADMIN_TOKEN', 'secret'):
+            get_short_url('https://example.com/')
+            with get_db_connection() as conn:
+                prune_changelog(conn, 0, now=10**10)
+            client = app.test_client()
+
+            assert client.get('/replication/changes?after=0', headers=self.AUTH).status_code == 410
+            del app.extensions['changelog']
+            assert client.get('/replication/changes?after=2', headers=self.AUTH).status_code == 404
+
+    def test_lookup_endpoint(self, app, primary):
+        with on_primary(primary), patch('app.config.ADMIN_TOKEN', 'secret'):
+            code = get_short_url('https://example.com/', 12345)
+            client = app.test_client()
+
+            assert client.get(f'/replication/lookup?code={code}').status_code == 401
+            assert client.get(f'/replication/lookup?code={code}&short_domain=x', headers=self.AUTH).status_code == 400
+            found = client.get(f'/replication/lookup?code={code}&short_domain=12345', headers=self.AUTH)
+            other_domain = client.get(f'/replication/lookup?code={code}&short_domain=0', headers=self.AUTH)
+
+        assert found.get_json() == {'code': code, 'original_url': 'https://example.com/'}
+        assert other_domain.get_json()['original_url'] is None
+
+    def test_status_on_primary(self, app, primary):
+        with on_primary(primary):
+            get_short_url('https://example.com/')
+            response = app.test_client().get('/replication/status')
+        assert response.get_json() == {'role': 'primary', 'last_seq': 2}
+
+    def test_follower_mode(self, app, primary, follower_db):
+        with on_primary(primary):
+            code = get_short_url('https://example.com/')
+        follower = start_follower(app, SqliteSource(primary))
+        client = app.test_client()
+        try:
+            assert client.post('/shorten', json={'url': 'https://example.com/'}).status_code == 503
+
+            # Served from the primary until the row arrives, then locally
+            assert client.get(f'/{code}').headers['Location'] == 'https://example.com/'
+            follower.sync()
+            assert client.get('/replication/status').get_json()['lag_changes'] == 0
+            assert client.get('/readyz').get_json()['checks']['replication'] == 'ok'
+        finally:
+            follower.close()
+
+    def test_lagging_follower_not_ready(self, app, follower_db):
+        app.extensions['follower'] = MagicMock()
+        with get_db_connection() as conn:
+            conn.execute("INSERT INTO replication_state (id, applied_seq, primary_seq, caught_up_at, synced_at) "
+                         "VALUES (1, 5, 10, 1.0, 100.0)")
+
+        response = app.test_client().get('/readyz')
+
+        assert response.status_code == 503
+        assert response.get_json()['checks']['replication'].endswith('s behind')
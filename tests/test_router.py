@@ -0,0 +1,348 @@
+import pytest
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from unittest.mock import patch
+from app.hashring import HashRing, id_owner
+from app.router import create_router_app, parse_nodes, NodeClient, NodeUnavailable
+from app.shortener import decode_short_url, generate_short_url
+
+NODES = {'a': 'http://127.0.0.1:9001', 'b': 'http://127.0.0.1:9002', 'c': 'http://127.0.0.1:9003'}
+
+
+@pytest.fixture
+def router_app():
+    app = create_router_app(NODES, {})
+    app.config['TESTING'] = True
+    return app
+
+
+@pytest.fixture
+def client(router_app):
+    return router_app.test_client()
+
+
+def owning_code(node, ring=None):
+    """A short code whose id lives on node"""
+    ring = ring or HashRing(NODES)
+    url_id = next(i for i in range(10000, 10**6, 1024) if id_owner(ring, i, 1024) == node)
+    return generate_short_url(url_id)
+
+
+class TestParseNodes:
+    # Test reading ROUTER_NODES
+
+    def test_parse(self):
+        assert parse_nodes('a=http://h:1, b=https://h:2/') == {'a': 'http://h:1', 'b': 'https://h:2'}
+        assert parse_nodes('') == {}
+
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            parse_nodes('a=h:1')
+
+
+class TestRedirects:
+    # Test forwarding redirects to the node owning the code
+
+    def test_forwards_to_owner(self, router_app, client):
+        code = owning_code('b')
+        clients = router_app.extensions['router'].clients
+        with patch.object(clients['b'], 'forward',
+                          return_value=(302, [('Location', 'https://example.com/'), ('Connection', 'close')], b'')) as mock_b, \
+                patch.object(clients['a'], 'forward') as mock_a:
+            response = client.get(f'/{code}', headers={'X-Forwarded-For': '203.0.113.7'})
+
+        assert response.status_code == 302
+        assert response.headers['Location'] == 'https://example.com/'
+        assert 'Connection' not in response.headers
+        method, path = mock_b.call_args[0]
+        assert (method, path) == ('GET', f'/{code}')
+        assert mock_b.call_args[1]['headers']['X-Forwarded-For'] == '203.0.113.7, 127.0.0.1'
+        mock_a.assert_not_called()
+
+    def test_not_found_passed_through(self, router_app, client):
+        code = owning_code('a')
+        with patch.object(router_app.extensions['router'].clients['a'], 'forward',
+                          return_value=(404, [('Content-Type', 'application/json')], b'{"error": "Short URL not found"}')):
+            response = client.get(f'/{code}')
+        assert response.status_code == 404
+        assert response.get_json() == {'error': 'Short URL not found'}
+
+    def test_undecodable_code_not_forwarded(self, router_app, client):
+        with patch('app.router.NodeClient.forward') as mock_forward:
+            response = client.get('/not-base62')
+        assert response.status_code == 404
+        mock_forward.assert_not_called()
+
+    def test_invalid_code(self, client):
+        assert client.get('/' + 'a' * 200).status_code == 400
+
+    def test_node_down(self, router_app, client):
+        code = owning_code('c')
+        with patch.object(router_app.extensions['router'].clients['c'], 'forward', side_effect=NodeUnavailable('c')):
+            assert client.get(f'/{code}').status_code == 502
+
+    def test_falls_back_to_previous_owner(self):
+        # 'b' joined; links it took over may still be on their old node
+        old = {'a': NODES['a'], 'c': NODES['c']}
+        app = create_router_app({**old, 'b': NODES['b']}, old)
+        code = owning_code('b')
+        old_owner = id_owner(HashRing(old), decode_short_url(code), 1024)
+        clients = app.extensions['router'].clients
+        with patch.object(clients['b'], 'forward', return_value=(404, [], b'')), \
+                patch.object(clients[old_owner], 'forward', return_value=(302, [('Location', 'https://example.com/')], b'')):
+            response = app.test_client().get(f'/{code}')
+        assert response.status_code == 302
+
+
+class TestShorten:
+    # Test spreading shortens over the nodes
+
+    def test_round_robin(self, router_app, client):
+        clients = router_app.extensions['router'].clients
+        with patch('app.router.NodeClient.forward', autospec=True,
+                   return_value=(201, [('Content-Type', 'application/json')], b'{}')) as mock_forward:
+            for _ in range(6):
+                assert client.post('/shorten', json={'url': 'https://example.com/'}).status_code == 201
+        names = [call[0][0].name for call in mock_forward.call_args_list]
+        assert sorted(names) == ['a', 'a', 'b', 'b', 'c', 'c']
+        assert set(clients) == {'a', 'b', 'c'}
+
+    def test_skips_unreachable_node(self, client):
+        def forward(node, method, path, body=None, headers=None):
+            if node.name == 'a':
+                raise NodeUnavailable('a')
+            return 201, [], b'{}'
+
+        with patch('app.router.NodeClient.forward', autospec=True, side_effect=forward):
+            statuses = [client.post('/shorten', json={'url': 'https://example.com/'}).status_code for _ in range(3)]
+        assert statuses == [201, 201, 201]
+
+    def test_all_nodes_down(self, client):
+        with patch('app.router.NodeClient.forward', side_effect=NodeUnavailable('down')):
+            assert client.post('/shorten', json={'url': 'https://example.com/'}).status_code == 502
+
+
+OK = b'HTTP/1.1 201 CREATED\r\nContent-Type: application/json\r\nContent-Length: 2\r\n\r\n{}'
+
+
+class FakeNode:
+    """A node on a local socket that runs handle(node, sock) for every connection"""
+
+    def __init__(self, handle):
+        self.methods = []
+        self._handle = handle
+        self._server = socket.create_server(('127.0.0.1', 0))
+        self.url = f'http://127.0.0.1:{self._server.getsockname()[1]}'
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        while True:
+            try:
+                sock, _ = self._server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._handle, args=(self, sock), daemon=True).start()
+
+    def read_request(self, sock):
+        """Read one request off sock and note its method; False if the router hung up"""
+        data = b''
+        while b'\r\n\r\n' not in data:
+            chunk = sock.recv(65536)
+            if not chunk:
+                return False
+            data += chunk
+        head, _, body = data.partition(b'\r\n\r\n')
+        length = next((int(line.split(b':')[1]) for line in head.split(b'\r\n')
+                       if line.lower().startswith(b'content-length:')), 0)
+        while len(body) < length:
+            body += sock.recv(65536)
+        self.methods.append(head.split(b' ', 1)[0].decode())
+        return True
+
+    def close(self):
+        self._server.close()
+
+
+def answers(node, sock):
+    with sock:
+        while node.read_request(sock):
+            sock.sendall(OK)
+
+
+def answers_once(node, sock):
+    # Then hangs up on the next request over the same connection
+    with sock:
+        if node.read_request(sock):
+            sock.sendall(OK)
+            node.read_request(sock)
+
+
+def answers_once_then_closes(node, sock):
+    with sock:
+        if node.read_request(sock):
+            sock.sendall(OK)
+
+
+def hangs_up(node, sock):
+    with sock:
+        node.read_request(sock)
+
+
+def never_answers(node, sock):
+    with sock:
+        node.read_request(sock)
+        time.sleep(1)
+
+
+@pytest.fixture
+def fake_node():
+    nodes = []
+
+    def start(handle):
+        nodes.append(FakeNode(handle))
+        return nodes[-1]
+
+    yield start
+    for node in nodes:
+        node.close()
+
+
+class TestNodeClient:
+    # Test forwarding over kept-alive connections, and what is retried
+
+    def test_keeps_connection_alive(self, fake_node):
+        node = fake_node(answers)
+        client = NodeClient('a', node.url)
+
+        assert [client.forward('GET', '/x')[0] for _ in range(3)] == [201, 201, 201]
+        assert node.methods == ['GET'] * 3
+
+    def test_timeout_is_node_unavailable(self, fake_node):
+        client = NodeClient('a', fake_node(never_answers).url, timeout=0.1)
+
+        with pytest.raises(NodeUnavailable) as raised:
+            client.forward('GET', '/x')
+        assert raised.value.sent
+
+    def test_get_retried_when_node_hangs_up(self, fake_node):
+        node = fake_node(answers_once)
+        client = NodeClient('a', node.url)
+        client.forward('GET', '/x')
+
+        assert client.forward('GET', '/x')[0] == 201
+        assert node.methods == ['GET'] * 3
+
+    def test_post_not_retried_once_sent(self, fake_node):
+        node = fake_node(answers_once)
+        client = NodeClient('a', node.url)
+        client.forward('GET', '/x')
+
+        with pytest.raises(NodeUnavailable) as raised:
+            client.forward('POST', '/shorten', b'{}')
+        assert raised.value.sent
+        assert node.methods == ['GET', 'POST']
+
+    def test_post_after_idle_close_uses_new_connection(self, fake_node):
+        node = fake_node(answers_once_then_closes)
+        client = NodeClient('a', node.url)
+        client.forward('GET', '/x')
+        time.sleep(0.05)  # the node's close arrives while the connection is idle
+
+        assert client.forward('POST', '/shorten', b'{}')[0] == 201
+        assert node.methods == ['GET', 'POST']
+
+    def test_post_retried_when_send_failed(self, fake_node):
+        node = fake_node(answers)
+        client = NodeClient('a', node.url)
+        client.forward('GET', '/x')
+        send = http.client.HTTPConnection.request
+        calls = []
+
+        def request(conn, *args, **kwargs):
+            calls.append(args[0])
+            if len(calls) == 1:
+                raise BrokenPipeError
+            return send(conn, *args, **kwargs)
+
+        with patch.object(http.client.HTTPConnection, 'request', autospec=True, side_effect=request):
+            assert client.forward('POST', '/shorten', b'{}')[0] == 201
+        assert calls == ['POST', 'POST']
+        assert node.methods == ['GET', 'POST']
+
+    def test_shorten_not_sent_to_another_node_after_hang_up(self, fake_node):
+        node = fake_node(hangs_up)
+        with patch('app.config.ROUTER_TIMEOUT', 1):
+            app = create_router_app({'a': node.url, 'b': NODES['b']}, {})
+        with patch.object(app.extensions['router'].clients['b'], 'forward') as mock_b:
+            response = app.test_client().post('/shorten', json={'url': 'https://example.com/'})
+
+        assert response.status_code == 502
+        assert node.methods == ['POST']
+        mock_b.assert_not_called()
+
+    def test_redirect_timeout_is_502(self, fake_node):
+        with patch('app.config.ROUTER_TIMEOUT', 0.1):
+            app = create_router_app({'a': fake_node(never_answers).url}, {})
+
+        assert app.test_client().get('/' + generate_short_url(10000)).status_code == 502
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(url, timeout=20):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            urllib.request.urlopen(url + '/healthz', timeout=1).read()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+class TestLocalCluster:
+    # Test a router in front of two node processes with their own databases
+
+    def test_shorten_and_redirect(self, tmp_path):
+        nodes = {name: f'http://127.0.0.1:{free_port()}' for name in ('a', 'b')}
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        processes = []
+        try:
+            for name, url in nodes.items():
+                env = dict(os.environ, DATABASE_PATH=str(tmp_path / f'{name}.db'), PARTITION_NODE=name,
+                           PARTITION_NODES='a,b', RATE_LIMIT_ENABLED='false', CACHE_WARMUP_SIZE='0',
+                           ROUTER_NODES='')
+                port = int(url.rsplit(':', 1)[1])
+                processes.append(subprocess.Popen(
+                    [sys.executable, '-c', f'import main; main.create_app().run(port={port})'],
+                    cwd=root, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+            for url in nodes.values():
+                wait_until_up(url)
+
+            client = create_router_app(nodes, {}).test_client()
+            urls = [f'https://example.com/{i}' for i in range(6)]
+            short_urls = [client.post('/shorten', json={'url': url}).get_json()['short_url'] for url in urls]
+            codes = [short_url.rsplit('/', 1)[1] for short_url in short_urls]
+
+            for code, url in zip(codes, urls):
+                response = client.get(f'/{code}')
+                assert response.status_code == 302
+                assert response.headers['Location'] == url
+            # Both nodes took shortens, and each code lives where the ring says
+            ring = HashRing(nodes)
+            assert {id_owner(ring, decode_short_url(code), 1024) for code in codes} == {'a', 'b'}
+        finally:
+            for process in processes:
+                process.terminate()
+                process.wait()
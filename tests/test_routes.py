@@ -140,6 +140,50 @@ class TestShortenEndpoint(TestRoutes):
         assert 'Internal server error' in data['error']
 
 
+class TestShortDomains(TestRoutes):
+    # Test short URLs on configured short domains
+
+    @pytest.fixture
+    def domains_app(self):
+        with patch('app.config.SHORT_DOMAIN', 'https://sho.rt'), patch('app.config.SHORT_DOMAINS', 'brand.co'):
+            app = Flask(__name__)
+            app.config['TESTING'] = True
+            register_routes(app)
+        return app
+
+    def test_canonical_domain(self, domains_app, temp_db):
+        response = domains_app.test_client().post('/shorten', json={'url': 'https://example.com/'})
+        assert response.get_json()['short_url'].startswith('https://sho.rt/')
+
+    def test_requested_domain(self, domains_app, temp_db):
+        response = domains_app.test_client().post('/shorten', json={'url': 'https://example.com/', 'domain': 'brand.co'})
+        assert response.get_json()['short_url'].startswith('http://brand.co/')
+
+    def test_unknown_domain(self, domains_app, temp_db):
+        response = domains_app.test_client().post('/shorten', json={'url': 'https://example.com/', 'domain': 'evil.co'})
+        assert response.status_code == 400
+
+    def test_codes_resolve_only_on_their_domain(self, domains_app, temp_db):
+        client = domains_app.test_client()
+        brand = client.post('/shorten', json={'url': 'https://example.com/b'}, headers={'Host': 'brand.co'})
+        code = brand.get_json()['short_url'].rsplit('/', 1)[1]
+        plain = client.post('/shorten', json={'url': 'https://example.com/p'}).get_json()['short_url'].rsplit('/', 1)[1]
+
+        assert client.get(f'/{code}', headers={'Host': 'brand.co'}).headers['Location'] == 'https://example.com/b'
+        assert client.get(f'/{code}', headers={'Host': 'sho.rt'}).status_code == 404
+        assert client.get(f'/{plain}', headers={'Host': 'brand.co'}).status_code == 404
+        assert client.get(f'/{plain}', headers={'Host': 'sho.rt'}).status_code == 302
+
+    def test_resolve_batch_leaves_out_other_domains(self, domains_app, temp_db):
+        client = domains_app.test_client()
+        brand = client.post('/shorten', json={'url': 'https://example.com/b', 'domain': 'brand.co'})
+        code = brand.get_json()['short_url'].rsplit('/', 1)[1]
+
+        response = client.post('/resolve/batch', json={'codes': [code]})
+
+        assert response.get_json()['results'] == [{'code': code, 'status': 'not_found', 'original_url': None}]
+
+
 class TestRedirectEndpoint(TestRoutes):
     # Test the /<short_url> redirect endpoint
 
@@ -165,6 +209,18 @@ class TestRedirectEndpoint(TestRoutes):
         assert data['error'] == 'Short URL not found'
         assert data['short_url'] == 'xyz789'
     
+    @patch('app.routes.find_original_url')
+    def test_redirect_served_from_cache(self, mock_find_original_url, client):
+        # Test that repeat redirects for a code don't hit the database again
+        mock_find_original_url.return_value = "https://example.com"
+        
+        client.get('/abc123')
+        response = client.get('/abc123')
+        
+        assert response.status_code == 302
+        assert response.location == "https://example.com"
+        mock_find_original_url.assert_called_once_with('abc123')
+    
     def test_redirect_invalid_format(self, client):
         # Test redirect with invalid short URL format
         response = client.get('/toolongshorturl123')
@@ -216,3 +272,149 @@ class TestIntegrationTests(TestRoutes):
         assert response.status_code == 302
         assert response.location == 'https://example.com'
         
+
+
+class TestResolveBatchEndpoint(TestRoutes):
+    # Test POST /resolve/batch
+
+    def test_results_in_request_order(self, client, temp_db):
+        from app.models import get_short_url
+        first = get_short_url('https://example.com/1')
+        second = get_short_url('https://example.com/2')
+
+        response = client.post('/resolve/batch', json={'codes': [second, 'zzzzz', first, second, 'x' * 50]})
+
+        assert response.status_code == 200
+        assert response.get_json()['results'] == [
+            {'code': second, 'status': 'found', 'original_url': 'https://example.com/2'},
+            {'code': 'zzzzz', 'status': 'not_found', 'original_url': None},
+            {'code': first, 'status': 'found', 'original_url': 'https://example.com/1'},
+            {'code': second, 'status': 'found', 'original_url': 'https://example.com/2'},
+            {'code': 'x' * 50, 'status': 'invalid', 'original_url': None},
+        ]
+
+    def test_cached_codes_skip_database(self, app, client):
+        app.extensions['redirect_cache'].set('abc123', 'https://cached.example.com/')
+
+        with patch('app.routes.find_original_urls', return_value={}) as mock_find:
+            response = client.post('/resolve/batch', json={'codes': ['abc123', 'def456']})
+
+        mock_find.assert_called_once_with(['def456'])
+        assert response.get_json()['results'][0]['original_url'] == 'https://cached.example.com/'
+
+    def test_does_not_fill_cache_or_count_clicks(self, app, client):
+        app.extensions['click_counter'] = MagicMock()
+        with patch('app.routes.find_original_urls', return_value={'abc123': 'https://example.com/'}):
+            client.post('/resolve/batch', json={'codes': ['abc123']})
+
+        assert len(app.extensions['redirect_cache']) == 0
+        app.extensions['click_counter'].record.assert_not_called()
+
+    def test_bad_request(self, client):
+        assert client.post('/resolve/batch', json={'codes': 'abc123'}).status_code == 400
+        assert client.post('/resolve/batch', data='not json').status_code == 400
+        with patch('app.config.RESOLVE_BATCH_MAX_CODES', 2):
+            assert client.post('/resolve/batch', json={'codes': ['a', 'b', 'c']}).status_code == 400
+
+
+class TestLinksEndpoint(TestRoutes):
+    # Test the operator link listing
+
+    AUTH = {'Authorization': 'Bearer secret'}
+
+    @pytest.fixture
+    def links_db(self, temp_db):
+        import sqlite3
+        with sqlite3.connect(temp_db) as conn:
+            conn.executemany(
+                "INSERT INTO urls (original_url, short_url, host) VALUES (?, ?, ?)",
+                [(f"https://example.com/{i}", f"c{i}", "example.com") for i in range(5)]
+            )
+        with patch('app.db.DB_PATH', temp_db), patch('app.config.ADMIN_TOKEN', 'secret'):
+            yield temp_db
+
+    def test_disabled_without_token(self, client):
+        with patch('app.config.ADMIN_TOKEN', ''):
+            response = client.get('/links', headers=self.AUTH)
+        assert response.status_code == 403
+
+    def test_requires_token(self, client, links_db):
+        response = client.get('/links', headers={'Authorization': 'Bearer wrong'})
+        assert response.status_code == 401
+
+    def test_list_links(self, client, links_db):
+        response = client.get('/links?limit=3', headers=self.AUTH)
+
+        assert response.status_code == 200
+        data = json.loads(response.get_data(as_text=True))
+        assert [link['short_url'] for link in data['links']] == ['c4', 'c3', 'c2']
+        assert data['next_cursor'] == data['links'][-1]['id']
+
+        response = client.get(f"/links?limit=3&cursor={data['next_cursor']}", headers=self.AUTH)
+        data = json.loads(response.get_data(as_text=True))
+        assert [link['short_url'] for link in data['links']] == ['c1', 'c0']
+        assert data['next_cursor'] is None
+
+    def test_domain_filter(self, client, links_db):
+        response = client.get('/links?domain=other.com', headers=self.AUTH)
+        assert json.loads(response.get_data(as_text=True)) == {'links': [], 'next_cursor': None}
+
+    @pytest.mark.parametrize('query', ['limit=0', 'limit=abc', 'cursor=x', 'created_after=yesterday',
+                                       'domain=not a host', 'prefix=ftp://example.com'])
+    def test_invalid_query(self, client, links_db, query):
+        response = client.get(f'/links?{query}', headers=self.AUTH)
+        assert response.status_code == 400
+
+
+class TestDomainStatsEndpoint(TestRoutes):
+    # Test /stats/domains
+
+    AUTH = {'Authorization': 'Bearer secret'}
+
+    @pytest.fixture
+    def stats_db(self, temp_db):
+        with patch('app.db.DB_PATH', temp_db), patch('app.config.ADMIN_TOKEN', 'secret'):
+            from app.models import get_short_url
+            get_short_url('https://example.com/1')
+            get_short_url('https://example.com/2')
+            get_short_url('https://other.org/')
+            yield temp_db
+
+    def test_top_domains(self, client, stats_db):
+        response = client.get('/stats/domains?limit=1', headers=self.AUTH)
+
+        assert response.status_code == 200
+        assert response.get_json() == {'domains': [{'domain': 'example.com', 'links': 2, 'clicks': 0}]}
+
+    def test_single_domain(self, client, stats_db):
+        response = client.get('/stats/domains?domain=Other.org', headers=self.AUTH)
+        assert response.get_json() == {'domain': 'other.org', 'links': 1, 'clicks': 0}
+
+        response = client.get('/stats/domains?domain=missing.org', headers=self.AUTH)
+        assert response.status_code == 404
+
+    def test_invalid_sort(self, client, stats_db):
+        response = client.get('/stats/domains?sort=name', headers=self.AUTH)
+        assert response.status_code == 400
+
+    def test_redirect_counts_click(self, app, client, stats_db):
+        from app.stats import start_click_counter, domain_stats
+        counter = start_click_counter(app, interval=3600)
+
+        with patch('app.routes.find_original_url', return_value='https://example.com/1'):
+            client.get('/abc123')
+        counter.close()
+
+        assert domain_stats('example.com')['clicks'] == 1
+
+    def test_redirect_logs_click_event(self, app, client, tmp_path):
+        from app.clicklog import ArrowStore, scan_clicks, start_click_log
+        store = ArrowStore(str(tmp_path / 'clicks'))
+        click_log = start_click_log(app, store)
+
+        with patch('app.routes.find_original_url', return_value='https://example.com/1'):
+            client.get('/abc123', headers={'Referer': 'https://news.example/', 'User-Agent': 'test-agent'})
+        click_log.close()
+
+        table = scan_clicks(['code', 'referrer', 'user_agent'], store=store)
+        assert table.to_pylist() == [{'code': 'abc123', 'referrer': 'https://news.example/', 'user_agent': 'test-agent'}]
@@ -0,0 +1,47 @@
+import pytest
+from app.shortdomains import ShortDomains, CANONICAL, cache_key, domain_key
+
+
+class TestShortDomains:
+    # Test building short URLs and finding a request's short domain
+
+    def test_request_host_without_config(self):
+        domains = ShortDomains()
+        assert domains.short_url('abc', 'https', 'localhost:8000') == 'https://localhost:8000/abc'
+        assert domains.namespace('localhost:8000') is None
+
+    def test_canonical_domain(self):
+        domains = ShortDomains('sho.rt')
+        assert domains.short_url('abc', 'http', 'internal:8000') == 'http://sho.rt/abc'
+        assert domains.short_url('abc', 'https', 'internal:8000') == 'https://sho.rt/abc'
+
+    def test_canonical_scheme_fixed(self):
+        assert ShortDomains('https://sho.rt/').short_url('abc', 'http', 'internal') == 'https://sho.rt/abc'
+
+    def test_extra_domains(self):
+        domains = ShortDomains('sho.rt', ['brand.co', 'https://Go.Example.com'])
+        brand = domains.for_host('brand.co')
+        assert brand.key == domain_key('brand.co') != CANONICAL
+        assert domains.for_host('GO.example.com:443').host == 'go.example.com'
+        assert domains.short_url('abc', 'http', 'internal', brand.key) == 'http://brand.co/abc'
+        assert domains.short_url('abc', 'http', 'internal', domains.for_host('go.example.com').key) == \
+            'https://go.example.com/abc'
+
+    def test_namespace_by_host(self):
+        domains = ShortDomains('sho.rt', ['brand.co'])
+        assert domains.namespace('brand.co') == domain_key('brand.co')
+        assert domains.namespace('sho.rt') == CANONICAL
+        assert domains.namespace('10.0.0.5:8000') == CANONICAL
+
+    def test_keys_independent_of_order(self):
+        first = ShortDomains('', ['a.co', 'b.co'])
+        second = ShortDomains('', ['b.co', 'a.co'])
+        assert first.for_host('a.co').key == second.for_host('a.co').key
+
+    def test_cache_key(self):
+        assert cache_key('abc', CANONICAL) == 'abc'
+        assert cache_key('abc', 7) == 'abc@7'
+
+    def test_invalid_domain(self):
+        with pytest.raises(ValueError):
+            ShortDomains('ftp://sho.rt')
@@ -1,5 +1,16 @@
 import pytest
-from app.shortener import generate_short_url
+import numpy as np
+from unittest.mock import patch
+from app.shortener import (
+    generate_short_url,
+    decode_short_url,
+    decode_base62,
+    encode_many,
+    decode_many,
+    permute_id,
+    unpermute_id,
+    FEISTEL_BITS,
+)
 
 
 class TestGenerateShortUrl:
@@ -88,4 +99,116 @@ class TestGenerateShortUrl:
         
         # Should all be identical
         assert url1 == url2 == url3
-    
+
+
+class TestDecodeShortUrl:
+    # Test decoding a short URL back into its id
+
+    def test_decode_round_trip(self):
+        for test_id in [0, 1, 61, 62, 123, 10000, 999999999, 62**10]:
+            assert decode_short_url(generate_short_url(test_id)) == test_id
+
+    def test_decode_invalid_short_url(self):
+        with pytest.raises(ValueError):
+            decode_short_url('')
+        with pytest.raises(ValueError):
+            decode_short_url('abc-1')
+
+
+class TestBulkEncoding:
+    # Test the vectorised encode_many / decode_many functions
+
+    def test_encode_many_matches_scalar(self):
+        ids = [0, 1, 61, 62, 123, 10000, 10001, 999999999, 62**10 - 1]
+        encoded = encode_many(ids)
+
+        assert [code.decode() for code in encoded] == [generate_short_url(i) for i in ids]
+
+    def test_encode_many_fixed_width(self):
+        encoded = encode_many(np.arange(10000, 10010), width=6)
+
+        assert encoded.dtype == np.dtype('S6')
+        assert encoded[0] == b'2Bi'
+
+    def test_encode_many_rejects_bad_input(self):
+        with pytest.raises(ValueError):
+            encode_many([-1])
+        with pytest.raises(ValueError):
+            encode_many([62**5], width=3)
+
+    def test_decode_many_round_trip(self):
+        ids = np.random.default_rng(0).integers(0, 62**10, size=5000)
+
+        assert np.array_equal(decode_many(encode_many(ids)), ids)
+
+    def test_decode_many_accepts_str(self):
+        codes = [generate_short_url(i) for i in range(10000, 10100)]
+
+        assert decode_many(codes).tolist() == list(range(10000, 10100))
+
+    def test_decode_many_rejects_invalid_codes(self):
+        with pytest.raises(ValueError):
+            decode_many(['abc', 'ab!'])
+        with pytest.raises(ValueError):
+            decode_many(['abc', ''])
+        with pytest.raises(ValueError):
+            decode_many(['thisIsTooLong'])
+
+    def test_bulk_empty_input(self):
+        assert encode_many([]).size == 0
+        assert decode_many([]).size == 0
+
+
+class TestFeistelScheme:
+    # Test the non-sequential "feistel" short code scheme
+
+    @pytest.fixture(autouse=True)
+    def feistel(self):
+        with patch('app.config.SHORT_CODE_SCHEME', 'feistel'), \
+             patch('app.config.SHORT_CODE_KEY', 'test-key'):
+            yield
+
+    def test_permutation_round_trip(self):
+        for test_id in [0, 1, 10000, 10001, 123456789, 2**FEISTEL_BITS - 1]:
+            assert unpermute_id(permute_id(test_id)) == test_id
+
+    def test_permutation_is_collision_free(self):
+        permuted = {permute_id(i) for i in range(10000, 60000)}
+        assert len(permuted) == 50000
+
+    def test_sequential_ids_are_not_sequential_codes(self):
+        codes = [generate_short_url(i) for i in range(10000, 10010)]
+
+        assert len(set(codes)) == 10
+        assert codes != sorted(codes)
+        assert all(len(code) <= 7 for code in codes)
+
+    def test_decode_returns_original_id(self):
+        for test_id in range(10000, 11000):
+            assert decode_short_url(generate_short_url(test_id)) == test_id
+
+    def test_key_changes_codes(self):
+        code = generate_short_url(10000)
+        with patch('app.config.SHORT_CODE_KEY', 'other-key'):
+            assert generate_short_url(10000) != code
+
+    def test_bulk_matches_scalar(self):
+        ids = np.arange(10000, 12000)
+        encoded = encode_many(ids)
+
+        assert [c.decode() for c in encoded] == [generate_short_url(int(i)) for i in ids]
+        assert np.array_equal(decode_many(encoded), ids)
+
+    def test_out_of_range_id(self):
+        with pytest.raises(ValueError):
+            generate_short_url(2**FEISTEL_BITS)
+
+    def test_missing_key(self):
+        with patch('app.config.SHORT_CODE_KEY', ''):
+            with pytest.raises(ValueError):
+                generate_short_url(10000)
+
+    def test_decode_base62_ignores_scheme(self):
+        code = generate_short_url(10000)
+
+        assert decode_base62(code) == permute_id(10000)
@@ -0,0 +1,105 @@
+import pytest
+import gzip
+import os
+import tempfile
+import shutil
+from unittest.mock import patch
+from flask import Flask
+from app.routes import register_routes
+from app.static_files import precompress, main, IMMUTABLE, REVALIDATE
+
+INDEX = b'<!doctype html><html><head><script src="/static/js/main.3f2a1b9c.js"></script></head></html>'
+SCRIPT = b'console.log("hello");' * 50
+
+
+@pytest.fixture
+def build_dir():
+    root = tempfile.mkdtemp()
+    os.makedirs(os.path.join(root, 'static', 'js'))
+    with open(os.path.join(root, 'index.html'), 'wb') as f:
+        f.write(INDEX)
+    with open(os.path.join(root, 'static', 'js', 'main.3f2a1b9c.js'), 'wb') as f:
+        f.write(SCRIPT)
+    with open(os.path.join(root, 'static', 'js', 'main.3f2a1b9c.js.br'), 'wb') as f:
+        f.write(b'fake brotli bytes')
+    with open(os.path.join(root, 'static', 'robots.txt'), 'wb') as f:
+        f.write(b'User-agent: *')
+    yield root
+    shutil.rmtree(root)
+
+
+@pytest.fixture
+def client(build_dir):
+    precompress(build_dir)
+    app = Flask(__name__, static_folder=None)
+    with patch('app.config.STATIC_ROOT', build_dir):
+        register_routes(app)
+    return app.test_client()
+
+
+class TestPrecompress:
+    # Test writing compressed variants at build time
+
+    def test_writes_gzip_for_compressible_files(self, build_dir):
+        assert precompress(build_dir) >= 1
+
+        with gzip.open(os.path.join(build_dir, 'static', 'js', 'main.3f2a1b9c.js.gz')) as f:
+            assert f.read() == SCRIPT
+        # Too small to be worth it
+        assert not os.path.exists(os.path.join(build_dir, 'static', 'robots.txt.gz'))
+
+    def test_cli(self, build_dir, capsys):
+        main(['precompress', build_dir])
+        assert "compressed files" in capsys.readouterr().out
+
+
+class TestStaticServing:
+    # Test serving index.html and fingerprinted assets
+
+    def test_index_from_memory_with_etag(self, client, build_dir):
+        response = client.get('/')
+
+        assert response.status_code == 200
+        assert response.data == INDEX
+        assert response.headers['Cache-Control'] == REVALIDATE
+        etag = response.headers['ETag']
+
+        # Later changes on disk don't matter: it was read once
+        os.unlink(os.path.join(build_dir, 'index.html'))
+        response = client.get('/', headers={'If-None-Match': etag})
+        assert response.status_code == 304
+
+    def test_fingerprinted_asset_is_immutable(self, client):
+        response = client.get('/static/js/main.3f2a1b9c.js')
+
+        assert response.status_code == 200
+        assert response.data == SCRIPT
+        assert response.headers['Cache-Control'] == IMMUTABLE
+        assert response.mimetype in ('text/javascript', 'application/javascript')
+        assert 'Accept-Encoding' in response.headers['Vary']
+
+    def test_precompressed_variant_served(self, client):
+        response = client.get('/static/js/main.3f2a1b9c.js', headers={'Accept-Encoding': 'gzip, br'})
+        assert response.headers['Content-Encoding'] == 'br'
+        assert response.data == b'fake brotli bytes'
+
+        response = client.get('/static/js/main.3f2a1b9c.js', headers={'Accept-Encoding': 'gzip'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert gzip.decompress(response.data) == SCRIPT
+
+    def test_conditional_request_per_encoding(self, client):
+        etag = client.get('/static/js/main.3f2a1b9c.js', headers={'Accept-Encoding': 'gzip'}).headers['ETag']
+
+        response = client.get('/static/js/main.3f2a1b9c.js', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+        assert response.status_code == 304
+        # A different representation doesn't match
+        response = client.get('/static/js/main.3f2a1b9c.js', headers={'If-None-Match': etag})
+        assert response.status_code == 200
+
+    def test_unfingerprinted_asset_revalidates(self, client):
+        response = client.get('/static/robots.txt')
+        assert response.headers['Cache-Control'] == REVALIDATE
+
+    def test_missing_and_unsafe_paths(self, client):
+        assert client.get('/static/js/missing.js').status_code == 404
+        assert client.get('/static/../index.html').status_code == 404
@@ -0,0 +1,106 @@
+import pytest
+import tempfile
+import os
+from unittest.mock import patch
+from flask import Flask
+from app.db import get_db_connection, init_db
+from app.models import get_short_url
+from app.stats import ClickCounter, start_click_counter, top_domains, domain_stats
+
+
+@pytest.fixture
+def temp_db():
+    temp_db_file = tempfile.NamedTemporaryFile(delete=False)
+    temp_db_file.close()
+    with patch('app.db.DB_PATH', temp_db_file.name):
+        init_db()
+        yield temp_db_file.name
+    os.unlink(temp_db_file.name)
+
+
+class TestLinkCounts:
+    # Test per-domain link counts kept by the urls triggers
+
+    def test_shorten_counts_domain(self, temp_db):
+        for path in ['a', 'b', 'c']:
+            get_short_url(f'https://Shop.Example.com/{path}')
+        get_short_url('https://other.org/')
+
+        assert domain_stats('shop.example.com') == {'domain': 'shop.example.com', 'links': 3, 'clicks': 0}
+        assert [d['domain'] for d in top_domains(10)] == ['shop.example.com', 'other.org']
+
+    def test_host_backfill_and_delete_update_counts(self, temp_db):
+        with get_db_connection() as conn:
+            conn.execute("INSERT INTO urls (original_url) VALUES ('https://late.example.com/')")
+            conn.execute("UPDATE urls SET host = 'late.example.com'")
+        assert domain_stats('late.example.com')['links'] == 1
+
+        with get_db_connection() as conn:
+            conn.execute("DELETE FROM urls")
+        assert domain_stats('late.example.com')['links'] == 0
+        assert top_domains(10) == []
+
+    def test_unknown_domain(self, temp_db):
+        assert domain_stats('nowhere.example') is None
+
+
+class TestClickCounter:
+    # Test buffered per-domain click counting
+
+    @pytest.fixture
+    def counter(self, temp_db):
+        counter = ClickCounter(interval=3600)  # flushed by hand in these tests
+        yield counter
+        counter.close()
+
+    def test_clicks_buffered_until_flush(self, counter):
+        get_short_url('https://example.com/x')
+        for _ in range(3):
+            counter.record('https://example.com/x')
+
+        assert counter.pending() == 3
+        assert domain_stats('example.com')['clicks'] == 0
+
+        assert counter.flush() == 3
+        assert counter.pending() == 0
+        assert domain_stats('example.com')['clicks'] == 3
+
+    def test_sort_by_clicks(self, counter):
+        get_short_url('https://many-links.com/1')
+        get_short_url('https://many-links.com/2')
+        get_short_url('https://popular.com/')
+        for _ in range(5):
+            counter.record('https://popular.com/')
+        counter.flush()
+
+        assert top_domains(1, sort='clicks')[0]['domain'] == 'popular.com'
+        assert top_domains(1, sort='links')[0]['domain'] == 'many-links.com'
+
+    def test_failed_flush_keeps_counts(self, counter):
+        counter.record('https://example.com/')
+        with patch('app.stats.get_db_connection', side_effect=RuntimeError("db down")):
+            with pytest.raises(RuntimeError):
+                counter.flush()
+        assert counter.pending() == 1
+
+    def test_trim_flushes_when_over_limit(self, counter):
+        get_short_url('https://example.com/x')
+        counter.record('https://example.com/x')
+        size = counter.nbytes()
+        assert size > len('example.com')
+
+        counter.trim(size)
+        assert counter.pending() == 1
+
+        counter.trim(0)
+        assert counter.pending() == 0
+        assert counter.nbytes() == 0
+        assert domain_stats('example.com')['clicks'] == 1
+
+    def test_close_flushes(self, temp_db):
+        get_short_url('https://example.com/')
+        counter = start_click_counter(Flask(__name__), interval=3600)
+        counter.record('https://example.com/')
+        counter.close()
+
+        assert domain_stats('example.com')['clicks'] == 1
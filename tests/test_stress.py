@@ -0,0 +1,56 @@
+import pytest
+import os
+import sqlite3
+import tempfile
+from unittest.mock import patch
+from app.db import init_db
+from app.models import get_short_url
+from benchmarks.stress import run_stress, check_database
+
+
+class TestStressHarness:
+    # Short CI run of the multi-process stress test; run benchmarks/stress.py for a soak
+
+    def test_concurrent_workers_keep_data_consistent(self):
+        report = run_stress(processes=2, threads=3, duration=2, read_ratio=0.7, wal=True)
+
+        assert report['problems'] == []
+        assert report['journal_mode'] == 'wal'
+        assert report['operations']['shorten']['count'] > 0
+        assert report['operations']['redirect']['count'] > 0
+
+    def test_group_commit_workers(self):
+        report = run_stress(processes=2, threads=3, duration=2, group_commit=True, wal=True)
+        assert report['problems'] == []
+
+
+class TestCheckDatabase:
+    # Test the end-of-run consistency checks
+
+    @pytest.fixture
+    def temp_db(self):
+        temp_db_file = tempfile.NamedTemporaryFile(delete=False)
+        temp_db_file.close()
+        with patch('app.db.DB_PATH', temp_db_file.name):
+            init_db()
+            yield temp_db_file.name
+        os.unlink(temp_db_file.name)
+
+    def test_consistent(self, temp_db):
+        created = [(get_short_url(f'https://example.com/{i}'), f'https://example.com/{i}') for i in range(3)]
+        assert check_database(temp_db, created) == []
+
+    def test_finds_lost_duplicate_and_null_rows(self, temp_db):
+        code = get_short_url('https://example.com/')
+        conn = sqlite3.connect(temp_db)
+        conn.execute("INSERT INTO urls (original_url) VALUES ('https://example.com/half-written')")
+        conn.commit()
+        conn.close()
+
+        problems = check_database(temp_db, [(code, 'https://example.com/'), (code, 'https://example.com/'),
+                                            ('zzzz', 'https://example.com/lost')])
+
+        assert len(problems) == 3
+        assert 'more than once' in problems[0]
+        assert 'missing' in problems[1]
+        assert 'NULL short_url' in problems[2]
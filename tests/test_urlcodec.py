@@ -0,0 +1,124 @@
+import pytest
+import tempfile
+import os
+from unittest.mock import patch
+from app.db import get_db_connection, init_db
+from app.migrations import run_backfill
+from app.models import get_short_url, find_original_url, iter_warmup_urls
+from app.urlcodec import (
+    UrlCodec,
+    DEFAULT_DICTIONARY,
+    encode_url,
+    decode_url,
+    train_dictionary,
+    add_dictionary,
+    storage_stats,
+    reset_codecs,
+    main,
+)
+
+SHOP_URL = 'https://www.ourshop.com/products/blue-linen-shirt-1234?utm_source=newsletter&utm_medium=email'
+
+
+@pytest.fixture
+def temp_db():
+    temp_db_file = tempfile.NamedTemporaryFile(delete=False)
+    temp_db_file.close()
+    with patch('app.db.DB_PATH', temp_db_file.name):
+        init_db()
+        yield temp_db_file.name
+        reset_codecs()
+    os.unlink(temp_db_file.name)
+
+
+class TestUrlCodec:
+    # Test compressing single URLs against a preset dictionary
+
+    def test_round_trip(self):
+        codec = UrlCodec(1, DEFAULT_DICTIONARY)
+        for url in [SHOP_URL, 'https://example.com/café?q=ü', 'https://www.youtube.com/watch?v=dQw4w9WgXcQ']:
+            value = codec.compress(url)
+            assert codec.decompress(value) == url if isinstance(value, bytes) else value == url
+
+    def test_compresses_typical_url(self):
+        value = UrlCodec(1, DEFAULT_DICTIONARY).compress(SHOP_URL)
+
+        assert isinstance(value, bytes)
+        assert value[0] == 1
+        assert len(value) < len(SHOP_URL) * 0.75
+
+    def test_incompressible_url_stays_text(self):
+        url = 'x'  # nothing to gain, the header alone is a byte
+        assert UrlCodec(1, DEFAULT_DICTIONARY).compress(url) is url
+
+    def test_dictionary_id_must_fit_header(self):
+        with pytest.raises(ValueError):
+            UrlCodec(256, DEFAULT_DICTIONARY)
+
+    def test_trained_dictionary_beats_default(self):
+        urls = [f'https://shop.example.org/catalogue/widgets/item-{i}?campaign=spring-sale&channel=partner' for i in range(200)]
+        trained = UrlCodec(2, train_dictionary(urls))
+        default = UrlCodec(1, DEFAULT_DICTIONARY)
+
+        assert len(trained.compress(urls[0])) < len(default.compress(urls[0]))
+
+    def test_train_dictionary_respects_size(self):
+        urls = [f'https://site{i % 50}.example.com/section-{i % 7}/page?ref=r{i % 3}' for i in range(1000)]
+        assert len(train_dictionary(urls, size=256)) <= 256
+
+
+class TestCompressedStorage:
+    # Test compressed original_url values through the models
+
+    def test_disabled_by_default_stores_text(self, temp_db):
+        short_url = get_short_url(SHOP_URL)
+
+        with get_db_connection() as conn:
+            stored = conn.execute("SELECT original_url FROM urls WHERE short_url = ?", (short_url,)).fetchone()[0]
+        assert stored == SHOP_URL
+
+    @patch('app.config.URL_COMPRESSION', True)
+    def test_enabled_stores_blob_and_reads_back(self, temp_db):
+        short_url = get_short_url(SHOP_URL)
+
+        with get_db_connection() as conn:
+            stored = conn.execute("SELECT original_url FROM urls WHERE short_url = ?", (short_url,)).fetchone()[0]
+        assert isinstance(stored, bytes)
+        assert find_original_url(short_url) == SHOP_URL
+        assert list(iter_warmup_urls(10)) == [(short_url, SHOP_URL)]
+
+    def test_mixed_rows_read_back(self, temp_db):
+        plain = get_short_url(SHOP_URL)
+        with patch('app.config.URL_COMPRESSION', True):
+            compressed = get_short_url(SHOP_URL + '&n=2')
+
+        assert find_original_url(plain) == SHOP_URL
+        assert find_original_url(compressed) == SHOP_URL + '&n=2'
+
+    def test_new_dictionary_used_after_reset(self, temp_db):
+        with get_db_connection() as conn:
+            dictionary_id = add_dictionary(conn, train_dictionary([SHOP_URL] * 10))
+            reset_codecs()
+            with patch('app.config.URL_COMPRESSION', True):
+                value = encode_url(conn, SHOP_URL)
+
+            assert dictionary_id == 2
+            assert value[0] == 2
+            assert decode_url(conn, value) == SHOP_URL
+
+    def test_backfill_compresses_existing_rows(self, temp_db):
+        short_urls = [get_short_url(f'{SHOP_URL}&n={i}') for i in range(25)]
+
+        with get_db_connection() as conn:
+            run_backfill(conn, 'compress_original_url', batch_size=10, sleep=0)
+            rows, compressed, stored, original = storage_stats(conn)
+
+        assert (rows, compressed) == (25, 25)
+        assert stored < original
+        assert [find_original_url(s) for s in short_urls] == [f'{SHOP_URL}&n={i}' for i in range(25)]
+
+    def test_cli_stats(self, temp_db, capsys):
+        get_short_url(SHOP_URL)
+        main(['stats'])
+
+        assert "1 urls, 0 compressed" in capsys.readouterr().out
@@ -1,5 +1,19 @@
 import pytest
-from app.validators import is_valid_url, validate_shorten_request, validate_short_url, URL_PATTERN
+import random
+import time
+from app.validators import (
+    is_valid_url,
+    validate_shorten_request,
+    validate_short_url,
+    check_url,
+    check_urls,
+    split_url,
+    url_host,
+    validate_links_request,
+    validate_resolve_batch_request,
+    URL_PATTERN,
+    MAX_URL_LENGTH,
+)
 
 
 class TestUrlValidation:
@@ -170,3 +184,127 @@ class TestShortUrlValidation:
         assert is_valid == False
         assert error_response == {'error': 'Invalid short URL format'}
         assert status_code == 400
+
+
+class TestTieredValidation:
+    # Test the structural fast path against the reference URL_PATTERN
+
+    # Fragments that exercise every branch of the URL pattern
+    FRAGMENTS = [
+        'http://', 'https://', 'HTTPS://', 'ftp://', 'example', '.com', '.co.uk', 'a', '-', '.',
+        '..', ':', '80', ':8080', '/', '?', '#', '@', 'localhost', '192.168.1.1', '255', '256',
+        '.1', 'x y', '\t', '_', '\u00e9', 'com', 'abcdefg', '/path', '?q=1', '//',
+    ]
+
+    def test_split_url(self):
+        assert split_url('https://example.com:8080/path?q=1') == ('https', 'example.com', '8080', '/path?q=1')
+        assert split_url('http://localhost') == ('http', 'localhost', None, '')
+        assert split_url('http://example.com?q=1/x') == ('http', 'example.com', None, '?q=1/x')
+        assert split_url('ftp://example.com') is None
+
+    def test_matches_reference_pattern(self):
+        # Fuzz: the fast path must accept exactly what URL_PATTERN accepts
+        rng = random.Random(42)
+        for _ in range(20000):
+            url = ''.join(rng.choice(self.FRAGMENTS) for _ in range(rng.randint(1, 8)))
+            expected = URL_PATTERN.match(url.strip()) is not None
+            assert is_valid_url(url) == expected, f"Mismatch for {url!r}"
+
+    def test_port_must_be_numeric(self):
+        assert is_valid_url('https://example.com:8080/')
+        assert not is_valid_url('https://example.com:/')
+        assert not is_valid_url('https://example.com:80a')
+
+    def test_ip_octets(self):
+        assert is_valid_url('http://255.255.255.255')
+        assert is_valid_url('http://001.02.3.4')
+        assert not is_valid_url('http://256.1.1.1')
+        assert not is_valid_url('http://1.2.3')
+
+    def test_overlong_host_rejected(self):
+        host = '.'.join(['a' * 60] * 5) + '.com'
+        assert not is_valid_url(f'https://{host}/')
+
+    def test_pathological_inputs_are_bounded(self):
+        # None of these should take more than a few milliseconds each
+        pathological = [
+            'https://' + 'a' * (MAX_URL_LENGTH - 8),
+            'https://' + 'a.' * 1000 + '-',
+            'https://' + 'a-' * 1000 + '.com',
+            'https://example.com/' + 'x' * (MAX_URL_LENGTH - 21) + ' ',
+            'https://' + '1.' * 1000,
+            'https://example.com:' + '9' * 2000,
+        ]
+        for url in pathological:
+            start = time.perf_counter()
+            check_url(url)
+            assert time.perf_counter() - start < 0.05, f"Too slow for {url[:40]!r}..."
+
+    def test_check_url_returns_stripped_url(self):
+        assert check_url('  https://example.com  ') == ('https://example.com', None, None)
+
+    def test_check_url_length_before_format(self):
+        # Length is checked first, so an overlong URL is reported as too long
+        url, error_response, status_code = check_url('not-a-url' * 500)
+        assert url is None
+        assert 'URL too long' in error_response['error']
+        assert status_code == 422
+
+    def test_check_url_non_string(self):
+        url, error_response, status_code = check_url(123)
+        assert url is None
+        assert status_code == 422
+
+    def test_check_urls_batch(self):
+        results = check_urls(['https://example.com', '', 'not-a-url'])
+
+        assert results[0] == ('https://example.com', None, None)
+        assert results[1][2] == 400
+        assert results[2][2] == 422
+
+
+class TestLinksRequestValidation:
+    # Test GET /links query validation
+
+    def test_defaults(self):
+        query, error, status = validate_links_request({}, 100, 1000)
+
+        assert error is None
+        assert query == {'limit': 100, 'before_id': None, 'created_after': None,
+                         'created_before': None, 'host': None, 'prefix': None}
+
+    def test_timestamps_normalised_to_utc(self):
+        query, _, _ = validate_links_request(
+            {'created_after': '2025-03-01', 'created_before': '2025-03-01T12:00:00+02:00'}, 100, 1000
+        )
+
+        assert query['created_after'] == '2025-03-01 00:00:00'
+        assert query['created_before'] == '2025-03-01 10:00:00'
+
+    def test_limit_bounds(self):
+        assert validate_links_request({'limit': '1001'}, 100, 1000)[2] == 400
+        assert validate_links_request({'limit': '1000'}, 100, 1000)[1] is None
+
+    def test_domain_lowercased(self):
+        query, _, _ = validate_links_request({'domain': 'Example.COM'}, 100, 1000)
+        assert query['host'] == 'example.com'
+
+    def test_url_host(self):
+        assert url_host('https://WWW.Example.com:8443/path?q=1') == 'www.example.com'
+        assert url_host('  http://localhost ') == 'localhost'
+        assert url_host('ftp://example.com') is None
+
+
+class TestResolveBatchValidation:
+    # Test POST /resolve/batch body validation
+
+    def test_valid(self):
+        assert validate_resolve_batch_request({'codes': ['abc', 'def']}, 10) == (['abc', 'def'], None, None)
+
+    def test_rejects_bad_bodies(self):
+        for body in (None, [], {'codes': 'abc'}, {'codes': ['abc', 1]}, {'codes': []}, {}):
+            codes, error, status = validate_resolve_batch_request(body, 10)
+            assert codes is None and status == 400
+
+    def test_too_many_codes(self):
+        assert validate_resolve_batch_request({'codes': ['a'] * 11}, 10)[2] == 400
@@ -0,0 +1,90 @@
+import pytest
+import tempfile
+import os
+import sqlite3
+from flask import Flask
+from unittest.mock import patch
+from app.cache import RedirectCache
+from app.db import init_db
+from app.shortener import generate_short_url
+from app.warmup import warm_redirect_cache, start_cache_warmup
+
+
+class TestCacheWarmup:
+    # Test preloading the redirect cache
+
+    @pytest.fixture
+    def temp_db(self):
+        temp_db_file = tempfile.NamedTemporaryFile(delete=False)
+        temp_db_file.close()
+        with patch('app.db.DB_PATH', temp_db_file.name):
+            init_db()
+            with sqlite3.connect(temp_db_file.name) as conn:
+                conn.executemany(
+                    "INSERT INTO urls (id, original_url, short_url) VALUES (?, ?, ?)",
+                    [(i, f"https://example.com/{i}", generate_short_url(i)) for i in range(10000, 11200)]
+                )
+                # A row whose short code was never written shouldn't be loaded
+                conn.execute("INSERT INTO urls (original_url) VALUES ('https://example.com/pending')")
+            yield temp_db_file.name
+        os.unlink(temp_db_file.name)
+
+    def test_loads_most_recent_links(self, temp_db):
+        cache = RedirectCache(max_entries=100)
+
+        assert warm_redirect_cache(cache, limit=5, budget=5) == 5
+        assert len(cache) == 5
+        assert cache.get(generate_short_url(11199))[0] == "https://example.com/11199"
+        assert cache.get(generate_short_url(11194))[0] is None
+
+    def test_most_clicked_links_first(self, temp_db):
+        clicked = [(generate_short_url(10000), 9), (generate_short_url(11199), 4), ('gone', 2)]
+        cache = RedirectCache(max_entries=100)
+
+        with patch('app.config.CLICK_LOG_ENABLED', True), patch('app.clicklog.top_codes', return_value=clicked), \
+                patch.object(cache, 'set_many', wraps=cache.set_many) as mock_set:
+            assert warm_redirect_cache(cache, limit=4, budget=5) == 4
+
+        # Then the newest links, without loading 11199 twice
+        assert [code for code, _ in mock_set.call_args.args[0]] == [
+            generate_short_url(i) for i in (10000, 11199, 11198, 11197)
+        ]
+
+    def test_recency_when_clicks_unavailable(self, temp_db):
+        cache = RedirectCache(max_entries=100)
+
+        with patch('app.config.CLICK_LOG_ENABLED', True), \
+                patch('app.clicklog.top_codes', side_effect=FileNotFoundError("no click log")):
+            assert warm_redirect_cache(cache, limit=5, budget=5) == 5
+        assert cache.get(generate_short_url(11199))[0] == "https://example.com/11199"
+
+    def test_limited_by_cache_size(self, temp_db):
+        cache = RedirectCache(max_entries=10)
+
+        assert warm_redirect_cache(cache, limit=1000, budget=5) == 10
+
+    def test_stops_at_time_budget(self, temp_db):
+        cache = RedirectCache(max_entries=5000)
+
+        # With no time at all it stops after the first chunk
+        assert warm_redirect_cache(cache, limit=1200, budget=0) == 500
+
+    def test_start_cache_warmup_runs_in_background(self, temp_db):
+        app = Flask(__name__)
+        app.extensions['redirect_cache'] = RedirectCache(max_entries=100)
+
+        thread = start_cache_warmup(app, limit=50, budget=5)
+        thread.join(5)
+
+        assert app.extensions['cache_warmup'].is_set()
+        assert len(app.extensions['redirect_cache']) == 50
+
+    def test_failed_warmup_still_finishes(self):
+        app = Flask(__name__)
+        app.extensions['redirect_cache'] = RedirectCache(max_entries=100)
+
+        with patch('app.warmup.iter_warmup_urls', side_effect=sqlite3.OperationalError("locked")):
+            start_cache_warmup(app, limit=50, budget=5).join(5)
+
+        assert app.extensions['cache_warmup'].is_set()
+        assert len(app.extensions['redirect_cache']) == 0
@@ -0,0 +1,119 @@
+import pytest
+import tempfile
+import os
+import threading
+import time
+from unittest.mock import patch
+from app import models
+from app.db import init_db, get_db_connection
+from app.models import get_short_url, find_original_url
+from app.writer import GroupCommitWriter, start_group_commit, stop_group_commit
+
+
+class TestGroupCommitWriter:
+    # Test batching inserts into shared transactions
+
+    @pytest.fixture
+    def temp_db(self):
+        temp_db_file = tempfile.NamedTemporaryFile(delete=False)
+        temp_db_file.close()
+        with patch('app.db.DB_PATH', temp_db_file.name):
+            init_db()
+            yield temp_db_file.name
+        os.unlink(temp_db_file.name)
+
+    def shorten_concurrently(self, shorten, count):
+        results = [None] * count
+        barrier = threading.Barrier(count)
+
+        def worker(index):
+            barrier.wait()
+            results[index] = shorten(f"https://example.com/{index}")
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_single_insert(self, temp_db):
+        writer = GroupCommitWriter(max_delay=0.001)
+        try:
+            short_url = writer.shorten("https://example.com")
+        finally:
+            writer.close()
+
+        assert find_original_url(short_url) == "https://example.com"
+        assert writer.batches == 1
+
+    def test_concurrent_inserts_share_commits(self, temp_db):
+        writer = GroupCommitWriter(max_batch=100, max_delay=0.05)
+        try:
+            short_urls = self.shorten_concurrently(writer.shorten, 40)
+        finally:
+            writer.close()
+
+        assert len(set(short_urls)) == 40
+        assert writer.rows == 40
+        assert writer.batches < 40
+        for index, short_url in enumerate(short_urls):
+            assert find_original_url(short_url) == f"https://example.com/{index}"
+
+        with get_db_connection() as conn:
+            assert conn.execute("SELECT COUNT(*) FROM urls WHERE short_url IS NULL").fetchone()[0] == 0
+
+    def test_batch_size_cap(self, temp_db):
+        writer = GroupCommitWriter(max_batch=5, max_delay=0.001)
+        try:
+            self.shorten_concurrently(writer.shorten, 20)
+        finally:
+            writer.close()
+
+        assert writer.batches >= 4
+
+    def test_commit_rate_is_bounded(self, temp_db):
+        # However fast requests arrive, commits are at least max_delay apart
+        commit_times = []
+        original_commit = GroupCommitWriter._commit
+
+        def timed_commit(self, batch):
+            commit_times.append(time.monotonic())
+            original_commit(self, batch)
+
+        with patch.object(GroupCommitWriter, '_commit', timed_commit):
+            writer = GroupCommitWriter(max_batch=2, max_delay=0.02)
+            try:
+                self.shorten_concurrently(writer.shorten, 10)
+            finally:
+                writer.close()
+
+        gaps = [later - earlier for earlier, later in zip(commit_times, commit_times[1:])]
+        assert len(commit_times) >= 5
+        assert min(gaps) >= 0.019
+
+    def test_failed_batch_fails_every_caller(self, temp_db):
+        writer = GroupCommitWriter(max_delay=0.001)
+        try:
+            with patch('app.models.insert_urls', side_effect=Exception("Database error")):
+                with pytest.raises(Exception, match="Database error"):
+                    writer.shorten("https://example.com")
+
+            # The writer keeps going after a failed batch
+            assert find_original_url(writer.shorten("https://example.com")) == "https://example.com"
+        finally:
+            writer.close()
+
+    def test_get_short_url_uses_writer(self, temp_db):
+        writer = start_group_commit(max_batch=10, max_delay=0.001)
+        try:
+            assert models.group_commit_writer is writer
+            assert start_group_commit() is writer
+
+            short_url = get_short_url("https://example.com/grouped")
+            assert writer.rows == 1
+            assert find_original_url(short_url) == "https://example.com/grouped"
+        finally:
+            stop_group_commit()
+
+        assert models.group_commit_writer is None